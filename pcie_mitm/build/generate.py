@@ -0,0 +1,254 @@
+import cProfile
+import hashlib
+import io
+import json
+import os
+import pstats
+import shutil
+import subprocess
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from importlib import metadata, util
+
+
+# Phase Profiler -----------------------------------------------------------------------------------
+
+_active = None
+
+class BuildProfiler:
+    """Wall time of the (nested) phases of a build, with an optional cProfile of each top phase.
+
+    `with BuildProfiler() as p:` makes it the target of `phase()`, which the SoC constructors use
+    to time their own steps (e.g. collecting the analyzer signals).
+    """
+    def __init__(self, detail=False):
+        self.detail = detail
+        self.phases = [] # (depth, name, seconds, stats)
+        self._depth = 0
+
+    def __enter__(self):
+        global _active
+        self._previous, _active = _active, self
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        _active = self._previous
+
+    @contextmanager
+    def phase(self, name):
+        index = len(self.phases)
+        self.phases.append((self._depth, name, None, None))
+        prof  = cProfile.Profile() if self.detail and self._depth == 0 else None
+        start = time.perf_counter()
+        self._depth += 1
+        if prof is not None:
+            prof.enable()
+        try:
+            yield
+        finally:
+            if prof is not None:
+                prof.disable()
+            self._depth -= 1
+            self.phases[index] = (self._depth, name, time.perf_counter() - start, prof)
+
+    def wrap(self, obj, method, name=None):
+        """Time every call of `obj.method` as the `name` phase (the instance attribute only)."""
+        func = getattr(obj, method)
+        def wrapper(*args, **kwargs):
+            with self.phase(name or method):
+                return func(*args, **kwargs)
+        setattr(obj, method, wrapper)
+
+    def report(self, top=15):
+        total = sum(seconds for depth, _, seconds, _ in self.phases if depth == 0 and seconds)
+        lines = ["{:<40} {:>9} {:>6}".format("Phase", "Time (s)", "%")]
+        for depth, name, seconds, _ in self.phases:
+            seconds = seconds or 0
+            lines.append("{:<40} {:>9.3f} {:>5.1f}%".format("  "*depth + name, seconds,
+                100*seconds/total if total else 0))
+        lines.append("{:<40} {:>9.3f}".format("Total", total))
+        for depth, name, _, prof in self.phases:
+            if prof is None:
+                continue
+            out = io.StringIO()
+            pstats.Stats(prof, stream=out).sort_stats("cumulative").print_stats(top)
+            lines += ["", f"{name}:", out.getvalue().rstrip()]
+        return "\n".join(lines)
+
+@contextmanager
+def phase(name):
+    """Time `name` in the active BuildProfiler, if any."""
+    if _active is None:
+        yield
+    else:
+        with _active.phase(name):
+            yield
+
+# Generation Key -----------------------------------------------------------------------------------
+
+# Python packages whose sources determine the generated gateware, hashed along with the script's.
+# The CPU Verilog of the pythondata-* packages is referenced as a source and not hashed here.
+key_packages = ["pcie_mitm", "migen", "litex", "litedram", "liteeth", "litescope", "litex_boards"]
+
+def _source_files(path):
+    if os.path.isfile(path):
+        return [path]
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs[:]  = sorted(d for d in dirs if d != "__pycache__")
+        files   += [os.path.join(root, n) for n in sorted(names) if not n.endswith((".pyc", ".pyo"))]
+    return files
+
+def generation_key(options, sources=(), packages=key_packages):
+    """Hash of `options` (JSON-able, e.g. the script arguments), the `sources` files/directories
+    and the installed `packages` (version and Python sources, missing packages are skipped)."""
+    h = hashlib.sha256()
+    h.update(json.dumps(options, sort_keys=True, default=repr).encode())
+    paths = [(os.path.abspath(s), False) for s in sources]
+    for name in packages:
+        spec = util.find_spec(name)
+        if spec is None or spec.origin is None:
+            continue
+        try:
+            version = metadata.version(name.replace("_", "-"))
+        except metadata.PackageNotFoundError:
+            version = "unknown"
+        h.update(f"{name} {version}\0".encode())
+        paths.append((os.path.dirname(spec.origin), True))
+    for path, python_only in paths:
+        for filename in _source_files(path):
+            if python_only and not filename.endswith(".py"):
+                continue
+            with open(filename, "rb") as f:
+                data = f.read()
+            h.update(os.path.relpath(filename, os.path.dirname(path)).encode() + b"\0" + data + b"\0")
+    return h.hexdigest()
+
+# Generation Cache ---------------------------------------------------------------------------------
+
+# Files of the gateware directory written by the LiteX generation (the toolchain outputs and its
+# subdirectories, e.g. Verilator's obj_dir or Quartus' db, are left alone). The Verilator flow also
+# writes the pad bindings and the Makefile variables of the model (sim_header.h, sim_init.cpp,
+# variables.mak).
+generated_suffixes = (".v", ".sv", ".vh", ".init", ".hex", ".qsf", ".qpf", ".sdc", ".tcl", ".sh", ".bat",
+    ".js", ".ys", ".xdc", ".pcf", ".lpf", ".mk", ".mak", ".h", ".cpp")
+
+manifest_file = "manifest.json"
+
+class GenerationCache:
+    """Generated files of each configuration in `cache_dir/<key>/`, the `max_entries` most recent
+    ones are kept. Paths are stored relative to the working directory."""
+    def __init__(self, cache_dir=os.path.join("build", "gen_cache"), max_entries=8):
+        self.cache_dir   = cache_dir
+        self.max_entries = max_entries
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def restore(self, key):
+        """Copy the files of `key` back (only the changed ones), return its metadata or None."""
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, manifest_file)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        files = [(os.path.join(entry, "files", stored), dest) for dest, stored in manifest["files"].items()]
+        if not all(os.path.exists(src) for src, _ in files):
+            return None
+        for src, dest in files:
+            copy_if_changed(src, dest)
+        os.utime(entry)
+        return manifest["meta"]
+
+    def store(self, key, files, meta):
+        entry = self._entry(key)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.makedirs(os.path.join(entry, "files"))
+        stored = {}
+        for i, filename in enumerate(files):
+            name = f"{i}_{os.path.basename(filename)}"
+            shutil.copyfile(filename, os.path.join(entry, "files", name))
+            stored[os.path.relpath(filename)] = name
+        # The manifest is written last: an interrupted store is a miss.
+        tmp = os.path.join(entry, manifest_file + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"meta": meta, "files": stored}, f, indent=1)
+        os.replace(tmp, os.path.join(entry, manifest_file))
+        self._prune()
+
+    def _prune(self):
+        entries = [os.path.join(self.cache_dir, e) for e in os.listdir(self.cache_dir)]
+        entries = sorted((e for e in entries if os.path.isdir(e)), key=os.path.getmtime, reverse=True)
+        for e in entries[self.max_entries:]:
+            shutil.rmtree(e, ignore_errors=True)
+
+def copy_if_changed(src, dest):
+    """Copy `src` to `dest` unless it has the same contents (keeps its mtime for the toolchains)."""
+    if os.path.exists(dest) and os.path.getsize(src) == os.path.getsize(dest):
+        with open(src, "rb") as fa, open(dest, "rb") as fb:
+            if fa.read() == fb.read():
+                return False
+    os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+    shutil.copyfile(src, dest)
+    return True
+
+def generated_files(builder, outputs=()):
+    """Generated gateware files, software headers and `outputs` (e.g. analyzer.csv) of `builder`."""
+    files = [os.path.join(builder.gateware_dir, f) for f in sorted(os.listdir(builder.gateware_dir))
+        if f.endswith(generated_suffixes) and os.path.isfile(os.path.join(builder.gateware_dir, f))]
+    if os.path.isdir(builder.generated_dir):
+        files += _source_files(builder.generated_dir)
+    files += [f for f in [builder.csr_csv, builder.csr_json, builder.csr_svd, *outputs]
+        if f is not None and os.path.isfile(f)]
+    return files
+
+# Build Driver -------------------------------------------------------------------------------------
+
+Generation = namedtuple("Generation", ["builder", "gateware_dir", "build_name", "sources", "cached"])
+
+def generate(make_soc, make_builder, key, outputs=(), cache=True, cache_dir=None, **kwargs):
+    """Elaborate `make_soc()` and generate it with `make_builder(soc).build(run=False, **kwargs)`,
+    or restore the files generated for `key` (see generation_key).
+
+    Each step is a phase of the active BuildProfiler. Returns a Generation, its `builder` is None
+    when the files were restored from the cache.
+    """
+    gen_cache = GenerationCache(**({} if cache_dir is None else {"cache_dir": cache_dir}))
+    if cache:
+        with phase("restore cache"):
+            meta = gen_cache.restore(key)
+        if meta is not None:
+            return Generation(None, os.path.abspath(meta["gateware_dir"]), meta["build_name"],
+                [tuple(s) for s in meta["sources"]], True)
+
+    with phase("elaborate"):
+        soc = make_soc()
+    builder = make_builder(soc)
+    if _active is not None:
+        _active.wrap(soc, "finalize")
+        _active.wrap(builder, "_generate_includes", "software headers")
+        _active.wrap(builder, "_generate_csr_map", "csr map")
+        _active.wrap(builder, "_generate_rom_software", "rom software")
+        _active.wrap(soc.platform, "get_verilog", "verilog")
+        _active.wrap(soc, "do_exit", "exports")
+    with phase("generate"):
+        builder.build(run=False, **kwargs)
+    gateware_dir = builder.gateware_dir
+    sources      = [tuple(s[:3]) for s in soc.platform.sources]
+    with phase("store cache"):
+        gen_cache.store(key, generated_files(builder, outputs), {
+            "gateware_dir": os.path.relpath(gateware_dir),
+            "build_name":   soc.build_name,
+            "sources":      sources,
+        })
+    return Generation(builder, gateware_dir, soc.build_name, sources, False)
+
+def run_toolchain(gateware_dir, build_name):
+    """Run the build script LiteX wrote for the toolchain (e.g. Quartus) in `gateware_dir`."""
+    with phase("toolchain"):
+        r = subprocess.call(["bash", f"build_{build_name}.sh"], cwd=gateware_dir)
+    if r != 0:
+        raise OSError("Error occured during the toolchain's script execution.")
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from migen import *
+from migen.fhdl import verilog
+from migen.fhdl.tools import list_signals, list_special_ios, list_targets
+
+from litex.soc.interconnect.csr import CSR, CSRStatus, CSRStorage
+
+
+# Module Conversion --------------------------------------------------------------------------------
+
+def _interface_signals(module):
+    """Signals/Records attributes (and CSRs) of `module`, the ports of its standalone netlist."""
+    signals = set()
+    def add(obj, depth=0):
+        if isinstance(obj, Signal):
+            signals.add(obj)
+        elif isinstance(obj, Record):
+            signals.update(obj.flatten())
+        elif isinstance(obj, (list, tuple)) and depth == 0:
+            for o in obj:
+                add(o, 1)
+        elif isinstance(obj, (CSR, CSRStatus, CSRStorage)):
+            for name in ["r", "re", "w", "we", "status", "storage"]:
+                if isinstance(getattr(obj, name, None), Signal):
+                    signals.add(getattr(obj, name))
+    for obj in vars(module).values():
+        add(obj)
+    if hasattr(module, "get_csrs"):
+        for csr in module.get_csrs():
+            add(csr)
+    return signals
+
+def module_ios(module, fragment=None):
+    """Ports of `module` converted on its own: the signals it reads but does not drive (e.g. CSR
+    storages and stream sinks) and the driven signals of its interface (so their logic is kept)."""
+    f       = module.get_fragment() if fragment is None else fragment
+    targets = list_targets(f) | list_special_ios(f, ins=False, outs=True, inouts=False)
+    inputs  = (list_signals(f) | list_special_ios(f, ins=True, outs=False, inouts=False)) - targets
+    outputs = _interface_signals(module) & targets
+    return inputs | outputs
+
+def convert_module(module, name="top"):
+    """Verilog of `module` alone, see module_ios."""
+    f = module.get_fragment()
+    return str(verilog.convert(f, ios=module_ios(module, f), name=name))
+
+# Yosys --------------------------------------------------------------------------------------------
+
+# Synthesis scripts, `{top}` is the top module.
+yosys_targets = {
+    # Intel ALMs (Cyclone V/Arria V ALMs, M10K/MLAB memories and DSPs).
+    "intel_alm": "synth_intel_alm -family cyclonev -top {top}",
+    # Technology-independent 6-LUTs, memories are mapped to flip-flops and LUTs.
+    "generic":   "synth -top {top} -flatten -lut 6",
+}
+
+# Resource of each synthesized cell type (first matching pattern).
+resource_patterns = [
+    ("BRAM",   r"M10K|M20K|\$mem"),
+    ("LUTRAM", r"MLAB"),
+    ("DSP",    r"MUL|DSP|\$mul"),
+    ("FF",     r"FF|DFF|\$_SDFF|\$_DLATCH"),
+    ("LUT",    r"ALUT|\$lut|\$_(AND|OR|XOR|NOT|MUX|NAND|NOR|XNOR|ANDNOT|ORNOT)_"),
+]
+resources = ["LUT", "FF", "BRAM", "LUTRAM", "DSP", "other"]
+
+NetlistReport = namedtuple("NetlistReport", ["name", "cells", "resources", "depth", "seconds"])
+
+def cell_resources(cells):
+    """{resource: count} of {cell type: count}."""
+    counts = {r: 0 for r in resources}
+    for cell, n in cells.items():
+        resource = next((r for r, pattern in resource_patterns if re.search(pattern, cell)), "other")
+        counts[resource] += n
+    return counts
+
+def parse_stat_json(text, top):
+    """{cell type: count} of the `top` module in the output of `stat -json`."""
+    modules = json.loads(text)["modules"]
+    module  = modules.get("\\" + top) or modules.get(top) or next(iter(modules.values()))
+    return dict(module["num_cells_by_type"])
+
+def parse_ltp(text):
+    """Longest topological path (cells, flip-flops excluded) in the output of `ltp -noff`."""
+    lengths = [int(n) for n in re.findall(r"Longest topological path in \S+ \(length=(\d+)\)", text)]
+    return max(lengths, default=0)
+
+def run_yosys(verilog_files, top, name=None, target="intel_alm", yosys="yosys"):
+    """Synthesize `verilog_files` with yosys, return a NetlistReport of `top`."""
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp:
+        stat_file, ltp_file = os.path.join(tmp, "stat.json"), os.path.join(tmp, "ltp.txt")
+        script = [f"read_verilog -sv {os.path.abspath(f)}" for f in verilog_files]
+        script += [yosys_targets[target].format(top=top),
+            f"tee -q -o {stat_file} stat -json",
+            f"tee -q -o {ltp_file} ltp -noff"]
+        script_file = os.path.join(tmp, "report.ys")
+        with open(script_file, "w") as f:
+            f.write("\n".join(script) + "\n")
+        try:
+            r = subprocess.run([yosys, "-q", "-s", script_file], cwd=tmp, capture_output=True, text=True)
+        except FileNotFoundError:
+            raise OSError("Unable to find yosys, please add it to your $PATH.")
+        if r.returncode != 0:
+            raise OSError(f"yosys failed on {name or top}:\n{r.stdout}{r.stderr}")
+        with open(stat_file) as f:
+            cells = parse_stat_json(f.read(), top)
+        with open(ltp_file) as f:
+            depth = parse_ltp(f.read())
+    return NetlistReport(name or top, cells, cell_resources(cells), depth, time.perf_counter() - start)
+
+def module_report(module, name, **kwargs):
+    """run_yosys on `module` converted on its own."""
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, f"{name}.v")
+        with open(filename, "w") as f:
+            f.write(convert_module(module, name))
+        return run_yosys([filename], name, name, **kwargs)
+
+# Baseline -----------------------------------------------------------------------------------------
+
+Regression = namedtuple("Regression", ["name", "metric", "baseline", "value"])
+
+def report_metrics(report):
+    return dict(report.resources, depth=report.depth)
+
+def save_baseline(reports, filename):
+    with open(filename, "w") as f:
+        json.dump({r.name: report_metrics(r) for r in reports}, f, indent=1, sort_keys=True)
+
+def load_baseline(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+def compare_baseline(reports, baseline, tolerance=0.0):
+    """[Regression] of the metrics that grew more than `tolerance` (relative) over `baseline`.
+
+    Designs missing from the baseline are new, not regressions.
+    """
+    regressions = []
+    for r in reports:
+        if r.name not in baseline:
+            continue
+        for metric, value in report_metrics(r).items():
+            before = baseline[r.name].get(metric, 0)
+            if value > before*(1 + tolerance) and value > before:
+                regressions.append(Regression(r.name, metric, before, value))
+    return regressions
+
+def format_reports(reports, baseline=None):
+    metrics = resources + ["depth"]
+    lines   = ["{:<24}".format("Design") + "".join("{:>14}".format(m) for m in metrics) + "{:>9}".format("Time (s)")]
+    for r in reports:
+        values = report_metrics(r)
+        before = (baseline or {}).get(r.name, {})
+        def cell(m):
+            delta = values[m] - before.get(m, values[m])
+            return f"{values[m]} ({delta:+d})" if delta else str(values[m])
+        lines.append("{:<24}".format(r.name) + "".join("{:>14}".format(cell(m)) for m in metrics) +
+            "{:>9.1f}".format(r.seconds))
+    return "\n".join(lines)
+
+# IP Designs ---------------------------------------------------------------------------------------
+
+def _capture(width=256, compress=False, port_width=256):
+    from litedram.common import LiteDRAMNativePort
+    from pcie_mitm.ip.capture import DRAMCapture
+    port = LiteDRAMNativePort("write", address_width=24, data_width=port_width)
+    return DRAMCapture([Signal(width)], port, base=0, depth=1024*1024, compress=compress, csr_csv=None)
+
+def _ip(module, cls):
+    def make(**params):
+        return getattr(__import__(module, fromlist=[cls]), cls)(**params)
+    return make
+
+# Configurable cores of pcie_mitm.ip, `name:param=value,...` on the command line.
+ip_designs = {
+    "sniffer":  _ip("pcie_mitm.ip.tlp",       "TLPSniffer"),
+    "rewriter": _ip("pcie_mitm.ip.rewrite",   "TLPRewriter"),
+    "perf":     _ip("pcie_mitm.ip.perf",      "TLPPerfMonitor"),
+    "mutator":  _ip("pcie_mitm.ip.fuzz",      "TLPMutator"),
+    "emulator": _ip("pcie_mitm.ip.emulation", "DeviceEmulator"),
+    "encoder":  _ip("pcie_mitm.ip.compress",  "ChangeEncoder"),
+    "gpio":     _ip("pcie_mitm.ip.gpio",      "AvalonMMGPIO"),
+    "trigger":  _ip("pcie_mitm.ip.trigger",   "TriggerSequencer"),
+    "capture":  _capture,
+}
+
+def parse_ip(spec):
+    """`rewriter:nrules=16,key_dws=6` -> (report name, design, params)."""
+    name, _, params = spec.partition(":")
+    if name not in ip_designs:
+        raise ValueError(f"unknown IP design {name}, one of {', '.join(ip_designs)}")
+    kwargs = {}
+    for param in filter(None, params.split(",")):
+        key, value = param.split("=")
+        try:
+            kwargs[key] = int(value, 0)
+        except ValueError:
+            kwargs[key] = {"True": True, "False": False}.get(value, value)
+    return spec.replace(":", "_").replace(",", "_").replace("=", ""), name, kwargs
+
+default_ip = ["sniffer", "rewriter", "perf", "mutator", "encoder:data_width=64", "gpio", "capture"]
+
+# Main ---------------------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Yosys resource and logic depth report of pcie_mitm designs.")
+    parser.add_argument("--ip",              action="append", default=None, help="IP design (`name:param=value,...`), default: {}.".format(" ".join(default_ip)))
+    parser.add_argument("--verilog",         action="append", default=[],   help="Generated Verilog file (e.g. build/<board>/gateware/<board>.v).")
+    parser.add_argument("--top",             default=None,                  help="Top module of --verilog (default: the name of the first file).")
+    parser.add_argument("--target",          default="intel_alm",           help="Yosys synthesis target: {}.".format(", ".join(yosys_targets)))
+    parser.add_argument("--yosys",           default="yosys",               help="Yosys binary.")
+    parser.add_argument("--jobs",            default=os.cpu_count(),        type=int, help="Parallel yosys runs.")
+    parser.add_argument("--baseline",        default=None,                  help="JSON baseline to compare the reports against.")
+    parser.add_argument("--tolerance",       default=0.0,                   type=float, help="Relative growth over the baseline allowed.")
+    parser.add_argument("--update-baseline", action="store_true",           help="Write the reports to --baseline.")
+    args = parser.parse_args()
+
+    kwargs = dict(target=args.target, yosys=args.yosys)
+    jobs   = []
+    for spec in (args.ip or ([] if args.verilog else default_ip)):
+        name, design, params = parse_ip(spec)
+        jobs.append(lambda name=name, design=design, params=params:
+            module_report(ip_designs[design](**params), name, **kwargs))
+    if args.verilog:
+        top = args.top or os.path.splitext(os.path.basename(args.verilog[0]))[0]
+        jobs.append(lambda: run_yosys(args.verilog, top, **kwargs))
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        reports = list(pool.map(lambda job: job(), jobs))
+
+    baseline = None
+    if args.baseline is not None and os.path.exists(args.baseline) and not args.update_baseline:
+        baseline = load_baseline(args.baseline)
+    print(format_reports(reports, baseline))
+    if args.update_baseline and args.baseline is not None:
+        save_baseline(reports, args.baseline)
+    elif baseline is not None:
+        regressions = compare_baseline(reports, baseline, args.tolerance)
+        for r in regressions:
+            print(f"Regression: {r.name} {r.metric} {r.baseline} -> {r.value}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
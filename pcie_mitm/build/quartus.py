@@ -0,0 +1,250 @@
+import hashlib
+import itertools
+import os
+import re
+import shutil
+import stat
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from pcie_mitm.build.generate import copy_if_changed, generated_suffixes
+
+
+# Trials -------------------------------------------------------------------------------------------
+
+# Design space exploration presets: global assignments added to the project of a trial.
+exploration_presets = {
+    "default":     {},
+    "performance": {
+        "OPTIMIZATION_MODE": '"HIGH PERFORMANCE EFFORT"',
+    },
+    "retiming":    {
+        "OPTIMIZATION_MODE":                    '"HIGH PERFORMANCE EFFORT"',
+        "PHYSICAL_SYNTHESIS_REGISTER_RETIMING": "ON",
+        "PHYSICAL_SYNTHESIS_COMBO_LOGIC":       "ON",
+    },
+    "aggressive":  {
+        "OPTIMIZATION_MODE":                    '"AGGRESSIVE PERFORMANCE"',
+        "PHYSICAL_SYNTHESIS_REGISTER_RETIMING": "ON",
+        "PHYSICAL_SYNTHESIS_REGISTER_DUPLICATION": "ON",
+        "PHYSICAL_SYNTHESIS_COMBO_LOGIC":       "ON",
+        "PLACEMENT_EFFORT_MULTIPLIER":          "4.0",
+        "ROUTER_TIMING_OPTIMIZATION_LEVEL":     "MAXIMUM",
+    },
+}
+
+Trial = namedtuple("Trial", ["name", "seed", "settings"])
+
+def trials(seeds=(1,), presets=("default",)):
+    """Every fitter seed of every exploration preset."""
+    return [Trial(f"{preset}_seed{seed}", seed, exploration_presets[preset])
+        for preset, seed in itertools.product(presets, seeds)]
+
+# Reports ------------------------------------------------------------------------------------------
+
+Slack = namedtuple("Slack", ["type", "slack", "tns"])
+
+def parse_sta_summary(text):
+    """[Slack] of a `<build_name>.sta.summary`."""
+    entries = re.findall(r"Type\s*:\s*(.+?)\s*\nSlack\s*:\s*(\S+)\s*\nTNS\s*:\s*(\S+)", text)
+    return [Slack(t, float(s), float(tns)) for t, s, tns in entries]
+
+def parse_fmax(text):
+    """{clock: restricted Fmax (MHz)} of a `<build_name>.sta.rpt`, the worst of every corner."""
+    fmax = {}
+    for _, restricted, clock in re.findall(r";\s*([\d.]+) MHz\s*;\s*([\d.]+) MHz\s*;\s*(\S+)\s*;", text):
+        fmax[clock] = min(fmax.get(clock, float("inf")), float(restricted))
+    return fmax
+
+TrialResult = namedtuple("TrialResult", ["trial", "directory", "returncode", "slacks", "fmax", "seconds", "reused"])
+
+def worst_setup_slack(result):
+    setup = [s.slack for s in result.slacks if "Setup" in s.type]
+    return min(setup) if setup else None
+
+def best_result(results, clock="sys_clk"):
+    """Successful result with the best Fmax of `clock` (then the best setup slack), or None."""
+    def score(r):
+        slack = worst_setup_slack(r)
+        return (r.fmax.get(clock, float("-inf")), float("-inf") if slack is None else slack)
+    ok = [r for r in results if r.returncode == 0 and (r.fmax or r.slacks)]
+    return max(ok, key=score, default=None)
+
+def format_results(results, clock="sys_clk"):
+    best  = best_result(results, clock)
+    lines = ["{:<28} {:>6} {:>11} {:>11} {:>9}".format("Trial", "Status", "Fmax (MHz)", "Setup slack", "Time (s)")]
+    for r in results:
+        status = "reused" if r.reused else ("ok" if r.returncode == 0 else f"err {r.returncode}")
+        slack  = worst_setup_slack(r)
+        lines.append("{:<28} {:>6} {:>11} {:>11} {:>9.1f}{}".format(r.trial.name, status,
+            "-" if clock not in r.fmax else f"{r.fmax[clock]:.2f}",
+            "-" if slack is None else f"{slack:.3f}",
+            r.seconds, "  <- best" if r is best else ""))
+    return "\n".join(lines)
+
+# Runner -------------------------------------------------------------------------------------------
+
+stamp_file = "pcie_mitm_trial.hash"
+
+# Files of a compiled trial copied back to the gateware directory.
+result_suffixes = (".sof", ".rbf", ".svf", ".sta.rpt", ".sta.summary", ".fit.summary", ".fit.rpt")
+
+class QuartusRunner:
+    """Parallel Quartus compiles of the project LiteX generated in `gateware_dir`.
+
+    Each trial is compiled in its own persistent directory (`gateware_dir/trials/<name>`) with its
+    seed and settings appended to the .qsf, `jobs` at a time. The trial directories keep their
+    Quartus database: SMART_RECOMPILE skips the stages whose inputs did not change and
+    `rapid_recompile` reuses the previous placement and routing of the unchanged logic (LiteX
+    flattens the design into a single module, so there are no instances to make design
+    partitions of). A trial whose inputs are identical to its last successful compile is not run
+    again. `quartus_bin` is prepended to the PATH, e.g. a stub_toolchain.
+    """
+    def __init__(self, gateware_dir, build_name, jobs=None, rapid_recompile=False, quartus_bin=None):
+        self.gateware_dir    = os.path.abspath(gateware_dir)
+        self.build_name      = build_name
+        self.jobs            = jobs or os.cpu_count()
+        self.rapid_recompile = rapid_recompile
+        self.quartus_bin     = quartus_bin
+
+    def trial_dir(self, trial):
+        return os.path.join(self.gateware_dir, "trials", trial.name)
+
+    def _qsf(self, trial, threads):
+        with open(os.path.join(self.gateware_dir, f"{self.build_name}.qsf")) as f:
+            qsf = f.read()
+        qsf += f"\n# Trial {trial.name}\n"
+        settings = {"SEED": trial.seed, "SMART_RECOMPILE": "ON", "NUM_PARALLEL_PROCESSORS": threads}
+        settings.update(trial.settings)
+        for name, value in settings.items():
+            qsf += f"set_global_assignment -name {name} {value}\n"
+        return qsf
+
+    def _script(self):
+        with open(os.path.join(self.gateware_dir, f"build_{self.build_name}.sh")) as f:
+            script = f.read()
+        if self.rapid_recompile:
+            script = re.sub(r"^(quartus_(?:map|fit) .*)$", r"\1 --recompile=on", script, flags=re.M)
+        return script
+
+    def prepare(self, trial, threads=1):
+        """Update the project of `trial` (only the changed files), return the hash of its inputs."""
+        directory = self.trial_dir(trial)
+        os.makedirs(directory, exist_ok=True)
+        h = hashlib.sha256()
+        for f in sorted(os.listdir(self.gateware_dir)):
+            src = os.path.join(self.gateware_dir, f)
+            if not f.endswith(generated_suffixes) or not os.path.isfile(src) or f.endswith((".qsf", ".sh")):
+                continue
+            copy_if_changed(src, os.path.join(directory, f))
+            with open(src, "rb") as fd:
+                h.update(f.encode() + b"\0" + fd.read() + b"\0")
+        for name, contents in [(f"{self.build_name}.qsf", self._qsf(trial, threads)),
+                               (f"build_{self.build_name}.sh", self._script())]:
+            filename = os.path.join(directory, name)
+            if not os.path.exists(filename) or open(filename).read() != contents:
+                with open(filename, "w") as f:
+                    f.write(contents)
+        # The number of threads of a compile doesn't change its results.
+        h.update(self._qsf(trial, 0).encode() + self._script().encode())
+        return h.hexdigest()
+
+    def _results(self, trial, returncode, seconds, reused):
+        directory = self.trial_dir(trial)
+        def read(suffix):
+            filename = os.path.join(directory, self.build_name + suffix)
+            if not os.path.exists(filename):
+                return ""
+            with open(filename, errors="replace") as f:
+                return f.read()
+        return TrialResult(trial, directory, returncode, parse_sta_summary(read(".sta.summary")),
+            parse_fmax(read(".sta.rpt")), seconds, reused)
+
+    def run_trial(self, trial, threads=1):
+        directory = self.trial_dir(trial)
+        digest    = self.prepare(trial, threads)
+        stamp     = os.path.join(directory, stamp_file)
+        start     = time.perf_counter()
+        if os.path.exists(stamp) and os.path.exists(os.path.join(directory, self.build_name + ".sof")):
+            with open(stamp) as f:
+                if f.read() == digest:
+                    return self._results(trial, 0, 0.0, True)
+        if os.path.exists(stamp):
+            os.remove(stamp)
+        env = dict(os.environ)
+        if self.quartus_bin is not None:
+            env["PATH"] = os.path.abspath(self.quartus_bin) + os.pathsep + env.get("PATH", "")
+        with open(os.path.join(directory, "build.log"), "w") as log:
+            r = subprocess.call(["bash", f"build_{self.build_name}.sh"], cwd=directory, env=env,
+                stdout=log, stderr=subprocess.STDOUT)
+        if r == 0:
+            with open(stamp, "w") as f:
+                f.write(digest)
+        return self._results(trial, r, time.perf_counter() - start, False)
+
+    def sweep(self, trials, clock="sys_clk"):
+        """Compile `trials` in parallel, copy the outputs of the best one to the gateware directory.
+
+        Returns `(results, best)` (best is None when every trial failed).
+        """
+        jobs    = max(1, min(self.jobs, len(trials)))
+        threads = max(1, (os.cpu_count() or 1)//jobs)
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(lambda t: self.run_trial(t, threads), trials))
+        best = best_result(results, clock)
+        if best is not None:
+            for suffix in result_suffixes:
+                src = os.path.join(best.directory, self.build_name + suffix)
+                if os.path.exists(src):
+                    shutil.copyfile(src, os.path.join(self.gateware_dir, self.build_name + suffix))
+        return results, best
+
+# Stub Toolchain -----------------------------------------------------------------------------------
+
+# Emulates the Quartus command line tools used by the LiteX build script: every call is logged to
+# quartus_stub.log, quartus_asm writes an empty .sof and quartus_sta reports an Fmax derived from
+# a hash of the .qsf (so of the seed and settings) around the clocks of the .sdc.
+_stub_tool = """#!{python}
+import hashlib, os, re, sys
+tool = os.path.basename(sys.argv[0])
+args = [a for a in sys.argv[1:] if not a.startswith("-")]
+with open("quartus_stub.log", "a") as f:
+    f.write(" ".join([tool] + sys.argv[1:]) + "\\n")
+fail = os.environ.get("QUARTUS_STUB_FAIL")
+if fail and tool != "quartus_cpf" and fail in open(args[-1] + ".qsf").read().splitlines():
+    sys.exit(1)
+if tool == "quartus_asm":
+    open(args[-1] + ".sof", "w").close()
+if tool == "quartus_sta":
+    name  = args[-1]
+    qsf   = open(name + ".qsf").read()
+    sdc   = open(name + ".sdc").read() if os.path.exists(name + ".sdc") else ""
+    clocks = re.findall(r"create_clock -name (\\S+) -period ([\\d.]+)", sdc) or [("sys_clk", "{period}")]
+    summary, fmax = "", ""
+    for clock, period in clocks:
+        h     = int(hashlib.sha256((qsf + clock).encode()).hexdigest(), 16)
+        f_mhz = 1e3/float(period)*(0.85 + (h % 300)/1000)
+        slack = float(period) - 1e3/f_mhz
+        summary += "Type  : Slow 1100mV 85C Model Setup '%s'\\nSlack : %.3f\\nTNS   : %.3f\\n\\n" % (clock, slack, min(slack, 0))
+        fmax    += "; %.2f MHz ; %.2f MHz ; %s ;      ;\\n" % (f_mhz, f_mhz, clock)
+    open(name + ".sta.summary", "w").write(summary)
+    open(name + ".sta.rpt", "w").write("; Slow 1100mV 85C Model Fmax Summary ;\\n" + fmax)
+"""
+
+stub_tools = ["quartus_map", "quartus_syn", "quartus_fit", "quartus_asm", "quartus_sta", "quartus_cpf"]
+
+def stub_toolchain(bin_dir, period=6.667):
+    """Write stub Quartus tools to `bin_dir` (see QuartusRunner's `quartus_bin`).
+
+    A trial whose .qsf contains the line in $QUARTUS_STUB_FAIL fails.
+    """
+    os.makedirs(bin_dir, exist_ok=True)
+    for tool in stub_tools:
+        filename = os.path.join(bin_dir, tool)
+        with open(filename, "w") as f:
+            f.write(_stub_tool.format(python=sys.executable, period=period))
+        os.chmod(filename, os.stat(filename).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return bin_dir
@@ -0,0 +1,183 @@
+import csv
+import os
+import sys
+import time
+
+from litescope.software.dump.common import *
+from litescope.software.dump import *
+
+from pcie_mitm.host.compress import decode_records, expand_changes, write_vcd
+
+
+# DRAM Capture Driver ------------------------------------------------------------------------------
+
+class DRAMCaptureDriver:
+    """Host side of pcie_mitm.ip.capture.DRAMCapture.
+
+    `bus` is a litex RemoteClient (Etherbone/JTAGbone through litex_server). The capture window is
+    pulled out of main_ram with multi-word reads instead of one register access per word.
+    """
+    max_burst = 192 # 32-bit words per Etherbone record.
+
+    def __init__(self, bus, name="capture", config_csv=None, debug=False):
+        self.bus        = bus
+        self.name       = name
+        self.config_csv = config_csv
+        if self.config_csv is None:
+            self.config_csv = name + ".csv"
+        self.debug = debug
+        self.timestamp_width = 0
+        self.get_config()
+        self.get_layout()
+        self.build()
+        self.data    = DumpData(self.data_width)
+        self.changes = None
+        self.pre     = 0
+        self.post = 0
+
+    def get_config(self):
+        with open(self.config_csv) as f:
+            for t, g, n, v in csv.reader(f, delimiter=",", quotechar="#"):
+                if t == "config":
+                    setattr(self, n, int(v))
+
+    def get_layout(self):
+        self.layout = []
+        with open(self.config_csv) as f:
+            for t, g, n, v in csv.reader(f, delimiter=",", quotechar="#"):
+                if t == "signal":
+                    self.layout.append((n, int(v)))
+
+    def build(self):
+        for key, value in self.bus.regs.d.items():
+            if self.name == key[:len(self.name)]:
+                key = key.replace(self.name + "_", "")
+                setattr(self, key, value)
+        offset = 0
+        for name, length in self.layout:
+            setattr(self, name + "_o", 1 << offset)
+            setattr(self, name + "_m", (2**length - 1) << offset)
+            offset += length
+        self.dram_base = self.bus.mems.main_ram.base
+
+    def configure_trigger(self, value=0, mask=0):
+        self.trigger_value.write(value)
+        self.trigger_mask.write(mask)
+
+    def add_trigger(self, name, value):
+        mask  = getattr(self, name + "_m")
+        value = (value*getattr(self, name + "_o")) & mask
+        self.configure_trigger(value, mask)
+
+    def run(self, pre=0, post=None):
+        if post is None:
+            post = self.samples//2
+        # The ring also holds the padding of the last DRAM word.
+        pre = min(pre, self.samples - post - self.ratio)
+        assert pre >= 0, "capture window larger than the DRAM ring"
+        self.pre  = pre
+        self.post = post
+        if self.debug:
+            print(f"[running] pre={pre} post={post}...")
+        self.pre_length.write(pre)
+        self.post_length.write(post)
+        self.arm.write(1)
+
+    @property
+    def ratio(self):
+        return self.word_width//self.sample_width
+
+    def done(self):
+        return self.status.read() & 0b1
+
+    def wait_done(self, poll=0.01):
+        while not self.done():
+            time.sleep(poll)
+
+    def _read_bytes(self, offset, length):
+        assert offset % 4 == 0 and length % 4 == 0
+        data  = bytearray()
+        addr  = self.dram_base + self.base + offset
+        words = length//4
+        done  = 0
+        while done < words:
+            n = min(words - done, self.max_burst)
+            for w in self.bus.read(addr + 4*done, length=n):
+                data += w.to_bytes(4, "little")
+            done += n
+            if self.debug:
+                sys.stdout.write(f"[{100*done//words:3d}%]\r")
+        if self.debug:
+            print("")
+        return bytes(data)
+
+    def upload(self):
+        sample_bytes  = self.sample_width//8
+        trigger_index = self.trigger_index.read()
+        count         = self.count.read()
+        overflow      = self.overflow.read()
+        if overflow and self.debug:
+            print(f"[warning] {overflow} samples dropped")
+        # Oldest sample still in the ring, clipped to what was actually written.
+        pre   = min(self.pre, trigger_index)
+        first = trigger_index - pre
+        n     = min(pre + 1 + self.post, count - first)
+        start = first % self.samples
+        self.offset = pre
+
+        # Read the window with word aligned accesses, splitting it at the end of the ring.
+        spans = [(start, min(n, self.samples - start))]
+        if spans[0][1] < n:
+            spans.append((0, n - spans[0][1]))
+        raw = bytearray()
+        for s, l in spans:
+            lo   = (s*sample_bytes) & ~3
+            hi   = ((s + l)*sample_bytes + 3) & ~3
+            data = self._read_bytes(lo, hi - lo)
+            skip = s*sample_bytes - lo
+            raw += data[skip:skip + l*sample_bytes]
+
+        mask    = 2**(self.timestamp_width + self.data_width) - 1
+        records = [int.from_bytes(raw[i*sample_bytes:(i + 1)*sample_bytes], "little") & mask
+            for i in range(n)]
+        if not self.timestamp_width:
+            self.data = DumpData(self.data_width)
+            self.data.extend(records)
+            return self.data
+
+        # Compressed capture: rebuild the per-cycle waveform from the change records.
+        self.changes, times = decode_records(records, self.timestamp_width)
+        self.offset = times[pre] if n > pre else 0
+        self.end    = times[-1] if times else 0
+        self.data   = expand_changes(self.changes, self.end, self.data_width)
+        return self.data
+
+    def save(self, filename, samplerate=None, flatten=False):
+        if samplerate is None:
+            samplerate = self.samplerate
+        if self.debug:
+            print("[writing to " + filename + "]...")
+        name, ext = os.path.splitext(filename)
+        if ext == ".vcd" and self.changes is not None and not flatten:
+            # Straight from the change records, without going through the expanded waveform.
+            write_vcd(filename, self.layout, self.changes, samplerate, trigger_time=self.offset)
+            return
+        if ext == ".vcd":
+            dump = VCDDump(samplerate=samplerate)
+        elif ext == ".csv":
+            dump = CSVDump()
+        elif ext == ".py":
+            dump = PythonDump()
+        elif ext == ".json":
+            dump = JSONDump()
+        elif ext == ".sr":
+            dump = SigrokDump(samplerate=samplerate)
+        else:
+            raise NotImplementedError
+        if not flatten:
+            dump.add_from_layout(self.layout, self.data)
+        else:
+            dump.add_from_layout_flatten(self.layout, self.data)
+        dump.add_scope_clk()
+        dump.add_scope_trig(self.offset)
+        dump.write(filename)
@@ -0,0 +1,99 @@
+from litescope.software.dump.common import DumpData
+
+
+# Change Records -----------------------------------------------------------------------------------
+
+def record_times(records, timestamp_width):
+    """Absolute time (in samples, first record at 0) of each ChangeEncoder record."""
+    delta_mask = 2**timestamp_width - 1
+    times      = []
+    time       = 0
+    for i, record in enumerate(records):
+        if i:
+            time += record & delta_mask
+        times.append(time)
+    return times
+
+def decode_records(records, timestamp_width):
+    """Turn ChangeEncoder records into `(time, value)` changes and the per-record times.
+
+    Records whose value did not change (delta overflow keepalives) produce no change.
+    """
+    times   = record_times(records, timestamp_width)
+    changes = []
+    last    = None
+    for time, record in zip(times, records):
+        value = record >> timestamp_width
+        if value != last:
+            changes.append((time, value))
+            last = value
+    return changes, times
+
+def expand_changes(changes, end, width):
+    """Rebuild one value per sample from `(time, value)` changes, up to and including `end`."""
+    data = DumpData(width)
+    for (time, value), (next_time, _) in zip(changes, changes[1:] + [(end + 1, None)]):
+        data.extend([value]*(next_time - time))
+    return data
+
+# VCD ----------------------------------------------------------------------------------------------
+
+def _vcd_codes():
+    n = 0
+    while True:
+        code = ""
+        i = n
+        while True:
+            code += chr(33 + i % 94)
+            i //= 94
+            if not i:
+                break
+        yield code
+        n += 1
+
+def write_vcd(filename, layout, changes, samplerate, trigger_time=None, timescale="1ps"):
+    """Write `(time, value)` changes of a packed `layout` as VCD, one entry per changed field.
+
+    Unlike the LiteScope dumps this never expands idle cycles, so the file size follows the
+    number of changes, not the capture duration.
+    """
+    period = int(1e12/samplerate) # in ps.
+    codes  = _vcd_codes()
+    fields = []
+    offset = 0
+    for name, width in layout:
+        fields.append((name, width, offset, next(codes)))
+        offset += width
+    trig_code = next(codes)
+
+    def fmt(value, width, code):
+        if width == 1:
+            return f"{value}{code}\n"
+        return f"b{value:b} {code}\n"
+
+    with open(filename, "w") as f:
+        f.write(f"$timescale {timescale} $end\n")
+        f.write("$scope module dump $end\n")
+        for name, width, offset, code in fields:
+            f.write(f"$var wire {width} {code} {name} $end\n")
+        f.write(f"$var wire 1 {trig_code} scope_trig $end\n")
+        f.write("$upscope $end\n")
+        f.write("$enddefinitions $end\n")
+        f.write(f"$dumpvars\n0{trig_code}\n$end\n")
+        last = None
+        trig = trigger_time
+        for time, value in changes:
+            if trig is not None and trig < time:
+                f.write(f"#{trig*period}\n1{trig_code}\n")
+                trig = None
+            f.write(f"#{time*period}\n")
+            if trig == time:
+                f.write(f"1{trig_code}\n")
+                trig = None
+            for name, width, offset, code in fields:
+                v = (value >> offset) & (2**width - 1)
+                if last is None or v != ((last >> offset) & (2**width - 1)):
+                    f.write(fmt(v, width, code))
+            last = value
+        if trig is not None:
+            f.write(f"#{trig*period}\n1{trig_code}\n")
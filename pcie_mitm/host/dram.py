@@ -0,0 +1,130 @@
+import time
+from collections import namedtuple
+
+
+# Patterns -----------------------------------------------------------------------------------------
+
+# BIST bandwidth patterns: name -> (mode, random addresses). Random addresses are an LFSR wrapped to
+# the tested range, so they repeat: only the sequential reads are checked for errors.
+bandwidth_patterns = {
+    "seq_write":  ("write", False),
+    "seq_read":   ("read",  False),
+    "rand_write": ("write", True),
+    "rand_read":  ("read",  True),
+}
+
+def latency_patterns(words_per_row, nbanks):
+    """Read latency patterns: name -> address stride (port words), ROW_BANK_COL address mapping."""
+    return {
+        "page_hit":  1,                     # Same row, column after column.
+        "bank_miss": words_per_row,         # Next bank, its row is closed.
+        "row_miss":  words_per_row*nbanks,  # Same bank, next row: precharge + activate.
+    }
+
+BandwidthResult = namedtuple("BandwidthResult", ["pattern", "bytes", "cycles", "errors", "bandwidth"])
+LatencyResult   = namedtuple("LatencyResult",   ["pattern", "count", "min", "max", "mean"])
+
+def bandwidth(nbytes, cycles, clk_freq):
+    """Bytes/s of `nbytes` transferred in `cycles` cycles of `clk_freq`."""
+    return nbytes*clk_freq/max(cycles, 1)
+
+def format_results(results, clk_freq):
+    lines = []
+    for r in results:
+        if isinstance(r, BandwidthResult):
+            lines.append("{:<12} {:>10} bytes {:>10} cycles {:>9.1f} MB/s {:>6} errors".format(
+                r.pattern, r.bytes, r.cycles, r.bandwidth/1e6, r.errors))
+        else:
+            lines.append("{:<12} {:>10} reads  latency min {} max {} mean {:.1f} cycles ({:.1f} ns)".format(
+                r.pattern, r.count, r.min, r.max, r.mean, 1e9*r.mean/clk_freq))
+    return "\n".join(lines)
+
+# Driver -------------------------------------------------------------------------------------------
+
+class DRAMBenchmarkDriver:
+    """Host side of pcie_mitm.ip.dram.DRAMBenchmark.
+
+    `bus` is a litex RemoteClient (board or Verilator simulation). Lengths and bases are in bytes,
+    `data_width` is the width of the benchmark ports (DRAM controller words).
+    """
+    def __init__(self, bus, name="dram_bench", clk_freq=None, data_width=256, words_per_row=256, nbanks=8):
+        self.bus           = bus
+        self.name          = name
+        self.clk_freq      = clk_freq or bus.constants.config_clock_frequency
+        self.data_width    = data_width
+        self.words_per_row = words_per_row
+        self.nbanks        = nbanks
+
+    def reg(self, name):
+        return self.bus.regs.d[f"{self.name}_{name}"]
+
+    def _wait(self, reg, timeout):
+        start = time.time()
+        while not reg.read():
+            if time.time() - start > timeout:
+                raise TimeoutError(f"{reg.name} not done after {timeout}s")
+
+    def bist(self, mode, random=False, base=0, length=1024*1024, timeout=10.0):
+        """(cycles, errors) of a BIST write (generator) or read (checker) of `length` bytes.
+
+        With `random` addresses, the range (`length`) must be a power of 2.
+        """
+        core = "generator" if mode == "write" else "checker"
+        self.reg(f"{core}_reset").write(1)
+        self.reg(f"{core}_reset").write(0)
+        self.reg(f"{core}_base").write(base)
+        self.reg(f"{core}_end").write(base + length)
+        self.reg(f"{core}_length").write(length)
+        self.reg(f"{core}_random").write(int(random) << 1)
+        self.reg(f"{core}_start").write(1)
+        self._wait(self.reg(f"{core}_done"), timeout)
+        errors = self.reg("checker_errors").read() if mode == "read" else 0
+        return self.reg(f"{core}_ticks").read(), errors
+
+    def latency(self, stride=1, count=256, base=0, timeout=10.0):
+        """(min, max, mean) read latency in cycles of `count` reads `stride` words apart."""
+        self.reg("latency_base").write(base//(self.data_width//8))
+        self.reg("latency_stride").write(stride)
+        self.reg("latency_count").write(count)
+        self.reg("latency_start").write(1)
+        self._wait(self.reg("latency_done"), timeout)
+        total = self.reg("latency_sum").read()
+        return self.reg("latency_min").read(), self.reg("latency_max").read(), total/count
+
+    def run(self, length=1024*1024, base=0, count=256):
+        """[BandwidthResult] of bandwidth_patterns then [LatencyResult] of latency_patterns."""
+        results = []
+        for pattern, (mode, random) in bandwidth_patterns.items():
+            cycles, errors = self.bist(mode, random, base, length)
+            results.append(BandwidthResult(pattern, length, cycles, 0 if random else errors,
+                bandwidth(length, cycles, self.clk_freq)))
+        for pattern, stride in latency_patterns(self.words_per_row, self.nbanks).items():
+            results.append(LatencyResult(pattern, count, *self.latency(stride, count, base)))
+        return results
+
+def main():
+    import argparse
+    from litex import RemoteClient
+    parser = argparse.ArgumentParser(description="DRAM bandwidth/latency benchmark through litex_server.")
+    parser.add_argument("--csr-csv",       default="csr.csv",  help="CSR configuration file.")
+    parser.add_argument("--port",          default=1234,       type=int, help="litex_server port.")
+    parser.add_argument("--length",        default=16*1024*1024, type=int, help="Bytes of each bandwidth pattern (power of 2).")
+    parser.add_argument("--base",          default=0,          type=int, help="Base (bytes) in the DRAM.")
+    parser.add_argument("--count",         default=256,        type=int, help="Reads of each latency pattern.")
+    parser.add_argument("--data-width",    default=256,        type=int, help="Benchmark port width (DRAM controller word).")
+    parser.add_argument("--words-per-row", default=256,        type=int, help="Controller words per DRAM row.")
+    parser.add_argument("--nbanks",        default=8,          type=int, help="DRAM banks.")
+    args = parser.parse_args()
+
+    bus = RemoteClient(csr_csv=args.csr_csv, port=args.port)
+    bus.open()
+    try:
+        driver  = DRAMBenchmarkDriver(bus, data_width=args.data_width, words_per_row=args.words_per_row,
+            nbanks=args.nbanks)
+        results = driver.run(args.length, args.base, args.count)
+        print(format_results(results, driver.clk_freq))
+    finally:
+        bus.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+import asyncio
+from collections import namedtuple
+
+import numpy as np
+
+from pcie_mitm.host.fuzz import beats_to_words, pack_corpus
+from pcie_mitm.host.tlp import decode_headers, tlp_record_dtype
+from pcie_mitm.ip.emulation import cpl_status
+from pcie_mitm.ip.tlp import fmt_type_dict, tlp_record_width
+
+
+# Config Space -------------------------------------------------------------------------------------
+
+def type0_config_space(vendor_id, device_id, class_code, revision=0, subsystem_vendor_id=0,
+    subsystem_id=0, bars=(), interrupt_pin=0, config_dws=1024):
+    """(data, write mask) DWs of a Type 0 config space with a PCI Express capability at 0x40.
+
+    `bars` are the sizes of 32-bit memory BARs (None: unused); the write masks make BAR sizing
+    work and keep the identification registers read-only.
+    """
+    data = [0]*config_dws
+    mask = [0]*config_dws
+    data[0]  = (device_id << 16) | vendor_id
+    data[1]  = 0x0010 << 16 # Status: capabilities list.
+    mask[1]  = 0x0546       # Command: memory space, bus master, parity/SERR# response, INTx disable.
+    data[2]  = (class_code << 8) | revision
+    mask[3]  = 0xff         # Cache line size.
+    for i, size in enumerate(bars):
+        if size:
+            assert size >= 16 and size & (size - 1) == 0
+            mask[4 + i] = ~(size - 1) & 0xffff_fff0
+    data[11] = (subsystem_id << 16) | subsystem_vendor_id
+    data[13] = 0x40         # Capabilities pointer.
+    data[15] = interrupt_pin << 8
+    mask[15] = 0xff         # Interrupt line.
+    # PCI Express capability v2, endpoint, 128B MPS, x1 2.5GT/s.
+    data[16] = 0x0002_0010
+    mask[18] = 0x7fff       # Device control.
+    data[19] = 0x0000_0011
+    data[20] = 0x0011 << 16
+    return data, mask
+
+# Completions --------------------------------------------------------------------------------------
+
+def read_byte_count(length, first_be, last_be):
+    """Byte count of a read of `length` DWs (also the Byte Count of its first completion)."""
+    lead  = ((first_be & -first_be).bit_length() - 1) if first_be else 0
+    if length == 1:
+        return (first_be.bit_length() - lead) if first_be else 1
+    trail = (4 - last_be.bit_length()) if last_be else 0
+    return 4*length - lead - trail
+
+def read_lower_address(address, first_be):
+    lead = ((first_be & -first_be).bit_length() - 1) if first_be else 0
+    return (address & 0x7c) | lead
+
+def make_completion(requester_id, tag, completer_id=0, datas=None, status="sc", byte_count=None,
+    lower_address=0):
+    """DWs of a completion (CplD when `datas` is given)."""
+    datas    = list(datas or [])
+    fmt_type = fmt_type_dict["cpld" if datas else "cpl"]
+    if byte_count is None:
+        byte_count = 4*len(datas) if datas else 4
+    dw0 = (fmt_type << 24) | (len(datas) & 0x3ff)
+    dw1 = (completer_id << 16) | (cpl_status[status] << 13) | (byte_count & 0xfff)
+    dw2 = (requester_id << 16) | (tag << 8) | (lower_address & 0x7f)
+    return [dw0, dw1, dw2] + datas
+
+# Trapped Requests ---------------------------------------------------------------------------------
+
+_fmt_type_names = {v: k for k, v in fmt_type_dict.items()}
+
+TrappedRequest = namedtuple("TrappedRequest", ["kind", "requester_id", "tag", "address", "bar",
+    "offset", "length", "first_be", "last_be", "datas", "truncated", "header", "timestamp"])
+
+def decode_trap_record(value, payload_dws=8, bar_masks=()):
+    """TrappedRequest of a DeviceEmulator trap record (as an integer).
+
+    `offset` is the byte offset in the BAR (`address & bar_masks[bar]`), or the register byte
+    address for config requests, which have `bar` None and the target ID in `address` bits 16+.
+    """
+    dtype   = tlp_record_dtype(payload_dws)
+    records = np.frombuffer(value.to_bytes(tlp_record_width(payload_dws)//8, "little"), dtype)
+    f       = decode_headers(records)
+    hdr     = [int(dw) for dw in records["header"][0]]
+    kind    = _fmt_type_names.get(int(f["fmt_type"][0]), hex(f["fmt_type"][0]))
+    length  = (hdr[0] & 0x3ff) or 1024
+    if kind.startswith("cfg"):
+        bar     = None
+        address = hdr[2]
+        offset  = hdr[2] & 0xffc
+    else:
+        bar     = (int(f["bar"][0]) & -int(f["bar"][0])).bit_length() - 1
+        address = int(f["address"][0])
+        offset  = address & bar_masks[bar] if bar < len(bar_masks) else address
+    return TrappedRequest(
+        kind         = kind,
+        requester_id = int(f["requester_id"][0]),
+        tag          = int(f["tag"][0]),
+        address      = address,
+        bar          = bar,
+        offset       = offset,
+        length       = length,
+        first_be     = hdr[1] & 0xf,
+        last_be      = (hdr[1] >> 4) & 0xf,
+        datas        = [int(dw) for dw in records["payload"][0][:f["captured"][0]]],
+        truncated    = bool(f["truncated"][0]),
+        header       = hdr,
+        timestamp    = int(f["timestamp"][0]))
+
+def is_non_posted(request):
+    return not (request.kind.startswith("mwr") or request.kind.startswith("msg"))
+
+# Driver -------------------------------------------------------------------------------------------
+
+class DeviceEmulatorDriver:
+    """pcie_mitm.ip.emulation.DeviceEmulator through an EtherboneQueue/CSRMap.
+
+    The config space, BAR memory and response BRAMs are the `<name>_config`, `<name>_bar` and
+    `<name>_response` memory regions unless their bases are given.
+    """
+    def __init__(self, csrs, name="emulator", data_width=64, payload_dws=8, config_dws=1024, nbars=6,
+                 response_depth=256, config_base=None, bar_base=None, response_base=None):
+        self.csrs           = csrs
+        self.bus            = csrs.queue
+        self.name           = name
+        self.data_width     = data_width
+        self.payload_dws    = payload_dws
+        self.config_dws     = config_dws
+        self.response_depth = response_depth
+        mems = csrs.mems
+        self.config_base    = mems[f"{name}_config"][0]   if config_base   is None else config_base
+        self.bar_base       = mems.get(f"{name}_bar", (None,))[0] if bar_base is None else bar_base
+        self.response_base  = mems[f"{name}_response"][0] if response_base is None else response_base
+        self.bar_masks      = [0]*nbars
+        self.completer_id   = 0
+
+    def reg(self, name):
+        return self.csrs.regs[f"{self.name}_{name}"]
+
+    # Configuration.
+
+    def load_config(self, data, mask):
+        self.bus.write(self.config_base, list(data))
+        self.bus.write(self.config_base + 4*self.config_dws, list(mask))
+
+    def write_bar_memory(self, address, datas):
+        """Write DWs at byte `address` of the BRAM BAR backing memory."""
+        self.bus.write(self.bar_base + address, list(datas))
+
+    def set_bar(self, n, size, base=0):
+        self.bar_masks[n] = size - 1
+        self.reg(f"bar{n}_mask").write(size - 1)
+        self.reg(f"bar{n}_base").write(base)
+
+    def set_trap(self, n, low, high, bars=None, config=False, reads=True, writes=True):
+        """Forward the accesses to byte offsets [low, high] of `bars` (or of the config space)."""
+        self.reg(f"trap{n}_bar_mask").write(sum(1 << bar for bar in (bars or [])))
+        self.reg(f"trap{n}_low").write(low)
+        self.reg(f"trap{n}_high").write(high)
+        self.reg(f"trap{n}_ctrl").write(1 | (config << 1) | (reads << 2) | (writes << 3))
+
+    def clear_trap(self, n):
+        self.reg(f"trap{n}_ctrl").write(0)
+
+    # Request/response channel.
+
+    async def trapped(self):
+        """Pop every trapped request waiting in the FIFO, the records all in flight at once."""
+        self.completer_id, level = await asyncio.gather(
+            self.reg("completer_id").read(),
+            self.reg("trap_level").read())
+        record = self.reg("trap_record")
+        pop    = self.reg("trap_pop")
+        futures = []
+        for i in range(level):
+            # Queue futures directly so that reads and pops go out in order.
+            futures.append(self.bus.read(record.addr, record.length))
+            pop.write(1)
+        requests = []
+        for words in await asyncio.gather(*futures):
+            value = 0
+            for word in words:
+                value = (value << record.data_width) | word
+            requests.append(decode_trap_record(value, self.payload_dws, self.bar_masks))
+        return requests
+
+    def completion(self, request, result=None):
+        """Completion of a non-posted trapped request.
+
+        `result` is a status name, or the payload DWs of a read (a single completion: trapped
+        reads must not be larger than the Max Payload Size).
+        """
+        status = result if isinstance(result, str) else "sc"
+        if request.kind.startswith("cfg"):
+            completer_id, byte_count, lower_address = request.address >> 16, 4, 0
+        else:
+            completer_id  = self.completer_id
+            byte_count    = read_byte_count(request.length, request.first_be, request.last_be)
+            lower_address = read_lower_address(request.address, request.first_be)
+        datas = None
+        if status == "sc" and not (request.header[0] >> 30) & 1:
+            datas = list(result or [0]*request.length)
+        return make_completion(request.requester_id, request.tag, completer_id, datas, status,
+            byte_count, lower_address)
+
+    async def respond(self, completions):
+        """Send completions through the response injector, as many per run as fit in its BRAM."""
+        runs, run = [], []
+        for cpl in completions:
+            beats = pack_corpus([cpl], self.data_width)
+            if run and len(run) + len(beats) > self.response_depth:
+                runs.append(run)
+                run = []
+            run += beats
+        if run:
+            runs.append(run)
+        for beats in runs:
+            while await self.reg("response_busy").read():
+                pass
+            self.bus.write(self.response_base, beats_to_words(beats, self.data_width))
+            self.reg("response_offset").write(0)
+            self.reg("response_length").write(len(beats))
+            self.reg("response_repeat").write(1)
+            self.reg("response_start").write(1)
+
+    async def serve(self, handler, poll_interval=1e-3):
+        """Answer trapped requests with `await handler(request)` until cancelled.
+
+        The trap FIFO keeps being polled while the handler runs; the completions of the requests
+        handled together are sent in one injector run. Handler results of posted requests are
+        ignored.
+        """
+        queue = asyncio.Queue()
+
+        async def poll():
+            while True:
+                requests = await self.trapped()
+                for request in requests:
+                    queue.put_nowait(request)
+                if not requests:
+                    await asyncio.sleep(poll_interval)
+
+        poller = asyncio.ensure_future(poll())
+        try:
+            while True:
+                requests = [await queue.get()]
+                while not queue.empty():
+                    requests.append(queue.get_nowait())
+                completions = []
+                for request in requests:
+                    result = await handler(request)
+                    if is_non_posted(request):
+                        completions.append(self.completion(request, result))
+                if completions:
+                    await self.respond(completions)
+        finally:
+            poller.cancel()
@@ -0,0 +1,390 @@
+import asyncio
+import csv
+import struct
+from collections import deque
+
+
+# Etherbone Codec ----------------------------------------------------------------------------------
+
+# Same wire format as litex.tools.remote.etherbone, packed with struct instead of per-field
+# Header objects: encoding is on the critical path of every batch.
+
+etherbone_magic = 0x4e6f
+max_record_ops  = 255
+
+def encode_packet(records, addr_size=4):
+    """Encode `[(write_base, write_datas, read_base, read_addrs), ...]` into one Etherbone packet.
+
+    `read_base` is the base_ret_addr of the reads: the slave writes the read data back there, so it
+    comes back as the `write_base` of the reply record.
+    """
+    afmt = {1: "B", 2: "H", 4: "I", 8: "Q"}[addr_size]
+    ba   = bytearray(struct.pack(">HBB4x", etherbone_magic, 0x10, (addr_size << 4) | 4))
+    for base, datas, rbase, addrs in records:
+        ba += struct.pack(">BBBB", 0, 0x0f, len(datas), len(addrs))
+        if datas:
+            ba += struct.pack(f">{afmt}{len(datas)}I", base, *datas)
+        if addrs:
+            ba += struct.pack(f">{afmt}{len(addrs)}{afmt}", rbase, *addrs)
+    return bytes(ba)
+
+def decode_packet(data, addr_size=4):
+    """Decode an Etherbone packet into `[(write_base, write_datas, read_base, read_addrs), ...]`."""
+    afmt    = {1: "B", 2: "H", 4: "I", 8: "Q"}[addr_size]
+    records = []
+    offset  = 8
+    while offset < len(data):
+        wcount, rcount = data[offset + 2], data[offset + 3]
+        offset += 4
+        base, datas, rbase, addrs = 0, (), 0, ()
+        if wcount:
+            base, *datas = struct.unpack_from(f">{afmt}{wcount}I", data, offset)
+            offset += addr_size + 4*wcount
+        if rcount:
+            rbase, *addrs = struct.unpack_from(f">{afmt}{rcount}{afmt}", data, offset)
+            offset += addr_size*(rcount + 1)
+        records.append((base, list(datas), rbase, list(addrs)))
+    return records
+
+def record_length(wcount, rcount, addr_size=4):
+    n = 4
+    if wcount:
+        n += addr_size + 4*wcount
+    if rcount:
+        n += addr_size*(rcount + 1)
+    return n
+
+# Transports ---------------------------------------------------------------------------------------
+
+class UDPTransport(asyncio.DatagramProtocol):
+    """Etherbone straight to the FPGA (LiteEth Etherbone core).
+
+    The LiteEth core only handles the first record of a datagram, so each record goes in its own
+    datagram; throughput comes from having several datagrams in flight.
+    """
+    max_records = 1
+    max_bytes   = 1400
+
+    def __init__(self, host, port=1234):
+        self.host = host
+        self.port = port
+
+    async def open(self, on_packet):
+        self.on_packet = on_packet
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(lambda: self,
+            remote_addr=(self.host, self.port))
+
+    def datagram_received(self, data, addr):
+        self.on_packet(data)
+
+    def send(self, data):
+        self.transport.sendto(data)
+
+    def close(self):
+        self.transport.close()
+
+class ServerTransport:
+    """Etherbone through litex_server (JTAGbone, UARTbone, ...).
+
+    litex_server only handles the first record of a packet, so each record goes in its own
+    packet, but packets are streamed back-to-back without waiting for the previous reply. It does
+    not echo the base_ret_addr of the reads either; replies come back in order over TCP, so it is
+    restored here.
+    """
+    max_records = 1
+    max_bytes   = 2**16
+
+    def __init__(self, host="localhost", port=1234):
+        self.host = host
+        self.port = port
+
+    async def open(self, on_packet):
+        self.on_packet = on_packet
+        self.rbases    = deque() # read_base per record with reads.
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        # Newer litex_server versions greet with a "CommXXX:ip:port" string, older ones do not.
+        try:
+            info = await asyncio.wait_for(self.reader.read(128), 0.1)
+        except asyncio.TimeoutError:
+            info = b""
+        self.pending = bytearray() if info.startswith(b"Comm") else bytearray(info)
+        self.task = asyncio.ensure_future(self._receive())
+
+    async def _receive(self):
+        buf = self.pending
+        while True:
+            # Replies always hold a single record.
+            while len(buf) >= 12:
+                n = 8 + record_length(buf[10], buf[11])
+                if len(buf) < n:
+                    break
+                reply = bytearray(buf[:n])
+                del buf[:n]
+                if reply[10] and self.rbases:
+                    struct.pack_into(">I", reply, 12, self.rbases.popleft())
+                self.on_packet(bytes(reply))
+            chunk = await self.reader.read(65536)
+            if not chunk:
+                return
+            buf += chunk
+
+    def send(self, data):
+        for base, datas, rbase, addrs in decode_packet(data):
+            if addrs:
+                self.rbases.append(rbase)
+        self.writer.write(data)
+
+    def close(self):
+        self.task.cancel()
+        self.writer.close()
+
+class UARTboneTransport:
+    """UARTbone over TCP (LiteX sim serial2tcp module, ser2net, ...).
+
+    Records are translated to UARTbone commands: reads of consecutive addresses become one
+    incrementing burst, and read replies are handed back as Etherbone packets.
+    """
+    max_records = 1
+    max_bytes   = 2**16
+    max_write   = 8 # Words per write command, as in litex.tools.remote.comm_uart.
+
+    def __init__(self, host="localhost", port=2430):
+        self.host = host
+        self.port = port
+
+    async def open(self, on_packet):
+        self.on_packet = on_packet
+        self.expected  = deque() # (words, read_base) expected per record with reads.
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.task = asyncio.ensure_future(self._receive())
+
+    async def _receive(self):
+        buf = bytearray()
+        while True:
+            while self.expected and len(buf) >= 4*self.expected[0][0]:
+                n, rbase = self.expected.popleft()
+                datas = struct.unpack_from(f">{n}I", buf)
+                del buf[:4*n]
+                self.on_packet(encode_packet([(rbase, datas, 0, [])]))
+            chunk = await self.reader.read(65536)
+            if not chunk:
+                return
+            buf += chunk
+
+    def send(self, data):
+        cmds = bytearray()
+        for base, datas, rbase, addrs in decode_packet(data):
+            for i in range(0, len(datas), self.max_write):
+                chunk = datas[i:i + self.max_write]
+                cmds += struct.pack(f">BBI{len(chunk)}I", 0x01, len(chunk), base//4 + i, *chunk)
+            if addrs:
+                start = 0
+                for i in range(1, len(addrs) + 1):
+                    if i == len(addrs) or addrs[i] != addrs[i - 1] + 4:
+                        cmds += struct.pack(">BBI", 0x02, i - start, addrs[start]//4)
+                        start = i
+                self.expected.append((len(addrs), rbase))
+        self.writer.write(bytes(cmds))
+
+    def close(self):
+        self.task.cancel()
+        self.writer.close()
+
+# Etherbone Queue ----------------------------------------------------------------------------------
+
+class EtherboneQueue:
+    """Queue of Etherbone accesses resolved asynchronously.
+
+    Accesses issued in the same event loop iteration (e.g. through `asyncio.gather`) are packed
+    into as few records/packets as possible and sent together. Each record with reads carries a
+    sequence tag as its base_ret_addr, which the slave echoes as the base of the reply: replies are
+    matched by tag, so a lost or late reply only fails its own reads. Writes are posted. Addresses
+    are byte addresses of 32-bit words.
+    """
+    def __init__(self, transport, timeout=2.0):
+        self.transport = transport
+        self.timeout   = timeout
+        self.ops       = []
+        self.inflight  = {} # Per tag of record with reads: [(future, first, length)].
+        self.tag       = 0
+        self.scheduled = False
+        self.packets   = 0
+
+    async def open(self):
+        await self.transport.open(self._on_packet)
+
+    def close(self):
+        self.transport.close()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.drain()
+        self.close()
+
+    def _schedule(self):
+        if not self.scheduled:
+            self.scheduled = True
+            asyncio.get_running_loop().call_soon(self.flush)
+
+    def write(self, addr, datas):
+        if not isinstance(datas, (list, tuple)):
+            datas = [datas]
+        self.ops.append(("w", addr, list(datas), None))
+        self._schedule()
+
+    def read(self, addr, length=1, burst="incr"):
+        """Return a future of the `length` words read at `addr` (same address if `burst="fixed"`)."""
+        future = asyncio.get_running_loop().create_future()
+        addrs  = [addr + 4*i*(burst == "incr") for i in range(length)]
+        self.ops.append(("r", addr, addrs, future))
+        self._schedule()
+        return future
+
+    async def read_memory(self, addr, length, burst="incr"):
+        """Read `length` words, with every record of the transfer in flight at once."""
+        futures = [self.read(addr + 4*i*(burst == "incr"), min(max_record_ops, length - i), burst)
+            for i in range(0, length, max_record_ops)]
+        datas = []
+        for chunk in await asyncio.gather(*futures):
+            datas += chunk
+        return datas
+
+    async def drain(self):
+        """Wait for every queued access, including posted writes, to be handled."""
+        # Reads complete in order after the writes queued before them.
+        await self.read(0)
+
+    def flush(self):
+        self.scheduled = False
+        records = [] # [base, datas, addrs, targets].
+        for kind, addr, values, future in self.ops:
+            r = records[-1] if records else None
+            if kind == "w":
+                for i in range(0, len(values), max_record_ops):
+                    chunk = values[i:i + max_record_ops]
+                    base  = addr + 4*i
+                    if (r is not None and not r[2] and r[1] and
+                        r[0] + 4*len(r[1]) == base and len(r[1]) + len(chunk) <= max_record_ops):
+                        r[1] += chunk
+                    else:
+                        r = [base, chunk, [], []]
+                        records.append(r)
+            else:
+                if r is None or len(r[2]) + len(values) > max_record_ops:
+                    r = [0, [], [], []]
+                    records.append(r)
+                r[3].append((future, len(r[2]), len(values)))
+                r[2] += values
+        self.ops = []
+
+        # Pack records into packets.
+        packet, size = [], 8
+        for base, datas, addrs, targets in records:
+            n = record_length(len(datas), len(addrs))
+            if packet and (len(packet) >= self.transport.max_records or
+                           size + n > self.transport.max_bytes):
+                self._send(packet)
+                packet, size = [], 8
+            packet.append((base, datas, addrs, targets))
+            size += n
+        if packet:
+            self._send(packet)
+
+    def _send(self, records):
+        encoded, tags = [], []
+        for base, datas, addrs, targets in records:
+            tag = 0
+            if addrs:
+                tag = self.tag
+                self.tag = (self.tag + 1) % 2**32
+                self.inflight[tag] = targets
+                tags.append(tag)
+            encoded.append((base, datas, tag, addrs))
+        self.transport.send(encode_packet(encoded))
+        self.packets += 1
+        if self.timeout is not None and tags:
+            asyncio.get_running_loop().call_later(self.timeout, self._expire, tags)
+
+    def _expire(self, tags):
+        for tag in tags:
+            for future, first, length in self.inflight.pop(tag, []):
+                if not future.done():
+                    future.set_exception(TimeoutError("Etherbone read timeout"))
+
+    def _on_packet(self, data):
+        for base, datas, rbase, addrs in decode_packet(data):
+            if not datas or base not in self.inflight:
+                continue
+            for future, first, length in self.inflight.pop(base):
+                if not future.done():
+                    future.set_result(datas[first:first + length])
+
+# CSR Map ------------------------------------------------------------------------------------------
+
+class AsyncCSRRegister:
+    def __init__(self, queue, name, addr, length, data_width, mode):
+        self.queue      = queue
+        self.name       = name
+        self.addr       = addr
+        self.length     = length
+        self.data_width = data_width
+        self.mode       = mode
+
+    async def read(self):
+        datas = await self.queue.read(self.addr, self.length)
+        value = 0
+        for data in datas:
+            value = (value << self.data_width) | (data & (2**self.data_width - 1))
+        return value
+
+    def write(self, value):
+        if self.mode not in ["rw", "wo"]:
+            raise KeyError(self.name + " register not writable")
+        datas = []
+        for i in range(self.length):
+            datas.insert(0, value & (2**self.data_width - 1))
+            value >>= self.data_width
+        self.queue.write(self.addr, datas)
+
+class CSRMap:
+    """csr.csv map (registers, constants, memory regions) on top of an EtherboneQueue."""
+    def __init__(self, queue, csr_csv="csr.csv", csr_data_width=None):
+        self.queue     = queue
+        self.regs      = {}
+        self.constants = {}
+        self.mems      = {}
+        self.bases     = {}
+        with open(csr_csv) as f:
+            items = [row for row in csv.reader(f, delimiter=",") if row and not row[0].startswith("#")]
+        for row in items:
+            if row[0] == "constant":
+                try:
+                    self.constants[row[1]] = int(row[2], 0)
+                except ValueError:
+                    self.constants[row[1]] = row[2]
+        if csr_data_width is None:
+            csr_data_width = self.constants.get("config_csr_data_width", 32)
+        for row in items:
+            if row[0] == "csr_base":
+                self.bases[row[1]] = int(row[2], 0)
+            elif row[0] == "csr_register":
+                self.regs[row[1]] = AsyncCSRRegister(queue, row[1], int(row[2], 0), int(row[3]),
+                    csr_data_width, row[4])
+            elif row[0] == "memory_region":
+                self.mems[row[1]] = (int(row[2], 0), int(row[3], 0))
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["regs"][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    async def dump(self, prefix=""):
+        """Read every register matching `prefix`, all in flight at once."""
+        regs   = [r for n, r in self.regs.items() if n.startswith(prefix)]
+        values = await asyncio.gather(*[r.read() for r in regs])
+        return {r.name: v for r, v in zip(regs, values)}
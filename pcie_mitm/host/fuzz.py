@@ -0,0 +1,244 @@
+import asyncio
+import math
+import random
+from collections import namedtuple
+
+from pcie_mitm.ip.fuzz import mutation_ops
+
+
+# Corpus -------------------------------------------------------------------------------------------
+
+def pack_corpus(tlps, data_width=64):
+    """Pack TLPs (lists of DWs) into `data_width` beats, each TLP starting on a beat."""
+    lanes = data_width//32
+    beats = []
+    for dws in tlps:
+        dws = list(dws) + [0]*(-len(dws) % lanes)
+        for i in range(0, len(dws), lanes):
+            beats.append(sum(dw << 32*j for j, dw in enumerate(dws[i:i + lanes])))
+    return beats
+
+def beats_to_words(beats, data_width=64):
+    """32-bit bus words of corpus beats (little-endian, as split by the Wishbone converter)."""
+    return [(beat >> 32*j) & 0xffffffff for beat in beats for j in range(data_width//32)]
+
+# Mutations ----------------------------------------------------------------------------------------
+
+Mutation = namedtuple("Mutation", ["index", "mask", "value", "op"])
+
+def flip_bits(index, mask):
+    return Mutation(index, mask, 0, "xor")
+
+def overwrite(index, mask, value):
+    return Mutation(index, mask, value, "set")
+
+def random_bits(index, mask=0xffffffff):
+    return Mutation(index, mask, 0, "random")
+
+def corrupt_length(delta=None):
+    """Length field (DW0[9:0]): random, or shifted by `delta` DWs."""
+    if delta is None:
+        return random_bits(0, 0x3ff)
+    return Mutation(0, 0x3ff, delta & 0x3ff, "add")
+
+def corrupt_tag():
+    return random_bits(1, 0xff00)
+
+def corrupt_fmt_type():
+    return random_bits(0, 0xff000000)
+
+def corrupt_byte_enables():
+    return random_bits(1, 0xff)
+
+def random_mutation(rng, max_dws=16):
+    """A random mutation of a header field or a payload DW."""
+    return rng.choice([
+        lambda: corrupt_length(),
+        lambda: corrupt_length(rng.choice([-1, 1, 2, -2])),
+        lambda: corrupt_tag(),
+        lambda: corrupt_fmt_type(),
+        lambda: corrupt_byte_enables(),
+        lambda: flip_bits(rng.randrange(max_dws), 1 << rng.randrange(32)),
+        lambda: random_bits(rng.randrange(2, max_dws)),
+        lambda: overwrite(rng.randrange(2, 4), 0xffffffff, rng.choice([0, 0xffffffff, 0xfffffffc, 0x80000000])),
+    ])()
+
+def mutate_tlp(dws, mutations, random_word=lambda: random.getrandbits(32)):
+    """Reference model of the TLPMutator slots on a TLP (list of DWs)."""
+    dws = list(dws)
+    for m in mutations:
+        if m.index >= len(dws):
+            continue
+        dw = dws[m.index]
+        if m.op == "set":
+            dw = (dw & ~m.mask) | (m.value & m.mask)
+        elif m.op == "xor":
+            dw ^= m.mask
+        elif m.op == "random":
+            dw ^= random_word() & m.mask
+        else:
+            dw = (dw & ~m.mask) | ((dw + m.value) & m.mask)
+        dws[m.index] = dw & 0xffffffff
+    return dws
+
+# Driver -------------------------------------------------------------------------------------------
+
+class TLPFuzzerDriver:
+    """pcie_mitm.ip.fuzz.TLPFuzzer through an EtherboneQueue/CSRMap (BRAM corpus at `corpus_base`)."""
+    counters = ["np_sent", "cpl_sc", "cpl_ur", "cpl_crs", "cpl_ca", "timeouts"]
+
+    def __init__(self, csrs, name="fuzzer", corpus_base=None, data_width=64, corpus_depth=1024):
+        self.csrs         = csrs
+        self.bus          = csrs.queue
+        self.name         = name
+        self.data_width   = data_width
+        self.corpus_depth = corpus_depth
+        if corpus_base is None:
+            corpus_base = csrs.mems[name][0]
+        self.corpus_base  = corpus_base
+
+    def reg(self, name):
+        return self.csrs.regs[f"{self.name}_{name}"]
+
+    def load(self, offset, beats):
+        words = beats_to_words(beats, self.data_width)
+        self.bus.write(self.corpus_base + offset*self.data_width//8, words)
+
+    def set_mutations(self, mutations, probability=1.0, fmt_type=0, fmt_type_mask=0, link=False, injected=True):
+        slots = len([r for r in self.csrs.regs if r.startswith(f"{self.name}_mutator_slot") and r.endswith("_ctrl")])
+        assert len(mutations) <= slots
+        for i in range(slots):
+            prefix = f"mutator_slot{i}_"
+            if i < len(mutations):
+                m = mutations[i]
+                self.reg(prefix + "index").write(m.index)
+                self.reg(prefix + "mask").write(m.mask)
+                self.reg(prefix + "value").write(m.value)
+                self.reg(prefix + "ctrl").write(1 | (mutation_ops[m.op] << 1))
+            else:
+                self.reg(prefix + "ctrl").write(0)
+        self.reg("mutator_fmt_type_value").write(fmt_type)
+        self.reg("mutator_fmt_type_mask").write(fmt_type_mask)
+        self.reg("mutator_probability").write(min(0xffff, int(probability*0x10000)))
+        self.reg("mutator_ctrl").write(1 | (link << 1) | (injected << 2))
+
+    def start(self, offset, length, repeat=1):
+        self.reg("injector_offset").write(offset)
+        self.reg("injector_length").write(length)
+        self.reg("injector_repeat").write(repeat)
+        self.reg("injector_start").write(1)
+
+    async def busy(self):
+        return await self.reg("injector_busy").read()
+
+    async def read_counters(self):
+        values = await asyncio.gather(*[self.reg(c).read() for c in self.counters])
+        return dict(zip(self.counters, values))
+
+# Scheduler ----------------------------------------------------------------------------------------
+
+Entry = namedtuple("Entry", ["seeds", "mutations", "signature"])
+
+class FuzzScheduler:
+    """Coverage-guided scheduling of injector runs.
+
+    Each run replays a batch of seed TLPs under one set of mutations. Its feedback signature
+    (which completion statuses came back, whether requests timed out, coarse counts) is the
+    coverage: runs producing a new signature are kept in the queue and mutated further, runs
+    with timeouts or Completer Aborts are also recorded as findings. The corpus BRAM is used as
+    two halves: the next batch is uploaded while the current one is replayed, so the injector
+    does not wait for the host.
+    """
+    def __init__(self, driver, seeds, batch_size=8, repeat=16, max_mutations=2, rng_seed=0,
+                 poll_interval=0.001):
+        self.driver        = driver
+        self.seeds         = [list(s) for s in seeds]
+        self.batch_size    = batch_size
+        self.repeat        = repeat
+        self.max_mutations = max_mutations
+        self.rng           = random.Random(rng_seed)
+        self.poll_interval = poll_interval
+        self.half          = driver.corpus_depth//2
+        self.queue         = [Entry(tuple(range(len(self.seeds))), (), None)]
+        self.energy        = [1.0]
+        self.signatures    = set()
+        self.findings      = []
+        self.runs          = 0
+
+    def _pick(self):
+        i     = self.rng.choices(range(len(self.queue)), weights=self.energy)[0]
+        entry = self.queue[i]
+        seeds = list(entry.seeds)
+        self.rng.shuffle(seeds)
+        seeds = seeds[:self.batch_size]
+        if len(seeds) < self.batch_size:
+            seeds += self.rng.sample(range(len(self.seeds)), min(len(self.seeds), self.batch_size - len(seeds)))
+        mutations = list(entry.mutations)
+        if not mutations or self.rng.random() < 0.5:
+            mutations.append(random_mutation(self.rng))
+        mutations = mutations[-self.max_mutations:]
+        if self.rng.random() < 0.25:
+            mutations[self.rng.randrange(len(mutations))] = random_mutation(self.rng)
+        return tuple(seeds), tuple(mutations)
+
+    def _pack(self, seeds):
+        beats = []
+        for s in seeds:
+            tlp = pack_corpus([self.seeds[s]], self.driver.data_width)
+            if len(beats) + len(tlp) > self.half:
+                break
+            beats += tlp
+        return beats
+
+    @staticmethod
+    def signature(delta):
+        bucket = lambda n: 0 if n == 0 else 1 + int(math.log2(n))
+        return (
+            bucket(delta["cpl_ur"]),
+            bucket(delta["cpl_crs"]),
+            bucket(delta["cpl_ca"]),
+            bucket(delta["timeouts"]),
+            bucket(max(0, delta["np_sent"] - delta["cpl_sc"] - delta["cpl_ur"] - delta["cpl_crs"] - delta["cpl_ca"])),
+        )
+
+    def _feedback(self, seeds, mutations, delta):
+        self.runs += 1
+        sig = self.signature(delta)
+        if delta["timeouts"] or delta["cpl_ca"]:
+            self.findings.append({"seeds": seeds, "mutations": mutations, "delta": delta})
+        if sig not in self.signatures:
+            self.signatures.add(sig)
+            self.queue.append(Entry(seeds, mutations, sig))
+            self.energy.append(4.0)
+        else:
+            # Decay the entries that stopped finding anything new.
+            for i, entry in enumerate(self.queue):
+                if entry.signature == sig:
+                    self.energy[i] = max(0.1, self.energy[i]*0.9)
+
+    async def _wait(self):
+        while await self.driver.busy():
+            await asyncio.sleep(self.poll_interval)
+
+    async def run(self, runs):
+        half     = 0
+        previous = await self.driver.read_counters()
+        seeds, mutations = self._pick()
+        beats = self._pack(seeds)
+        self.driver.load(0, beats)
+        for i in range(runs):
+            offset = half*self.half
+            self.driver.set_mutations(mutations)
+            self.driver.start(offset, len(beats), self.repeat)
+            # Prepare and upload the next batch while this one runs.
+            next_seeds, next_mutations = self._pick()
+            next_beats = self._pack(next_seeds)
+            self.driver.load((1 - half)*self.half, next_beats)
+            await self._wait()
+            counters = await self.driver.read_counters()
+            delta    = {k: (counters[k] - previous[k]) & 0xffffffff for k in counters}
+            previous = counters
+            self._feedback(seeds, mutations, delta)
+            seeds, mutations, beats = next_seeds, next_mutations, next_beats
+            half = 1 - half
+        return self.findings
@@ -0,0 +1,179 @@
+import math
+from functools import lru_cache
+
+import numpy as np
+
+
+# Scalar -------------------------------------------------------------------------------------------
+
+def _ent_dec(buf):
+    """Get the entropy of a decimal byte-string [0-9]"""
+    freqs = [0] * 10
+    norm_buf = []
+    for b in buf:
+        if ord('0') <= b <= ord('9'):
+            norm_buf.append(b - ord('0'))
+        else:
+            raise ValueError(f"not a decimal digit: '{chr(b)}'")
+    for b in norm_buf:
+        freqs[b] += 1
+    num_bytes = len(norm_buf)
+    freqs = map(lambda cnt: cnt / num_bytes, freqs)
+    ent = 0
+    nsyms = 0
+    for freq in freqs:
+        if freq == 0:
+            continue
+        nsyms += 1
+        ent += freq * math.log2(freq)
+    if ent: # avoid -0.0
+        ent = -ent
+    return ent, nsyms
+
+def _ent_hex(buf):
+    """Get the entropy of a decimal byte-string [0-9a-z]"""
+    freqs = [0] * 16
+    norm_buf = []
+    if buf.startswith(b'0x'):
+        buf = buf[2:]
+    for b in buf:
+        if ord('0') <= b <= ord('9'):
+            norm_buf.append(b - ord('0'))
+        elif ord('a') <= b <= ord('f'):
+            norm_buf.append(b - ord('a') + 10)
+        else:
+            raise ValueError(f"not a hex digit: '{chr(b)}'")
+    for b in norm_buf:
+        freqs[b] += 1
+    num_bytes = len(norm_buf)
+    freqs = map(lambda cnt: cnt / num_bytes, freqs)
+    ent = 0
+    nsyms = 0
+    for freq in freqs:
+        if freq == 0:
+            continue
+        nsyms += 1
+        ent += freq * math.log2(freq)
+    if ent: # avoid -0.0
+        ent = -ent
+    return ent, nsyms
+
+def _is_pretty_base_hex(n):
+    if n < 0:
+        n = -n
+
+    if n == 0:
+        return False
+
+    if math.log10(n) == int(math.log10(n)):
+        return False
+    if math.log2(n) == int(math.log2(n)) and n >= 16:
+        return True
+
+    d = str(n).encode('utf8')
+    h = hex(n).encode('utf8')[2:]
+    dl, hl = len(d), len(h)
+    ed, nsymsd = _ent_dec(d)
+    eh, nsymsh = _ent_hex(h)
+    frac_unique_d = nsymsd / dl
+    frac_unique_h = nsymsh / hl
+
+    if frac_unique_d < frac_unique_h:
+        return False
+    elif frac_unique_h < frac_unique_d:
+        return True
+
+    if n < 1000:
+        return False
+
+    if ed < eh:
+        return False
+    elif eh < ed:
+        return True
+
+    return False
+
+@lru_cache(maxsize=1 << 16)
+def is_pretty_base_hex(n):
+    """True if `n` reads better in hex than in decimal (cached: BARs, sizes, ... repeat a lot)."""
+    return _is_pretty_base_hex(n)
+
+@lru_cache(maxsize=1 << 16)
+def smart_literal(n):
+    """`n` as a Python literal in its prettiest base."""
+    if is_pretty_base_hex(n):
+        return f"-0x{-n:x}" if n < 0 else f"0x{n:x}"
+    return f"{n:d}"
+
+# Batch --------------------------------------------------------------------------------------------
+
+# Entropy terms freq*log2(freq) for every (digit count, length): computed with math.log2 like the
+# scalar version so that the batch results are bit-identical, including entropy ties.
+_max_digits = 20
+_terms = np.zeros((_max_digits + 1, _max_digits + 1))
+for _length in range(1, _max_digits + 1):
+    for _count in range(1, _length + 1):
+        _freq = _count / _length
+        _terms[_length, _count] = _freq * math.log2(_freq)
+
+def _digit_stats(n, base, ndigits):
+    """Number of distinct digits and entropy of the base-`base` representation of each `n`."""
+    positions = np.arange(ndigits, dtype=np.uint64)
+    if base == 16:
+        digits = (n[:, None] >> (positions*np.uint64(4))) & np.uint64(0xf)
+        powers = np.uint64(1) << (positions*np.uint64(4))
+    else:
+        powers = np.uint64(base)**positions
+        digits = (n[:, None] // powers) % np.uint64(base)
+    # Digit count: number of powers <= n (at least one digit, for 0).
+    length = np.maximum(1, (n[:, None] >= powers).sum(axis=1))
+    valid  = positions < length[:, None]
+    index  = np.arange(len(n))[:, None]*base + digits.astype(np.intp)
+    counts = np.bincount(index[valid], minlength=len(n)*base).reshape(len(n), base)
+    # Summed in digit order like the scalar version (ndarray.sum is pairwise: ties would differ).
+    terms  = _terms[length[:, None], counts]
+    ent    = np.zeros(len(n))
+    for d in range(base):
+        ent += terms[:, d]
+    nsyms  = np.count_nonzero(counts, axis=1)
+    return -ent, nsyms, length
+
+def is_pretty_base_hex_array(values):
+    """Vectorized is_pretty_base_hex of an integer array (|values| < 2**64)."""
+    values = np.asarray(values)
+    if values.dtype.kind == "i":
+        n = np.abs(values.astype(np.int64)).view(np.uint64)
+    else:
+        n = values.astype(np.uint64)
+    nf   = n.astype(np.float64)
+    zero = n == 0
+    with np.errstate(divide="ignore"):
+        log10 = np.log10(nf)
+        log2  = np.log2(nf)
+    pow10 = ~zero & (log10 == np.trunc(log10))
+    pow2  = ~zero & (log2 == np.trunc(log2)) & (n >= 16)
+
+    ed, nsymsd, dl = _digit_stats(n, 10, _max_digits)
+    eh, nsymsh, hl = _digit_stats(n, 16, 16)
+    frac_unique_d = nsymsd / dl
+    frac_unique_h = nsymsh / hl
+    return np.select(
+        [zero | pow10, pow2,
+         frac_unique_d < frac_unique_h, frac_unique_h < frac_unique_d,
+         n < 1000,
+         ed < eh, eh < ed],
+        [False, True,
+         False, True,
+         False,
+         False, True],
+        default=False)
+
+def smart_literals(values):
+    """smart_literal of every value of an integer array, formatting each distinct value once."""
+    values = np.asarray(values)
+    unique, inverse = np.unique(values, return_inverse=True)
+    hexes = is_pretty_base_hex_array(unique)
+    strs  = np.array([
+        (f"-0x{-v:x}" if v < 0 else f"0x{v:x}") if h else f"{v:d}"
+        for v, h in zip(unique.tolist(), hexes.tolist())], dtype=object)
+    return strs[inverse.reshape(values.shape)]
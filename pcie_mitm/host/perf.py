@@ -0,0 +1,107 @@
+import asyncio
+from collections import namedtuple
+
+from pcie_mitm.ip.perf import latency_classes, perf_region_words, perf_regions, tlp_classes
+
+
+# Decoding -----------------------------------------------------------------------------------------
+
+def _u64s(words):
+    return [words[i] | (words[i + 1] << 32) for i in range(0, len(words), 2)]
+
+def decode_counters(words):
+    """{tlp class: (TLPs, payload DWs)} of the words of a down/up_counters region."""
+    values = _u64s(words[:4*len(tlp_classes)])
+    return {name: (values[2*i], values[2*i + 1]) for name, i in tlp_classes.items()}
+
+def decode_histograms(words, nbins):
+    """{latency class: bins} of the words of a device/host_latency region."""
+    values = _u64s(words[:2*nbins*len(latency_classes)])
+    return {name: values[nbins*i:nbins*(i + 1)] for name, i in latency_classes.items()}
+
+LatencyStats = namedtuple("LatencyStats", ["count", "sum", "min", "max", "unmatched", "lost"])
+
+PerfSnapshot = namedtuple("PerfSnapshot", ["timestamp", "bin_shift", "counters", "histograms", "stats"])
+
+# Analysis -----------------------------------------------------------------------------------------
+
+def histogram_percentile(bins, bin_shift, q):
+    """Upper bound (cycles) of the latency of the `q` quantile (None: empty, inf: last bin)."""
+    total = sum(bins)
+    if not total:
+        return None
+    target, count = q*total, 0
+    for i, n in enumerate(bins):
+        count += n
+        if count >= target and n:
+            return float("inf") if i == len(bins) - 1 else (i + 1) << bin_shift
+    return float("inf")
+
+def throughput(before, after, clk_freq):
+    """{direction: {tlp class: (TLPs/s, payload bytes/s)}} between two snapshots."""
+    seconds = ((after.timestamp - before.timestamp) % 2**64)/clk_freq
+    rates   = {}
+    for direction in after.counters:
+        rates[direction] = {}
+        for name, (tlps, dws) in after.counters[direction].items():
+            tlps0, dws0 = before.counters[direction][name]
+            rates[direction][name] = ((tlps - tlps0)/seconds, 4*(dws - dws0)/seconds)
+    return rates
+
+def histogram_delta(before, after):
+    """Histograms of the completions between two snapshots."""
+    return {tracker: {name: [b - a for a, b in zip(before.histograms[tracker][name], bins)]
+        for name, bins in classes.items()} for tracker, classes in after.histograms.items()}
+
+# Driver -------------------------------------------------------------------------------------------
+
+class TLPPerfDriver:
+    """pcie_mitm.ip.perf.TLPPerfMonitor through an EtherboneQueue/CSRMap.
+
+    The counter memories are the `<name>` memory region unless `base` is given. A snapshot reads
+    the timestamp, every counter memory and the latency statistics in one batch of requests.
+    """
+    trackers = ["device", "host"]
+    stats    = ["count", "sum", "min", "max", "unmatched", "lost"]
+
+    def __init__(self, csrs, name="perf", nbins=64, base=None):
+        self.csrs      = csrs
+        self.bus       = csrs.queue
+        self.name      = name
+        self.nbins     = nbins
+        self.base      = csrs.mems[name][0] if base is None else base
+        self.bin_shift = 0
+
+    def reg(self, name):
+        return self.csrs.regs[f"{self.name}_{name}"]
+
+    def enable(self, enable=True):
+        self.reg("ctrl").write(int(enable))
+
+    def clear(self):
+        self.reg("clear").write(1)
+
+    def set_bin_shift(self, bin_shift):
+        """Latency bins of 2**bin_shift cycles."""
+        self.bin_shift = bin_shift
+        self.reg("bin_shift").write(bin_shift)
+
+    async def snapshot(self):
+        region = 4*perf_region_words(self.nbins)
+        sizes  = {
+            "down_counters":  4*len(tlp_classes),
+            "up_counters":    4*len(tlp_classes),
+            "device_latency": 2*self.nbins*len(latency_classes),
+            "host_latency":   2*self.nbins*len(latency_classes),
+        }
+        futures = [self.reg("timestamp").read()]
+        futures += [self.bus.read_memory(self.base + i*region, sizes[name]) for i, name in enumerate(perf_regions)]
+        futures += [self.reg(f"{t}_{s}").read() for t in self.trackers for s in self.stats]
+        timestamp, down, up, device, host, *stats = await asyncio.gather(*futures)
+        n = len(self.stats)
+        return PerfSnapshot(
+            timestamp  = timestamp,
+            bin_shift  = self.bin_shift,
+            counters   = {"down": decode_counters(down), "up": decode_counters(up)},
+            histograms = {"device": decode_histograms(device, self.nbins), "host": decode_histograms(host, self.nbins)},
+            stats      = {t: LatencyStats(*stats[n*i:n*(i + 1)]) for i, t in enumerate(self.trackers)})
@@ -0,0 +1,195 @@
+import asyncio
+from collections import namedtuple
+
+from pcie_mitm.host.fuzz import Mutation, mutate_tlp
+from pcie_mitm.ip.fuzz import mutation_ops
+from pcie_mitm.ip.rewrite import (max_key_dws, rewrite_actions, rule_key_mask, rule_key_value,
+    rule_patches, rule_words)
+from pcie_mitm.ip.tlp import fmt_type_dict
+
+
+# Rules --------------------------------------------------------------------------------------------
+
+# A rewrite rule before compilation. Address and payload fields depend on the header size, so a
+# rule without a `kind` (or with an address range) compiles to several TCAM entries.
+#   kind          fmt_type_dict name, or None (any memory request when `address` is given)
+#   requester_id  requester ID (requests: DW1[31:16])
+#   tag           tag (requests: DW1[15:8])
+#   address       byte address, or inclusive (low, high) range of memory requests
+#   payload       {payload DW offset: value or (value, mask)}
+#   action        rewrite_actions name
+#   delay         cycles the TLP is held with the "delay" action
+#   patches       Patch list, applied unless the TLP is dropped
+Rule = namedtuple("Rule", ["kind", "requester_id", "tag", "address", "payload", "action", "delay",
+    "patches"])
+
+def rule(kind=None, requester_id=None, tag=None, address=None, payload=None, action="forward",
+    delay=0, patches=()):
+    return Rule(kind, requester_id, tag, address, dict(payload or {}), action, delay, tuple(patches))
+
+# A patch of a header DW ("header", absolute DW index), a payload DW ("payload", offset after the
+# header) or of the low address DW ("address", index ignored), see pcie_mitm.ip.fuzz.mutation_ops.
+Patch = namedtuple("Patch", ["field", "index", "mask", "value", "op"])
+
+def patch_payload_bytes(offset, data):
+    """Patches setting `data` (bytes) at byte `offset` of the payload."""
+    patches = {}
+    for i, byte in enumerate(data):
+        dw, lane = divmod(offset + i, 4)
+        mask, value = patches.get(dw, (0, 0))
+        patches[dw] = (mask | (0xff << 8*lane), value | (byte << 8*lane))
+    return [Patch("payload", dw, mask, value, "set") for dw, (mask, value) in sorted(patches.items())]
+
+def remap_address(low, high, new_low, kind=None, action="forward", delay=0):
+    """Rule moving memory requests to [low, high] by `new_low - low`.
+
+    The offset is added to the low address DW only, so the window must not cross a 4GB boundary.
+    """
+    assert low >> 32 == high >> 32 == new_low >> 32 == (new_low + high - low) >> 32
+    delta = (new_low - low) & 0xffff_fffc
+    assert (new_low - low) & 0x3 == 0
+    return rule(kind, address=(low, high), action=action, delay=delay,
+        patches=[Patch("address", 0, 0xffff_fffc, delta, "add")])
+
+# Compilation --------------------------------------------------------------------------------------
+
+# TCAM entry: value/mask of each key DW, and the resolved patches (pcie_mitm.host.fuzz.Mutation).
+RewriteEntry = namedtuple("RewriteEntry", ["values", "masks", "action", "delay", "patches"])
+
+def range_to_prefixes(low, high, width):
+    """Minimal list of (value, mask) prefixes covering [low, high] of `width`-bit integers."""
+    prefixes = []
+    while low <= high:
+        size = (low & -low) if low else 1 << width
+        while size > high - low + 1:
+            size >>= 1
+        prefixes.append((low, ((1 << width) - 1) & ~(size - 1)))
+        low += size
+    return prefixes
+
+def compile_rule(r, key_dws=6):
+    """TCAM entries of a Rule, one per header size and address prefix."""
+    if r.kind is not None:
+        formats = [(fmt_type_dict[r.kind] >> 5) & 1]
+    elif r.address is not None or r.payload or any(p.field != "header" for p in r.patches):
+        formats = [0, 1]
+    else:
+        formats = [None]
+    entries = []
+    for four_dw in formats:
+        header_dws = 3 if four_dw is None else 3 + four_dw
+        values, masks = [0]*key_dws, [0]*key_dws
+
+        def match(dw, value, mask):
+            assert dw < key_dws, f"DW {dw} is not part of the {key_dws} DWs key"
+            values[dw] = (values[dw] & ~mask) | (value & mask)
+            masks[dw] |= mask
+
+        if r.kind is not None:
+            match(0, fmt_type_dict[r.kind] << 24, 0xff << 24)
+        elif r.address is not None:
+            match(0, four_dw << 29, 0x3f << 24) # Memory read/write, 3 or 4DW header.
+        elif four_dw is not None:
+            match(0, four_dw << 29, 0x1 << 29)
+        if r.requester_id is not None:
+            match(1, r.requester_id << 16, 0xffff << 16)
+        if r.tag is not None:
+            match(1, r.tag << 8, 0xff << 8)
+        for offset, value in r.payload.items():
+            value, mask = value if isinstance(value, tuple) else (value, 0xffff_ffff)
+            match(header_dws + offset, value, mask)
+
+        patches = []
+        for p in r.patches:
+            if p.field == "header":
+                index = p.index
+            elif p.field == "payload":
+                index = header_dws + p.index
+            else:
+                index = header_dws - 1
+            patches.append(Mutation(index, p.mask, p.value, p.op))
+
+        if r.address is None:
+            prefixes = [(0, 0)]
+        else:
+            low, high = r.address if isinstance(r.address, tuple) else (r.address, r.address)
+            width    = 62 if four_dw else 30
+            prefixes = range_to_prefixes(low >> 2, high >> 2, width)
+        for value, mask in prefixes:
+            v, m = list(values), list(masks)
+            if r.address is not None:
+                value, mask = value << 2, mask << 2
+                if four_dw:
+                    v[2], m[2] = value >> 32, mask >> 32
+                    v[3], m[3] = value & 0xffff_ffff, mask & 0xffff_ffff
+                else:
+                    v[2], m[2] = value, mask
+            entries.append(RewriteEntry(v, m, r.action, r.delay, patches))
+    return entries
+
+def compile_rules(rules, key_dws=6):
+    """TCAM entries of rules in priority order (the first matching rule wins)."""
+    return [e for r in rules for e in compile_rule(r, key_dws)]
+
+def entry_words(entry, npatches=2):
+    """The rule_words words of a TCAM entry on the TLPRewriter rule table bus (None: disabled)."""
+    words = [0]*rule_words
+    if entry is None:
+        return words
+    assert len(entry.values) <= max_key_dws and len(entry.patches) <= npatches
+    words[0] = 1 | (rewrite_actions[entry.action] << 1) | (entry.delay << 16)
+    for i, (value, mask) in enumerate(zip(entry.values, entry.masks)):
+        words[rule_key_value + i] = value & mask
+        words[rule_key_mask + i]  = mask
+    for p, m in enumerate(entry.patches):
+        words[rule_patches + 3*p + 0] = 1 | (mutation_ops[m.op] << 1) | (m.index << 16)
+        words[rule_patches + 3*p + 1] = m.mask
+        words[rule_patches + 3*p + 2] = m.value
+    return words
+
+def rewrite_tlp(entries, dws, key_dws=6):
+    """Reference model of the TLPRewriter: (action, delay, rewritten DWs) of a TLP."""
+    key = list(dws[:key_dws]) + [0]*(key_dws - len(dws[:key_dws]))
+    for e in entries:
+        if all((k ^ v) & m == 0 for k, v, m in zip(key, e.values, e.masks)):
+            return e.action, e.delay, mutate_tlp(dws, e.patches)
+    return "forward", 0, list(dws)
+
+# Driver -------------------------------------------------------------------------------------------
+
+class TLPRewriterDriver:
+    """pcie_mitm.ip.rewrite.TLPRewriter through an EtherboneQueue/CSRMap.
+
+    The rule table is the `<name>` memory region unless `table_base` is given. `load` writes the
+    shadow bank, `commit` makes it active: TLPs see either the old or the new table, never a mix.
+    """
+    counters = ["matched", "dropped", "delayed"]
+
+    def __init__(self, csrs, name="rewriter", table_base=None, nrules=8, key_dws=6, npatches=2):
+        self.csrs     = csrs
+        self.bus      = csrs.queue
+        self.name     = name
+        self.nrules   = nrules
+        self.key_dws  = key_dws
+        self.npatches = npatches
+        self.table_base = csrs.mems[name][0] if table_base is None else table_base
+
+    def reg(self, name):
+        return self.csrs.regs[f"{self.name}_{name}"]
+
+    def load(self, rules):
+        """Write Rules (or compiled RewriteEntries) to the shadow bank, disabling the other slots."""
+        entries = [e for r in rules for e in (compile_rule(r, self.key_dws) if isinstance(r, Rule) else [r])]
+        assert len(entries) <= self.nrules, f"{len(entries)} TCAM entries, {self.nrules} available"
+        words = []
+        for i in range(self.nrules):
+            words += entry_words(entries[i] if i < len(entries) else None, self.npatches)
+        self.bus.write(self.table_base, words)
+        return entries
+
+    def commit(self):
+        self.reg("commit").write(1)
+
+    async def read_counters(self):
+        values = await asyncio.gather(*[self.reg(c).read() for c in self.counters])
+        return dict(zip(self.counters, values))
@@ -0,0 +1,65 @@
+from pcie_mitm.ip.tlp import fmt_type_dict
+
+
+# TLP Sniffer Driver -------------------------------------------------------------------------------
+
+class TLPSnifferDriver:
+    """Host side configuration of pcie_mitm.ip.tlp.TLPSniffer filters.
+
+    `bus` is a litex RemoteClient.
+    """
+    def __init__(self, bus, name="sniffer", nfilters=4):
+        self.bus      = bus
+        self.name     = name
+        self.nfilters = nfilters
+        self.build()
+
+    def build(self):
+        for key, value in self.bus.regs.d.items():
+            if self.name == key[:len(self.name)]:
+                key = key.replace(self.name + "_", "")
+                setattr(self, key, value)
+
+    def _filter_reg(self, n, name):
+        return getattr(self, f"filter{n}_{name}")
+
+    def clear_filters(self):
+        for n in range(self.nfilters):
+            self._filter_reg(n, "ctrl").write(0)
+
+    def set_filter(self, n, kind=None, fmt_type=None, fmt_type_mask=0xff, requester_id=None,
+        requester_mask=0xffff, address=None, bars=None):
+        """Configure rule `n`; fields left to None match anything.
+
+        `kind` is a fmt_type_dict key, `address` a (first, last) tuple and `bars` a list of BARs.
+        """
+        if kind is not None:
+            fmt_type = fmt_type_dict[kind]
+        if fmt_type is None:
+            fmt_type, fmt_type_mask = 0, 0
+        if requester_id is None:
+            requester_id, requester_mask = 0, 0
+        self._filter_reg(n, "fmt_type_value").write(fmt_type)
+        self._filter_reg(n, "fmt_type_mask").write(fmt_type_mask)
+        self._filter_reg(n, "requester_value").write(requester_id)
+        self._filter_reg(n, "requester_mask").write(requester_mask)
+        if address is not None:
+            self._filter_reg(n, "address_low").write(address[0])
+            self._filter_reg(n, "address_high").write(address[1])
+        self._filter_reg(n, "bar_mask").write(sum(1 << bar for bar in (bars or [])))
+        self._filter_reg(n, "ctrl").write(0b01 | ((address is not None) << 1))
+
+    def start(self, match_all=False, max_payload=None):
+        if max_payload is not None:
+            self.max_payload.write(max_payload)
+        self.ctrl.write(0b01 | (match_all << 1))
+
+    def stop(self):
+        self.ctrl.write(0)
+
+    def stats(self):
+        return {
+            "tlps":    self.tlps.read(),
+            "matched": self.matched.read(),
+            "dropped": self.dropped.read(),
+        }
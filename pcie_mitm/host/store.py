@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from pcie_mitm.host.literals import smart_literals
+from pcie_mitm.host.tlp import TLPStreamDecoder, decode_headers, file_blocks, tlp_record_dtype
+from pcie_mitm.host.pcapng import PcapngWriter
+from pcie_mitm.ip.tlp import fmt_type_dict
+
+
+# Capture Store ------------------------------------------------------------------------------------
+
+# A store is a directory with:
+#   meta.json        payload_dws, clk_freq, chunk_records.
+#   chunks/N.rec     raw sniffer records, chunk_records per file (memory-mapped on query).
+#   index.bin        one index_dtype row per chunk, to skip chunks without touching them.
+
+requester_bits = 1024
+
+index_dtype = np.dtype([
+    ("first_ts",   "<u8"),
+    ("last_ts",    "<u8"),
+    ("count",      "<u4"),
+    ("bars",       "u1"),
+    ("pad",        "u1", 3),
+    ("addr_min",   "<u8"),
+    ("addr_max",   "<u8"),
+    ("types",      "u1", 256//8),             # fmt_type bitmap.
+    ("requesters", "u1", requester_bits//8),  # Requester ID hash bitmap.
+])
+
+def _requester_hash(requester_id):
+    requester_id = np.asarray(requester_id, np.uint32)
+    return ((requester_id * 0x9e37) >> 6) % requester_bits
+
+def _bitmap(values, bits):
+    bitmap = np.zeros(bits, np.uint8)
+    bitmap[values] = 1
+    return np.packbits(bitmap, bitorder="little")
+
+def _test_bit(bitmaps, value):
+    return (bitmaps[:, value//8] >> (value % 8)) & 1 == 1
+
+class CaptureStoreWriter:
+    def __init__(self, path, payload_dws=8, clk_freq=125e6, chunk_records=1 << 16):
+        self.path          = path
+        self.dtype         = tlp_record_dtype(payload_dws)
+        self.chunk_records = chunk_records
+        os.makedirs(os.path.join(path, "chunks"), exist_ok=True)
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"payload_dws": payload_dws, "clk_freq": clk_freq, "chunk_records": chunk_records}, f)
+        self.index   = open(os.path.join(path, "index.bin"), "wb")
+        self.chunks  = 0
+        # Records are copied here: decoder outputs are views of reused capture blocks.
+        self.buffer  = np.empty(chunk_records, self.dtype)
+        self.npending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, records):
+        while len(records):
+            n = min(len(records), self.chunk_records - self.npending)
+            self.buffer[self.npending:self.npending + n] = records[:n]
+            self.npending += n
+            records = records[n:]
+            if self.npending == self.chunk_records:
+                self._flush()
+
+    def _flush(self):
+        if not self.npending:
+            return
+        records = self.buffer[:self.npending]
+        f       = decode_headers(records)
+        row     = np.zeros(1, index_dtype)
+        row["first_ts"]   = records["timestamp"][0]
+        row["last_ts"]    = records["timestamp"][-1]
+        row["count"]      = len(records)
+        row["bars"]       = np.bitwise_or.reduce(records["bar"])
+        is_mem = f["is_mem"]
+        row["addr_min"]   = f["address"][is_mem].min() if is_mem.any() else 2**64 - 1
+        row["addr_max"]   = f["address"][is_mem].max() if is_mem.any() else 0
+        row["types"]      = _bitmap(f["fmt_type"], 256)
+        row["requesters"] = _bitmap(_requester_hash(f["requester_id"]), requester_bits)
+        records.tofile(os.path.join(self.path, "chunks", f"{self.chunks}.rec"))
+        self.index.write(row.tobytes())
+        self.chunks  += 1
+        self.npending = 0
+
+    def close(self):
+        self._flush()
+        self.index.close()
+
+class CaptureStore:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.payload_dws   = meta["payload_dws"]
+        self.clk_freq      = meta["clk_freq"]
+        self.chunk_records = meta["chunk_records"]
+        self.dtype  = tlp_record_dtype(self.payload_dws)
+        self.index  = np.fromfile(os.path.join(path, "index.bin"), index_dtype)
+        self.chunks = {}
+        self.scanned = 0
+
+    def __len__(self):
+        return int(self.index["count"].sum())
+
+    def chunk(self, n):
+        if n not in self.chunks:
+            self.chunks[n] = np.memmap(os.path.join(self.path, "chunks", f"{n}.rec"), self.dtype, mode="r")
+        return self.chunks[n]
+
+    def candidates(self, t_start=None, t_end=None, fmt_types=None, requester_id=None, address=None, bar=None):
+        """Chunks that may hold matching records, from the index only."""
+        index = self.index
+        first = 0
+        last  = len(index)
+        if t_start is not None:
+            first = int(np.searchsorted(index["last_ts"], t_start, side="left"))
+        if t_end is not None:
+            last = int(np.searchsorted(index["first_ts"], t_end, side="right"))
+        index = index[first:last]
+        keep  = np.ones(len(index), bool)
+        if fmt_types is not None:
+            keep &= np.logical_or.reduce([_test_bit(index["types"], t) for t in fmt_types])
+        if requester_id is not None:
+            keep &= _test_bit(index["requesters"], int(_requester_hash(requester_id)))
+        if address is not None:
+            keep &= (index["addr_max"] >= address[0]) & (index["addr_min"] <= address[1])
+        if bar is not None:
+            keep &= (index["bars"] & (1 << bar)) != 0
+        return first + np.flatnonzero(keep)
+
+    def query(self, t_start=None, t_end=None, fmt_types=None, requester_id=None, address=None, bar=None):
+        """Yield arrays of the records matching every given criterion (times in sniffer cycles)."""
+        self.scanned = 0
+        for n in self.candidates(t_start, t_end, fmt_types, requester_id, address, bar):
+            records = self.chunk(n)
+            ts      = records["timestamp"]
+            lo = 0 if t_start is None else np.searchsorted(ts, t_start, side="left")
+            hi = len(records) if t_end is None else np.searchsorted(ts, t_end, side="right")
+            records = records[lo:hi]
+            self.scanned += 1
+            f    = decode_headers(records)
+            mask = np.ones(len(records), bool)
+            if fmt_types is not None:
+                mask &= np.isin(f["fmt_type"], fmt_types)
+            if requester_id is not None:
+                mask &= f["requester_id"] == requester_id
+            if address is not None:
+                mask &= f["is_mem"] & (f["address"] >= address[0]) & (f["address"] <= address[1])
+            if bar is not None:
+                mask &= (records["bar"] & (1 << bar)) != 0
+            if mask.any():
+                yield records[mask]
+
+# CLI ----------------------------------------------------------------------------------------------
+
+def _parse_kinds(kinds):
+    if kinds is None:
+        return None
+    fmt_types = []
+    for kind in kinds.split(","):
+        fmt_types.append(fmt_type_dict[kind] if kind in fmt_type_dict else int(kind, 0))
+    return fmt_types
+
+def main():
+    parser = argparse.ArgumentParser(description="pcie_mitm indexed capture store")
+    sub    = parser.add_subparsers(dest="command", required=True)
+
+    ingest = sub.add_parser("ingest", help="Build a store from a raw sniffer capture.")
+    ingest.add_argument("capture")
+    ingest.add_argument("store")
+    ingest.add_argument("--payload-dws",   default=8,       help="Payload DWs per record (sniffer payload_dws).")
+    ingest.add_argument("--clk-freq",      default=125e6,   help="Sniffer clock frequency.")
+    ingest.add_argument("--chunk-records", default=1 << 16, help="Records per chunk.")
+
+    info = sub.add_parser("info", help="Show store summary.")
+    info.add_argument("store")
+
+    query = sub.add_parser("query", help="Query a store.")
+    query.add_argument("store")
+    query.add_argument("--start",     default=None, help="Start time (ns).")
+    query.add_argument("--end",       default=None, help="End time (ns).")
+    query.add_argument("--type",      default=None, help="Comma separated TLP types (mwr32,cpld,... or fmt/type byte).")
+    query.add_argument("--requester", default=None, help="Requester ID.")
+    query.add_argument("--address",   default=None, help="Address range (first:last).")
+    query.add_argument("--bar",       default=None, help="BAR.")
+    query.add_argument("--count",     action="store_true", help="Only print the number of matching TLPs.")
+    query.add_argument("--pcapng",    default=None, help="Write the matching TLPs to a pcap-ng file.")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        decoder = TLPStreamDecoder(int(args.payload_dws))
+        with open(args.capture, "rb") as f, CaptureStoreWriter(args.store,
+            payload_dws   = int(args.payload_dws),
+            clk_freq      = float(args.clk_freq),
+            chunk_records = int(args.chunk_records)) as store:
+            for records in decoder.decode(file_blocks(f)):
+                store.write(records)
+        print(f"{decoder.records} records ingested")
+        return
+
+    store = CaptureStore(args.store)
+    if args.command == "info":
+        index = store.index
+        print(f"records: {len(store)}, chunks: {len(index)}, payload DWs: {store.payload_dws}")
+        if len(index):
+            print(f"time: {index['first_ts'][0]*1e9/store.clk_freq:.0f} - {index['last_ts'][-1]*1e9/store.clk_freq:.0f} ns")
+        return
+
+    to_cycles = lambda t: None if t is None else int(float(t)*store.clk_freq/1e9)
+    address   = None
+    if args.address is not None:
+        address = tuple(int(a, 0) for a in args.address.split(":"))
+    start   = time.perf_counter()
+    results = store.query(
+        t_start      = to_cycles(args.start),
+        t_end        = to_cycles(args.end),
+        fmt_types    = _parse_kinds(args.type),
+        requester_id = None if args.requester is None else int(args.requester, 0),
+        address      = address,
+        bar          = None if args.bar is None else int(args.bar))
+    names  = {v: k for k, v in fmt_type_dict.items()}
+    count  = 0
+    writer = None
+    if args.pcapng is not None:
+        writer = PcapngWriter(open(args.pcapng, "wb"), clk_freq=store.clk_freq, payload_dws=store.payload_dws)
+    for records in results:
+        count += len(records)
+        if writer is not None:
+            writer.write(records)
+        elif not args.count:
+            f       = decode_headers(records)
+            addrs   = smart_literals(f["address"])
+            lengths = smart_literals(f["length"])
+            for i in range(len(records)):
+                print(f"{f['timestamp'][i]*1e9/store.clk_freq:16.0f} ns "
+                      f"{names.get(int(f['fmt_type'][i]), hex(f['fmt_type'][i])):<8} "
+                      f"rid={f['requester_id'][i]:04x} tag={f['tag'][i]:02x} "
+                      f"addr={addrs[i]} len={lengths[i]} bar={f['bar'][i]:02x}")
+    if writer is not None:
+        writer.f.close()
+    elapsed = time.perf_counter() - start
+    print(f"{count} TLPs, {store.scanned}/{len(store.index)} chunks scanned in {elapsed*1e3:.1f} ms", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import socket
+
+import numpy as np
+
+from pcie_mitm.ip.tlp import tlp_record_width
+
+
+# TLP Records --------------------------------------------------------------------------------------
+
+# Records are stored little-endian, exactly as packed by pcie_mitm.ip.tlp.TLPSniffer.
+
+def tlp_record_dtype(payload_dws=8):
+    return np.dtype({
+        "names":    ["timestamp", "bar", "captured", "flags", "hits", "header", "payload"],
+        "formats":  ["<u8", "u1", "u1", "u1", "u1", ("<u4", 4), ("<u4", payload_dws)],
+        "offsets":  [0, 8, 9, 10, 11, 12, 32],
+        "itemsize": tlp_record_width(payload_dws)//8,
+    })
+
+def concatenate_records(parts, dtype):
+    """np.concatenate that keeps the padded record dtype (numpy packs structured dtypes)."""
+    records = np.empty(sum(len(p) for p in parts), dtype)
+    offset  = 0
+    for p in parts:
+        records[offset:offset + len(p)] = p
+        offset += len(p)
+    return records
+
+def decode_headers(records):
+    """Vectorized header fields of a record array, as a dict of arrays."""
+    hdr       = records["header"]
+    dw0       = hdr[:, 0]
+    fmt_type  = (dw0 >> 24).astype(np.uint8)
+    four_dw   = (fmt_type >> 5) & 1 == 1
+    with_data = (fmt_type >> 6) & 1 == 1
+    is_cpl    = (fmt_type & 0b11110) == 0b01010
+    # Memory and IO requests, the TLPs with an address (as TLPHeader.is_mem).
+    is_mem    = ((fmt_type & 0b11110) == 0) | ((fmt_type & 0x1f) == 0b00010)
+    length    = (dw0 & 0x3ff).astype(np.uint16)
+    length    = np.where(length == 0, 1024, length)
+    rid_dw    = np.where(is_cpl, hdr[:, 2], hdr[:, 1])
+    address   = np.where(four_dw,
+        (hdr[:, 2].astype(np.uint64) << np.uint64(32)) | hdr[:, 3],
+        hdr[:, 2].astype(np.uint64)) & np.uint64(0xffff_ffff_ffff_fffc)
+    return {
+        "timestamp":    records["timestamp"],
+        "fmt_type":     fmt_type,
+        "four_dw":      four_dw,
+        "with_data":    with_data,
+        "is_cpl":       is_cpl,
+        "is_mem":       is_mem,
+        "length":       np.where(with_data, length, 0).astype(np.uint16),
+        "requester_id": (rid_dw >> 16).astype(np.uint16),
+        "tag":          ((rid_dw >> 8) & 0xff).astype(np.uint8),
+        "address":      np.where(is_cpl, np.uint64(0), address),
+        "bar":          records["bar"],
+        "captured":     records["captured"],
+        "truncated":    records["flags"] & 1 == 1,
+    }
+
+# Streaming Decoder --------------------------------------------------------------------------------
+
+class TLPStreamDecoder:
+    """Turn raw capture blocks into record arrays.
+
+    `feed` returns a zero-copy view of the whole records of the block (only a record split across
+    two blocks is copied), so the block must not be reused until the returned array is consumed.
+    """
+    def __init__(self, payload_dws=8):
+        self.dtype   = tlp_record_dtype(payload_dws)
+        self.carry   = bytearray()
+        self.records = 0
+        self.bytes   = 0
+
+    def feed(self, block):
+        block = memoryview(block).cast("B")
+        self.bytes += len(block)
+        size  = self.dtype.itemsize
+        parts = []
+        if self.carry:
+            n = min(size - len(self.carry), len(block))
+            self.carry += block[:n]
+            block = block[n:]
+            if len(self.carry) < size:
+                return np.empty(0, self.dtype)
+            parts.append(np.frombuffer(bytes(self.carry), self.dtype))
+            self.carry = bytearray()
+        n = len(block)//size
+        parts.append(np.frombuffer(block[:n*size], self.dtype))
+        self.carry += block[n*size:]
+        records = parts[0] if len(parts) == 1 else concatenate_records(parts, self.dtype)
+        self.records += len(records)
+        return records
+
+    def decode(self, blocks):
+        """Record arrays of an iterable of blocks."""
+        for block in blocks:
+            records = self.feed(block)
+            if len(records):
+                yield records
+
+# Block Sources ------------------------------------------------------------------------------------
+
+def file_blocks(f, block_size=1 << 20):
+    """Blocks of a capture file, read into a single reused buffer."""
+    buf  = bytearray(block_size)
+    view = memoryview(buf)
+    while True:
+        n = f.readinto(buf)
+        if not n:
+            return
+        yield view[:n]
+
+def udp_blocks(port, host="0.0.0.0", block_size=9000, rcvbuf=64 << 20):
+    """Datagrams received on `port`, into a single reused buffer."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    sock.bind((host, port))
+    buf  = bytearray(block_size)
+    view = memoryview(buf)
+    try:
+        while True:
+            n = sock.recv_into(buf)
+            yield view[:n]
+    finally:
+        sock.close()
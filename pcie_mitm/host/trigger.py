@@ -0,0 +1,125 @@
+import csv
+import re
+from collections import namedtuple
+
+
+# Stages -------------------------------------------------------------------------------------------
+
+# A pcie_mitm.ip.trigger.TriggerSequencer stage.
+#   cond     {signal name: value} of the analyzer layout, values are ints or "0b1x0"/"0x1f"/"0xx3"
+#            strings ("x": don't care), or'ed into value/mask
+#   value    raw value of the sample
+#   mask     raw mask of the sample (bits compared)
+#   count    matching samples needed to complete the stage
+#   timeout  samples after which the stage fails and restarts from `fail` (0: never)
+#   fail     stage index to restart from on timeout
+#   edge     only count samples entering the condition
+#   invert   match the samples outside of the condition
+Stage = namedtuple("Stage", ["cond", "value", "mask", "count", "timeout", "fail", "edge", "invert"])
+
+def stage(cond=None, value=0, mask=0, count=1, timeout=0, fail=0, edge=False, invert=False):
+    return Stage(dict(cond or {}), value, mask, count, timeout, fail, edge, invert)
+
+def within(a, b, cycles, count=1):
+    """Stages of "`a` then `b` within `cycles` cycles" (`a`/`b`: cond dicts or Stages)."""
+    a = a if isinstance(a, Stage) else stage(a, count=count)
+    b = b if isinstance(b, Stage) else stage(b)
+    return [a, b._replace(timeout=cycles, fail=0)]
+
+def load_layout(config_csv, group=0):
+    """{signal name: (offset, width)} of a group of an analyzer.csv/capture.csv."""
+    layout, offset = {}, 0
+    with open(config_csv) as f:
+        for t, g, n, v in csv.reader(f, delimiter=",", quotechar="#"):
+            if t == "signal" and (g == "None" or int(g) == group):
+                layout[n] = (offset, int(v))
+                offset += int(v)
+    return layout
+
+def cond_value_mask(layout, cond):
+    """(value, mask) of a {signal name: value} condition, see Stage."""
+    value, mask = 0, 0
+    for name, v in cond.items():
+        offset, width = layout[name]
+        m = re.fullmatch(r"0([bx])([0-9a-fA-Fx_]+)", v) if isinstance(v, str) else None
+        if m is not None:
+            bits = 4 if m.group(1) == "x" else 1
+            v, vm = 0, 0
+            for c in m.group(2).replace("_", ""):
+                v, vm = v << bits, vm << bits
+                if c != "x":
+                    v  |= int(c, 16)
+                    vm |= (1 << bits) - 1
+        else:
+            v, vm = int(v, 0) if isinstance(v, str) else v, (1 << width) - 1
+        field  = ((1 << width) - 1) << offset
+        value |= (v << offset) & field
+        mask  |= (vm << offset) & field
+    return value, mask
+
+def stage_value_mask(s, layout=None):
+    value, mask = cond_value_mask(layout or {}, s.cond)
+    return value | (s.value & s.mask & ~mask), mask | s.mask
+
+# Reference Model ----------------------------------------------------------------------------------
+
+def sequence_trigger(stages, samples, layout=None):
+    """Index of the sample firing a TriggerSequencer programmed with `stages`, None if none does."""
+    matchers = [stage_value_mask(s, layout) for s in stages]
+    current, count, timer, prev = 0, 0, 0, 0
+    for i, sample in enumerate(samples):
+        s           = stages[current]
+        value, mask = matchers[current]
+        match = (((sample ^ value) & mask) == 0) != s.invert
+        was   = (((prev ^ value) & mask) == 0) != s.invert
+        event = match and not (s.edge and was)
+        prev  = sample
+        if event and count + 1 >= s.count:
+            if current == len(stages) - 1:
+                return i
+            current, count, timer = current + 1, 0, 0
+        elif s.timeout and timer + 1 >= s.timeout:
+            current, count, timer = s.fail, 0, 0
+        else:
+            count += event
+            timer += 1
+    return None
+
+# Driver -------------------------------------------------------------------------------------------
+
+class TriggerSequencerDriver:
+    """Host side of pcie_mitm.ip.trigger.TriggerSequencer (the `analyzer` of a SequencedAnalyzer).
+
+    `bus` is a litex RemoteClient, conditions are resolved against the signal layout of
+    `config_csv`. Arm with LiteScopeAnalyzerDriver.run, which enables the trigger.
+    """
+    def __init__(self, bus, name="analyzer_trigger", config_csv="analyzer.csv", group=0):
+        self.bus    = bus
+        self.name   = name
+        self.layout = load_layout(config_csv, group) if config_csv is not None else {}
+
+    def reg(self, name):
+        return self.bus.regs.d[f"{self.name}_{name}"]
+
+    def write_stage(self, index, s, last=False):
+        value, mask = stage_value_mask(s, self.layout)
+        self.reg("stage_sel").write(index)
+        self.reg("stage_value").write(value)
+        self.reg("stage_mask").write(mask)
+        self.reg("stage_count").write(s.count)
+        self.reg("stage_timeout").write(s.timeout)
+        self.reg("stage_ctrl").write(int(last) | (int(s.edge) << 1) | (int(s.invert) << 2) | (s.fail << 8))
+        self.reg("stage_write").write(1)
+
+    def configure(self, stages):
+        """Disable the trigger and write `stages`, the last one fires."""
+        assert stages
+        self.reg("enable").write(0)
+        for i, s in enumerate(stages):
+            assert s.fail <= i, "stages can only fail backwards"
+            self.write_stage(i, s, last=(i == len(stages) - 1))
+
+    @property
+    def status(self):
+        """(current stage, restarts since enable, done)."""
+        return self.reg("stage").read(), self.reg("restarts").read(), bool(self.reg("done").read())
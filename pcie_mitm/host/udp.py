@@ -0,0 +1,188 @@
+import ctypes
+import ctypes.util
+import select
+import socket
+import struct
+import sys
+from collections import namedtuple
+
+from pcie_mitm.ip.udp import frame_header_bytes
+
+
+# Frames -------------------------------------------------------------------------------------------
+
+frame_header = struct.Struct("<II")
+assert frame_header.size == frame_header_bytes
+
+def parse_frame(data):
+    """(sequence, dropped beats, payload) of a pcie_mitm.ip.udp.UDPCaptureStreamer frame."""
+    seq, overflow = frame_header.unpack_from(data)
+    return seq, overflow, data[frame_header_bytes:]
+
+ReceiverStats = namedtuple("ReceiverStats", ["frames", "bytes", "lost", "late", "overflow"])
+
+# recvmmsg -----------------------------------------------------------------------------------------
+
+# Python has no recvmmsg(2): on Linux it is called through ctypes to receive a whole batch of
+# datagrams per system call, elsewhere the batch is drained with non-blocking recv_into calls.
+
+class _iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name",       ctypes.c_void_p),
+        ("msg_namelen",    ctypes.c_uint32),
+        ("msg_iov",        ctypes.POINTER(_iovec)),
+        ("msg_iovlen",     ctypes.c_size_t),
+        ("msg_control",    ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags",      ctypes.c_int),
+    ]
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _msghdr), ("msg_len", ctypes.c_uint)]
+
+MSG_WAITFORONE = 0x10000
+
+def _load_recvmmsg():
+    if not sys.platform.startswith("linux"):
+        return None
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    recvmmsg = getattr(libc, "recvmmsg", None)
+    if recvmmsg is not None:
+        recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_mmsghdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+        recvmmsg.restype  = ctypes.c_int
+    return recvmmsg
+
+# Receiver -----------------------------------------------------------------------------------------
+
+class UDPCaptureReceiver:
+    """Host side of pcie_mitm.ip.udp.UDPCaptureStreamer.
+
+    Receives up to `batch` frames per wakeup into preallocated buffers (recvmmsg on Linux) from a
+    socket with a `rcvbuf` bytes receive buffer (SO_RCVBUFFORCE when permitted, the kernel clamps
+    SO_RCVBUF to net.core.rmem_max otherwise). Sequence numbers are checked to count the frames lost
+    on the network (`lost`) or received out of order (`late`), `overflow` is the last drop count
+    reported by the gateware.
+    """
+    def __init__(self, port=4321, address="0.0.0.0", rcvbuf=64*1024*1024, batch=64, max_frame=9216,
+                 use_recvmmsg=True):
+        self.sock = sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, getattr(socket, "SO_RCVBUFFORCE", 33), rcvbuf)
+        except OSError:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        sock.bind((address, port))
+        sock.setblocking(False)
+        self.rcvbuf    = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        self.batch     = batch
+        self.max_frame = max_frame
+        self.buffer    = bytearray(batch*max_frame)
+        self.view      = memoryview(self.buffer)
+        self.recvmmsg  = _load_recvmmsg() if use_recvmmsg else None
+        if self.recvmmsg is not None:
+            base = ctypes.addressof(ctypes.c_char.from_buffer(self.buffer))
+            self._iovecs = (_iovec*batch)(*[_iovec(base + i*max_frame, max_frame) for i in range(batch)])
+            self._msgs   = (_mmsghdr*batch)()
+            for i in range(batch):
+                self._msgs[i].msg_hdr.msg_iov    = ctypes.pointer(self._iovecs[i])
+                self._msgs[i].msg_hdr.msg_iovlen = 1
+        self.reset()
+
+    def reset(self):
+        self.expected = None
+        self.frames   = 0
+        self.bytes    = 0
+        self.lost     = 0
+        self.late     = 0
+        self.overflow = 0
+
+    def close(self):
+        self.sock.close()
+
+    @property
+    def port(self):
+        return self.sock.getsockname()[1]
+
+    @property
+    def stats(self):
+        return ReceiverStats(self.frames, self.bytes, self.lost, self.late, self.overflow)
+
+    def _recv_batch(self):
+        if self.recvmmsg is not None:
+            n = self.recvmmsg(self.sock.fileno(), self._msgs, self.batch, MSG_WAITFORONE, None)
+            if n < 0:
+                return []
+            return [self.view[i*self.max_frame:i*self.max_frame + self._msgs[i].msg_len] for i in range(n)]
+        datagrams = []
+        for i in range(self.batch):
+            try:
+                n = self.sock.recv_into(self.view[i*self.max_frame:(i + 1)*self.max_frame])
+            except BlockingIOError:
+                break
+            datagrams.append(self.view[i*self.max_frame:i*self.max_frame + n])
+        return datagrams
+
+    def _account(self, seq, overflow, length):
+        self.frames += 1
+        self.bytes  += length
+        if self.expected is not None:
+            gap = (seq - self.expected) % 2**32
+            if gap >= 2**31:
+                self.late += 1
+                return
+            self.lost += gap
+        self.expected = (seq + 1) % 2**32
+        self.overflow = overflow
+
+    def receive(self, timeout=None):
+        """Next batch of frames as [(sequence, dropped beats, payload)], [] on timeout.
+
+        The payloads are views of the receive buffers, only valid until the next call.
+        """
+        if not select.select([self.sock], [], [], timeout)[0]:
+            return []
+        frames = []
+        for datagram in self._recv_batch():
+            if len(datagram) < frame_header_bytes:
+                continue
+            seq, overflow, payload = parse_frame(datagram)
+            self._account(seq, overflow, len(payload))
+            frames.append((seq, overflow, payload))
+        return frames
+
+    def save(self, f, nbytes=None, timeout=1.0):
+        """Write the payloads to the file object `f` until `nbytes` (or a `timeout` without data)."""
+        written = 0
+        while nbytes is None or written < nbytes:
+            frames = self.receive(timeout)
+            if not frames:
+                break
+            for _, _, payload in frames:
+                f.write(payload)
+                written += len(payload)
+        return written
+
+# Main ---------------------------------------------------------------------------------------------
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Receive a UDPCaptureStreamer stream to a file.")
+    parser.add_argument("--port",    default=4321, type=int, help="UDP port.")
+    parser.add_argument("--address", default="0.0.0.0",      help="Address to bind to.")
+    parser.add_argument("--bytes",   default=None, type=int, help="Stop after this many payload bytes.")
+    parser.add_argument("--timeout", default=5.0,  type=float, help="Stop after this many seconds without data.")
+    parser.add_argument("--rcvbuf",  default=64*1024*1024, type=int, help="Socket receive buffer size.")
+    parser.add_argument("output",                            help="Output file (concatenated payloads).")
+    args = parser.parse_args()
+
+    receiver = UDPCaptureReceiver(args.port, args.address, rcvbuf=args.rcvbuf)
+    if receiver.rcvbuf < args.rcvbuf:
+        print(f"[warning] receive buffer is {receiver.rcvbuf} bytes, raise net.core.rmem_max")
+    with open(args.output, "wb") as f:
+        receiver.save(f, args.bytes, args.timeout)
+    print("frames: {}, bytes: {}, lost: {}, late: {}, dropped by the gateware: {}".format(*receiver.stats))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+from migen import *
+
+from litex.soc.interconnect import stream
+from litex.soc.interconnect import wishbone
+
+
+# Wishbone -> Avalon-MM Bridge ---------------------------------------------------------------------
+
+class Wishbone2AvalonMM(Module):
+    """Wishbone slave to Avalon-MM master bridge with posted writes and pipelined reads.
+
+    Writes are acked as soon as they are queued and go out as Avalon bursts of up to `burst_size`
+    beats (one burst per Wishbone incrementing burst, split at `burst_size`). Reads of a linear
+    Wishbone incrementing burst are prefetched, keeping up to `max_pending` reads in flight, and
+    read data that the master did not consume when the burst ends is dropped: only enable
+    `prefetch` for slaves whose reads have no side effects. Reads wait for posted writes to drain.
+
+    Both sides use word addresses. `burst_size=1` never uses Avalon bursts (reads are still
+    pipelined). Slaves without `readdatavalid` (e.g. Qsys PIOs) are supported by giving their fixed
+    `read_latency`; they cannot burst.
+    """
+    def __init__(self, wb, avl, max_pending=8, burst_size=None, read_latency=None, prefetch=True):
+        if burst_size is None:
+            burst_size = 1 if read_latency is not None else max(1, max_pending//2)
+        assert burst_size <= max_pending
+        assert read_latency is None or burst_size == 1
+        assert burst_size < 2**len(avl.burstcount)
+        data_width = len(wb.dat_w)
+
+        # # #
+
+        burst = Signal()
+        self.comb += burst.eq((wb.cti == wishbone.CTI_BURST_INCREMENTING) & (wb.bte == 0b00))
+
+        # Write path -------------------------------------------------------------------------------
+
+        # Beats and burst lengths are queued separately so the Avalon side knows the burstcount
+        # before the first beat.
+        self.submodules.wfifo = wfifo = stream.SyncFIFO([
+            ("address", len(avl.address)),
+            ("data",    data_width),
+            ("sel",     len(avl.byteenable))], max_pending)
+        self.submodules.lfifo = lfifo = stream.SyncFIFO([("count", len(avl.burstcount))], max_pending)
+
+        wbeats = Signal(max=burst_size + 1)
+        wlast  = Signal()
+        wpush  = Signal()
+        wclose = Signal()
+        self.comb += [
+            wlast.eq(~burst | (wb.cti == wishbone.CTI_BURST_END) | (wbeats == (burst_size - 1))),
+            wfifo.sink.address.eq(wb.adr),
+            wfifo.sink.data.eq(wb.dat_w),
+            wfifo.sink.sel.eq(wb.sel),
+            lfifo.sink.count.eq(Mux(wclose, wbeats, wbeats + 1)),
+        ]
+        # A burst aborted by the master (cyc dropped before the last beat) is closed with the beats
+        # already queued. lfifo always has room then: its entries never outnumber the wfifo beats.
+        self.comb += [
+            wclose.eq(~wb.cyc & (wbeats != 0)),
+            If(wclose, lfifo.sink.valid.eq(1)),
+        ]
+        self.sync += [
+            If(wpush,
+                If(wlast,
+                    wbeats.eq(0)
+                ).Else(
+                    wbeats.eq(wbeats + 1)
+                )
+            ).Elif(~wb.cyc,
+                wbeats.eq(0)
+            )
+        ]
+
+        wcount = Signal(len(avl.burstcount))
+        wbusy  = Signal()
+        self.comb += wbusy.eq(wfifo.source.valid | lfifo.source.valid)
+
+        # Read path --------------------------------------------------------------------------------
+
+        self.submodules.rfifo = rfifo = stream.SyncFIFO([("data", data_width)], max_pending)
+
+        rvalid = Signal()
+        if read_latency is None:
+            self.comb += rvalid.eq(avl.readdatavalid)
+        else:
+            issued = avl.read & ~avl.waitrequest
+            for i in range(read_latency):
+                issued_d = Signal()
+                self.sync += issued_d.eq(issued)
+                issued = issued_d
+            self.comb += rvalid.eq(issued)
+        self.comb += [
+            rfifo.sink.valid.eq(rvalid),
+            rfifo.sink.data.eq(avl.readdata),
+        ]
+
+        pending   = Signal(max=max_pending + 1) # Reads issued and not consumed/dropped yet.
+        issue     = Signal(max=burst_size + 1)
+        consume   = Signal()
+        radr      = Signal(len(avl.address))
+        rchunk    = Signal(len(avl.burstcount))
+        self.sync += pending.eq(pending + issue - consume)
+        self.comb += consume.eq(rfifo.source.valid & rfifo.source.ready)
+        if prefetch:
+            self.comb += rchunk.eq(Mux(burst, burst_size, 1))
+        else:
+            self.comb += rchunk.eq(1)
+
+        # Control ----------------------------------------------------------------------------------
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            If(wb.cyc & wb.stb,
+                If(wb.we,
+                    wpush.eq(wfifo.sink.ready & lfifo.sink.ready),
+                    wfifo.sink.valid.eq(wpush),
+                    lfifo.sink.valid.eq(wpush & wlast),
+                    wb.ack.eq(wpush),
+                ).Elif(~wbusy,
+                    NextValue(radr, wb.adr),
+                    NextState("READ")
+                )
+            )
+        )
+        fsm.act("READ",
+            # Issue: a read when the current beat has nothing in flight, keep prefetching during
+            # linear bursts.
+            If(((pending == 0) | (prefetch & burst)) & ((pending + rchunk) <= max_pending),
+                avl.read.eq(1),
+                avl.address.eq(radr),
+                avl.burstcount.eq(rchunk),
+                avl.byteenable.eq(2**len(avl.byteenable) - 1),
+                If(~avl.waitrequest,
+                    issue.eq(rchunk),
+                    NextValue(radr, radr + rchunk),
+                )
+            ),
+            # Respond.
+            wb.dat_r.eq(rfifo.source.data),
+            wb.ack.eq(rfifo.source.valid & wb.cyc & wb.stb),
+            rfifo.source.ready.eq(wb.ack),
+            If(wb.ack & (~burst | (wb.cti == wishbone.CTI_BURST_END)),
+                NextState("FLUSH")
+            ),
+            If(~wb.cyc,
+                NextState("FLUSH")
+            )
+        )
+        fsm.act("FLUSH",
+            # Drop the prefetched data the master did not consume.
+            rfifo.source.ready.eq(1),
+            If((pending - consume) == 0,
+                NextState("IDLE")
+            )
+        )
+
+        # Avalon write bursts, drained independently of the Wishbone side.
+        self.comb += If(fsm.ongoing("IDLE"),
+            avl.write.eq(wfifo.source.valid & lfifo.source.valid),
+            avl.address.eq(wfifo.source.address),
+            avl.writedata.eq(wfifo.source.data),
+            avl.byteenable.eq(wfifo.source.sel),
+            avl.burstcount.eq(lfifo.source.count),
+            If(avl.write & ~avl.waitrequest,
+                wfifo.source.ready.eq(1),
+                lfifo.source.ready.eq(wcount == (lfifo.source.count - 1)),
+            )
+        )
+        if hasattr(avl, "burstbegin"):
+            self.comb += avl.burstbegin.eq(avl.write & (wcount == 0))
+        self.sync += If(wfifo.source.valid & wfifo.source.ready,
+            If(lfifo.source.ready,
+                wcount.eq(0)
+            ).Else(
+                wcount.eq(wcount + 1)
+            )
+        )
+        if hasattr(avl, "chipselect"):
+            self.comb += avl.chipselect.eq(avl.read | avl.write)
@@ -0,0 +1,226 @@
+from migen import *
+
+from litex.build.tools import write_to_file
+from litex.soc.interconnect import stream
+from litex.soc.interconnect.csr import *
+
+from litedram.frontend.dma import LiteDRAMDMAWriter
+
+from pcie_mitm.ip.compress import ChangeEncoder
+
+
+# Helpers ------------------------------------------------------------------------------------------
+
+def _pow2_ceil(n):
+    return 1 << max(0, (n - 1).bit_length())
+
+# DRAM Ring Capture --------------------------------------------------------------------------------
+
+class DRAMCapture(Module, AutoCSR):
+    """Deep capture of a signal set into a DRAM ring buffer.
+
+    Samples are taken every `sys` cycle, or on `sink.valid` when `signals` is None and `sink` is
+    driven by an upstream stage of `data_width` bits, packed into DRAM words and written through a
+    LiteDRAMDMAWriter to `[base, base + depth)`. After arming, the core keeps at least `pre` samples
+    in the ring before it accepts a trigger, then stops `post` samples after the trigger. The
+    trigger fires on a value/mask match on the sample or when `trigger` is asserted by external
+    logic.
+
+    With `compress`, a ChangeEncoder sits in front of the ring and only (delta, value) records of
+    the cycles where the sample changed are stored: `pre`/`post` and the trigger index then count
+    records, not cycles.
+    """
+    def __init__(self, signals, port, base, depth, data_width=None, samplerate=1e12, fifo_depth=64,
+                 compress=False, timestamp_width=16, csr_csv="capture.csv"):
+        assert depth % (port.data_width//8) == 0
+        self.signals     = signals = self.format_signals(signals)
+        self.port        = port
+        self.base        = base
+        self.depth       = depth
+        self.samplerate  = int(samplerate)
+        self.csr_csv     = csr_csv
+        if data_width is None:
+            data_width = sum(len(s) for s in signals)
+        self.data_width  = data_width
+        self.compress    = compress
+        self.timestamp_width = timestamp_width if compress else 0
+        self.record_width = record_width = self.timestamp_width + data_width
+        self.sample_width = sample_width = max(8, _pow2_ceil(record_width))
+        assert sample_width <= port.data_width, \
+            f"sample width {sample_width} > DRAM port width {port.data_width}, split the signal set"
+        self.ratio       = ratio = port.data_width//sample_width
+        self.words       = words = depth//(port.data_width//8)
+        self.samples     = words*ratio
+
+        self.sink    = sink = stream.Endpoint([("data", data_width)])
+        self.trigger = Signal()
+
+        self._arm           = CSR()
+        self._pre_length    = CSRStorage(32, description="Samples kept before the trigger.")
+        self._post_length   = CSRStorage(32, description="Samples captured after the trigger.")
+        self._trigger_value = CSRStorage(data_width)
+        self._trigger_mask  = CSRStorage(data_width)
+        self._status        = CSRStatus(fields=[
+            CSRField("done",      size=1, description="Capture window complete and flushed to DRAM."),
+            CSRField("triggered", size=1, description="Trigger seen since arm."),
+        ])
+        self._trigger_index = CSRStatus(32, description="Sample index of the trigger in the ring.")
+        self._count         = CSRStatus(32, description="Samples written since arm.")
+        self._overflow      = CSRStatus(32, description="Samples dropped because DRAM was busy.")
+
+        # # #
+
+        if signals:
+            self.comb += [
+                sink.valid.eq(1),
+                sink.data.eq(Cat(*signals)),
+            ]
+
+        clear = Signal()
+
+        # Change compression.
+        if compress:
+            self.submodules.encoder = encoder = ChangeEncoder(data_width, timestamp_width)
+            self.comb += sink.connect(encoder.sink)
+            records = encoder.source
+            value   = records.data[timestamp_width:]
+            self.comb += encoder.restart.eq(clear)
+        else:
+            records = sink
+            value   = sink.data
+
+        # Sample packing / DRAM writer.
+        self.submodules.converter = converter = stream.Converter(sample_width, port.data_width)
+        self.submodules.dma       = dma       = LiteDRAMDMAWriter(port, fifo_depth=fifo_depth)
+
+        shift    = log2_int(port.data_width//8)
+        base_adr = base >> shift
+        offset   = Signal(max=max(words, 2))
+        self.comb += [
+            dma.sink.valid.eq(converter.source.valid),
+            dma.sink.address.eq(base_adr + offset),
+            dma.sink.data.eq(converter.source.data),
+            converter.source.ready.eq(dma.sink.ready),
+        ]
+        self.sync += If(clear,
+            offset.eq(0)
+        ).Elif(converter.source.valid & converter.source.ready,
+            If(offset == (words - 1),
+                offset.eq(0)
+            ).Else(
+                offset.eq(offset + 1)
+            )
+        )
+
+        # Trigger.
+        hit = Signal()
+        self.comb += hit.eq(self.trigger |
+            (((value ^ self._trigger_value.storage) & self._trigger_mask.storage) == 0))
+
+        # Control.
+        done      = Signal()
+        triggered = Signal()
+        count     = Signal(32)
+        remaining = Signal(32)
+        padding   = Signal(32)
+        write     = Signal()
+        accept    = Signal()
+        self.comb += [
+            converter.sink.valid.eq(records.valid & write),
+            converter.sink.data.eq(records.data),
+            records.ready.eq(1),
+            accept.eq(write & records.valid & converter.sink.ready),
+            self._count.status.eq(count),
+            self._status.fields.done.eq(done),
+            self._status.fields.triggered.eq(triggered),
+            # Pad the post window so the last DRAM word is completely filled.
+            padding.eq((0 - (count + 1 + self._post_length.storage)) & (ratio - 1)),
+        ]
+        self.sync += [
+            If(clear,
+                count.eq(0),
+                self._overflow.status.eq(0),
+            ).Elif(write & records.valid,
+                If(converter.sink.ready,
+                    count.eq(count + 1)
+                ).Else(
+                    self._overflow.status.eq(self._overflow.status + 1)
+                )
+            )
+        ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            If(self._arm.re,
+                clear.eq(1),
+                NextValue(done, 0),
+                NextValue(triggered, 0),
+                NextState("PRE")
+            )
+        )
+        fsm.act("PRE",
+            write.eq(1),
+            If(count >= self._pre_length.storage,
+                NextState("WAIT")
+            )
+        )
+        fsm.act("WAIT",
+            write.eq(1),
+            If(accept & hit,
+                NextValue(self._trigger_index.status, count),
+                NextValue(triggered, 1),
+                NextValue(remaining, self._post_length.storage + padding),
+                If((self._post_length.storage + padding) == 0,
+                    NextState("FLUSH")
+                ).Else(
+                    NextState("POST")
+                )
+            )
+        )
+        fsm.act("POST",
+            write.eq(1),
+            If(accept,
+                NextValue(remaining, remaining - 1),
+                If(remaining == 1,
+                    NextState("FLUSH")
+                )
+            )
+        )
+        fsm.act("FLUSH",
+            If(~converter.source.valid & ~dma.fifo.source.valid,
+                NextValue(done, 1),
+                NextState("IDLE")
+            )
+        )
+
+    def format_signals(self, signals):
+        if signals is None:
+            return []
+        if not isinstance(signals, list):
+            signals = [signals]
+        split_signals = []
+        for s in signals:
+            if isinstance(s, Record):
+                split_signals.extend(s.flatten())
+            else:
+                split_signals.append(s)
+        return list(dict.fromkeys(split_signals)) # Remove duplicates.
+
+    def export_csv(self, vns, filename):
+        def format_line(*args):
+            return ",".join(args) + "\n"
+        r  = format_line("config", "None", "data_width",   str(self.data_width))
+        r += format_line("config", "None", "timestamp_width", str(self.timestamp_width))
+        r += format_line("config", "None", "sample_width", str(self.sample_width))
+        r += format_line("config", "None", "word_width",   str(self.port.data_width))
+        r += format_line("config", "None", "samples",      str(self.samples))
+        r += format_line("config", "None", "base",         str(self.base))
+        r += format_line("config", "None", "depth",        str(self.depth))
+        r += format_line("config", "None", "samplerate",   str(self.samplerate))
+        for s in self.signals:
+            r += format_line("signal", "0", vns.get_name(s), str(len(s)))
+        write_to_file(filename, r)
+
+    def do_exit(self, vns):
+        if self.csr_csv is not None:
+            self.export_csv(vns, self.csr_csv)
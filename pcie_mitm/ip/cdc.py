@@ -0,0 +1,78 @@
+from migen import *
+from migen.genlib.cdc import BusSynchronizer, PulseSynchronizer
+
+from litex.soc.interconnect import stream
+from litex.soc.interconnect.csr import *
+
+
+# Helpers ------------------------------------------------------------------------------------------
+
+def capture_ratio(from_freq, to_freq):
+    """Smallest power of 2 of samples per word sustaining `from_freq` samples/s in `to_freq`."""
+    ratio = 1
+    while ratio*to_freq < from_freq:
+        ratio *= 2
+    return ratio
+
+# Capture Clock Domain Crossing --------------------------------------------------------------------
+
+class CaptureCDC(Module, AutoCSR):
+    """Capture samples from a fast clock domain (capture/PCIe core clock) into a slower one (SoC).
+
+    `sink` is in `cd_from` and never back-pressured: the capture datapath samples every cycle. Groups
+    of `ratio` samples are packed into a word (first sample in the LSBs, like stream.Converter) and
+    crossed through an AsyncFIFO of `depth` words, so `source` (in `cd_to`, `ratio*data_width` bits)
+    sustains the full sample rate as long as `ratio` >= f(cd_from)/f(cd_to), see capture_ratio.
+    Samples arriving while the FIFO is full are dropped and counted.
+    """
+    def __init__(self, data_width, ratio=1, depth=16, cd_from="capture", cd_to="sys"):
+        self.data_width = data_width
+        self.ratio      = ratio
+        self.sink   = sink   = stream.Endpoint([("data", data_width)])
+        self.source = source = stream.Endpoint([("data", data_width*ratio)])
+
+        self._clear    = CSR()
+        self._overflow = CSRStatus(32, description="Samples dropped since clear (crossing FIFO full).")
+
+        # # #
+
+        # Packing.
+        converter = stream.Converter(data_width, data_width*ratio)
+        converter = ClockDomainsRenamer(cd_from)(converter)
+        self.submodules.converter = converter
+
+        # Crossing.
+        self.submodules.cdc = cdc = stream.ClockDomainCrossing([("data", data_width*ratio)],
+            cd_from = cd_from,
+            cd_to   = cd_to,
+            depth   = depth)
+        self.comb += [
+            converter.source.connect(cdc.sink),
+            cdc.source.connect(source),
+        ]
+
+        # Drop (and count) instead of back-pressuring the capture.
+        self.comb += [
+            converter.sink.valid.eq(sink.valid),
+            converter.sink.data.eq(sink.data),
+            sink.ready.eq(1),
+        ]
+
+        # Overflow count, kept in `cd_from` and read from `sys`.
+        overflow = Signal(32)
+        self.submodules.clear_sync = PulseSynchronizer("sys", cd_from)
+        self.comb += self.clear_sync.i.eq(self._clear.re)
+        sync = getattr(self.sync, cd_from)
+        sync += If(self.clear_sync.o,
+            overflow.eq(0)
+        ).Elif(converter.sink.valid & ~converter.sink.ready,
+            overflow.eq(overflow + 1)
+        )
+        if cd_from == "sys":
+            self.comb += self._overflow.status.eq(overflow)
+        else:
+            self.submodules.overflow_sync = BusSynchronizer(32, cd_from, "sys")
+            self.comb += [
+                self.overflow_sync.i.eq(overflow),
+                self._overflow.status.eq(self.overflow_sync.o),
+            ]
@@ -0,0 +1,53 @@
+from migen import *
+
+from litex.soc.interconnect import stream
+
+
+# Change Encoder -----------------------------------------------------------------------------------
+
+def change_record_layout(data_width, timestamp_width):
+    return [("data", timestamp_width + data_width)]
+
+class ChangeEncoder(Module):
+    """Emit a (timestamp delta, value) record only on the cycles where the sample changes.
+
+    Records are `Cat(delta, value)`: `delta` is the number of samples since the previous record
+    (0 for the first record after `restart`) and `value` is the full new sample, so decoding can
+    start from any record. A record with an unchanged value is emitted when `delta` would overflow.
+    `sink` is always ready, `source` has one cycle of latency and no backpressure: the consumer
+    is expected to count what it could not store.
+    """
+    def __init__(self, data_width, timestamp_width=16):
+        self.data_width      = data_width
+        self.timestamp_width = timestamp_width
+        self.sink    = sink   = stream.Endpoint([("data", data_width)])
+        self.source  = source = stream.Endpoint(change_record_layout(data_width, timestamp_width))
+        self.restart = Signal()
+
+        # # #
+
+        last    = Signal(data_width)
+        delta   = Signal(timestamp_width)
+        first   = Signal(reset=1)
+        changed = Signal()
+        self.comb += [
+            sink.ready.eq(1),
+            changed.eq(first | (sink.data != last) | (delta == (2**timestamp_width - 1))),
+        ]
+        self.sync += [
+            source.valid.eq(0),
+            If(self.restart,
+                first.eq(1),
+                delta.eq(0),
+            ).Elif(sink.valid,
+                If(changed,
+                    source.valid.eq(1),
+                    source.data.eq(Cat(delta, sink.data)),
+                    last.eq(sink.data),
+                    first.eq(0),
+                    delta.eq(1),
+                ).Else(
+                    delta.eq(delta + 1)
+                )
+            )
+        ]
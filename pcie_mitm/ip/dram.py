@@ -0,0 +1,335 @@
+import os
+
+from migen import *
+from migen.genlib.cdc import MultiReg
+from migen.genlib.roundrobin import RoundRobin, SP_CE
+
+from litex.soc.interconnect import avalon
+from litex.soc.interconnect import stream
+from litex.soc.interconnect.csr import *
+
+from litedram.common import LiteDRAMNativePort
+from litedram.frontend.adapter import LiteDRAMNativePortCDC, LiteDRAMNativePortConverter
+from litedram.frontend.bist import LiteDRAMBISTChecker, LiteDRAMBISTGenerator
+from litedram.modules import DDR3Module, _SpeedgradeTimings, _TechnologyTimings
+
+
+# DDR3 SODIMM --------------------------------------------------------------------------------------
+
+class MT8JSF12864HZ(DDR3Module):
+    """Micron MT8JSF12864HZ-1G1 1GB DDR3 SODIMM of the Arria V board (see doc/part-notes.txt)."""
+    # base chip: MT41J128M8
+    # geometry
+    nbanks = 8
+    nrows  = 16384
+    ncols  = 1024
+    # timings
+    technology_timings = _TechnologyTimings(tREFI=64e6/8192, tWTR=(4, 7.5), tCCD=(4, None), tRRD=(4, 7.5), tZQCS=(64, 80))
+    speedgrade_timings = {
+        "1066": _SpeedgradeTimings(tRP=13.125, tRCD=13.125, tWR=15, tRFC=(None, 110), tFAW=(None, 37.5), tRAS=37.5),
+    }
+    speedgrade_timings["default"] = speedgrade_timings["1066"]
+
+# Avalon-MM DRAM Crossbar --------------------------------------------------------------------------
+
+class AvalonMMDRAMCrossbar(Module):
+    """LiteDRAM native ports on an Avalon-MM memory controller (e.g. the UniPHY DDR3 controller).
+
+    Same `get_port` as litedram.core.crossbar.LiteDRAMCrossbar, so LiteDRAM frontends (BIST, DMA,
+    Wishbone bridge, pcie_mitm.ip.capture.DRAMCapture) run unchanged on a vendor controller. Ports
+    are arbitrated round-robin per access on `avl` (single-beat, pipelined reads returned in order)
+    in `clock_domain`; each port keeps up to `max_pending` reads in flight.
+    """
+    def __init__(self, avl, clock_domain="sys", max_pending=8, cmd_depth=4):
+        self.avl           = avl
+        self.clock_domain  = clock_domain
+        self.data_width    = len(avl.writedata)
+        self.address_width = len(avl.address)
+        self.max_pending   = max_pending
+        self.cmd_depth     = cmd_depth
+        self.masters       = []
+
+    def get_port(self, mode="both", data_width=None, clock_domain="sys", reverse=False):
+        if self.finalized:
+            raise FinalizeError
+        if data_width is None:
+            data_width = self.data_width
+
+        # Crossbar port.
+        port = LiteDRAMNativePort(
+            mode          = mode,
+            address_width = self.address_width,
+            data_width    = self.data_width,
+            clock_domain  = self.clock_domain,
+            id            = len(self.masters))
+        self.masters.append(port)
+
+        # Clock domain crossing.
+        if clock_domain != self.clock_domain:
+            new_port = LiteDRAMNativePort(
+                mode          = mode,
+                address_width = port.address_width,
+                data_width    = port.data_width,
+                clock_domain  = clock_domain,
+                id            = port.id)
+            self.submodules += LiteDRAMNativePortCDC(new_port, port)
+            port = new_port
+
+        # Data width conversion.
+        if data_width != self.data_width:
+            if data_width > self.data_width:
+                addr_shift = -log2_int(data_width//self.data_width)
+            else:
+                addr_shift = log2_int(self.data_width//data_width)
+            new_port = LiteDRAMNativePort(
+                mode          = mode,
+                address_width = port.address_width + addr_shift,
+                data_width    = data_width,
+                clock_domain  = clock_domain,
+                id            = port.id)
+            self.submodules += ClockDomainsRenamer(clock_domain)(
+                LiteDRAMNativePortConverter(new_port, port, reverse))
+            port = new_port
+
+        return port
+
+    def do_finalize(self):
+        avl     = self.avl
+        nports  = len(self.masters)
+        sync    = getattr(self.sync, self.clock_domain)
+        renamer = ClockDomainsRenamer(self.clock_domain)
+        if nports == 0:
+            return
+
+        # Ports: accepted commands, wait for the write data of writes and for a free read slot.
+        cmds     = []
+        rdatas   = []
+        requests = []
+        issues   = []
+        for port in self.masters:
+            cmd   = renamer(stream.SyncFIFO([("we", 1), ("addr", self.address_width)], self.cmd_depth))
+            rdata = renamer(stream.SyncFIFO([("data", self.data_width)], self.max_pending))
+            self.submodules += cmd, rdata
+            inflight = Signal(max=self.max_pending + 1) # Reads issued, not yet consumed.
+            request  = Signal()
+            issue    = Signal()
+            self.comb += [
+                port.cmd.connect(cmd.sink),
+                request.eq(cmd.source.valid & Mux(cmd.source.we,
+                    port.wdata.valid,
+                    inflight != self.max_pending)),
+                cmd.source.ready.eq(issue),
+                port.wdata.ready.eq(issue & cmd.source.we),
+                rdata.source.connect(port.rdata),
+            ]
+            sync += inflight.eq(inflight + (issue & ~cmd.source.we) - (rdata.source.valid & rdata.source.ready))
+            cmds.append(cmd.source)
+            rdatas.append(rdata.sink)
+            requests.append(request)
+            issues.append(issue)
+
+        # Arbitration, one access per grant.
+        self.submodules.rr = rr = renamer(RoundRobin(nports, SP_CE))
+        grant = rr.grant
+        cmd   = Array(cmds)[grant]
+        wdata = Array(p.wdata for p in self.masters)[grant]
+        self.comb += [
+            rr.request.eq(Cat(*requests)),
+            rr.ce.eq(~Array(requests)[grant] | ~avl.waitrequest),
+            avl.address.eq(cmd.addr),
+            avl.writedata.eq(wdata.data),
+            avl.byteenable.eq(Mux(cmd.we, wdata.we, 2**len(avl.byteenable) - 1)),
+            avl.burstcount.eq(1),
+            avl.write.eq(Array(requests)[grant] & cmd.we),
+            avl.read.eq(Array(requests)[grant] & ~cmd.we),
+        ]
+        self.comb += [issues[i].eq(requests[i] & (grant == i) & ~avl.waitrequest) for i in range(nports)]
+        if hasattr(avl, "chipselect"):
+            self.comb += avl.chipselect.eq(avl.read | avl.write)
+        if hasattr(avl, "burstbegin"):
+            self.comb += avl.burstbegin.eq(avl.read | avl.write)
+
+        # Read data, returned in order to the issuing ports.
+        order = renamer(stream.SyncFIFO([("port", bits_for(max(nports - 1, 1)))], nports*self.max_pending))
+        self.submodules.order = order
+        self.comb += [
+            order.sink.valid.eq(avl.read & ~avl.waitrequest),
+            order.sink.port.eq(grant),
+            order.source.ready.eq(avl.readdatavalid),
+        ]
+        for i, rdata in enumerate(rdatas):
+            self.comb += [
+                rdata.valid.eq(avl.readdatavalid & (order.source.port == i)),
+                rdata.data.eq(avl.readdata),
+            ]
+
+# Benchmark ----------------------------------------------------------------------------------------
+
+class DRAMLatencyProbe(Module, AutoCSR):
+    """Read latency of a LiteDRAM native port.
+
+    Issues `count` single reads at `base + i*stride` (port words), each once the previous one
+    returned, and keeps the min/max/sum of the cycles from command to data.
+    """
+    def __init__(self, port):
+        self._start  = CSR()
+        self._base   = CSRStorage(port.address_width)
+        self._stride = CSRStorage(port.address_width, reset=1)
+        self._count  = CSRStorage(32, reset=1)
+        self._done   = CSRStatus()
+        self._min    = CSRStatus(32)
+        self._max    = CSRStatus(32)
+        self._sum    = CSRStatus(64)
+
+        # # #
+
+        address   = Signal(port.address_width)
+        remaining = Signal(32)
+        cycles    = Signal(32)
+        self.comb += [
+            port.cmd.we.eq(0),
+            port.cmd.addr.eq(address),
+            port.wdata.valid.eq(0),
+        ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            self._done.status.eq(1),
+            If(self._start.re,
+                NextValue(address, self._base.storage),
+                NextValue(remaining, self._count.storage),
+                NextValue(self._min.status, 2**32 - 1),
+                NextValue(self._max.status, 0),
+                NextValue(self._sum.status, 0),
+                If(self._count.storage != 0,
+                    NextState("CMD")
+                )
+            )
+        )
+        fsm.act("CMD",
+            port.cmd.valid.eq(1),
+            If(port.cmd.ready,
+                NextValue(cycles, 1),
+                NextState("WAIT")
+            )
+        )
+        fsm.act("WAIT",
+            port.rdata.ready.eq(1),
+            NextValue(cycles, cycles + 1),
+            If(port.rdata.valid,
+                If(cycles < self._min.status, NextValue(self._min.status, cycles)),
+                If(cycles > self._max.status, NextValue(self._max.status, cycles)),
+                NextValue(self._sum.status, self._sum.status + cycles),
+                NextValue(address, address + self._stride.storage),
+                NextValue(remaining, remaining - 1),
+                If(remaining == 1,
+                    NextState("IDLE")
+                ).Else(
+                    NextState("CMD")
+                )
+            )
+        )
+
+class DRAMBenchmark(Module, AutoCSR):
+    """Bandwidth and latency benchmark of a LiteDRAM crossbar.
+
+    A LiteDRAMBISTGenerator (writes) and a LiteDRAMBISTChecker (reads) measure the bandwidth of
+    sequential or random accesses, a DRAMLatencyProbe the read latency, each on its own port of
+    `crossbar` (a LiteDRAMCrossbar or an AvalonMMDRAMCrossbar), in `sys`. Driven by
+    pcie_mitm.host.dram.DRAMBenchmarkDriver.
+    """
+    def __init__(self, crossbar):
+        write_port = crossbar.get_port(mode="write")
+        read_port  = crossbar.get_port(mode="read")
+        probe_port = crossbar.get_port(mode="read")
+        self.data_width = write_port.data_width
+
+        # # #
+
+        self.submodules.generator = LiteDRAMBISTGenerator(write_port)
+        self.submodules.checker   = LiteDRAMBISTChecker(read_port)
+        self.submodules.latency   = DRAMLatencyProbe(probe_port)
+
+# UniPHY DDR3 --------------------------------------------------------------------------------------
+
+class UniPHYDDR3(Module, AutoCSR):
+    """Arria V DDR3 through the UniPHY controller of ddr3.qsys (half-rate, 256-bit Avalon-MM).
+
+    LiteDRAM has no Arria V PHY: the hard-calibrated UniPHY controller is used instead and its
+    Avalon-MM port is shared between LiteDRAM native ports by an AvalonMMDRAMCrossbar in the `dram`
+    clock domain (UniPHY afi_clk), see `crossbar.get_port`. `ref_clk` is the 125MHz PLL reference.
+    """
+    def __init__(self, platform, pads, ref_clk, module, reset=0):
+        geom = module.geom_settings
+        self.size = 2**(geom.bankbits + geom.rowbits + geom.colbits)*len(pads.dq)//8
+        data_width    = 4*len(pads.dq) # Half-rate: 4 beats per afi_clk.
+        address_width = log2_int(self.size//(data_width//8))
+
+        self.clock_domains.cd_dram = ClockDomain()
+        self.avl = avl = avalon.AvalonMMInterface(data_width=data_width, adr_width=address_width)
+
+        self._status = CSRStatus(fields=[
+            CSRField("init_done",   size=1, description="Controller initialization done."),
+            CSRField("cal_success", size=1, description="PHY calibration succeeded."),
+            CSRField("cal_fail",    size=1, description="PHY calibration failed."),
+        ])
+
+        # # #
+
+        init_done   = Signal()
+        cal_success = Signal()
+        cal_fail    = Signal()
+        afi_reset_n = Signal()
+        avl_ready   = Signal()
+        self.specials += [
+            MultiReg(init_done,   self._status.fields.init_done),
+            MultiReg(cal_success, self._status.fields.cal_success),
+            MultiReg(cal_fail,    self._status.fields.cal_fail),
+        ]
+        self.comb += [
+            self.cd_dram.rst.eq(~afi_reset_n),
+            avl.waitrequest.eq(~avl_ready),
+        ]
+
+        self.specials += Instance("ddr3",
+            i_pll_ref_clk_clk                   = ref_clk,
+            i_ddr3_global_reset_reset_n         = ~reset,
+            i_ddr3_soft_reset_reset_n           = ~reset,
+            o_ddr3_afi_clk_clk                  = self.cd_dram.clk,
+            o_ddr3_afi_reset_reset_n            = afi_reset_n,
+
+            o_memory_mem_a                      = pads.a,
+            o_memory_mem_ba                     = pads.ba,
+            o_memory_mem_ck                     = pads.clk_p,
+            o_memory_mem_ck_n                   = pads.clk_n,
+            o_memory_mem_cke                    = pads.cke,
+            o_memory_mem_cs_n                   = pads.cs_n,
+            o_memory_mem_dm                     = pads.dm,
+            o_memory_mem_ras_n                  = pads.ras_n,
+            o_memory_mem_cas_n                  = pads.cas_n,
+            o_memory_mem_we_n                   = pads.we_n,
+            o_memory_mem_reset_n                = pads.reset_n,
+            io_memory_mem_dq                    = pads.dq,
+            io_memory_mem_dqs                   = pads.dqs_p,
+            io_memory_mem_dqs_n                 = pads.dqs_n,
+            o_memory_mem_odt                    = pads.odt,
+            i_oct_rzqin                         = pads.rzq,
+
+            o_ddr3_avl_waitrequest_n            = avl_ready,
+            i_ddr3_avl_beginbursttransfer       = avl.burstbegin,
+            i_ddr3_avl_address                  = avl.address,
+            o_ddr3_avl_readdatavalid            = avl.readdatavalid,
+            o_ddr3_avl_readdata                 = avl.readdata,
+            i_ddr3_avl_writedata                = avl.writedata,
+            i_ddr3_avl_byteenable               = avl.byteenable,
+            i_ddr3_avl_read                     = avl.read,
+            i_ddr3_avl_write                    = avl.write,
+            i_ddr3_avl_burstcount               = avl.burstcount,
+
+            o_ddr3_status_local_init_done       = init_done,
+            o_ddr3_status_local_cal_success     = cal_success,
+            o_ddr3_status_local_cal_fail        = cal_fail,
+        )
+        platform.add_ip(os.path.join(os.path.dirname(__file__), "ddr3.qsys"))
+
+        self.submodules.crossbar = AvalonMMDRAMCrossbar(avl, clock_domain="dram")
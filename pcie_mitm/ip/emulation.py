@@ -0,0 +1,591 @@
+from migen import *
+from migen.genlib.coding import PriorityEncoder
+
+from litex.soc.interconnect import stream
+from litex.soc.interconnect import wishbone
+from litex.soc.interconnect.csr import *
+
+from litedram.frontend.dma import LiteDRAMDMAReader
+
+from pcie_mitm.ip.fuzz import TLPInjector
+from pcie_mitm.ip.tlp import TLPHeader, fmt_type_dict, tlp_layout, tlp_record_width
+
+
+# Helpers ------------------------------------------------------------------------------------------
+
+cpl_status = {
+    "sc":  0b000, # Successful Completion.
+    "ur":  0b001, # Unsupported Request.
+    "crs": 0b010, # Configuration Request Retry Status.
+    "ca":  0b100, # Completer Abort.
+}
+
+# Byte enable nibble tables: first enabled byte, bytes after the last enabled byte, enabled span.
+_be_lead  = [((be & -be).bit_length() - 1) if be else 0 for be in range(16)]
+_be_trail = [(4 - be.bit_length()) if be else 0 for be in range(16)]
+_be_span  = [(be.bit_length() - _be_lead[be]) if be else 1 for be in range(16)]
+
+def _be_table(table, be):
+    return Array([Constant(v, 3) for v in table])[be]
+
+def _cpl_header(fmt_type, length, completer_id, status, byte_count, requester_id, tag, lower_address):
+    """Completion header DWs (DW0, DW1, DW2)."""
+    return [
+        Cat(length[0:10], Constant(0, 14), Constant(fmt_type, 8)),
+        Cat(byte_count[0:12], Constant(0, 1), Constant(status, 3), completer_id),
+        Cat(lower_address[0:7], Constant(0, 1), tag, requester_id),
+    ]
+
+# Memory Backends ----------------------------------------------------------------------------------
+
+class _BRAMBackend(Module):
+    """BAR memory in a BRAM: host access on `bus`, one read/write port for the emulator."""
+    def __init__(self, data_width, depth):
+        self.mem = mem = Memory(data_width, depth)
+        self.bus = wishbone.Interface(data_width=data_width)
+        self.submodules.sram = wishbone.SRAM(mem, bus=self.bus)
+
+        address_width = log2_int(depth)
+        self.reader_sink   = reader_sink   = stream.Endpoint([("address", address_width)])
+        self.reader_source = reader_source = stream.Endpoint([("data", data_width)])
+        self.writer_sink   = writer_sink   = stream.Endpoint([("address", address_width),
+            ("data", data_width), ("we", data_width//8)])
+        self.idle = Signal(reset=1)
+
+        # # #
+
+        port = mem.get_port(write_capable=True, we_granularity=8, has_re=True)
+        self.specials += port
+        self.comb += [
+            writer_sink.ready.eq(1),
+            reader_sink.ready.eq(~writer_sink.valid & (~reader_source.valid | reader_source.ready)),
+            port.adr.eq(Mux(writer_sink.valid, writer_sink.address, reader_sink.address)),
+            port.dat_w.eq(writer_sink.data),
+            port.we.eq(Replicate(writer_sink.valid, data_width//8) & writer_sink.we),
+            port.re.eq(reader_sink.ready),
+            reader_source.data.eq(port.dat_r),
+        ]
+        self.sync += If(reader_sink.ready, reader_source.valid.eq(reader_sink.valid))
+
+class _DRAMBackend(Module):
+    """BAR memory in DRAM, through a read and a write port of the crossbar.
+
+    LiteDRAMDMAWriter always writes whole words, so writes go through their own FIFO with the
+    byte enables of the TLP. `idle` tells when every write has been handed to the controller.
+    """
+    def __init__(self, read_port, write_port, fifo_depth=16):
+        assert read_port.data_width == write_port.data_width
+        data_width = write_port.data_width
+        self.submodules.reader = reader = LiteDRAMDMAReader(read_port)
+        self.reader_sink   = reader.sink
+        self.reader_source = reader.source
+        self.writer_sink   = writer_sink = stream.Endpoint([("address", write_port.address_width),
+            ("data", data_width), ("we", data_width//8)])
+        self.idle = Signal()
+
+        # # #
+
+        self.submodules.fifo = fifo = stream.SyncFIFO([("data", data_width), ("we", data_width//8)], fifo_depth)
+        cmd, wdata = write_port.cmd, write_port.wdata
+        self.comb += [
+            cmd.we.eq(1),
+            cmd.addr.eq(writer_sink.address),
+            cmd.valid.eq(fifo.sink.ready & writer_sink.valid),
+            writer_sink.ready.eq(fifo.sink.ready & cmd.ready),
+            fifo.sink.valid.eq(writer_sink.valid & cmd.ready),
+            fifo.sink.data.eq(writer_sink.data),
+            fifo.sink.we.eq(writer_sink.we),
+            wdata.valid.eq(fifo.source.valid),
+            fifo.source.ready.eq(wdata.ready),
+            wdata.data.eq(fifo.source.data),
+            wdata.we.eq(fifo.source.we),
+            self.idle.eq(~fifo.source.valid),
+        ]
+
+# Trap Rule ----------------------------------------------------------------------------------------
+
+class _TrapRule(Module, AutoCSR):
+    def __init__(self, is_cfg, is_mem, is_write, bar, offset):
+        self.match = Signal()
+
+        self._ctrl = CSRStorage(fields=[
+            CSRField("enable", size=1, description="Rule enable."),
+            CSRField("config", size=1, description="Trap config space registers instead of BAR memory."),
+            CSRField("reads",  size=1, description="Trap reads."),
+            CSRField("writes", size=1, description="Trap writes."),
+        ])
+        self._bar_mask = CSRStorage(8,  description="BARs to trap (0: any).")
+        self._low      = CSRStorage(32, description="First trapped byte offset (in the BAR or the config space).")
+        self._high     = CSRStorage(32, description="Last trapped byte offset.")
+
+        # # #
+
+        bar_match = Signal()
+        self.comb += [
+            bar_match.eq((self._bar_mask.storage == 0) | ((bar & self._bar_mask.storage) != 0)),
+            self.match.eq(self._ctrl.fields.enable &
+                Mux(self._ctrl.fields.config, is_cfg, is_mem & bar_match) &
+                Mux(is_write, self._ctrl.fields.writes, self._ctrl.fields.reads) &
+                (offset >= self._low.storage) &
+                (offset <= self._high.storage)),
+        ]
+
+# Device Emulator ----------------------------------------------------------------------------------
+
+class DeviceEmulator(Module, AutoCSR):
+    """Endpoint emulation: config space and BAR memory served from gateware.
+
+    `sink` receives the requests of the link (BAR hit vector in `bar`), `source` sends the
+    completions. Type 0 config requests are served from `config_mem` (`config_dws` DWs followed
+    by their write masks, so BAR sizing and read-only registers behave), memory requests from
+    the BAR backing memory: a BRAM on `bar_bus`, or DRAM through `read_port`/`write_port`. Each
+    BAR maps `address & barN_mask` at byte `barN_base` of the backing memory. Reads are answered
+    at one beat per cycle, split on Max Payload Size boundaries; unsupported non-posted requests
+    get a UR completion.
+
+    Requests matching a trap rule are not served: they are pushed as pcie_mitm.ip.tlp records
+    (with up to `payload_dws` payload DWs) to a FIFO read through the `trap_*` CSRs, and the host
+    answers with completions written to the `response` injector BRAM. When the trap FIFO is full
+    the link is back-pressured, trapped writes are never lost.
+    """
+    def __init__(self, data_width=64, nbars=6, bar_depth=4096, read_port=None, write_port=None,
+                 config_dws=1024, ntraps=4, trap_depth=16, payload_dws=8, response_depth=256):
+        assert data_width in [64, 128, 256]
+        assert ntraps <= 8
+        self.data_width   = data_width
+        self.config_dws   = config_dws
+        self.payload_dws  = payload_dws
+        self.record_width = record_width = tlp_record_width(payload_dws)
+        self.sink   = sink   = stream.Endpoint(tlp_layout(data_width))
+        self.source = source = stream.Endpoint(tlp_layout(data_width))
+
+        self._max_payload  = CSRStorage(11, reset=32, description="Max Payload Size in DWs (power of 2).")
+        self._completer_id = CSRStatus(16, description="Bus/Device/Function captured from Type 0 config requests.")
+        self._requests     = CSRStatus(32, description="Requests received.")
+        self._completions  = CSRStatus(32, description="Completions sent by the emulator.")
+        self._unsupported  = CSRStatus(32, description="Unsupported Request Completions sent.")
+        self._trapped      = CSRStatus(32, description="Requests forwarded to the host.")
+        self._trap_level   = CSRStatus(bits_for(trap_depth), description="Trapped requests waiting for the host.")
+        self._trap_record  = CSRStatus(record_width, description="Oldest trapped request.")
+        self._trap_pop     = CSR()
+        bar_masks = []
+        bar_bases = []
+        for i in range(nbars):
+            mask = CSRStorage(32, name=f"bar{i}_mask", description="BAR size - 1.")
+            base = CSRStorage(32, name=f"bar{i}_base", description="Byte address of the BAR in the backing memory.")
+            setattr(self, f"_bar{i}_mask", mask)
+            setattr(self, f"_bar{i}_base", base)
+            bar_masks.append(mask.storage)
+            bar_bases.append(base.storage)
+
+        # # #
+
+        lanes = data_width//32
+        shift = log2_int(lanes)
+
+        timestamp = Signal(64)
+        self.sync += timestamp.eq(timestamp + 1)
+
+        # Memories ---------------------------------------------------------------------------------
+        self.config_mem = Memory(32, 2*config_dws)
+        self.config_bus = wishbone.Interface()
+        self.submodules.config_sram = wishbone.SRAM(self.config_mem, bus=self.config_bus)
+        config_port = self.config_mem.get_port(write_capable=True)
+        self.specials += config_port
+
+        if read_port is None:
+            self.submodules.backend = backend = _BRAMBackend(data_width, bar_depth)
+            self.bar_mem = backend.mem
+            self.bar_bus = backend.bus
+        else:
+            assert read_port.data_width == data_width
+            self.submodules.backend = backend = _DRAMBackend(read_port, write_port)
+
+        self.submodules.response = response = TLPInjector(data_width, response_depth)
+        self.response_bus = response.bus
+
+        # Request capture --------------------------------------------------------------------------
+        hdr      = [Signal(32) for _ in range(4)]
+        payload  = [Signal(32) for _ in range(payload_dws)]
+        bar      = Signal(8)
+        position = Signal(16) # DWs of the current TLP received.
+        done     = Signal(reset=1) # Last beat of the current TLP received.
+        prev     = Signal(data_width)
+        cur      = Signal(data_width)
+        consume  = Signal()
+        flush    = Signal() # Shift in an empty beat after the last one (write realignment).
+        base     = Signal(16)
+        four_dw  = Signal()
+        self.comb += [
+            consume.eq(sink.valid & sink.ready),
+            base.eq(Mux(sink.first, 0, position)),
+            four_dw.eq(Mux(sink.first, sink.dat[29], hdr[0][29])),
+        ]
+        for lane in range(lanes):
+            dw  = sink.dat[32*lane:32*(lane + 1)]
+            idx = base + lane
+            for i in range(4):
+                self.sync += If(consume & (idx == i), hdr[i].eq(dw))
+            for i in range(payload_dws):
+                self.sync += If(consume & (idx == Mux(four_dw, 4 + i, 3 + i)), payload[i].eq(dw))
+        self.sync += [
+            If(consume,
+                position.eq(base + lanes),
+                prev.eq(Mux(sink.first, 0, cur)),
+                cur.eq(sink.dat),
+                done.eq(sink.last),
+                If(sink.first,
+                    bar.eq(sink.bar),
+                    self._requests.status.eq(self._requests.status + 1)
+                )
+            ).Elif(flush,
+                position.eq(position + lanes),
+                prev.eq(cur),
+                cur.eq(0),
+            )
+        ]
+
+        # Request decoding -------------------------------------------------------------------------
+        self.header = header = TLPHeader(hdr)
+        self.comb += header.comb
+
+        first_be   = hdr[1][0:4]
+        last_be    = hdr[1][4:8]
+        length     = Signal(11)
+        hdr_dws    = Signal(3)
+        is_cfg0    = Signal()
+        is_mem     = Signal()
+        non_posted = Signal()
+        self.comb += [
+            length.eq(Mux(header.length == 0, 1024, header.length)),
+            hdr_dws.eq(Mux(header.four_dw, 4, 3)),
+            is_cfg0.eq(header.type == 0b00100),
+            is_mem.eq(header.type == 0b00000),
+            # Posted: memory writes and messages.
+            non_posted.eq(~(header.with_data & is_mem) & (header.type[3:5] != 0b10) & ~header.is_cpl),
+        ]
+
+        self.submodules.bar_encoder = bar_encoder = PriorityEncoder(8)
+        bar_hit = Signal()
+        offset  = Signal(32)
+        mem_dw  = Signal(30)
+        cfg_reg = hdr[2][2:12]
+        self.comb += [
+            bar_encoder.i.eq(bar),
+            bar_hit.eq(bar[0:nbars] != 0),
+            offset.eq(header.address[0:32] & Array(bar_masks)[bar_encoder.o]),
+            mem_dw.eq((Array(bar_bases)[bar_encoder.o] + offset)[2:32]),
+        ]
+
+        trap_offset = Signal(32)
+        self.comb += trap_offset.eq(Mux(is_cfg0, Cat(Constant(0, 2), cfg_reg), offset))
+        self.rules = []
+        for i in range(ntraps):
+            rule = _TrapRule(is_cfg0, is_mem, header.with_data, bar, trap_offset)
+            setattr(self.submodules, f"trap{i}", rule)
+            self.rules.append(rule)
+        hits = Signal(8)
+        self.comb += hits.eq(Cat(*[r.match for r in self.rules]))
+
+        # Completion emitter -----------------------------------------------------------------------
+        # Completions are `nbeats` beats: `novl` overlay DWs (header, config data) then the DWs read
+        # from the backing memory, realigned from the memory words.
+        cpl       = stream.Endpoint(tlp_layout(data_width))
+        ovl       = [Signal(32) for _ in range(4)]
+        novl      = Signal(3)
+        nbeats    = Signal(10)
+        beat      = Signal(10)
+        use_mem   = Signal()
+        rd_addr   = Signal(30)
+        rd_left   = Signal(11)
+        rd_shift  = Signal(shift)
+        rd_skip   = Signal() # First word of a misaligned read only fills `rd_prev`.
+        rd_prev   = Signal(data_width)
+        words     = backend.reader_source
+        emitting  = Signal()
+        self.comb += [
+            backend.reader_sink.valid.eq(emitting & use_mem & (rd_left != 0)),
+            backend.reader_sink.address.eq(rd_addr),
+        ]
+        self.sync += If(backend.reader_sink.valid & backend.reader_sink.ready,
+            rd_addr.eq(rd_addr + 1),
+            rd_left.eq(rd_left - 1),
+        )
+        window = Cat(rd_prev, words.data)
+        data   = Array([window[32*i:32*i + data_width] for i in range(lanes + 1)])[Mux(rd_shift == 0, lanes, rd_shift)]
+        self.comb += [
+            cpl.valid.eq(emitting & (~use_mem | (words.valid & ~rd_skip))),
+            words.ready.eq(emitting & use_mem & (rd_skip | cpl.ready)),
+            cpl.first.eq(beat == 0),
+            cpl.last.eq(beat == nbeats - 1),
+        ]
+        self.sync += If(words.valid & words.ready,
+            rd_prev.eq(words.data),
+            rd_skip.eq(0),
+        )
+        for lane in range(lanes):
+            dw = Signal(32)
+            self.comb += dw.eq(data[32*lane:32*(lane + 1)])
+            for b in range((4 + lanes - 1)//lanes):
+                idx = b*lanes + lane
+                if idx < 4:
+                    self.comb += If((beat == b) & (idx < novl), dw.eq(ovl[idx]))
+            self.comb += cpl.dat[32*lane:32*(lane + 1)].eq(dw)
+
+        # Read requests state.
+        rd_dw       = Signal(30) # Next DW in the backing memory.
+        addr_dw     = Signal(30) # Next DW in the host address space.
+        remaining   = Signal(11)
+        byte_count  = Signal(13)
+        first_chunk = Signal()
+        room        = Signal(11)
+        chunk       = Signal(11)
+        rd_start    = Signal(30) # Backing memory DW of the completion DW0 (modulo 2**30).
+        mps         = self._max_payload.storage
+        self.comb += [
+            rd_start.eq(rd_dw - 3),
+            room.eq(mps - (addr_dw & (mps - 1))),
+            chunk.eq(Mux(remaining < room, remaining, room)),
+        ]
+
+        # Write requests state.
+        wr_start = Signal(30) # Backing memory DW of the TLP DW0 (modulo 2**30).
+        wr_base = Signal(30) # Backing memory word of the first realigned window.
+        wr_t    = Signal(shift)
+        wr_lo   = Signal(16)
+        wr_hi   = Signal(16)
+        wr_have = Signal()
+        wr_flush = Signal()
+        wr_data  = Array([Cat(prev, cur)[32*i:32*i + data_width] for i in range(lanes + 1)])[lanes - wr_t]
+        wr_we    = Signal(data_width//8)
+        for lane in range(lanes):
+            idx = Signal(16)
+            be  = Signal(4)
+            self.comb += [
+                # TLP DW index of the lane, + lanes.
+                idx.eq(position + lane - wr_t),
+                If((idx >= wr_lo) & (idx < wr_hi),
+                    be.eq(Mux(idx == wr_lo, first_be, Mux(idx == wr_hi - 1, last_be, 0xf)))
+                ),
+                wr_we[4*lane:4*(lane + 1)].eq(be),
+            ]
+        wr_any  = Signal()
+        wr_done = Signal()
+        self.comb += [
+            wr_start.eq(mem_dw - hdr_dws),
+            wr_any.eq(wr_we != 0),
+            backend.writer_sink.address.eq(wr_base + (position >> shift) - 1),
+            backend.writer_sink.data.eq(wr_data),
+            backend.writer_sink.we.eq(wr_we),
+        ]
+
+        # Config write read-modify-write.
+        cfg_old = Signal(32)
+        be_mask = Cat(*[Replicate(first_be[i], 8) for i in range(4)])
+
+        # Trap records.
+        ncaptured = Signal(8)
+        wlength   = Signal(11)
+        self.comb += [
+            wlength.eq(Mux(header.with_data, length, 0)),
+            ncaptured.eq(Mux(wlength < payload_dws, wlength, payload_dws)),
+        ]
+        self.submodules.trap_fifo = trap_fifo = stream.SyncFIFO([("data", record_width)], trap_depth, buffered=True)
+        self.comb += [
+            trap_fifo.sink.data.eq(Cat(
+                timestamp,
+                bar,
+                ncaptured,
+                wlength > ncaptured,
+                Constant(0, 7),
+                hits,
+                *hdr,
+                Constant(0, 32),
+                *payload)),
+            self._trap_level.status.eq(trap_fifo.level),
+            self._trap_record.status.eq(trap_fifo.source.data),
+            trap_fifo.source.ready.eq(self._trap_pop.re),
+        ]
+
+        # FSM --------------------------------------------------------------------------------------
+        completer_id = self._completer_id.status
+        action = Signal(3)
+        actions = {"drop": 0, "ur": 1, "trap": 2, "read": 3, "cfg_read": 4, "cfg_write": 5}
+
+        def small_completion(fmt_type, status, data=None, completer=completer_id):
+            ovls = _cpl_header(fmt_type, Constant(0 if data is None else 1, 10), completer, status,
+                Constant(4, 13), header.requester_id, header.tag, Constant(0, 7))
+            if data is not None:
+                ovls.append(data)
+            return [NextValue(o, v) for o, v in zip(ovl, ovls)] + [
+                NextValue(novl, len(ovls)),
+                NextValue(nbeats, (len(ovls) + lanes - 1)//lanes),
+                NextValue(beat, 0),
+                NextValue(use_mem, 0),
+                NextValue(remaining, 0),
+                NextState("EMIT"),
+            ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="HEADER")
+        fsm.act("HEADER",
+            sink.ready.eq(1),
+            If(consume & ((base + lanes >= 4) | sink.last),
+                NextState("DECODE")
+            )
+        )
+        fsm.act("DECODE",
+            If(is_cfg0,
+                NextValue(completer_id, hdr[2][16:32])
+            ),
+            NextValue(rd_dw, mem_dw),
+            NextValue(addr_dw, header.address[2:32]),
+            NextValue(remaining, length),
+            If(length == 1,
+                NextValue(byte_count, _be_table(_be_span, first_be))
+            ).Else(
+                NextValue(byte_count, 4*length - _be_table(_be_lead, first_be) - _be_table(_be_trail, last_be))
+            ),
+            NextValue(first_chunk, 1),
+            NextValue(wr_base, wr_start >> shift),
+            NextValue(wr_t, wr_start[0:shift]),
+            NextValue(wr_lo, hdr_dws + lanes),
+            NextValue(wr_hi, hdr_dws + length + lanes),
+            NextValue(wr_have, 1),
+            NextValue(wr_flush, 0),
+            NextState("DRAIN"),
+            If(hits != 0,
+                NextValue(action, actions["trap"])
+            ).Elif(is_mem & bar_hit & header.with_data,
+                NextState("WRITE")
+            ).Elif(is_mem & bar_hit,
+                NextValue(action, actions["read"])
+            ).Elif(is_cfg0 & header.with_data,
+                NextValue(action, actions["cfg_write"])
+            ).Elif(is_cfg0,
+                NextValue(action, actions["cfg_read"])
+            ).Elif(non_posted,
+                NextValue(action, actions["ur"])
+            ).Else(
+                NextValue(action, actions["drop"])
+            )
+        )
+        fsm.act("DRAIN",
+            sink.ready.eq(~done),
+            If(done,
+                Case(action, {
+                    actions["drop"]:      NextState("HEADER"),
+                    actions["ur"]:        NextState("UR"),
+                    actions["trap"]:      NextState("TRAP"),
+                    actions["read"]:      NextState("READ"),
+                    actions["cfg_read"]:  NextState("CFG_READ"),
+                    actions["cfg_write"]: NextState("CFG_WRITE"),
+                })
+            )
+        )
+        fsm.act("TRAP",
+            trap_fifo.sink.valid.eq(1),
+            If(trap_fifo.sink.ready,
+                NextValue(self._trapped.status, self._trapped.status + 1),
+                NextState("HEADER")
+            )
+        )
+        fsm.act("UR",
+            NextValue(self._unsupported.status, self._unsupported.status + 1),
+            *small_completion(fmt_type_dict["cpl"], cpl_status["ur"])
+        )
+        fsm.act("CFG_READ",
+            config_port.adr.eq(cfg_reg),
+            NextState("CFG_READ_DATA")
+        )
+        fsm.act("CFG_READ_DATA",
+            *small_completion(fmt_type_dict["cpld"], cpl_status["sc"], config_port.dat_r, hdr[2][16:32])
+        )
+        fsm.act("CFG_WRITE",
+            config_port.adr.eq(cfg_reg),
+            NextState("CFG_WRITE_MASK")
+        )
+        fsm.act("CFG_WRITE_MASK",
+            NextValue(cfg_old, config_port.dat_r),
+            config_port.adr.eq(config_dws + cfg_reg),
+            NextState("CFG_WRITE_DATA")
+        )
+        fsm.act("CFG_WRITE_DATA",
+            config_port.adr.eq(cfg_reg),
+            config_port.we.eq(1),
+            config_port.dat_w.eq((cfg_old & ~(config_port.dat_r & be_mask)) | (hdr[3] & config_port.dat_r & be_mask)),
+            *small_completion(fmt_type_dict["cpl"], cpl_status["sc"], completer=hdr[2][16:32])
+        )
+        fsm.act("READ",
+            # Reads must not pass the writes before them.
+            If(backend.idle,
+                *[NextValue(o, v) for o, v in zip(ovl, _cpl_header(fmt_type_dict["cpld"], chunk,
+                    completer_id, cpl_status["sc"], byte_count, header.requester_id, header.tag,
+                    Cat(Mux(first_chunk, _be_table(_be_lead, first_be), 0)[0:2], addr_dw[0:5])))],
+                NextValue(novl, 3),
+                NextValue(nbeats, (3 + chunk + lanes - 1) >> shift),
+                NextValue(beat, 0),
+                NextValue(use_mem, 1),
+                # Words covering the DWs of the completion, header DWs included (don't care).
+                NextValue(rd_addr, rd_start >> shift),
+                NextValue(rd_shift, rd_start[0:shift]),
+                NextValue(rd_skip, rd_start[0:shift] != 0),
+                NextValue(rd_left, ((3 + chunk + lanes - 1) >> shift) + (rd_start[0:shift] != 0)),
+                NextValue(rd_dw, rd_dw + chunk),
+                NextValue(addr_dw, addr_dw + chunk),
+                NextValue(remaining, remaining - chunk),
+                NextValue(byte_count, byte_count - 4*chunk + Mux(first_chunk, _be_table(_be_lead, first_be), 0)),
+                NextValue(first_chunk, 0),
+                NextState("EMIT")
+            )
+        )
+        fsm.act("EMIT",
+            emitting.eq(1),
+            If(cpl.valid & cpl.ready,
+                NextValue(beat, beat + 1),
+                If(cpl.last,
+                    NextValue(self._completions.status, self._completions.status + 1),
+                    If(remaining == 0,
+                        NextState("HEADER")
+                    ).Else(
+                        NextState("READ")
+                    )
+                )
+            )
+        )
+        fsm.act("WRITE",
+            backend.writer_sink.valid.eq(wr_have & wr_any),
+            wr_done.eq(wr_have & (~wr_any | backend.writer_sink.ready)),
+            If(wr_done,
+                If(done,
+                    If(wr_flush,
+                        NextState("HEADER")
+                    ).Else(
+                        flush.eq(1),
+                        NextValue(wr_flush, 1)
+                    )
+                ).Else(
+                    sink.ready.eq(1),
+                    NextValue(wr_have, sink.valid)
+                )
+            ).Elif(~wr_have,
+                sink.ready.eq(1),
+                NextValue(wr_have, sink.valid)
+            )
+        )
+
+        # Output: emulator completions first, host responses on TLP boundaries --------------------
+        sel      = Signal()
+        locked   = Signal()
+        sel_next = Signal()
+        self.comb += [
+            sel_next.eq(Mux(locked, sel, ~cpl.valid & response.source.valid)),
+            If(sel_next,
+                response.source.connect(source)
+            ).Else(
+                cpl.connect(source)
+            ),
+        ]
+        self.sync += If(source.valid & source.ready,
+            sel.eq(sel_next),
+            locked.eq(~source.last)
+        )
@@ -0,0 +1,340 @@
+from migen import *
+from migen.genlib.misc import WaitTimer
+
+from litex.soc.interconnect import stream
+from litex.soc.interconnect import wishbone
+from litex.soc.interconnect.csr import *
+
+from litedram.frontend.dma import LiteDRAMDMAReader
+
+from pcie_mitm.ip.tlp import tlp_layout
+
+
+# Helpers ------------------------------------------------------------------------------------------
+
+def _tlp_dws(dw0):
+    """Total DWs (header + payload) of a TLP from its DW0."""
+    length = Mux(dw0[0:10] == 0, 1024, dw0[0:10])
+    return Mux(dw0[29], 4, 3) + Mux(dw0[30], length, 0)
+
+class _LFSR(Module):
+    """32-bit Galois LFSR, stepped every cycle."""
+    def __init__(self, seed=0xace1ace1):
+        self.o = Signal(32, reset=seed)
+        self.sync += If(self.o[0],
+            self.o.eq((self.o >> 1) ^ 0x80200003)
+        ).Else(
+            self.o.eq(self.o >> 1)
+        )
+
+class _BRAMReader(Module):
+    """Pipelined address -> data reads of a Memory, same interface as LiteDRAMDMAReader."""
+    def __init__(self, mem):
+        self.sink   = sink   = stream.Endpoint([("address", bits_for(mem.depth - 1))])
+        self.source = source = stream.Endpoint([("data", mem.width)])
+
+        # # #
+
+        port = mem.get_port(has_re=True)
+        self.specials += port
+        self.comb += [
+            sink.ready.eq(~source.valid | source.ready),
+            port.adr.eq(sink.address),
+            port.re.eq(sink.ready),
+            source.data.eq(port.dat_r),
+        ]
+        self.sync += If(sink.ready, source.valid.eq(sink.valid))
+
+# TLP Injector -------------------------------------------------------------------------------------
+
+class TLPInjector(Module, AutoCSR):
+    """Replay TLPs from a corpus at line rate.
+
+    The corpus holds whole TLPs, each starting on a `data_width` beat (see
+    pcie_mitm.host.fuzz.pack_corpus). It lives in a BRAM written through `bus`, or in DRAM at
+    `base` when `port` is given. A run replays beats `[offset, offset + length)` `repeat` times
+    (0: until stopped); `stop` takes effect at the end of the current pass so only whole TLPs
+    are sent.
+    """
+    def __init__(self, data_width=64, corpus_depth=1024, port=None, base=0):
+        self.data_width = data_width
+        self.source = source = stream.Endpoint(tlp_layout(data_width))
+
+        self._start    = CSR()
+        self._stop     = CSR()
+        self._offset   = CSRStorage(32, description="First corpus beat.")
+        self._length   = CSRStorage(32, description="Corpus beats per pass.")
+        self._repeat   = CSRStorage(32, description="Passes (0: until stopped).")
+        self._busy     = CSRStatus()
+        self._injected = CSRStatus(32, description="TLPs injected.")
+
+        # # #
+
+        lanes = data_width//32
+
+        # Corpus storage.
+        if port is None:
+            self.mem = Memory(data_width, corpus_depth)
+            self.bus = wishbone.Interface(data_width=data_width)
+            self.submodules.sram   = wishbone.SRAM(self.mem, bus=self.bus)
+            self.submodules.reader = reader = _BRAMReader(self.mem)
+            words = reader.source
+            base_word = 0
+        else:
+            # Get a port of the datapath width from the crossbar: get_port(data_width=data_width).
+            assert port.data_width == data_width
+            self.submodules.reader = reader = LiteDRAMDMAReader(port)
+            words = reader.source
+            base_word = base//(data_width//8)
+
+        # Address generation.
+        running   = Signal()
+        stopping  = Signal()
+        index     = Signal(32)
+        passes    = Signal(32)
+        last_word = Signal()
+        self.comb += [
+            self._busy.status.eq(running),
+            last_word.eq(index == self._length.storage - 1),
+            reader.sink.valid.eq(running),
+            reader.sink.address.eq(base_word + self._offset.storage + index),
+        ]
+        self.sync += [
+            If(self._stop.re & running,
+                stopping.eq(1)
+            ),
+            If(self._start.re & ~running & (self._length.storage != 0),
+                running.eq(1),
+                stopping.eq(0),
+                index.eq(0),
+                passes.eq(0),
+            ).Elif(reader.sink.valid & reader.sink.ready,
+                index.eq(index + 1),
+                If(last_word,
+                    index.eq(0),
+                    passes.eq(passes + 1),
+                    If(stopping | ((self._repeat.storage != 0) & (passes + 1 == self._repeat.storage)),
+                        running.eq(0)
+                    )
+                )
+            )
+        ]
+
+        # Framing: TLP boundaries from DW0 of each first beat.
+        beats_left = Signal(10)
+        nbeats     = Signal(10)
+        first      = Signal()
+        self.comb += [
+            first.eq(beats_left == 0),
+            nbeats.eq((_tlp_dws(words.data[0:32]) + lanes - 1) >> log2_int(lanes)),
+            words.connect(source, omit={"data", "first", "last"}),
+            source.dat.eq(words.data),
+            source.first.eq(first),
+            source.last.eq(Mux(first, nbeats == 1, beats_left == 1)),
+        ]
+        self.sync += If(words.valid & words.ready,
+            If(first,
+                beats_left.eq(nbeats - 1),
+                self._injected.status.eq(self._injected.status + 1)
+            ).Else(
+                beats_left.eq(beats_left - 1)
+            )
+        )
+
+# TLP Mutator --------------------------------------------------------------------------------------
+
+mutation_ops = {
+    "set":    0, # dw = (dw & ~mask) | (value & mask)
+    "xor":    1, # dw ^= mask
+    "random": 2, # dw ^= random & mask
+    "add":    3, # masked field += value
+}
+
+class _MutationSlot(Module, AutoCSR):
+    def __init__(self):
+        self._ctrl  = CSRStorage(fields=[
+            CSRField("enable", size=1, description="Slot enable."),
+            CSRField("op",     size=2, description="Operation.", values=[
+                ("``0b00``", "Set the masked bits to value."),
+                ("``0b01``", "Flip the masked bits."),
+                ("``0b10``", "Flip random masked bits."),
+                ("``0b11``", "Add value to the masked field (value aligned to the mask)."),
+            ]),
+        ])
+        self._index = CSRStorage(16, description="DW index in the TLP (0: DW0).")
+        self._mask  = CSRStorage(32)
+        self._value = CSRStorage(32)
+
+    def apply(self, dw, random):
+        mask  = self._mask.storage
+        value = self._value.storage
+        op    = self._ctrl.fields.op
+        return Mux(op == mutation_ops["set"],    (dw & ~mask) | (value & mask),
+               Mux(op == mutation_ops["xor"],    dw ^ mask,
+               Mux(op == mutation_ops["random"], dw ^ (random & mask),
+                                                 (dw & ~mask) | ((dw + value) & mask))))
+
+class TLPMutator(Module, AutoCSR):
+    """Line-rate TLP mutator.
+
+    At the first beat of each TLP matching the fmt/type value/mask (and the link/injected
+    selection), an LFSR draw below `probability` arms the enabled slots for that TLP (0 never
+    does, 0xffff always does). Each slot rewrites one DW (bit flips, field overwrites, length/tag
+    corruption, ...) as it streams by, without backpressure or added latency. The TLP framing is
+    not changed: a corrupted length field is sent with the original payload.
+    """
+    def __init__(self, data_width=64, nslots=4):
+        self.sink     = sink   = stream.Endpoint(tlp_layout(data_width))
+        self.source   = source = stream.Endpoint(tlp_layout(data_width))
+        self.injected = Signal() # Current TLP comes from the injector.
+
+        self._ctrl = CSRStorage(fields=[
+            CSRField("enable",   size=1, description="Mutator enable."),
+            CSRField("link",     size=1, description="Mutate link TLPs."),
+            CSRField("injected", size=1, description="Mutate injected TLPs."),
+        ])
+        self._fmt_type_value = CSRStorage(8)
+        self._fmt_type_mask  = CSRStorage(8)
+        self._probability    = CSRStorage(16, reset=0xffff,
+            description="Mutated fraction, in 1/65536 (0: no TLP, 0xffff: every TLP).")
+        self._mutated        = CSRStatus(32, description="TLPs mutated.")
+
+        # # #
+
+        lanes = data_width//32
+
+        self.submodules.lfsr = lfsr = _LFSR()
+        self.slots = []
+        for i in range(nslots):
+            slot = _MutationSlot()
+            setattr(self.submodules, f"slot{i}", slot)
+            self.slots.append(slot)
+
+        # TLP selection at the first beat.
+        active       = Signal()
+        active_first = Signal()
+        position     = Signal(16)
+        base         = Signal(16)
+        fmt_type     = sink.dat[24:32]
+        self.comb += [
+            active_first.eq(self._ctrl.fields.enable &
+                Mux(self.injected, self._ctrl.fields.injected, self._ctrl.fields.link) &
+                (((fmt_type ^ self._fmt_type_value.storage) & self._fmt_type_mask.storage) == 0) &
+                ((lfsr.o[0:16] < self._probability.storage) |
+                 (self._probability.storage == 0xffff))),
+            base.eq(Mux(sink.first, 0, position)),
+        ]
+        self.sync += If(sink.valid & sink.ready,
+            position.eq(base + lanes),
+            If(sink.first,
+                active.eq(active_first),
+                If(active_first,
+                    self._mutated.status.eq(self._mutated.status + 1)
+                )
+            )
+        )
+
+        # DW rewriting (slots apply in order).
+        self.comb += sink.connect(source, omit={"dat"})
+        selected = Signal()
+        self.comb += selected.eq(Mux(sink.first, active_first, active))
+        dws = []
+        for lane in range(lanes):
+            dw = sink.dat[32*lane:32*(lane + 1)]
+            for slot in self.slots:
+                random = Cat(lfsr.o[lane:], lfsr.o[:lane]) if lane else lfsr.o # Different bits per lane.
+                hit    = selected & slot._ctrl.fields.enable & (slot._index.storage == base + lane)
+                new    = Signal(32)
+                self.comb += new.eq(Mux(hit, slot.apply(dw, random), dw))
+                dw = new
+            dws.append(dw)
+        self.comb += source.dat.eq(Cat(*dws))
+
+# TLP Fuzzer ---------------------------------------------------------------------------------------
+
+class TLPFuzzer(Module, AutoCSR):
+    """MITM fuzzing path: link TLPs and injected corpus TLPs, merged on TLP boundaries and
+    mutated at line rate, with completion status/timeout feedback for the host scheduler.
+
+    `sink` -> `source` is the forwarded direction, `cpl` taps the opposite direction (completions
+    of the requests sent on `source`).
+    """
+    def __init__(self, data_width=64, corpus_depth=1024, nslots=4, port=None, base=0, clk_freq=125e6,
+                 cpl_timeout=50e-3):
+        self.sink   = sink   = stream.Endpoint(tlp_layout(data_width))
+        self.source = source = stream.Endpoint(tlp_layout(data_width))
+        self.cpl    = cpl    = stream.Endpoint(tlp_layout(data_width))
+
+        self._np_sent  = CSRStatus(32, description="Non-posted requests sent.")
+        self._cpl_sc   = CSRStatus(32, description="Successful Completions.")
+        self._cpl_ur   = CSRStatus(32, description="Unsupported Request Completions.")
+        self._cpl_crs  = CSRStatus(32, description="Configuration Request Retry Status Completions.")
+        self._cpl_ca   = CSRStatus(32, description="Completer Abort Completions.")
+        self._timeouts = CSRStatus(32, description="Times requests were outstanding without any Completion for cpl_timeout.")
+
+        # # #
+
+        self.submodules.injector = injector = TLPInjector(data_width, corpus_depth, port, base)
+        self.submodules.mutator  = mutator  = TLPMutator(data_width, nslots)
+        if port is None:
+            self.bus = injector.bus
+
+        # Packet mux, link TLPs first.
+        sel    = Signal()
+        locked = Signal()
+        sel_next = Signal()
+        self.comb += [
+            sel_next.eq(Mux(locked, sel, ~sink.valid & injector.source.valid)),
+            mutator.injected.eq(sel_next),
+            If(sel_next,
+                injector.source.connect(mutator.sink)
+            ).Else(
+                sink.connect(mutator.sink)
+            ),
+            mutator.source.connect(source),
+        ]
+        self.sync += If(mutator.sink.valid & mutator.sink.ready,
+            sel.eq(sel_next),
+            locked.eq(~mutator.sink.last)
+        )
+
+        # Feedback.
+        self.comb += cpl.ready.eq(1)
+        out_fmt_type = source.dat[24:32]
+        non_posted   = Signal()
+        is_cpl       = Signal()
+        status       = Signal(3)
+        self.comb += [
+            # Posted: memory writes and messages.
+            non_posted.eq(~(out_fmt_type[6] & (out_fmt_type[0:5] == 0b00000)) &
+                          ~(out_fmt_type[3:5] == 0b10) & (out_fmt_type[1:5] != 0b0101)),
+            is_cpl.eq(cpl.dat[25:29] == 0b0101),
+            status.eq(cpl.dat[32 + 13:32 + 16]),
+        ]
+        outstanding = Signal(32)
+        sent        = Signal()
+        received    = Signal()
+        self.comb += [
+            sent.eq(source.valid & source.ready & source.first & non_posted),
+            received.eq(cpl.valid & cpl.first & is_cpl),
+        ]
+        self.sync += [
+            If(sent,
+                self._np_sent.status.eq(self._np_sent.status + 1),
+            ),
+            If(received,
+                Case(status, {
+                    0b000: self._cpl_sc.status.eq(self._cpl_sc.status + 1),
+                    0b001: self._cpl_ur.status.eq(self._cpl_ur.status + 1),
+                    0b010: self._cpl_crs.status.eq(self._cpl_crs.status + 1),
+                    0b100: self._cpl_ca.status.eq(self._cpl_ca.status + 1),
+                })
+            ),
+            outstanding.eq(outstanding + sent - (received & (outstanding != 0))),
+        ]
+        self.submodules.timer = timer = WaitTimer(int(cpl_timeout*clk_freq))
+        self.comb += timer.wait.eq((outstanding != 0) & ~received & ~timer.done)
+        self.sync += If(timer.done,
+            self._timeouts.status.eq(self._timeouts.status + 1),
+            outstanding.eq(0)
+        )
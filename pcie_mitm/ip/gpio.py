@@ -1,27 +1,106 @@
-from pathlib import Path
-
 from migen import *
+from migen.genlib.cdc import MultiReg
+
 from litex.soc.interconnect import avalon
-from litex.soc.interconnect import wishbone
 
 
+# Register Map -------------------------------------------------------------------------------------
+
+# Word addresses of the AvalonMMGPIO registers.
+gpio_registers = {
+    "out":      0, # RW   Output value.
+    "set":      1, # WO   out |= value (reads out).
+    "clear":    2, # WO   out &= ~value (reads out).
+    "toggle":   3, # WO   out ^= value (reads out).
+    "in":       4, # RO   Input value (synchronized).
+    "edges":    5, # RW1C Captured input edges.
+    "rising":   6, # RW   Inputs whose rising edges are captured.
+    "falling":  7, # RW   Inputs whose falling edges are captured.
+    "irq_mask": 8, # RW   Captured edges raising `irq`.
+}
+
 # Avalon-MM PIO ------------------------------------------------------------------------------------
 
 class AvalonMMGPIO(Module):
-    def __init__(self, platform):
-        # platform.add_ip((Path(__file__).parent / "gpio.qsys").resolve())
-        platform.add_source((Path(__file__).parent / "gpio.v").resolve())
-        self.avmm      = avalon.AvalonMMInterface(adr_width=2)
-        # self.addr      = Signal(3)
-        self.out_port  = Signal(8)
-        # self.comb     += self.addr.eq(self.avmm.address)
-        self.specials += Instance("gpio_pio",
-            i_clk        =  ClockSignal(),
-            i_reset_n    = ~ResetSignal(),
-            i_address    =  self.avmm.address,
-            i_write_n    = ~self.avmm.write,
-            i_writedata  =  self.avmm.writedata,
-            i_chipselect =  self.avmm.chipselect,
-            o_readdata   =  self.avmm.readdata,
-            o_out_port   =  self.out_port,
-        )
+    """Avalon-MM PIO with `width` outputs and `in_width` edge-capturing inputs.
+
+    `set`/`clear`/`toggle` update any subset of the outputs with a single write (no
+    read-modify-write over the host bus), see gpio_registers. Writes honor `byteenable`.
+    `readdata` is combinatorial (no `readdatavalid`): bridge it with `read_latency=0`. `irq` is
+    high while an edge enabled in `irq_mask` is captured.
+    """
+    def __init__(self, width=8, in_width=0):
+        assert 1 <= width <= 32 and 0 <= in_width <= 32
+        self.avmm     = avmm = avalon.AvalonMMInterface(adr_width=4)
+        self.out_port = Signal(width)
+        self.in_port  = Signal(max(in_width, 1))
+        self.irq      = Signal()
+
+        # # #
+
+        out      = self.out_port
+        inputs   = Signal(max(in_width, 1))
+        previous = Signal(max(in_width, 1))
+        edges    = Signal(max(in_width, 1))
+        rising   = Signal(max(in_width, 1))
+        falling  = Signal(max(in_width, 1))
+        irq_mask = Signal(max(in_width, 1))
+        if in_width:
+            self.specials += MultiReg(self.in_port, inputs)
+            self.sync += previous.eq(inputs)
+
+        # Writes.
+        write = Signal()
+        mask  = Signal(32)
+        value = Signal(32)
+        self.comb += [
+            write.eq(avmm.write & avmm.chipselect),
+            mask.eq(Cat(*[Replicate(avmm.byteenable[i], 8) for i in range(4)])),
+            value.eq(avmm.writedata & mask),
+        ]
+        def register(reg):
+            return write & (avmm.address == gpio_registers[reg])
+        self.sync += [
+            If(register("out"),
+                out.eq((out & ~mask) | value)
+            ),
+            If(register("set"),
+                out.eq(out | value)
+            ),
+            If(register("clear"),
+                out.eq(out & ~value)
+            ),
+            If(register("toggle"),
+                out.eq(out ^ value)
+            ),
+        ]
+        if in_width:
+            captured = Signal(in_width)
+            self.comb += captured.eq((inputs & ~previous & rising) | (~inputs & previous & falling))
+            self.sync += [
+                # Edges captured in the same cycle as a clear stay captured.
+                edges.eq((edges & ~Mux(register("edges"), value, 0)) | captured),
+                If(register("rising"),
+                    rising.eq((rising & ~mask) | value)
+                ),
+                If(register("falling"),
+                    falling.eq((falling & ~mask) | value)
+                ),
+                If(register("irq_mask"),
+                    irq_mask.eq((irq_mask & ~mask) | value)
+                ),
+            ]
+            self.comb += self.irq.eq((edges & irq_mask) != 0)
+
+        # Reads.
+        cases = {gpio_registers[reg]: avmm.readdata.eq(out) for reg in ["out", "set", "clear", "toggle"]}
+        if in_width:
+            cases.update({
+                gpio_registers["in"]:       avmm.readdata.eq(inputs),
+                gpio_registers["edges"]:    avmm.readdata.eq(edges),
+                gpio_registers["rising"]:   avmm.readdata.eq(rising),
+                gpio_registers["falling"]:  avmm.readdata.eq(falling),
+                gpio_registers["irq_mask"]: avmm.readdata.eq(irq_mask),
+            })
+        cases["default"] = avmm.readdata.eq(0)
+        self.comb += Case(avmm.address, cases)
@@ -0,0 +1,431 @@
+from migen import *
+
+from litex.soc.interconnect import stream
+from litex.soc.interconnect import wishbone
+from litex.soc.interconnect.csr import *
+
+from pcie_mitm.ip.tlp import tlp_layout
+
+
+# Definitions --------------------------------------------------------------------------------------
+
+# Throughput counter classes (index in the counter memory of each direction).
+tlp_classes = {
+    "mrd":   0, # Memory reads (including locked).
+    "mwr":   1, # Memory writes.
+    "io":    2, # IO reads/writes.
+    "cfg":   3, # Config reads/writes.
+    "msg":   4, # Messages.
+    "cpl":   5, # Completions without data.
+    "cpld":  6, # Completions with data.
+    "other": 7, # AtomicOps, ...
+}
+
+# Latency histogram classes (non-posted requests).
+latency_classes = {
+    "mrd":   0,
+    "io":    1,
+    "cfg":   2,
+    "other": 3,
+}
+
+# Counter memories on the TLPPerfMonitor bus, each in a `perf_region_words` words region.
+#   down/up_counters:       per tlp_classes entry, 64-bit TLPs then 64-bit payload DWs (4 words)
+#   device/host_latency:    per latency_classes entry, nbins 64-bit bins (2 words each)
+perf_regions = ["down_counters", "up_counters", "device_latency", "host_latency"]
+
+def perf_region_words(nbins):
+    return 1 << (2*nbins*len(latency_classes) - 1).bit_length()
+
+# Counter Memory -----------------------------------------------------------------------------------
+
+class _CounterMemory(Module):
+    """Counters in a BRAM, incremented with a read-modify-write pipeline (one update per cycle).
+
+    Each entry has `lanes` counters of `lane_width` bits incremented together. The host reads the
+    entries on `bus` (32-bit words, lowest first); reading the first word of an entry latches the
+    others so that wide counters are read atomically. `clear` zeroes the memory, updates are
+    ignored while `clearing`.
+    """
+    def __init__(self, depth, lanes=1, lane_width=64):
+        width = lanes*lane_width
+        words = width//32
+        assert words & (words - 1) == 0
+        self.mem        = mem = Memory(width, depth)
+        self.bus        = bus = wishbone.Interface()
+        self.valid      = Signal()
+        self.index      = Signal(max=max(depth, 2))
+        self.increments = Signal(width)
+        self.clear      = Signal()
+        self.clearing   = Signal()
+
+        # # #
+
+        rd   = mem.get_port()
+        wr   = mem.get_port(write_capable=True)
+        host = mem.get_port()
+        self.specials += mem, rd, wr, host
+
+        # Read-modify-write, forwarding the value written in the previous cycle.
+        s1_valid      = Signal()
+        s1_index      = Signal.like(self.index)
+        s1_increments = Signal(width)
+        forward       = Signal()
+        forward_value = Signal(width)
+        old           = Signal(width)
+        new           = Signal(width)
+        clear_address = Signal.like(self.index)
+        self.comb += [
+            rd.adr.eq(self.index),
+            old.eq(Mux(forward, forward_value, rd.dat_r)),
+            *[new[lane_width*i:lane_width*(i + 1)].eq(old[lane_width*i:lane_width*(i + 1)] +
+                s1_increments[lane_width*i:lane_width*(i + 1)]) for i in range(lanes)],
+            wr.adr.eq(Mux(self.clearing, clear_address, s1_index)),
+            wr.dat_w.eq(Mux(self.clearing, 0, new)),
+            wr.we.eq(self.clearing | s1_valid),
+        ]
+        self.sync += [
+            s1_valid.eq(self.valid & ~self.clearing),
+            s1_index.eq(self.index),
+            s1_increments.eq(self.increments),
+            forward.eq(wr.we & (wr.adr == self.index)),
+            forward_value.eq(wr.dat_w),
+            If(self.clear,
+                self.clearing.eq(1),
+                clear_address.eq(0)
+            ).Elif(self.clearing,
+                clear_address.eq(clear_address + 1),
+                If(clear_address == depth - 1,
+                    self.clearing.eq(0)
+                )
+            )
+        ]
+
+        # Host reads.
+        word_bits = log2_int(words)
+        word      = Signal(max=max(words, 2))
+        pending   = Signal()
+        snapshot  = Signal(width)
+        self.comb += [
+            host.adr.eq(bus.adr[word_bits:]),
+            word.eq(bus.adr[:word_bits]) if words > 1 else word.eq(0),
+        ]
+        self.sync += [
+            bus.ack.eq(0),
+            If(bus.cyc & bus.stb & ~bus.ack,
+                If(bus.we,
+                    bus.ack.eq(1)
+                ).Elif(~pending,
+                    pending.eq(1)
+                ).Else(
+                    pending.eq(0),
+                    bus.ack.eq(1),
+                    If(word == 0,
+                        snapshot.eq(host.dat_r),
+                        bus.dat_r.eq(host.dat_r[:32])
+                    ).Else(
+                        bus.dat_r.eq(Array([snapshot[32*i:32*(i + 1)] for i in range(words)])[word])
+                    )
+                )
+            )
+        ]
+
+# Header Tap ---------------------------------------------------------------------------------------
+
+class _HeaderTap(Module):
+    """Header DWs 0-2 of the TLPs of a tap, with the timestamp of their first beat.
+
+    One event per TLP (`valid` for one cycle), registered after the beat holding DW2.
+    """
+    def __init__(self, sink, timestamp, enable):
+        lanes = len(sink.dat)//32
+        self.valid     = Signal()
+        self.hdr       = hdr = [Signal(32) for _ in range(3)]
+        self.timestamp = Signal.like(timestamp)
+
+        # Decoded fields.
+        self.fmt_type     = fmt_type = hdr[0][24:32]
+        self.with_data    = hdr[0][30]
+        self.tag          = Signal(8)
+        self.requester_id = Signal(16)
+        self.is_cpl       = Signal()
+        self.tlp_class    = Signal(3)
+        self.non_posted   = Signal()
+        self.latency_class = Signal(2)
+        self.payload_dws  = Signal(11)
+        self.last_cpl     = Signal() # Last completion of a request (remaining bytes all in this one).
+
+        # # #
+
+        position  = Signal(16)
+        base      = Signal(16)
+        first_ts  = Signal.like(timestamp)
+        hdr_next  = [Signal(32) for _ in range(3)]
+        self.comb += [
+            base.eq(Mux(sink.first, 0, position)),
+            [a.eq(b) for a, b in zip(hdr_next, hdr)],
+        ]
+        for lane in range(lanes):
+            for i in range(3):
+                self.comb += If(base + lane == i, hdr_next[i].eq(sink.dat[32*lane:32*(lane + 1)]))
+        self.sync += [
+            self.valid.eq(0),
+            If(sink.valid,
+                position.eq(base + lanes),
+                If(sink.first,
+                    first_ts.eq(timestamp)
+                ),
+                [a.eq(b) for a, b in zip(hdr, hdr_next)],
+                If((base <= 2) & (base + lanes > 2),
+                    self.valid.eq(enable),
+                    self.timestamp.eq(Mux(sink.first, timestamp, first_ts))
+                )
+            )
+        ]
+
+        type_    = hdr[0][24:29]
+        length   = Signal(11)
+        bytes_   = Signal(13)
+        byte_count = Signal(13)
+        self.comb += [
+            length.eq(Mux(hdr[0][0:10] == 0, 1024, hdr[0][0:10])),
+            self.payload_dws.eq(Mux(self.with_data, length, 0)),
+            self.is_cpl.eq(type_[1:5] == 0b0101),
+            If(self.is_cpl,
+                self.requester_id.eq(hdr[2][16:32]),
+                self.tag.eq(hdr[2][8:16])
+            ).Else(
+                self.requester_id.eq(hdr[1][16:32]),
+                self.tag.eq(hdr[1][8:16])
+            ),
+            # Byte Count is 0 for 4096 bytes; the first data byte is at Lower Address[1:0].
+            byte_count.eq(Mux(hdr[1][0:12] == 0, 4096, hdr[1][0:12])),
+            bytes_.eq(Cat(Constant(0, 2), length) - hdr[2][0:2]),
+            self.last_cpl.eq(~self.with_data | (byte_count <= bytes_)),
+            self.tlp_class.eq(tlp_classes["other"]),
+            self.latency_class.eq(latency_classes["other"]),
+            If(type_[1:5] == 0b0000,
+                If(self.with_data,
+                    self.tlp_class.eq(tlp_classes["mwr"])
+                ).Else(
+                    self.tlp_class.eq(tlp_classes["mrd"]),
+                    self.latency_class.eq(latency_classes["mrd"]),
+                    self.non_posted.eq(1)
+                )
+            ).Elif(type_ == 0b00010,
+                self.tlp_class.eq(tlp_classes["io"]),
+                self.latency_class.eq(latency_classes["io"]),
+                self.non_posted.eq(1)
+            ).Elif(type_[1:5] == 0b0010,
+                self.tlp_class.eq(tlp_classes["cfg"]),
+                self.latency_class.eq(latency_classes["cfg"]),
+                self.non_posted.eq(1)
+            ).Elif(type_[3:5] == 0b10,
+                self.tlp_class.eq(tlp_classes["msg"])
+            ).Elif(self.is_cpl,
+                self.tlp_class.eq(Mux(self.with_data, tlp_classes["cpld"], tlp_classes["cpl"]))
+            ).Elif(self.with_data & (type_[2:5] == 0b011),
+                # FetchAdd/Swap/CAS.
+                self.non_posted.eq(1)
+            )
+        ]
+
+# Latency Tracker ----------------------------------------------------------------------------------
+
+class _LatencyTracker(Module, AutoCSR):
+    """Pairs the non-posted requests of one tap with the completions of the other by tag.
+
+    The table keeps the timestamp and requester ID of the outstanding request of each tag;
+    the latency (first beat to first beat) of the first completion of a request is binned in
+    the histogram, by latency_classes. Split completions are matched until the last one.
+    """
+    def __init__(self, requests, completions, bin_shift, clear, nbins=64, tag_bits=8):
+        assert nbins >= 2 and nbins & (nbins - 1) == 0
+        self._count     = CSRStatus(64, description="Completed requests.")
+        self._sum       = CSRStatus(64, description="Sum of the latencies (cycles).")
+        self._min       = CSRStatus(32, reset=2**32 - 1, description="Lowest latency.")
+        self._max       = CSRStatus(32, description="Highest latency.")
+        self._unmatched = CSRStatus(32, description="Completions without an outstanding request.")
+        self._lost      = CSRStatus(32, description="Requests reusing the tag of an outstanding request.")
+
+        self.submodules.histogram = histogram = _CounterMemory(nbins*len(latency_classes), 1, 64)
+        self.comb += histogram.clear.eq(clear)
+
+        # # #
+
+        ts_width = len(requests.timestamp)
+        ntags    = 2**tag_bits
+        table    = Memory(ts_width + 16 + 2, ntags)
+        wr = table.get_port(write_capable=True)
+        rd = table.get_port()
+        self.specials += table, wr, rd
+        valid = Signal(ntags) # Request outstanding.
+        seen  = Signal(ntags) # First completion received.
+
+        # Requests.
+        request = Signal()
+        self.comb += [
+            request.eq(requests.valid & requests.non_posted),
+            wr.adr.eq(requests.tag[:tag_bits]),
+            wr.dat_w.eq(Cat(requests.timestamp, requests.requester_id, requests.latency_class)),
+            wr.we.eq(request),
+        ]
+
+        # Completions: table read, then match.
+        s1_valid = Signal()
+        s1_tag   = Signal(tag_bits)
+        s1_rid   = Signal(16)
+        s1_ts    = Signal(ts_width)
+        s1_last  = Signal()
+        self.comb += rd.adr.eq(completions.tag[:tag_bits])
+        self.sync += [
+            s1_valid.eq(completions.valid & completions.is_cpl),
+            s1_tag.eq(completions.tag[:tag_bits]),
+            s1_rid.eq(completions.requester_id),
+            s1_ts.eq(completions.timestamp),
+            s1_last.eq(completions.last_cpl),
+        ]
+        entry_ts    = rd.dat_r[:ts_width]
+        entry_rid   = rd.dat_r[ts_width:ts_width + 16]
+        entry_class = rd.dat_r[ts_width + 16:]
+        match = Signal()
+        first = Signal()
+        self.comb += [
+            match.eq(s1_valid & (valid >> s1_tag)[0] & (entry_rid == s1_rid)),
+            first.eq(match & ~(seen >> s1_tag)[0]),
+        ]
+        def onehot(tag):
+            return Cat(*[tag == i for i in range(ntags)])
+        done_mask  = Signal(ntags)
+        first_mask = Signal(ntags)
+        req_mask   = Signal(ntags)
+        self.comb += [
+            done_mask.eq(Replicate(match & s1_last, ntags) & onehot(s1_tag)),
+            first_mask.eq(Replicate(first, ntags) & onehot(s1_tag)),
+            req_mask.eq(Replicate(request, ntags) & onehot(requests.tag[:tag_bits])),
+        ]
+        self.sync += [
+            # A tag completed and reused in the same cycle stays outstanding.
+            valid.eq((valid & ~done_mask) | req_mask),
+            seen.eq((seen | first_mask) & ~req_mask),
+            If(clear,
+                valid.eq(0)
+            )
+        ]
+
+        # Binning.
+        s2_valid   = Signal()
+        s2_latency = Signal(32)
+        s2_class   = Signal(2)
+        self.sync += [
+            s2_valid.eq(first),
+            s2_latency.eq(s1_ts - entry_ts),
+            s2_class.eq(entry_class),
+        ]
+        shifted = Signal(32)
+        bin     = Signal(max=nbins)
+        self.comb += [
+            shifted.eq(s2_latency >> bin_shift),
+            bin.eq(Mux(shifted >= nbins - 1, nbins - 1, shifted)),
+            histogram.valid.eq(s2_valid),
+            histogram.index.eq(Cat(bin, s2_class)),
+            histogram.increments.eq(1),
+        ]
+
+        # Statistics.
+        self.sync += [
+            If(s2_valid,
+                self._count.status.eq(self._count.status + 1),
+                self._sum.status.eq(self._sum.status + s2_latency),
+                If(s2_latency < self._min.status,
+                    self._min.status.eq(s2_latency)
+                ),
+                If(s2_latency > self._max.status,
+                    self._max.status.eq(s2_latency)
+                )
+            ),
+            If(s1_valid & ~match,
+                self._unmatched.status.eq(self._unmatched.status + 1)
+            ),
+            If(request & (valid >> requests.tag[:tag_bits])[0],
+                self._lost.status.eq(self._lost.status + 1)
+            ),
+            If(clear,
+                self._count.status.eq(0),
+                self._sum.status.eq(0),
+                self._min.status.eq(2**32 - 1),
+                self._max.status.eq(0),
+                self._unmatched.status.eq(0),
+                self._lost.status.eq(0)
+            )
+        ]
+
+# TLP Performance Monitor --------------------------------------------------------------------------
+
+class TLPPerfMonitor(Module, AutoCSR):
+    """Per-transaction latency histograms and throughput counters of both link directions.
+
+    `down` taps the TLPs from the root complex to the device, `up` those from the device (drive
+    `valid` with the link's valid & ready, `ready` is always 1). TLPs are timestamped at their
+    first beat with a free-running `sys` cycle counter. Requests going down are paired with the
+    completions coming up (`device` latency), requests going up with the completions coming down
+    (`host` latency, DMA reads of the device).
+
+    Only aggregates are kept: 64-bit TLP/payload DW counters per tlp_classes entry and direction,
+    and `nbins` latency bins of 2**`bin_shift` cycles (the last bin also counts longer latencies)
+    per latency_classes entry. They are read on `bus` (see perf_regions), so the host can poll a
+    production link continuously for a few hundred bytes per snapshot.
+    """
+    def __init__(self, data_width=64, nbins=64, tag_bits=8):
+        assert data_width in [64, 128, 256]
+        self.data_width = data_width
+        self.nbins      = nbins
+        self.down = down = stream.Endpoint(tlp_layout(data_width))
+        self.up   = up   = stream.Endpoint(tlp_layout(data_width))
+        self.bus  = bus  = wishbone.Interface()
+
+        self._ctrl = CSRStorage(fields=[
+            CSRField("enable", size=1, reset=1, description="Count TLPs."),
+        ])
+        self._clear     = CSR()
+        self._bin_shift = CSRStorage(5, description="Latency bin width: 2**bin_shift cycles.")
+        self._timestamp = CSRStatus(64, description="Free-running cycle counter (TLP timestamps).")
+
+        # # #
+
+        timestamp = Signal(64)
+        self.sync += timestamp.eq(timestamp + 1)
+        self.comb += [
+            down.ready.eq(1),
+            up.ready.eq(1),
+            self._timestamp.status.eq(timestamp),
+        ]
+
+        enable = self._ctrl.fields.enable
+        clear  = self._clear.re
+        self.submodules.down_tap = down_tap = _HeaderTap(down, timestamp[:32], enable)
+        self.submodules.up_tap   = up_tap   = _HeaderTap(up,   timestamp[:32], enable)
+
+        # Throughput.
+        counters = []
+        for name, tap in [("down", down_tap), ("up", up_tap)]:
+            memory = _CounterMemory(len(tlp_classes), 2, 64)
+            setattr(self.submodules, f"{name}_counters", memory)
+            self.comb += [
+                memory.clear.eq(clear),
+                memory.valid.eq(tap.valid),
+                memory.index.eq(tap.tlp_class),
+                memory.increments.eq(Cat(Constant(1, 64), tap.payload_dws)),
+            ]
+            counters.append(memory)
+
+        # Latency.
+        self.submodules.device = device = _LatencyTracker(down_tap, up_tap, self._bin_shift.storage, clear, nbins, tag_bits)
+        self.submodules.host   = host   = _LatencyTracker(up_tap, down_tap, self._bin_shift.storage, clear, nbins, tag_bits)
+
+        # Host access.
+        region_bits = log2_int(perf_region_words(nbins))
+        slaves = []
+        for i, memory in enumerate(counters + [device.histogram, host.histogram]):
+            slaves.append((lambda adr, i=i: adr[region_bits:region_bits + 2] == i, memory.bus))
+        self.submodules.decoder = wishbone.Decoder(bus, slaves, register=True)
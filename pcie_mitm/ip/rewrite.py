@@ -0,0 +1,267 @@
+from functools import reduce
+from operator import and_
+
+from migen import *
+from migen.genlib.coding import PriorityEncoder
+
+from litex.soc.interconnect import stream
+from litex.soc.interconnect import wishbone
+from litex.soc.interconnect.csr import *
+
+from pcie_mitm.ip.fuzz import mutation_ops
+from pcie_mitm.ip.tlp import tlp_layout
+
+
+# Rule Table Layout --------------------------------------------------------------------------------
+
+# Each rule is `rule_words` 32-bit words of the rule table bus:
+#   0          ctrl: [0] enable, [2:1] action (rewrite_actions), [31:16] delay cycles
+#   1 +  i     key value of DW i (DWs 0..key_dws-1 of the TLP: header then payload)
+#   9 +  i     key mask of DW i
+#   17 + 3*p   patch p ctrl: [0] enable, [2:1] op (mutation_ops set/xor/add), [31:16] DW index
+#   18 + 3*p   patch p mask
+#   19 + 3*p   patch p value
+rule_words     = 32
+max_key_dws    = 8
+max_patches    = 5
+rule_key_value = 1
+rule_key_mask  = 9
+rule_patches   = 17
+
+rewrite_actions = {
+    "forward": 0, # Forward, with the patches applied.
+    "drop":    1, # Drop the whole TLP.
+    "delay":   2, # Hold the TLP for the delay cycles, then forward it patched.
+}
+
+def _patch_layout(npatches):
+    layout = []
+    for p in range(npatches):
+        layout += [
+            (f"p{p}_enable", 1),
+            (f"p{p}_op",     2),
+            (f"p{p}_index", 16),
+            (f"p{p}_mask",  32),
+            (f"p{p}_value", 32),
+        ]
+    return layout
+
+def _apply_patch(op, dw, mask, value):
+    return Mux(op == mutation_ops["set"], (dw & ~mask) | (value & mask),
+           Mux(op == mutation_ops["xor"], dw ^ mask,
+           Mux(op == mutation_ops["add"], (dw & ~mask) | ((dw + value) & mask),
+                                          dw)))
+
+# TLP Rewriter -------------------------------------------------------------------------------------
+
+class TLPRewriter(Module, AutoCSR):
+    """In-flight TLP match/rewrite with rules held in a double-banked TCAM.
+
+    Each TLP is matched on its first `key_dws` DWs (header fields, and payload DWs after the
+    header) against the value/mask of every rule in parallel; the first enabled rule that matches
+    decides: forward with up to `npatches` DW patches (address rewrites, payload byte patches,
+    ...), drop, or delay. TLPs are held in a FIFO until their key is complete, so the added
+    latency is fixed: the beats holding the key plus two cycles (see bench_rewrite.py).
+
+    `bus` (32-bit, write-only, see rule_words for the layout) writes the shadow bank of the
+    table; `commit` swaps the banks. The matched rule's action and patches are copied with the
+    decision, so each TLP sees exactly one version of the table.
+    """
+    def __init__(self, data_width=64, nrules=8, key_dws=6, npatches=2, fifo_depth=16):
+        assert data_width in [64, 128, 256]
+        assert 1 <= key_dws <= max_key_dws
+        assert npatches <= max_patches
+        lanes     = data_width//32
+        key_beats = (key_dws + lanes - 1)//lanes
+        assert fifo_depth >= key_beats + 2
+        self.data_width = data_width
+        self.nrules     = nrules
+        self.key_dws    = key_dws
+        self.npatches   = npatches
+        self.latency    = key_beats + 2
+        self.sink   = sink   = stream.Endpoint(tlp_layout(data_width))
+        self.source = source = stream.Endpoint(tlp_layout(data_width))
+        self.bus    = bus    = wishbone.Interface()
+
+        self._commit  = CSR()
+        self._bank    = CSRStatus(description="Active bank, rules are written to the other one.")
+        self._matched = CSRStatus(32, description="TLPs matching a rule.")
+        self._dropped = CSRStatus(32, description="TLPs dropped.")
+        self._delayed = CSRStatus(32, description="TLPs delayed.")
+
+        # # #
+
+        # Rule table -------------------------------------------------------------------------------
+        words = [0] + [rule_key_value + i for i in range(key_dws)] + [rule_key_mask + i for i in range(key_dws)]
+        for p in range(npatches):
+            words += [rule_patches + 3*p + i for i in range(3)]
+        slot  = {w: slice(32*k, 32*(k + 1)) for k, w in enumerate(words)} # Word -> rule bits.
+        bank  = self._bank.status
+        rules = [[Signal(32*len(words), name=f"rule{r}_bank{b}") for r in range(nrules)] for b in range(2)]
+
+        self.sync += [
+            bus.ack.eq(bus.cyc & bus.stb & ~bus.ack),
+            If(bus.cyc & bus.stb & bus.we & ~bus.ack,
+                Case(bus.adr, {r*rule_words + w: [
+                    If(bank,
+                        rules[0][r][slot[w]].eq(bus.dat_w)
+                    ).Else(
+                        rules[1][r][slot[w]].eq(bus.dat_w)
+                    )] for r in range(nrules) for w in words})
+            ),
+            If(self._commit.re,
+                bank.eq(~bank)
+            )
+        ]
+        self.comb += bus.dat_r.eq(0)
+
+        # Active rules (copied with each decision, bank swaps are atomic per TLP).
+        active = []
+        for r in range(nrules):
+            rule = Signal(32*len(words), name=f"rule{r}")
+            self.comb += rule.eq(Mux(bank, rules[1][r], rules[0][r]))
+            active.append({w: rule[slot[w]] for w in words})
+
+        # Input: buffering and key extraction ------------------------------------------------------
+        self.submodules.data = data = stream.SyncFIFO(tlp_layout(data_width), fifo_depth)
+        self.submodules.decisions = decisions = stream.SyncFIFO(
+            [("hit", 1), ("action", 2), ("delay", 16)] + _patch_layout(npatches), fifo_depth + 2)
+        self.comb += sink.connect(data.sink)
+
+        consume  = Signal()
+        position = Signal(16)
+        base     = Signal(16)
+        keyed    = Signal() # Key of the current TLP already sent to matching.
+        key      = [Signal(32) for _ in range(key_dws)]
+        key_next = [Signal(32) for _ in range(key_dws)]
+        self.comb += [
+            consume.eq(sink.valid & sink.ready),
+            base.eq(Mux(sink.first, 0, position)),
+        ]
+        for i in range(key_dws):
+            self.comb += key_next[i].eq(Mux(sink.first, 0, key[i]))
+            for lane in range(lanes):
+                self.comb += If(base + lane == i, key_next[i].eq(sink.dat[32*lane:32*(lane + 1)]))
+        key_done = Signal()
+        self.comb += key_done.eq(consume & ~(keyed & ~sink.first) & ((base + lanes >= key_dws) | sink.last))
+        self.sync += If(consume,
+            position.eq(base + lanes),
+            [k.eq(kn) for k, kn in zip(key, key_next)],
+            keyed.eq(Mux(sink.first, 0, keyed) | key_done),
+        )
+
+        # Matching ---------------------------------------------------------------------------------
+        m_valid = Signal()
+        m_key   = [Signal(32) for _ in range(key_dws)]
+        self.sync += [
+            m_valid.eq(key_done),
+            If(key_done, [mk.eq(kn) for mk, kn in zip(m_key, key_next)]),
+        ]
+        matches = Signal(nrules)
+        for r in range(nrules):
+            rule = active[r]
+            self.comb += matches[r].eq(rule[0][0] & reduce(and_, [
+                ((m_key[i] ^ rule[rule_key_value + i]) & rule[rule_key_mask + i]) == 0
+                for i in range(key_dws)]))
+        index = Signal(max=max(nrules, 2))
+        hit   = Signal()
+        if nrules > 1:
+            self.submodules.encoder = encoder = PriorityEncoder(nrules)
+            self.comb += [
+                encoder.i.eq(matches),
+                index.eq(encoder.o),
+                hit.eq(~encoder.n),
+            ]
+        else:
+            self.comb += hit.eq(matches[0])
+        def field(word, lo, hi):
+            return Array([active[r][word][lo:hi] for r in range(nrules)])[index]
+        d = decisions.sink
+        self.sync += [
+            d.valid.eq(m_valid),
+            d.hit.eq(hit),
+            d.action.eq(Mux(hit, field(0, 1, 3), rewrite_actions["forward"])),
+            d.delay.eq(field(0, 16, 32)),
+        ]
+        for p in range(npatches):
+            w = rule_patches + 3*p
+            self.sync += [
+                getattr(d, f"p{p}_enable").eq(hit & field(w, 0, 1)),
+                getattr(d, f"p{p}_op").eq(field(w, 1, 3)),
+                getattr(d, f"p{p}_index").eq(field(w, 16, 32)),
+                getattr(d, f"p{p}_mask").eq(field(w + 1, 0, 32)),
+                getattr(d, f"p{p}_value").eq(field(w + 2, 0, 32)),
+            ]
+        self.sync += If(m_valid & hit,
+            self._matched.status.eq(self._matched.status + 1),
+            If(field(0, 1, 3) == rewrite_actions["drop"],
+                self._dropped.status.eq(self._dropped.status + 1)
+            ),
+            If(field(0, 1, 3) == rewrite_actions["delay"],
+                self._delayed.status.eq(self._delayed.status + 1)
+            )
+        )
+
+        # Output: apply the decision of each TLP ---------------------------------------------------
+        have    = Signal() # Decision of the current TLP latched (after its first beat or during a delay).
+        latched = Record(decisions.source.description.payload_layout)
+        dec     = Record(decisions.source.description.payload_layout)
+        delay   = Signal(16)
+        self.comb += [
+            If(have,
+                dec.eq(latched)
+            ).Else(
+                dec.eq(decisions.source.payload)
+            )
+        ]
+        out_position = Signal(16)
+        out_base     = Signal(16)
+        forward      = Signal()
+        self.comb += out_base.eq(Mux(data.source.first, 0, out_position))
+        self.comb += [
+            If(~have,
+                # First beat: wait for its decision.
+                If(data.source.valid & decisions.source.valid,
+                    If((dec.action == rewrite_actions["delay"]) & (dec.delay != 0),
+                        decisions.source.ready.eq(1)
+                    ).Else(
+                        forward.eq(1),
+                        decisions.source.ready.eq(data.source.ready),
+                    )
+                )
+            ).Else(
+                forward.eq(delay == 0)
+            ),
+            If(forward,
+                If(dec.action == rewrite_actions["drop"],
+                    data.source.ready.eq(1)
+                ).Else(
+                    data.source.connect(source, omit={"dat"})
+                )
+            ),
+        ]
+        self.sync += [
+            If(~have & data.source.valid & decisions.source.valid,
+                latched.eq(decisions.source.payload),
+                If((dec.action == rewrite_actions["delay"]) & (dec.delay != 0),
+                    have.eq(1),
+                    delay.eq(dec.delay - 1)
+                )
+            ),
+            If(have & (delay != 0),
+                delay.eq(delay - 1)
+            ),
+            If(data.source.valid & data.source.ready,
+                out_position.eq(out_base + lanes),
+                have.eq(~data.source.last)
+            )
+        ]
+        for lane in range(lanes):
+            dw = data.source.dat[32*lane:32*(lane + 1)]
+            for p in range(npatches):
+                new = Signal(32)
+                self.comb += new.eq(Mux(getattr(dec, f"p{p}_enable") & (getattr(dec, f"p{p}_index") == out_base + lane),
+                    _apply_patch(getattr(dec, f"p{p}_op"), dw, getattr(dec, f"p{p}_mask"), getattr(dec, f"p{p}_value")),
+                    dw))
+                dw = new
+            self.comb += source.dat[32*lane:32*(lane + 1)].eq(dw)
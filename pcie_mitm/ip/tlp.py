@@ -0,0 +1,281 @@
+from migen import *
+
+from litex.soc.interconnect import stream
+from litex.soc.interconnect.csr import *
+
+
+# TLP Definitions ----------------------------------------------------------------------------------
+
+# Fmt[2:0]/Type[4:0] byte (DW0[31:24]).
+fmt_type_dict = {
+    "mrd32":   0b0000_0000,
+    "mrd64":   0b0010_0000,
+    "mrdlk32": 0b0000_0001,
+    "mwr32":   0b0100_0000,
+    "mwr64":   0b0110_0000,
+    "iord":    0b0000_0010,
+    "iowr":    0b0100_0010,
+    "cfgrd0":  0b0000_0100,
+    "cfgwr0":  0b0100_0100,
+    "cfgrd1":  0b0000_0101,
+    "cfgwr1":  0b0100_0101,
+    "msg":     0b0011_0000,
+    "msgd":    0b0111_0000,
+    "cpl":     0b0000_1010,
+    "cpld":    0b0100_1010,
+    "cpllk":   0b0000_1011,
+    "cpldlk":  0b0100_1011,
+}
+
+def tlp_layout(data_width):
+    """Link-side TLP stream: header DWs immediately followed by payload DWs, DW0 in the LSBs.
+
+    `bar` is the BAR hit vector of the hard IP for requests received by an endpoint.
+    """
+    return [
+        ("dat", data_width),
+        ("bar", 8),
+    ]
+
+# Sniffer records: one beat per TLP.
+#   [  0: 64] timestamp (cycles of the sniffer clock, at the last beat of the TLP)
+#   [ 64: 72] bar
+#   [ 72: 80] number of payload DWs captured
+#   [ 80: 81] payload truncated
+#   [ 88: 96] filter rule hits
+#   [ 96:224] header DW0..DW3
+#   [256:   ] payload DWs
+tlp_record_header_width = 256
+
+def tlp_record_width(payload_dws):
+    width = tlp_record_header_width + 32*payload_dws
+    return 1 << (width - 1).bit_length()
+
+class TLPHeader:
+    """Combinatorial header fields of the 4 header DWs."""
+    def __init__(self, dws):
+        dw0, dw1, dw2, dw3 = dws
+        self.fmt_type  = dw0[24:32]
+        self.fmt       = dw0[29:32]
+        self.type      = dw0[24:29]
+        self.length    = dw0[0:10]
+        self.with_data = dw0[30]
+        self.four_dw   = dw0[29]
+        self.tag       = dw1[8:16]
+        is_cpl = Signal()
+        self.is_cpl = is_cpl
+        self.requester_id = Signal(16)
+        self.address      = Signal(64)
+        self.is_mem = Signal()
+        self.comb = [
+            is_cpl.eq(self.type[1:5] == 0b0101),
+            self.is_mem.eq((self.type[1:5] == 0b0000) | (self.type == 0b00010)),
+            # Completions carry the requester ID in DW2, requests in DW1.
+            If(is_cpl,
+                self.requester_id.eq(dw2[16:32])
+            ).Else(
+                self.requester_id.eq(dw1[16:32])
+            ),
+            If(self.four_dw,
+                self.address.eq(Cat(Constant(0, 2), dw3[2:32], dw2))
+            ).Else(
+                self.address.eq(Cat(Constant(0, 2), dw2[2:32]))
+            ),
+        ]
+
+# TLP Filter Rule ----------------------------------------------------------------------------------
+
+class TLPFilterRule(Module, AutoCSR):
+    def __init__(self, header, bar):
+        self.match = Signal()
+
+        self._ctrl = CSRStorage(fields=[
+            CSRField("enable",  size=1, description="Rule enable."),
+            CSRField("address", size=1, description="Also match the address range (memory/IO requests only)."),
+        ])
+        self._fmt_type_value  = CSRStorage(8)
+        self._fmt_type_mask   = CSRStorage(8)
+        self._requester_value = CSRStorage(16)
+        self._requester_mask  = CSRStorage(16)
+        self._address_low     = CSRStorage(64, description="First matching address.")
+        self._address_high    = CSRStorage(64, description="Last matching address.")
+        self._bar_mask        = CSRStorage(8,  description="BARs to match (0: any).")
+
+        # # #
+
+        type_match      = Signal()
+        requester_match = Signal()
+        address_match   = Signal()
+        bar_match       = Signal()
+        self.comb += [
+            type_match.eq(((header.fmt_type ^ self._fmt_type_value.storage) & self._fmt_type_mask.storage) == 0),
+            requester_match.eq(((header.requester_id ^ self._requester_value.storage) & self._requester_mask.storage) == 0),
+            address_match.eq(~self._ctrl.fields.address |
+                (header.is_mem &
+                 (header.address >= self._address_low.storage) &
+                 (header.address <= self._address_high.storage))),
+            bar_match.eq((self._bar_mask.storage == 0) | ((bar & self._bar_mask.storage) != 0)),
+            self.match.eq(self._ctrl.fields.enable & type_match & requester_match & address_match & bar_match),
+        ]
+
+# TLP Sniffer --------------------------------------------------------------------------------------
+
+class TLPSniffer(Module, AutoCSR):
+    """Line-rate TLP header sniffer with hardware filtering.
+
+    `sink` taps a TLP stream (drive `valid` with the link's valid & ready, `sink.ready` is always
+    1). Headers are parsed on the fly and, at the last beat of each TLP, the filter rules decide
+    whether one record (see tlp_record_width) with the header and up to `payload_dws` payload DWs
+    is pushed to `source`. Rules are ORed; `match_all` bypasses them. The output FIFO absorbs
+    bursts, TLPs that do not fit are counted in `dropped`.
+    """
+    def __init__(self, data_width=64, payload_dws=8, nfilters=4, fifo_depth=64):
+        assert data_width in [64, 128, 256]
+        self.data_width   = data_width
+        self.payload_dws  = payload_dws
+        self.record_width = record_width = tlp_record_width(payload_dws)
+        self.sink   = sink   = stream.Endpoint(tlp_layout(data_width))
+        self.source = source = stream.Endpoint([("data", record_width)])
+
+        self._ctrl = CSRStorage(fields=[
+            CSRField("enable",    size=1, description="Sniffer enable."),
+            CSRField("match_all", size=1, description="Capture every TLP, ignoring the rules."),
+        ])
+        self._max_payload = CSRStorage(8, reset=payload_dws, description="Payload DWs to capture per TLP.")
+        self._tlps        = CSRStatus(32, description="TLPs seen.")
+        self._matched     = CSRStatus(32, description="TLPs matching the filters.")
+        self._dropped     = CSRStatus(32, description="Matching TLPs lost because the FIFO was full.")
+
+        # # #
+
+        lanes = data_width//32
+
+        # Timestamp.
+        timestamp = Signal(64)
+        self.sync += timestamp.eq(timestamp + 1)
+
+        # Stage 1: DW collection ------------------------------------------------------------------
+        hdr     = [Signal(32) for _ in range(4)]
+        payload = [Signal(32) for _ in range(payload_dws)]
+        hdr_next     = [Signal(32) for _ in range(4)]
+        payload_next = [Signal(32) for _ in range(payload_dws)]
+        position     = Signal(16) # DW index of the current beat in the TLP.
+        four_dw      = Signal()
+        captured     = Signal(max=1024 + lanes + 1) # Up to 1024 payload DWs + beat padding.
+        captured_next = Signal(max=1024 + lanes + 1)
+        self.comb += sink.ready.eq(1)
+        # DWs a TLP does not carry (DW3 of a 3 DW header, ...) record as 0.
+        self.comb += [a.eq(Mux(sink.first, 0, b))
+            for a, b in zip(hdr_next + payload_next, hdr + payload)]
+        self.comb += [
+            four_dw.eq(Mux(sink.first, sink.dat[29], hdr[0][29])),
+            captured_next.eq(Mux(sink.first, 0, captured)),
+        ]
+        base = Signal(16)
+        self.comb += base.eq(Mux(sink.first, 0, position))
+        for lane in range(lanes):
+            dw  = sink.dat[32*lane:32*(lane + 1)]
+            idx = base + lane
+            for i in range(4):
+                self.comb += If(sink.valid & (idx == i), hdr_next[i].eq(dw))
+            for i in range(payload_dws):
+                slot = Mux(four_dw, 4 + i, 3 + i)
+                self.comb += If(sink.valid & (idx == slot) & (i < self._max_payload.storage),
+                    payload_next[i].eq(dw),
+                )
+        # Captured payload DWs: those that fall in the slots up to the end of this beat.
+        hdr_dws = Signal(3)
+        end     = Signal(16)
+        self.comb += [
+            hdr_dws.eq(Mux(four_dw, 4, 3)),
+            end.eq(base + lanes),
+            If(end > hdr_dws,
+                captured_next.eq(end - hdr_dws)
+            ),
+        ]
+        self.sync += If(sink.valid,
+            [a.eq(b) for a, b in zip(hdr + payload, hdr_next + payload_next)],
+            position.eq(base + lanes),
+            captured.eq(captured_next),
+        )
+
+        # Stage 2: Filtering -----------------------------------------------------------------------
+        s2_valid   = Signal()
+        s2_hdr     = [Signal(32) for _ in range(4)]
+        s2_payload = [Signal(32) for _ in range(payload_dws)]
+        s2_bar     = Signal(8)
+        s2_first_bar = Signal(8)
+        s2_dws     = Signal(16)
+        s2_time    = Signal(64)
+        self.sync += [
+            If(sink.valid & sink.first,
+                s2_first_bar.eq(sink.bar)
+            ),
+            s2_valid.eq(sink.valid & sink.last & self._ctrl.fields.enable),
+            If(sink.valid & sink.last,
+                [a.eq(b) for a, b in zip(s2_hdr + s2_payload, hdr_next + payload_next)],
+                s2_bar.eq(Mux(sink.first, sink.bar, s2_first_bar)),
+                s2_dws.eq(captured_next),
+                s2_time.eq(timestamp),
+            )
+        ]
+
+        self.header = header = TLPHeader(s2_hdr)
+        self.comb += header.comb
+        self.rules = []
+        for i in range(nfilters):
+            rule = TLPFilterRule(header, s2_bar)
+            setattr(self.submodules, f"filter{i}", rule)
+            self.rules.append(rule)
+        hits  = Signal(8)
+        match = Signal()
+        self.comb += [
+            hits.eq(Cat(*[r.match for r in self.rules])),
+            match.eq(self._ctrl.fields.match_all | (hits != 0)),
+        ]
+
+        # Payload DWs actually captured (payload length is 0 for TLPs without data).
+        length    = Signal(11)
+        nmax      = Signal(8) # min(max_payload, length).
+        ncaptured = Signal(8)
+        truncated = Signal()
+        self.comb += [
+            length.eq(Mux(header.with_data, Mux(header.length == 0, 1024, header.length), 0)),
+            nmax.eq(self._max_payload.storage),
+            If(length < self._max_payload.storage,
+                nmax.eq(length)
+            ),
+            ncaptured.eq(nmax),
+            If(s2_dws < nmax,
+                ncaptured.eq(s2_dws)
+            ),
+            truncated.eq(length > ncaptured),
+        ]
+
+        # Output -----------------------------------------------------------------------------------
+        self.submodules.fifo = fifo = stream.SyncFIFO([("data", record_width)], fifo_depth, buffered=True)
+        self.comb += [
+            fifo.sink.valid.eq(s2_valid & match),
+            fifo.sink.data.eq(Cat(
+                s2_time,
+                s2_bar,
+                ncaptured,
+                truncated,
+                Constant(0, 7),
+                hits,
+                *s2_hdr,
+                Constant(0, 32),
+                *s2_payload)),
+            fifo.source.connect(source),
+        ]
+        self.sync += [
+            If(s2_valid,
+                self._tlps.status.eq(self._tlps.status + 1),
+                If(match,
+                    self._matched.status.eq(self._matched.status + 1),
+                    If(~fifo.sink.ready,
+                        self._dropped.status.eq(self._dropped.status + 1)
+                    )
+                )
+            )
+        ]
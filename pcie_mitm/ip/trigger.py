@@ -0,0 +1,210 @@
+from migen import *
+from migen.genlib.cdc import BusSynchronizer, MultiReg
+
+from litex.soc.interconnect import stream
+from litex.soc.interconnect.csr import *
+
+from litescope.core import LiteScopeAnalyzer, _Mux, _Storage, _SubSampler, core_layout
+
+
+# Trigger Sequencer --------------------------------------------------------------------------------
+
+class TriggerSequencer(Module, AutoCSR):
+    """Multi-stage sequential trigger.
+
+    Each of the `nstages` stages waits for `count` samples matching its value/mask condition
+    (optionally inverted, or only on the transition into the condition with `edge`), then moves to
+    the next stage, or fires when it is the `last` one. A stage with a `timeout` that spends that
+    many samples without completing jumps back to its `fail` stage, so "A then B within N cycles"
+    is stage 0 on A and stage 1 on B with timeout N and fail 0.
+
+    Drop-in replacement of the LiteScope analyzer trigger (`sink`/`source` with `hit`, `enable`
+    and `done`), see SequencedAnalyzer. The stages are written through `stage_sel` and the
+    `stage_*` registers, then `stage_write`, while disabled, see
+    pcie_mitm.host.trigger.TriggerSequencerDriver. The sequencer runs in `clock_domain`.
+    """
+    def __init__(self, data_width, nstages=4, clock_domain="sys"):
+        assert nstages >= 1
+        stage_bits = bits_for(nstages - 1)
+        self.data_width = data_width
+        self.nstages    = nstages
+        self.sink   = sink   = stream.Endpoint(core_layout(data_width))
+        self.source = source = stream.Endpoint(core_layout(data_width))
+
+        self._enable        = CSRStorage(description="Arm the sequencer, disabling restarts it from stage 0.")
+        self._done          = CSRStatus(description="Last stage completed since enable.")
+        self._stage_sel     = CSRStorage(stage_bits, description="Stage written by stage_write.")
+        self._stage_value   = CSRStorage(data_width)
+        self._stage_mask    = CSRStorage(data_width)
+        self._stage_count   = CSRStorage(16, description="Matches needed to complete the stage (0: one).")
+        self._stage_timeout = CSRStorage(32, description="Samples after which the stage fails (0: never).")
+        self._stage_ctrl    = CSRStorage(fields=[
+            CSRField("last",   size=1, description="Fire the trigger when the stage completes."),
+            CSRField("edge",   size=1, description="Only count samples entering the condition."),
+            CSRField("invert", size=1, description="Match samples outside of value/mask."),
+            CSRField("fail",   size=stage_bits, offset=8, description="Stage to restart from on timeout."),
+        ])
+        self._stage_write   = CSR()
+        self._stage         = CSRStatus(stage_bits, description="Current stage.")
+        self._restarts      = CSRStatus(32, description="Stage timeouts since enable.")
+
+        # # #
+
+        # Stages (written from `sys`, static while enabled).
+        ctrl     = self._stage_ctrl.storage
+        values   = Array(Signal(data_width, name=f"stage{s}_value")   for s in range(nstages))
+        masks    = Array(Signal(data_width, name=f"stage{s}_mask")    for s in range(nstages))
+        counts   = Array(Signal(16,         name=f"stage{s}_count")   for s in range(nstages))
+        timeouts = Array(Signal(32,         name=f"stage{s}_timeout") for s in range(nstages))
+        lasts    = Array(Signal(            name=f"stage{s}_last")    for s in range(nstages))
+        edges    = Array(Signal(            name=f"stage{s}_edge")    for s in range(nstages))
+        inverts  = Array(Signal(            name=f"stage{s}_invert")  for s in range(nstages))
+        fails    = Array(Signal(stage_bits, name=f"stage{s}_fail")    for s in range(nstages))
+        self.sync += If(self._stage_write.re,
+            Case(self._stage_sel.storage, {s: [
+                values[s].eq(self._stage_value.storage),
+                masks[s].eq(self._stage_mask.storage),
+                counts[s].eq(self._stage_count.storage),
+                timeouts[s].eq(self._stage_timeout.storage),
+                lasts[s].eq(ctrl[0] | (s == nstages - 1)),
+                edges[s].eq(ctrl[1]),
+                inverts[s].eq(ctrl[2]),
+                fails[s].eq(ctrl[8:8 + stage_bits]),
+            ] for s in range(nstages)})
+        )
+
+        # Control/status re-synchronization.
+        enable    = Signal()
+        stage     = Signal(stage_bits)
+        restarts  = Signal(32)
+        triggered = Signal()
+        if clock_domain == "sys":
+            self.comb += [
+                enable.eq(self._enable.storage),
+                self._done.status.eq(triggered),
+                self._stage.status.eq(stage),
+                self._restarts.status.eq(restarts),
+            ]
+        else:
+            self.submodules.stage_sync    = BusSynchronizer(stage_bits, clock_domain, "sys")
+            self.submodules.restarts_sync = BusSynchronizer(32, clock_domain, "sys")
+            self.specials += [
+                MultiReg(self._enable.storage, enable, clock_domain),
+                MultiReg(triggered, self._done.status),
+            ]
+            self.comb += [
+                self.stage_sync.i.eq(stage),
+                self._stage.status.eq(self.stage_sync.o),
+                self.restarts_sync.i.eq(restarts),
+                self._restarts.status.eq(self.restarts_sync.o),
+            ]
+
+        # Matching.
+        data_d = Signal(data_width)
+        match  = Signal()
+        prev   = Signal()
+        event  = Signal()
+        self.comb += [
+            match.eq((((sink.data ^ values[stage]) & masks[stage]) == 0) ^ inverts[stage]),
+            prev.eq((((data_d ^ values[stage]) & masks[stage]) == 0) ^ inverts[stage]),
+            event.eq(sink.valid & match & ~(edges[stage] & prev)),
+        ]
+
+        # Sequencing.
+        count    = Signal(16)
+        timer    = Signal(32)
+        complete = Signal()
+        timeout  = Signal()
+        fire     = Signal()
+        self.comb += [
+            complete.eq(event & ((count + 1) >= counts[stage])),
+            timeout.eq(sink.valid & (timeouts[stage] != 0) & ((timer + 1) >= timeouts[stage])),
+            fire.eq(enable & ~triggered & complete & lasts[stage]),
+        ]
+        sync = getattr(self.sync, clock_domain)
+        sync += [
+            If(sink.valid, data_d.eq(sink.data)),
+            If(~enable,
+                stage.eq(0),
+                count.eq(0),
+                timer.eq(0),
+                restarts.eq(0),
+                triggered.eq(0),
+            ).Elif(~triggered,
+                If(complete,
+                    count.eq(0),
+                    timer.eq(0),
+                    If(lasts[stage],
+                        triggered.eq(1)
+                    ).Else(
+                        stage.eq(stage + 1)
+                    )
+                ).Elif(timeout,
+                    stage.eq(fails[stage]),
+                    count.eq(0),
+                    timer.eq(0),
+                    restarts.eq(restarts + 1),
+                ).Elif(sink.valid,
+                    If(event, count.eq(count + 1)),
+                    timer.eq(timer + 1),
+                )
+            )
+        ]
+
+        # Output.
+        self.comb += [
+            sink.connect(source, omit={"hit"}),
+            source.hit.eq(triggered | fire),
+        ]
+
+# Sequenced Analyzer -------------------------------------------------------------------------------
+
+class SequencedAnalyzer(LiteScopeAnalyzer):
+    """LiteScopeAnalyzer with a TriggerSequencer of `trigger_stages` stages as its trigger.
+
+    Storage, subsampler, group mux and analyzer.csv are LiteScope's, so LiteScopeAnalyzerDriver
+    still runs and uploads the captures; the trigger is configured with TriggerSequencerDriver.
+    """
+    def __init__(self, groups, depth,
+        samplerate     = 1e12,
+        clock_domain   = "sys",
+        trigger_stages = 4,
+        register       = False,
+        csr_csv        = "analyzer.csv",
+    ):
+        self.groups     = groups = self.format_groups(groups)
+        self.depth      = depth
+        self.samplerate = int(samplerate)
+
+        self.data_width = data_width = max([sum([len(s) for s in g]) for g in groups.values()])
+
+        self.csr_csv = csr_csv
+
+        # # #
+
+        self.cd_scope = ClockDomain()
+        self.comb += self.cd_scope.clk.eq(ClockSignal(clock_domain))
+
+        self.mux = _Mux(data_width, len(groups))
+        sd = getattr(self.sync, clock_domain)
+        for i, signals in groups.items():
+            s = Cat(signals)
+            if register:
+                s_d = Signal(len(s))
+                sd += s_d.eq(s)
+                s = s_d
+            self.comb += [
+                self.mux.sinks[i].valid.eq(1),
+                self.mux.sinks[i].data.eq(s)
+            ]
+
+        self.trigger    = TriggerSequencer(data_width, nstages=trigger_stages, clock_domain="scope")
+        self.subsampler = _SubSampler(data_width)
+        self.storage    = _Storage(data_width, depth)
+
+        self.pipeline = stream.Pipeline(
+            self.mux,
+            self.trigger,
+            self.subsampler,
+            self.storage,
+        )
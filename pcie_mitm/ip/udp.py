@@ -0,0 +1,214 @@
+import math
+
+from migen import *
+from migen.genlib.cdc import BusSynchronizer, MultiReg
+
+from litex.soc.interconnect import stream
+from litex.soc.interconnect.csr import *
+
+from liteeth.common import convert_ip
+
+
+# Frame Format -------------------------------------------------------------------------------------
+
+# Every UDP payload starts with a little-endian header: the frame sequence number (0 after
+# enable) then the number of sink beats dropped since enable (FIFO full), followed by the data
+# beats, least significant byte first.
+frame_header_bytes = 8
+
+# Ethernet/IPv4/UDP bytes per frame on the wire besides the UDP payload: preamble/SFD 8, MAC header
+# 14, IPv4 header 20, UDP header 8, FCS 4, inter-frame gap 12.
+frame_overhead_bytes = 66
+
+def udp_capture_decimation(clk_freq, data_width, payload_bytes=8192, link_rate=1e9):
+    """Smallest UDPCaptureStreamer `decimation` sustaining `data_width`-bit sink beats at
+    `clk_freq` on a `link_rate` b/s link (1 Gb/s for GMII) without overflow."""
+    wire_bytes = frame_overhead_bytes + frame_header_bytes + payload_bytes
+    beat_rate  = link_rate/8*payload_bytes/wire_bytes/(data_width//8)
+    return max(1, math.ceil(clk_freq/beat_rate))
+
+# UDP Framer ---------------------------------------------------------------------------------------
+
+class _UDPFramer(Module):
+    def __init__(self, tx, data_width, payload_bytes, fifo_frames, src_port):
+        bytes_per_word = data_width//8
+        payload_words  = payload_bytes//bytes_per_word
+        self.sink       = sink = stream.Endpoint([("data", data_width)])
+        self.enable     = Signal()
+        self.ip_address = Signal(32)
+        self.dst_port   = Signal(16)
+        self.timeout    = Signal(32)
+        self.overflow   = Signal(32)
+        self.frames     = Signal(32)
+
+        # # #
+
+        # Frame buffer: a frame is only sent once complete (or on timeout), so a slow producer never
+        # stalls the MAC in the middle of a frame while the next one fills up.
+        fifo = stream.SyncFIFO([("data", data_width)], fifo_frames*payload_words, buffered=True)
+        fifo = ResetInserter()(fifo)
+        self.submodules.fifo = fifo
+        self.comb += sink.connect(fifo.sink)
+
+        # Partial frames are flushed after `timeout` cycles without new data (0: never).
+        idle      = Signal(32)
+        timed_out = Signal()
+        self.sync += If(fifo.sink.valid & fifo.sink.ready,
+            idle.eq(0)
+        ).Elif(~timed_out,
+            idle.eq(idle + 1)
+        )
+        self.comb += timed_out.eq((self.timeout != 0) & (idle >= self.timeout))
+
+        # Payload: `words` FIFO entries, serialized to bytes.
+        self.submodules.converter = converter = stream.Converter(data_width, 8)
+        words     = Signal(max=payload_words + 1)
+        remaining = Signal(max=payload_words + 1)
+        sending   = Signal()
+        self.comb += [
+            converter.sink.valid.eq(fifo.source.valid & sending & (remaining != 0)),
+            converter.sink.data.eq(fifo.source.data),
+            converter.sink.last.eq(remaining == 1),
+            fifo.source.ready.eq(converter.sink.ready & sending & (remaining != 0)),
+        ]
+        self.sync += If(converter.sink.valid & converter.sink.ready, remaining.eq(remaining - 1))
+
+        # Header.
+        seq    = Signal(32)
+        header = Signal(8*frame_header_bytes)
+        index  = Signal(max=frame_header_bytes)
+        self.comb += [
+            tx.src_port.eq(src_port),
+            tx.dst_port.eq(self.dst_port),
+            tx.ip_address.eq(self.ip_address),
+            tx.length.eq(frame_header_bytes + words*bytes_per_word),
+            tx.last_be.eq(tx.last),
+        ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            If(~self.enable,
+                fifo.reset.eq(1),
+                NextValue(seq, 0),
+                NextValue(self.frames, 0),
+            ).Elif(fifo.level >= payload_words,
+                NextValue(words, payload_words),
+                NextValue(remaining, payload_words),
+                NextState("HEADER")
+            ).Elif((fifo.level != 0) & timed_out,
+                NextValue(words, fifo.level),
+                NextValue(remaining, fifo.level),
+                NextState("HEADER")
+            ),
+            NextValue(header, Cat(seq, self.overflow)),
+            NextValue(index, 0),
+        )
+        fsm.act("HEADER",
+            tx.valid.eq(1),
+            tx.data.eq(header[:8]),
+            If(tx.ready,
+                NextValue(header, header[8:]),
+                NextValue(index, index + 1),
+                If(index == (frame_header_bytes - 1),
+                    NextState("PAYLOAD")
+                )
+            )
+        )
+        fsm.act("PAYLOAD",
+            sending.eq(1),
+            converter.source.connect(tx, keep={"valid", "ready", "data", "last"}),
+            If(tx.valid & tx.ready & tx.last,
+                NextValue(seq, seq + 1),
+                NextValue(self.frames, self.frames + 1),
+                NextState("IDLE")
+            )
+        )
+
+# UDP Capture Streamer -----------------------------------------------------------------------------
+
+class UDPCaptureStreamer(Module, AutoCSR):
+    """Stream `sink` to the host in (jumbo) UDP frames of `payload_bytes` data bytes.
+
+    `udp_port` is a LiteEth UDP crossbar port (`ethcore.udp.crossbar.get_port(...)`, 8-bit) in the
+    `cd` clock domain, `sink` is in `sys` and never back-pressured: beats arriving while the frame
+    buffer (`fifo_frames` frames) is full are dropped and counted. Frames carry a sequence number
+    and the drop count (see frame_header_bytes) so the host tells network loss from overflow, see
+    pcie_mitm.host.udp.UDPCaptureReceiver.
+
+    A sink valid every cycle is far more than a 1 Gb/s link carries: `sink` is only sampled one
+    cycle out of `decimation` (CSR, 0/1: every cycle), see udp_capture_decimation for the
+    sustainable value. Beats skipped this way are not counted as dropped.
+    """
+    def __init__(self, udp_port, data_width=64, payload_bytes=8192, fifo_frames=2, cd="sys",
+                 ip_address="192.168.42.100", src_port=4321, dst_port=4321, cdc_depth=16,
+                 decimation=1):
+        assert data_width % 8 == 0 and payload_bytes % (data_width//8) == 0
+        assert frame_header_bytes + payload_bytes <= 2**16 - 1 - 28
+        self.data_width    = data_width
+        self.payload_bytes = payload_bytes
+        self.sink = sink = stream.Endpoint([("data", data_width)])
+
+        self._enable     = CSRStorage(description="Stream `sink`, disabling drops the buffered data and restarts the sequence.")
+        self._ip_address = CSRStorage(32, reset=convert_ip(ip_address), description="Destination IP address.")
+        self._dst_port   = CSRStorage(16, reset=dst_port, description="Destination UDP port.")
+        self._timeout    = CSRStorage(32, description="Cycles without data after which a partial frame is sent (0: never).")
+        self._decimation = CSRStorage(16, reset=decimation, description="Sample `sink` one cycle out of `decimation` (0, 1: every cycle).")
+        self._frames     = CSRStatus(32, description="Frames sent since enable.")
+        self._overflow   = CSRStatus(32, description="Sink beats dropped since enable (frame buffer full).")
+
+        # # #
+
+        framer = _UDPFramer(udp_port.sink, data_width, payload_bytes, fifo_frames, src_port)
+        framer = ClockDomainsRenamer(cd)(framer)
+        self.submodules.framer = framer
+
+        # Clock domain crossing (the LiteEth core runs in the PHY domain unless sys datapath).
+        if cd == "sys":
+            self.comb += [
+                framer.enable.eq(self._enable.storage),
+                framer.ip_address.eq(self._ip_address.storage),
+                framer.dst_port.eq(self._dst_port.storage),
+                framer.timeout.eq(self._timeout.storage),
+                framer.overflow.eq(self._overflow.status),
+                self._frames.status.eq(framer.frames),
+            ]
+            framer_sink = framer.sink
+        else:
+            self.submodules.cdc = cdc = stream.ClockDomainCrossing([("data", data_width)],
+                cd_from="sys", cd_to=cd, depth=cdc_depth)
+            self.specials += [
+                MultiReg(self._enable.storage,     framer.enable,     cd),
+                MultiReg(self._ip_address.storage, framer.ip_address, cd),
+                MultiReg(self._dst_port.storage,   framer.dst_port,   cd),
+                MultiReg(self._timeout.storage,    framer.timeout,    cd),
+            ]
+            self.submodules.overflow_sync = BusSynchronizer(32, "sys", cd)
+            self.submodules.frames_sync   = BusSynchronizer(32, cd, "sys")
+            self.comb += [
+                self.overflow_sync.i.eq(self._overflow.status),
+                framer.overflow.eq(self.overflow_sync.o),
+                self.frames_sync.i.eq(framer.frames),
+                self._frames.status.eq(self.frames_sync.o),
+                cdc.source.connect(framer.sink),
+            ]
+            framer_sink = cdc.sink
+
+        # Decimation.
+        phase = Signal(16)
+        self.sync += If(~self._enable.storage | ((phase + 1) >= self._decimation.storage),
+            phase.eq(0)
+        ).Else(
+            phase.eq(phase + 1)
+        )
+
+        # Drop (and count) instead of back-pressuring the capture.
+        self.comb += [
+            framer_sink.valid.eq(sink.valid & self._enable.storage & (phase == 0)),
+            framer_sink.data.eq(sink.data),
+            sink.ready.eq(1),
+        ]
+        self.sync += If(~self._enable.storage,
+            self._overflow.status.eq(0)
+        ).Elif(framer_sink.valid & ~framer_sink.ready,
+            self._overflow.status.eq(self._overflow.status + 1)
+        )
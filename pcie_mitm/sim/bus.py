@@ -0,0 +1,146 @@
+import random
+
+from migen import *
+from migen.sim import passive
+
+from litex.soc.interconnect import wishbone
+
+
+# Wishbone Master ----------------------------------------------------------------------------------
+
+def wishbone_burst_write(wb, adr, datas, sel=None):
+    """Incrementing Wishbone burst write, one beat per cycle when the slave allows it."""
+    if sel is None:
+        sel = 2**len(wb.sel) - 1
+    yield wb.we.eq(1)
+    yield wb.sel.eq(sel)
+    yield wb.bte.eq(0b00)
+    yield wb.cyc.eq(1)
+    yield wb.stb.eq(1)
+    for i, data in enumerate(datas):
+        last = (i == len(datas) - 1)
+        yield wb.adr.eq(adr + i)
+        yield wb.dat_w.eq(data)
+        if len(datas) == 1:
+            yield wb.cti.eq(wishbone.CTI_BURST_NONE)
+        else:
+            yield wb.cti.eq(wishbone.CTI_BURST_END if last else wishbone.CTI_BURST_INCREMENTING)
+        yield
+        while not (yield wb.ack):
+            yield
+    yield wb.cyc.eq(0)
+    yield wb.stb.eq(0)
+    yield wb.we.eq(0)
+
+def wishbone_burst_read(wb, adr, length):
+    """Incrementing Wishbone burst read of `length` words."""
+    datas = []
+    yield wb.we.eq(0)
+    yield wb.bte.eq(0b00)
+    yield wb.cyc.eq(1)
+    yield wb.stb.eq(1)
+    for i in range(length):
+        last = (i == length - 1)
+        yield wb.adr.eq(adr + i)
+        if length == 1:
+            yield wb.cti.eq(wishbone.CTI_BURST_NONE)
+        else:
+            yield wb.cti.eq(wishbone.CTI_BURST_END if last else wishbone.CTI_BURST_INCREMENTING)
+        yield
+        while not (yield wb.ack):
+            yield
+        datas.append((yield wb.dat_r))
+    yield wb.cyc.eq(0)
+    yield wb.stb.eq(0)
+    return datas
+
+# Avalon-MM Slave ----------------------------------------------------------------------------------
+
+class AvalonMMMemoryModel:
+    """Avalon-MM memory slave with pipelined reads, bursts and a configurable read latency.
+
+    `waitrequest_rate` randomly stalls commands to exercise the master's backpressure handling.
+    """
+    def __init__(self, avl, mem=None, read_latency=2, waitrequest_rate=0.0, bursts=True, seed=0):
+        self.avl              = avl
+        self.mem              = {} if mem is None else mem
+        self.read_latency     = read_latency
+        self.waitrequest_rate = waitrequest_rate
+        self.bursts           = bursts
+        self.rng              = random.Random(seed)
+        self.reads            = 0
+        self.writes           = 0
+
+    @passive
+    def generator(self):
+        avl       = self.avl
+        responses = [] # (cycle, data).
+        cycle     = 0
+        wburst    = 0
+        wadr      = 0
+        while True:
+            stall = self.rng.random() < self.waitrequest_rate
+            yield avl.waitrequest.eq(stall)
+            yield avl.readdatavalid.eq(0)
+            if responses and responses[0][0] <= cycle:
+                yield avl.readdatavalid.eq(1)
+                yield avl.readdata.eq(responses.pop(0)[1])
+            yield
+            cycle += 1
+            if (yield avl.waitrequest):
+                continue
+            count = (yield avl.burstcount) if self.bursts else 1
+            count = max(count, 1)
+            if (yield avl.read):
+                adr   = (yield avl.address)
+                start = max([cycle + self.read_latency - 1] + [c + 1 for c, _ in responses[-1:]])
+                for i in range(count):
+                    responses.append((start + i, self.mem.get(adr + i, 0)))
+                self.reads += count
+            elif (yield avl.write):
+                if wburst == 0:
+                    wadr   = (yield avl.address)
+                    wburst = count
+                self.mem[wadr] = (yield avl.writedata)
+                wadr   += 1
+                wburst -= 1
+                self.writes += 1
+
+# Wishbone Slave -----------------------------------------------------------------------------------
+
+class WishboneMemoryModel:
+    """Wishbone memory slave acking each access `read_latency` cycles (writes: 1 cycle) after it is
+    seen, for bridges mastering Wishbone (e.g. the stock LiteX AvalonMM2Wishbone).
+
+    `waitrequest_rate` randomly delays accesses, like AvalonMMMemoryModel.
+    """
+    def __init__(self, wb, mem=None, read_latency=1, waitrequest_rate=0.0, seed=0):
+        self.wb               = wb
+        self.mem              = {} if mem is None else mem
+        self.read_latency     = max(read_latency, 1)
+        self.waitrequest_rate = waitrequest_rate
+        self.rng              = random.Random(seed)
+        self.reads            = 0
+        self.writes           = 0
+
+    @passive
+    def generator(self):
+        wb = self.wb
+        while True:
+            yield wb.ack.eq(0)
+            yield
+            if not ((yield wb.cyc) and (yield wb.stb)):
+                continue
+            if self.rng.random() < self.waitrequest_rate:
+                continue
+            adr = (yield wb.adr)
+            if (yield wb.we):
+                self.mem[adr] = (yield wb.dat_w)
+                self.writes += 1
+            else:
+                for _ in range(self.read_latency - 1):
+                    yield
+                yield wb.dat_r.eq(self.mem.get(adr, 0))
+                self.reads += 1
+            yield wb.ack.eq(1)
+            yield
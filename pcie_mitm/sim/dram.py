@@ -0,0 +1,78 @@
+from migen import *
+
+from litex.soc.interconnect import avalon
+
+from pcie_mitm.host.dram import BandwidthResult, LatencyResult, bandwidth, bandwidth_patterns, latency_patterns
+from pcie_mitm.ip.dram import AvalonMMDRAMCrossbar, DRAMBenchmark
+from pcie_mitm.sim.bus import AvalonMMMemoryModel
+
+
+# Avalon-MM DRAM Model -----------------------------------------------------------------------------
+
+class DRAMBenchModel(Module):
+    """DRAMBenchmark on an AvalonMMDRAMCrossbar, `model` (AvalonMMMemoryModel) stands for the UniPHY
+    controller: run its generator along the benchmark ones. A full SDRAMPHYModel of the SODIMM is too
+    large for the migen simulator, use the Verilator simulation (sim.py --with-dram-bench) for it.
+    """
+    def __init__(self, data_width=64, address_width=16, clk_freq=int(100e6), words_per_row=16, nbanks=8,
+        **model_kwargs):
+        self.clk_freq      = clk_freq
+        self.words_per_row = words_per_row
+        self.nbanks        = nbanks
+        self.avl = avalon.AvalonMMInterface(data_width=data_width, adr_width=address_width)
+        self.submodules.crossbar = AvalonMMDRAMCrossbar(self.avl)
+        self.submodules.bench    = DRAMBenchmark(self.crossbar)
+        self.model = AvalonMMMemoryModel(self.avl, **model_kwargs)
+
+# Benchmark Generators -----------------------------------------------------------------------------
+
+def _pulse(csr):
+    yield csr.re.eq(1)
+    yield
+    yield csr.re.eq(0)
+
+def bist(bench, mode, random=False, base=0, length=1024, timeout=100000):
+    """Simulation counterpart of DRAMBenchmarkDriver.bist, returns (cycles, errors)."""
+    core = bench.generator if mode == "write" else bench.checker
+    yield from _pulse(core.reset)
+    yield core.base.storage.eq(base)
+    yield core.end.storage.eq(base + length)
+    yield core.length.storage.eq(length)
+    yield core.random.fields.data.eq(0)
+    yield core.random.fields.addr.eq(random)
+    yield
+    yield from _pulse(core.start)
+    for _ in range(timeout):
+        yield
+        if (yield core.done.status):
+            break
+    else:
+        raise TimeoutError(f"BIST {mode} not done after {timeout} cycles")
+    errors = (yield bench.checker.errors.status) if mode == "read" else 0
+    return (yield core.ticks.status), errors
+
+def latency(bench, stride=1, count=16, base=0, timeout=100000):
+    """Simulation counterpart of DRAMBenchmarkDriver.latency, returns (min, max, mean) cycles."""
+    probe = bench.latency
+    yield probe._base.storage.eq(base)
+    yield probe._stride.storage.eq(stride)
+    yield probe._count.storage.eq(count)
+    yield from _pulse(probe._start)
+    for _ in range(timeout):
+        yield
+        if (yield probe._done.status):
+            break
+    else:
+        raise TimeoutError(f"latency probe not done after {timeout} cycles")
+    return (yield probe._min.status), (yield probe._max.status), (yield probe._sum.status)/count
+
+def run_benchmark(dut, length=1024, count=16, results=None):
+    """DRAMBenchmarkDriver.run on a DRAMBenchModel, appends to `results`."""
+    results = [] if results is None else results
+    for pattern, (mode, random) in bandwidth_patterns.items():
+        cycles, errors = yield from bist(dut.bench, mode, random, 0, length)
+        results.append(BandwidthResult(pattern, length, cycles, 0 if random else errors,
+            bandwidth(length, cycles, dut.clk_freq)))
+    for pattern, stride in latency_patterns(dut.words_per_row, dut.nbanks).items():
+        results.append(LatencyResult(pattern, count, *(yield from latency(dut.bench, stride, count))))
+    return results
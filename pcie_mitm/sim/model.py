@@ -0,0 +1,304 @@
+import random
+
+from pcie_mitm.ip.gpio import gpio_registers
+from pcie_mitm.sim.bus import wishbone_burst_read, wishbone_burst_write
+
+
+# Transaction-level models of the pcie_mitm.ip cores, in plain Python: register accesses and TLPs
+# are applied as whole transactions, time only advances where the gateware behavior depends on it
+# (`step`). The bus functional drivers below replay the same vectors on a model, on the migen
+# gateware or on the Verilator build (Etherbone), see check_equivalence.
+
+def _mask(width):
+    return (1 << width) - 1
+
+def _byteenable_mask(byteenable):
+    return sum(0xff << 8*i for i in range(4) if (byteenable >> i) & 1)
+
+# GPIO ---------------------------------------------------------------------------------------------
+
+class GPIOModel:
+    """Model of pcie_mitm.ip.gpio.AvalonMMGPIO, on its Avalon-MM word addresses.
+
+    Cycle accurate for the inputs: `in_port` goes through the 2-stage synchronizer and the edge
+    detector one `step` (cycle) at a time, a write is one cycle.
+    """
+    def __init__(self, width=8, in_width=0):
+        self.width    = width
+        self.in_width = in_width
+        self.in_port  = 0
+        self.out      = 0
+        self.inputs   = 0
+        self.previous = 0
+        self.edges    = 0
+        self.rising   = 0
+        self.falling  = 0
+        self.irq_mask = 0
+        self._sync    = 0
+
+    @property
+    def out_port(self):
+        return self.out
+
+    @property
+    def irq(self):
+        return (self.edges & self.irq_mask) != 0
+
+    def _cycle(self, clear=0):
+        if self.in_width:
+            captured = ((self.inputs & ~self.previous & self.rising) |
+                        (~self.inputs & self.previous & self.falling))
+            self.edges    = ((self.edges & ~clear) | captured) & _mask(self.in_width)
+            self.previous = self.inputs
+            self.inputs, self._sync = self._sync, self.in_port & _mask(self.in_width)
+
+    def step(self, cycles=1):
+        for _ in range(cycles):
+            self._cycle()
+
+    def write(self, address, value, byteenable=0b1111):
+        address = address & 0xf
+        mask    = _byteenable_mask(byteenable)
+        value   = value & mask
+        self._cycle(clear=value if address == gpio_registers["edges"] else 0)
+        def update(old):
+            return (old & ~mask) | value
+        if address == gpio_registers["out"]:
+            self.out = update(self.out)
+        elif address == gpio_registers["set"]:
+            self.out |= value
+        elif address == gpio_registers["clear"]:
+            self.out &= ~value
+        elif address == gpio_registers["toggle"]:
+            self.out ^= value
+        elif self.in_width and address == gpio_registers["rising"]:
+            self.rising = update(self.rising)
+        elif self.in_width and address == gpio_registers["falling"]:
+            self.falling = update(self.falling)
+        elif self.in_width and address == gpio_registers["irq_mask"]:
+            self.irq_mask = update(self.irq_mask)
+        self.out      &= _mask(self.width)
+        self.rising   &= _mask(self.in_width)
+        self.falling  &= _mask(self.in_width)
+        self.irq_mask &= _mask(self.in_width)
+
+    def read(self, address):
+        address = address & 0xf
+        if address in [gpio_registers[reg] for reg in ["out", "set", "clear", "toggle"]]:
+            return self.out
+        if self.in_width:
+            inputs = {
+                gpio_registers["in"]:       self.inputs,
+                gpio_registers["edges"]:    self.edges,
+                gpio_registers["rising"]:   self.rising,
+                gpio_registers["falling"]:  self.falling,
+                gpio_registers["irq_mask"]: self.irq_mask,
+            }
+            return inputs.get(address, 0)
+        return 0
+
+# Wishbone -> Avalon-MM ----------------------------------------------------------------------------
+
+class Wishbone2AvalonMMModel:
+    """Model of the Wishbone side of a pcie_mitm.ip.bridge.Wishbone2AvalonMM and its Avalon slave.
+
+    `slave` is a model with `read(address)`/`write(address, value, byteenable)` (and optionally
+    `step(cycles)`) on word addresses. Accesses are ordered (posted writes drain before reads) and
+    advance `cycles` by the Wishbone cycles measured on the gateware with a `read_latency=0` slave.
+    """
+    def __init__(self, slave):
+        self.slave  = slave
+        self.cycles = 0
+
+    def step(self, cycles=1):
+        self.cycles += cycles
+        if hasattr(self.slave, "step"):
+            self.slave.step(cycles)
+
+    def write(self, adr, datas, sel=0b1111):
+        for i, data in enumerate(datas):
+            self.slave.write(adr + i, data, sel)
+        self.step(len(datas) + (len(datas) > 1))
+
+    def read(self, adr, length=1):
+        datas = [self.slave.read(adr + i) for i in range(length)]
+        self.step(3 + length)
+        return datas
+
+# TLP Sniffer --------------------------------------------------------------------------------------
+
+_filter_regs = ["ctrl", "fmt_type_value", "fmt_type_mask", "requester_value", "requester_mask",
+    "address_low", "address_high", "bar_mask"]
+
+class TLPSnifferModel:
+    """Model of pcie_mitm.ip.tlp.TLPSniffer: `push` one TLP, get its record (None if filtered).
+
+    Records are dicts of the unpacked record fields without the timestamp, as returned by
+    pcie_mitm.sim.tlp.unpack_record. Like the gateware, header DWs not present in a TLP (DW3 of a
+    3 DW header without payload) are 0. The output FIFO is not modeled: nothing is dropped. CSRs
+    (`csrs`) use the names of the sniffer CSRs, see ModelBus.
+    """
+    def __init__(self, data_width=64, payload_dws=8, nfilters=4):
+        self.lanes       = data_width//32
+        self.payload_dws = payload_dws
+        self.nfilters    = nfilters
+        self.csrs = {"ctrl": 0, "max_payload": payload_dws, "tlps": 0, "matched": 0, "dropped": 0}
+        for n in range(nfilters):
+            self.csrs.update({f"filter{n}_{reg}": 0 for reg in _filter_regs})
+
+    def _rule_match(self, n, dws, bar):
+        csr      = lambda reg: self.csrs[f"filter{n}_{reg}"]
+        fmt_type = dws[0] >> 24
+        is_cpl   = ((fmt_type & 0x1f) >> 1) == 0b0101
+        is_mem   = ((fmt_type & 0x1f) >> 1) == 0 or (fmt_type & 0x1f) == 0b00010
+        requester_id = (dws[2] if is_cpl else dws[1]) >> 16
+        if (fmt_type >> 5) & 1:
+            address = (dws[2] << 32) | (dws[3] & ~3)
+        else:
+            address = dws[2] & ~3
+        return ((csr("ctrl") & 1) and
+            ((fmt_type ^ csr("fmt_type_value")) & csr("fmt_type_mask")) == 0 and
+            ((requester_id ^ csr("requester_value")) & csr("requester_mask")) == 0 and
+            (not (csr("ctrl") & 2) or (is_mem and csr("address_low") <= address <= csr("address_high"))) and
+            (csr("bar_mask") == 0 or (bar & csr("bar_mask")) != 0))
+
+    def push(self, dws, bar=0):
+        # DW collection: beats are padded with zero DWs.
+        padded      = list(dws) + [0]*(-len(dws) % self.lanes)
+        hdr_dws     = 4 if (dws[0] >> 29) & 1 else 3
+        max_payload = self.csrs["max_payload"] & 0xff
+        hdr         = (padded + [0]*4)[:4]
+        payload     = padded[hdr_dws:hdr_dws + min(self.payload_dws, max_payload)]
+        if not (self.csrs["ctrl"] & 1):
+            return None
+        self.csrs["tlps"] += 1
+
+        # Filtering.
+        hits  = sum(1 << n for n in range(self.nfilters) if self._rule_match(n, hdr, bar))
+        match = (self.csrs["ctrl"] & 2) or hits
+        if not match:
+            return None
+        self.csrs["matched"] += 1
+
+        # Payload DWs captured.
+        length = ((hdr[0] & 0x3ff) or 1024) if (hdr[0] >> 30) & 1 else 0
+        dws_captured = max(len(padded) - hdr_dws, 0)
+        captured = min(max_payload, length, dws_captured)
+        return {
+            "bar":       bar,
+            "captured":  captured,
+            "truncated": int(length > captured),
+            "hits":      hits,
+            "header":    hdr,
+            "payload":   payload[:captured],
+        }
+
+# Model CSR Bus ------------------------------------------------------------------------------------
+
+class _ModelCSR:
+    def __init__(self, csrs, key, name):
+        self.csrs = csrs
+        self.key  = key
+        self.name = name
+
+    def read(self):
+        return self.csrs[self.key]
+
+    def write(self, value):
+        self.csrs[self.key] = value
+
+class _ModelRegs:
+    def __init__(self, models):
+        self.d = {}
+        for prefix, model in models.items():
+            for key in model.csrs:
+                self.d[f"{prefix}_{key}"] = _ModelCSR(model.csrs, key, f"{prefix}_{key}")
+
+    def __getattr__(self, name):
+        try:
+            return self.d[name]
+        except KeyError:
+            raise AttributeError(name)
+
+class ModelBus:
+    """RemoteClient-like bus on the CSRs of models ({CSR prefix: model}), for the host drivers.
+
+    e.g. TLPSnifferDriver(ModelBus({"sniffer": TLPSnifferModel()})).
+    """
+    def __init__(self, models):
+        self.regs = _ModelRegs(models)
+
+# Vectors ------------------------------------------------------------------------------------------
+
+# Register access vectors, word addresses:
+#   ("write", adr, value, sel)
+#   ("read",  adr)
+#   ("input", value)  drive the GPIO inputs and let them settle (migen/model only).
+input_settle_cycles = 4
+
+def random_gpio_vectors(n, seed=0, in_width=0, byteenables=True):
+    prng    = random.Random(seed)
+    regs    = list(gpio_registers.values()) + [15] # Last: unmapped.
+    vectors = []
+    for _ in range(n):
+        r = prng.random()
+        if in_width and r < 0.1:
+            vectors.append(("input", prng.getrandbits(in_width)))
+        elif r < 0.55:
+            sel = prng.choice([0b1111, 0b0001, 0b0010, 0b0011]) if byteenables else 0b1111
+            vectors.append(("write", prng.choice(regs), prng.getrandbits(32), sel))
+        else:
+            vectors.append(("read", prng.choice(regs)))
+    return vectors
+
+# Bus Functional Drivers ---------------------------------------------------------------------------
+
+def run_model(model, vectors):
+    """Replay `vectors` on a Wishbone2AvalonMMModel (of a GPIOModel), return the read values."""
+    reads = []
+    for vector in vectors:
+        if vector[0] == "write":
+            model.write(vector[1], [vector[2]], vector[3])
+        elif vector[0] == "read":
+            reads += model.read(vector[1])
+        else:
+            model.slave.in_port = vector[1]
+            model.step(input_settle_cycles)
+    return reads
+
+def run_migen(wb, vectors, in_port=None, reads=None):
+    """Replay `vectors` on a migen Wishbone interface, append the read values to `reads`."""
+    reads = [] if reads is None else reads
+    for vector in vectors:
+        if vector[0] == "write":
+            yield from wishbone_burst_write(wb, vector[1], [vector[2]], vector[3])
+        elif vector[0] == "read":
+            reads += (yield from wishbone_burst_read(wb, vector[1], 1))
+        else:
+            yield in_port.eq(vector[1])
+            for _ in range(input_settle_cycles):
+                yield
+    return reads
+
+async def run_etherbone(bus, base, vectors):
+    """Replay `vectors` through an EtherboneQueue at byte address `base`, return the read values.
+
+    Etherbone writes have no byte enables: vectors must use sel=0b1111, and no inputs.
+    """
+    reads = []
+    for vector in vectors:
+        if vector[0] == "write":
+            assert vector[3] == 0b1111, "Etherbone writes are full words"
+            bus.write(base + 4*vector[1], vector[2])
+        elif vector[0] == "read":
+            reads += await bus.read(base + 4*vector[1])
+        else:
+            raise ValueError("GPIO inputs can't be driven over Etherbone")
+    return reads
+
+def check_equivalence(vectors, expected, got):
+    """Raise an AssertionError at the first read of `got` differing from the model's `expected`."""
+    reads = [v for v in vectors if v[0] == "read"]
+    assert len(expected) == len(got) == len(reads), f"{len(got)} reads, expected {len(expected)}"
+    for i, (vector, e, g) in enumerate(zip(reads, expected, got)):
+        assert e == g, f"read {i} {vector}: 0x{g:08x}, model 0x{e:08x}"
@@ -0,0 +1,165 @@
+import asyncio
+import importlib.util
+import json
+import os
+import shutil
+import socket
+import subprocess
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from pcie_mitm.host.etherbone import EtherboneQueue, CSRMap, UARTboneTransport
+
+
+# Stimulus -----------------------------------------------------------------------------------------
+
+def load_stimulus(filename):
+    spec   = importlib.util.spec_from_file_location("stimulus", filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+async def stimulus_session(module, transport, csr_csv="csr.csv", seed=0, timeout=10.0,
+    finish=False):
+    """Run `async def main(bus, csrs, seed)` of a stimulus module once the model is listening.
+
+    With `finish`, the model is then ended through the SimFinish CSR (`sim_finish_finish`): its
+    $finish is what writes the coverage file and the trace.
+    """
+    bus   = EtherboneQueue(transport)
+    start = time.monotonic()
+    while True:
+        try:
+            await bus.open()
+            break
+        except OSError:
+            if time.monotonic() - start > timeout:
+                raise OSError("Unable to connect to the simulation")
+            await asyncio.sleep(0.1)
+    csrs = CSRMap(bus, csr_csv)
+    try:
+        await module.main(bus, csrs, seed)
+        await bus.drain()
+    finally:
+        if finish and "sim_finish_finish" in csrs.regs:
+            csrs.sim_finish_finish.write(1)
+            bus.flush()
+        bus.close()
+
+# Coverage -----------------------------------------------------------------------------------------
+
+def read_coverage(filename):
+    """Points of a Verilator coverage file (`C '<key>' <count>` lines)."""
+    points = Counter()
+    with open(filename, errors="replace") as f:
+        for line in f:
+            if line.startswith("C '"):
+                key, count = line[3:].rstrip().rsplit("' ", 1)
+                points[key] += int(count)
+    return points
+
+# Regression ---------------------------------------------------------------------------------------
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+def run_instance(gateware_dir, run_dir, sim_config, stimulus, csr_csv, seed, command=None,
+    timeout=60.0, finish_timeout=10.0):
+    """Run one model instance in its own directory with its own UARTbone TCP port.
+
+    `sim_config` is a SimConfig-style module list whose serial2tcp port is replaced. The model is
+    ended with $finish (SimFinish CSR) and given `finish_timeout` seconds to exit and write its
+    coverage; only then is it killed, without coverage (Verilator models have no SIGTERM handler).
+    """
+    shutil.rmtree(run_dir, ignore_errors=True)
+    os.makedirs(run_dir)
+    # Everything but the sim config is shared with the build (model, modules/, memory inits).
+    for name in os.listdir(gateware_dir):
+        if name not in ["sim_config.js", "sim.cov"]:
+            os.symlink(os.path.join(gateware_dir, name), os.path.join(run_dir, name))
+    port   = _free_port()
+    config = json.loads(json.dumps(sim_config))
+    for module in config:
+        if isinstance(module, dict) and module.get("module") == "serial2tcp":
+            module["args"]["port"] = port
+    with open(os.path.join(run_dir, "sim_config.js"), "w") as f:
+        json.dump(config, f, indent=4)
+
+    if command is None:
+        command = [os.path.join(gateware_dir, "obj_dir", "Vsim")]
+    start  = time.monotonic()
+    result = {"seed": seed, "passed": False, "error": None, "coverage": None}
+    with open(os.path.join(run_dir, "sim.log"), "wb") as log:
+        sim = subprocess.Popen(command, cwd=run_dir, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            asyncio.run(asyncio.wait_for(
+                stimulus_session(load_stimulus(stimulus), UARTboneTransport("localhost", port),
+                    csr_csv = csr_csv,
+                    seed    = seed,
+                    finish  = True),
+                timeout))
+            result["passed"] = True
+        except Exception as e:
+            result["error"] = "".join(traceback.format_exception_only(type(e), e)).strip()
+        finally:
+            try:
+                sim.wait(finish_timeout)
+            except subprocess.TimeoutExpired:
+                sim.kill()
+                sim.wait()
+    result["elapsed"] = time.monotonic() - start
+    coverage = os.path.join(run_dir, "sim.cov")
+    if os.path.exists(coverage):
+        result["coverage"] = coverage
+    return result
+
+def run_regression(gateware_dir, sim_config, stimulus, seeds, jobs=None, run_dir="regression",
+    csr_csv="csr.csv", command=None, timeout=60.0):
+    """Run `stimulus` once per seed on a pool of `jobs` model instances and return a report."""
+    gateware_dir = os.path.abspath(gateware_dir)
+    run_dir      = os.path.abspath(run_dir)
+    start        = time.monotonic()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(run_instance, gateware_dir, os.path.join(run_dir, f"seed{seed}"),
+            sim_config, os.path.abspath(stimulus), os.path.abspath(csr_csv), seed, command, timeout)
+            for seed in seeds]
+        results = [f.result() for f in futures]
+    elapsed = time.monotonic() - start
+
+    points = Counter()
+    for r in results:
+        if r["coverage"] is not None:
+            points.update(read_coverage(r["coverage"]))
+    report = {
+        "passed":   sum(r["passed"] for r in results),
+        "failed":   sum(not r["passed"] for r in results),
+        "elapsed":  elapsed,
+        "runs_per_second": len(results)/elapsed if elapsed else 0.0,
+        "failures": [{"seed": r["seed"], "error": r["error"]} for r in results if not r["passed"]],
+        "coverage": {
+            "points": len(points),
+            "hit":    sum(1 for c in points.values() if c),
+        },
+    }
+    if points:
+        with open(os.path.join(run_dir, "merged.cov"), "w") as f:
+            f.write("# SystemC::Coverage-3\n")
+            for key, count in points.items():
+                f.write(f"C '{key}' {count}\n")
+    with open(os.path.join(run_dir, "report.json"), "w") as f:
+        json.dump({**report, "results": results}, f, indent=4)
+    return report
+
+def print_report(report):
+    coverage = report["coverage"]
+    print(f"{report['passed']} passed, {report['failed']} failed in {report['elapsed']:.1f}s "
+          f"({report['runs_per_second']:.1f} runs/s)")
+    if coverage["points"]:
+        print(f"coverage: {coverage['hit']}/{coverage['points']} points "
+              f"({100*coverage['hit']/coverage['points']:.1f}%)")
+    for failure in report["failures"]:
+        print(f"  seed {failure['seed']}: {failure['error']}")
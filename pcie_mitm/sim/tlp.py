@@ -0,0 +1,128 @@
+import random
+
+from migen import *
+from migen.sim import passive
+
+from pcie_mitm.ip.tlp import fmt_type_dict
+
+
+# CSRs ---------------------------------------------------------------------------------------------
+
+def finalize_csrs(module):
+    """Finalize the CSRs of `module` as its submodules and return it.
+
+    In a SoC, CSRStorage fields and CSR `re`/`we` are driven from the CSR bank: without one, the
+    CSRs must be finalized for the fields to follow `storage`.
+    """
+    for csr in module.get_csrs():
+        if isinstance(csr, Module):
+            csr.finalize(32, "big")
+            module.submodules += csr
+    return module
+
+# TLP Builders -------------------------------------------------------------------------------------
+
+def make_tlp(kind, requester_id=0, tag=0, address=0, length=None, datas=None, completer_id=0,
+    byte_count=None, first_be=0xf, last_be=None):
+    """Return the DWs (header then payload) of a TLP of `kind` (see fmt_type_dict)."""
+    fmt_type  = fmt_type_dict[kind]
+    with_data = (fmt_type >> 6) & 1
+    four_dw   = (fmt_type >> 5) & 1
+    datas     = list(datas or [])
+    if length is None:
+        length = len(datas) if with_data else 1
+    if last_be is None:
+        last_be = 0xf if length > 1 else 0
+    dw0 = (fmt_type << 24) | (length & 0x3ff)
+    if kind.startswith("cpl"):
+        if byte_count is None:
+            byte_count = 4*length
+        dw1 = (completer_id << 16) | (byte_count & 0xfff)
+        dw2 = (requester_id << 16) | (tag << 8) | (address & 0x7f)
+        hdr = [dw0, dw1, dw2]
+    else:
+        dw1 = (requester_id << 16) | (tag << 8) | (last_be << 4) | first_be
+        if four_dw:
+            hdr = [dw0, dw1, address >> 32, address & 0xfffffffc]
+        else:
+            hdr = [dw0, dw1, address & 0xfffffffc]
+    return hdr + datas
+
+def tlp_length(dws):
+    """Header + payload DWs of the TLP starting at `dws[0]`."""
+    length = (dws[0] & 0x3ff) or 1024
+    return (4 if (dws[0] >> 29) & 1 else 3) + (length if (dws[0] >> 30) & 1 else 0)
+
+def random_tlps(n, seed=0):
+    """`n` random memory requests/completions (1-11 DWs) from 0x0100/0x0200: [(dws, bar hit)]."""
+    prng = random.Random(seed)
+    tlps = []
+    for i in range(n):
+        kind   = prng.choice(["mrd32", "mrd64", "mwr32", "mwr64", "cpld", "cpl"])
+        length = prng.randrange(1, 12)
+        datas  = [prng.randrange(2**32) for _ in range(length)] if kind in ["mwr32", "mwr64", "cpld"] else None
+        tlps.append((make_tlp(kind,
+            requester_id = prng.choice([0x0100, 0x0200]),
+            tag          = i & 0xff,
+            address      = prng.randrange(2**(64 if kind.endswith("64") else 32)) & ~3,
+            length       = length,
+            datas        = datas), 1 << prng.randrange(6)))
+    return tlps
+
+# TLP Stream Driver --------------------------------------------------------------------------------
+
+def tlp_stream_write(ep, dws, bar=0, gap=0):
+    """Send the DWs of one TLP on a tlp_layout stream, `gap` idle cycles after the last beat."""
+    lanes = len(ep.dat)//32
+    beats = [dws[i:i + lanes] for i in range(0, len(dws), lanes)]
+    for i, beat in enumerate(beats):
+        yield ep.valid.eq(1)
+        yield ep.first.eq(i == 0)
+        yield ep.last.eq(i == len(beats) - 1)
+        yield ep.bar.eq(bar)
+        yield ep.dat.eq(sum(dw << 32*j for j, dw in enumerate(beat)))
+        yield
+        while not (yield ep.ready):
+            yield
+    yield ep.valid.eq(0)
+    for i in range(gap):
+        yield
+
+# TLP Sniffer --------------------------------------------------------------------------------------
+
+def unpack_record(record, payload_dws):
+    """Fields of a TLPSniffer record (see tlp_record_width), timestamp excluded."""
+    dws = [(record >> 32*i) & 0xffffffff for i in range(8 + payload_dws)]
+    return {
+        "bar":       (record >> 64) & 0xff,
+        "captured":  (record >> 72) & 0xff,
+        "truncated": (record >> 80) & 1,
+        "hits":      (record >> 88) & 0xff,
+        "header":    dws[3:7],
+        "payload":   dws[8:8 + ((record >> 72) & 0xff)],
+    }
+
+def run_sniffer(dut, tlps, setup):
+    """Simulate a TLPSniffer (CSRs finalized): run the `setup()` generator, send `tlps`
+    ([(dws, bar)]) and return the unpacked records."""
+    records = []
+
+    def generator():
+        yield from setup()
+        for _ in range(4):
+            yield
+        for dws, bar in tlps:
+            yield from tlp_stream_write(dut.sink, dws, bar)
+        for _ in range(16):
+            yield
+
+    @passive
+    def collector():
+        yield dut.source.ready.eq(1)
+        while True:
+            if (yield dut.source.valid):
+                records.append(unpack_record((yield dut.source.data), dut.payload_dws))
+            yield
+
+    run_simulation(dut, [generator(), collector()])
+    return records
@@ -0,0 +1,78 @@
+import hashlib
+import os
+import subprocess
+import sys
+
+
+# Cached Verilator Build ---------------------------------------------------------------------------
+
+# LiteX always regenerates the gateware and its build script starts with `rm -rf obj_dir/`, so
+# every run recompiles the Verilator model. Here the generated files are hashed instead and the
+# compile step is skipped when the model in obj_dir was built from the same inputs.
+
+hash_file = "pcie_mitm_sim.hash"
+
+def _strip_comments(data):
+    # Generated Verilog starts with a "// Auto-Generated by LiteX on <date>" header.
+    return b"\n".join(l for l in data.splitlines() if not l.lstrip().startswith(b"//"))
+
+def sim_build_hash(gateware_dir, sources=(), options=None):
+    """Hash of the generated gateware, sim config/build files, extra sources and `options`."""
+    h = hashlib.sha256()
+    files = sorted(f for f in os.listdir(gateware_dir)
+        if os.path.isfile(os.path.join(gateware_dir, f)) and os.path.splitext(f)[1] not in [".init", ".hex"])
+    files = [os.path.join(gateware_dir, f) for f in files]
+    files += sorted(os.path.abspath(s[0]) for s in sources
+        if os.path.dirname(os.path.abspath(s[0])) != os.path.abspath(gateware_dir))
+    for filename in files:
+        with open(filename, "rb") as f:
+            data = f.read()
+        if filename.endswith((".v", ".sv")):
+            data = _strip_comments(data)
+        h.update(os.path.basename(filename).encode() + b"\0" + data + b"\0")
+    h.update(repr(sorted((options or {}).items())).encode())
+    return h.hexdigest()
+
+def build_sim(builder, sim_config, build_name="sim", cache=True, **kwargs):
+    """Generate the SoC and compile its Verilator model unless an identical one is already built.
+
+    Returns `(gateware_dir, rebuilt)`.
+    """
+    builder.build(build=True, run=False, build_name=build_name, sim_config=sim_config, **kwargs)
+    gateware_dir = builder.gateware_dir
+    rebuilt = compile_sim(gateware_dir, builder.soc.platform.sources, build_name, cache, kwargs)
+    return gateware_dir, rebuilt
+
+def compile_sim(gateware_dir, sources=(), build_name="sim", cache=True, options=None):
+    """Compile the Verilator model generated in `gateware_dir`, return False if it was up to date."""
+    digest  = sim_build_hash(gateware_dir, sources, options)
+    stamp   = os.path.join(gateware_dir, "obj_dir", hash_file)
+    binary  = os.path.join(gateware_dir, "obj_dir", "Vsim")
+    if cache and os.path.exists(binary) and os.path.exists(stamp):
+        with open(stamp) as f:
+            if f.read() == digest:
+                return False
+    r = subprocess.call(["bash", f"build_{build_name}.sh"], cwd=gateware_dir)
+    if r != 0:
+        raise OSError("Verilator build failed")
+    with open(stamp, "w") as f:
+        f.write(digest)
+    return True
+
+def start_sim(gateware_dir, as_root=False, **kwargs):
+    """Start the compiled model (it reads sim_config.js from `gateware_dir`), return the Popen."""
+    cmd = ["sudo"] if as_root else []
+    cmd += [os.path.join("obj_dir", "Vsim")]
+    return subprocess.Popen(cmd, cwd=gateware_dir, **kwargs)
+
+def run_sim(gateware_dir, as_root=False):
+    if sys.platform != "win32" and sys.stdin.isatty():
+        import termios
+        termios_settings = termios.tcgetattr(sys.stdin.fileno())
+    try:
+        return start_sim(gateware_dir, as_root).wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if sys.platform != "win32" and sys.stdin.isatty():
+            termios.tcsetattr(sys.stdin.fileno(), termios.TCSAFLUSH, termios_settings)
@@ -9,6 +9,7 @@ setup(
     description="LiteX-based PCIe MITM, sniffing, fuzzing, device emulation",
     packages=find_packages(),
     install_requires=[
+        "numpy",
         "rich",
     ],
 )
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from migen import *
+from migen.sim import passive
+
+from litex.soc.interconnect import avalon
+from litex.soc.interconnect import wishbone
+
+from pcie_mitm.ip.bridge import Wishbone2AvalonMM
+from pcie_mitm.sim.bus import AvalonMMMemoryModel, WishboneMemoryModel
+from pcie_mitm.sim.bus import wishbone_burst_read, wishbone_burst_write
+
+
+# Bench --------------------------------------------------------------------------------------------
+
+class BenchDUT(Module):
+    def __init__(self, bridge, max_pending=8, burst_size=None):
+        self.wb  = wishbone.Interface()
+        self.avl = avalon.AvalonMMInterface(adr_width=16)
+        if bridge == "litex":
+            # The stock bridge goes the other way (Avalon-MM master -> Wishbone slave): the bench
+            # masters self.avl and a WishboneMemoryModel answers on self.wb.
+            self.submodules.bridge = avalon.AvalonMM2Wishbone(
+                data_width             = 32,
+                avalon_address_width   = len(self.avl.address),
+                wishbone_address_width = len(self.wb.adr))
+            self.comb += [
+                self.avl.connect(self.bridge.a2w_avl),
+                self.bridge.a2w_wb.connect(self.wb),
+            ]
+        else:
+            self.submodules.bridge = Wishbone2AvalonMM(self.wb, self.avl,
+                max_pending = max_pending,
+                burst_size  = burst_size)
+
+def bench(bridge, pattern, words, burst_length, read_latency, waitrequest_rate, **bridge_kwargs):
+    dut    = BenchDUT(bridge, **bridge_kwargs)
+    cycles = {"now": 0}
+    if bridge == "litex":
+        model = WishboneMemoryModel(dut.wb,
+            read_latency     = read_latency,
+            waitrequest_rate = waitrequest_rate)
+    else:
+        model = AvalonMMMemoryModel(dut.avl,
+            read_latency     = read_latency,
+            waitrequest_rate = waitrequest_rate)
+
+    def access(adr):
+        if bridge == "litex":
+            if pattern == "write":
+                yield from dut.avl.bus_write(adr, list(range(adr, adr + burst_length)))
+            else:
+                yield from dut.avl.bus_read(adr, burstcount=burst_length)
+                for _ in range(burst_length - 1):
+                    yield from dut.avl.continue_read_burst()
+        else:
+            if pattern == "write":
+                yield from wishbone_burst_write(dut.wb, adr, list(range(adr, adr + burst_length)))
+            else:
+                yield from wishbone_burst_read(dut.wb, adr, burst_length)
+
+    def generator():
+        start = cycles["now"]
+        for adr in range(0, words, burst_length):
+            yield from access(adr)
+        cycles["elapsed"] = cycles["now"] - start
+
+    @passive
+    def timer():
+        while True:
+            yield
+            cycles["now"] += 1
+
+    run_simulation(dut, [generator(), timer(), model.generator()])
+    return cycles["elapsed"]
+
+# Main ---------------------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Wishbone -> Avalon-MM bridge throughput benchmark")
+    parser.add_argument("--sys-clk-freq",     default=150e6, help="System clock frequency used to convert cycles to MB/s.")
+    parser.add_argument("--words",            default=1024,  help="32-bit words moved per pattern.")
+    parser.add_argument("--read-latency",     default=4,     help="Avalon slave read latency (cycles).")
+    parser.add_argument("--waitrequest-rate", default=0.0,   help="Fraction of cycles the slave stalls.")
+    parser.add_argument("--max-pending",      default=8,     help="Outstanding reads/queued writes of the pcie_mitm bridge.")
+    parser.add_argument("--bridges",          default="litex,pcie_mitm", help="Bridges to compare.")
+    args = parser.parse_args()
+
+    sys_clk_freq = float(args.sys_clk_freq)
+    words        = int(args.words)
+    print(f"{'bridge':<12} {'pattern':<8} {'burst':>5} {'cycles':>8} {'MB/s':>8}")
+    for bridge in args.bridges.split(","):
+        for pattern in ["write", "read"]:
+            for burst_length in [1, 4, 16]:
+                kwargs = {}
+                if bridge != "litex":
+                    kwargs["max_pending"] = int(args.max_pending)
+                cycles = bench(bridge, pattern, words, burst_length,
+                    read_latency     = int(args.read_latency),
+                    waitrequest_rate = float(args.waitrequest_rate),
+                    **kwargs)
+                mbps = 4*words*sys_clk_freq/cycles/1e6
+                print(f"{bridge:<12} {pattern:<8} {burst_length:>5} {cycles:>8} {mbps:>8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import random
+
+from migen import *
+
+from litex.soc.interconnect import avalon
+from litex.soc.interconnect import wishbone
+
+from pcie_mitm.ip.bridge import Wishbone2AvalonMM
+from pcie_mitm.sim.bus import AvalonMMMemoryModel, wishbone_burst_read, wishbone_burst_write
+
+
+# Helpers ------------------------------------------------------------------------------------------
+
+class _DUT(Module):
+    def __init__(self, **kwargs):
+        self.wb  = wishbone.Interface()
+        self.avl = avalon.AvalonMMInterface(adr_width=16)
+        self.submodules.bridge = Wishbone2AvalonMM(self.wb, self.avl, **kwargs)
+
+def _run(bridge_kwargs, model_kwargs, accesses):
+    dut   = _DUT(**bridge_kwargs)
+    model = AvalonMMMemoryModel(dut.avl, **model_kwargs)
+    ref   = {}
+
+    def generator():
+        for adr, datas in accesses:
+            if datas is None:
+                length = random.randint(1, 12)
+                got    = yield from wishbone_burst_read(dut.wb, adr, length)
+                assert got == [ref.get(adr + i, 0) for i in range(length)]
+            else:
+                yield from wishbone_burst_write(dut.wb, adr, datas)
+                for i, data in enumerate(datas):
+                    ref[adr + i] = data
+
+    run_simulation(dut, [generator(), model.generator()])
+    return model
+
+def _accesses(n, seed):
+    random.seed(seed)
+    accesses = []
+    for i in range(n):
+        adr = random.randrange(64)
+        if random.random() < 0.5:
+            accesses.append((adr, [random.getrandbits(32) for _ in range(random.randint(1, 12))]))
+        else:
+            accesses.append((adr, None))
+    return accesses
+
+# Tests --------------------------------------------------------------------------------------------
+
+def test_bridge_bursts():
+    _run({}, dict(read_latency=3), _accesses(60, 0))
+
+def test_bridge_waitrequest():
+    _run({"max_pending": 4}, dict(read_latency=1, waitrequest_rate=0.3), _accesses(60, 1))
+
+def test_bridge_no_bursts():
+    _run({"burst_size": 1}, dict(read_latency=2, bursts=False), _accesses(60, 2))
+
+def test_bridge_aborted_burst():
+    dut   = _DUT()
+    model = AvalonMMMemoryModel(dut.avl, read_latency=2)
+
+    def generator():
+        # Incrementing burst dropped by the master after 3 beats, without a CTI_BURST_END beat.
+        yield dut.wb.we.eq(1)
+        yield dut.wb.sel.eq(0xf)
+        yield dut.wb.bte.eq(0b00)
+        yield dut.wb.cti.eq(wishbone.CTI_BURST_INCREMENTING)
+        yield dut.wb.cyc.eq(1)
+        yield dut.wb.stb.eq(1)
+        for i in range(3):
+            yield dut.wb.adr.eq(0x10 + i)
+            yield dut.wb.dat_w.eq(0x100 + i)
+            yield
+            while not (yield dut.wb.ack):
+                yield
+        yield dut.wb.cyc.eq(0)
+        yield dut.wb.stb.eq(0)
+        yield
+        # The next burst must start with a fresh burstcount.
+        yield from wishbone_burst_write(dut.wb, 0x20, [0x200 + i for i in range(4)])
+        got = yield from wishbone_burst_read(dut.wb, 0x10, 3)
+        assert got == [0x100 + i for i in range(3)]
+        got = yield from wishbone_burst_read(dut.wb, 0x20, 4)
+        assert got == [0x200 + i for i in range(4)]
+
+    run_simulation(dut, [generator(), model.generator()])
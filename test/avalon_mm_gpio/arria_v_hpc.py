@@ -14,7 +14,9 @@ from litex_boards.platforms import hpc_store_arriav_v31 as arriav_board
 
 from litex.soc.cores.clock import ArriaVPLL
 from litex.soc.interconnect import avalon
+from litex.soc.interconnect import stream
 from litex.soc.interconnect import wishbone
+from litex.soc.integration.soc import SoCRegion
 from litex.soc.integration.soc_core import *
 from litex.soc.integration.builder import *
 from litex.soc.cores.led import LedChaser
@@ -23,16 +25,26 @@ from litex.config import DEFAULT_IP_PREFIX
 
 from liteeth.phy.gmii import LiteEthPHYGMII
 
+from litedram.frontend.wishbone import LiteDRAMWishbone2Native
+
 from litescope.core import LiteScopeAnalyzer
 
 from pcie_mitm.ip.gpio import AvalonMMGPIO
+from pcie_mitm.ip.bridge import Wishbone2AvalonMM
+from pcie_mitm.ip.trigger import SequencedAnalyzer
+from pcie_mitm.ip.dram import DRAMBenchmark, MT8JSF12864HZ, UniPHYDDR3
+from pcie_mitm.ip.udp import UDPCaptureStreamer, udp_capture_decimation
+from pcie_mitm.build.generate import BuildProfiler, generate, generation_key, phase, run_toolchain
+from pcie_mitm.build.quartus import QuartusRunner, exploration_presets, format_results, trials
 
 # CRG ----------------------------------------------------------------------------------------------
 
 class _CRG(Module):
-    def __init__(self, platform, sys_clk_freq):
+    def __init__(self, platform, sys_clk_freq, with_dram_ref=False):
         self.rst = Signal()
         self.clock_domains.cd_sys    = ClockDomain()
+        if with_dram_ref:
+            self.clock_domains.cd_dram_ref = ClockDomain()
 
         # # #
 
@@ -44,13 +56,17 @@ class _CRG(Module):
         self.comb += pll.reset.eq(self.rst)
         pll.register_clkin(clk50, 50e6)
         pll.create_clkout(self.cd_sys,  sys_clk_freq)
+        if with_dram_ref:
+            # UniPHY PLL reference.
+            pll.create_clkout(self.cd_dram_ref, 125e6)
 
 # BaseSoC ------------------------------------------------------------------------------------------
 
 class BaseSoC(SoCCore):
     def __init__(self, sys_clk_freq=int(150e6), with_led_chaser=True, with_jtagbone=False,
-                 with_etherbone=False, eth_ip=DEFAULT_IP_PREFIX + "50",
-                 **kwargs):
+                 with_etherbone=False, eth_ip=DEFAULT_IP_PREFIX + "50", trigger_stages=4,
+                 with_ddr3=False, with_udp_capture=False,
+                 udp_capture_ip=DEFAULT_IP_PREFIX + "100", **kwargs):
         self.platform = platform = arriav_board.Platform()
 
         # SoCCore ----------------------------------------------------------------------------------
@@ -59,7 +75,28 @@ class BaseSoC(SoCCore):
             **kwargs)
 
         # CRG --------------------------------------------------------------------------------------
-        self.submodules.crg = self.crg = _CRG(platform, sys_clk_freq)
+        self.submodules.crg = self.crg = _CRG(platform, sys_clk_freq, with_dram_ref=with_ddr3)
+
+        # DDR3 -------------------------------------------------------------------------------------
+        if with_ddr3:
+            self.submodules.ddr3 = UniPHYDDR3(platform,
+                pads    = platform.request("ddram"),
+                ref_clk = ClockSignal("dram_ref"),
+                module  = MT8JSF12864HZ(sys_clk_freq, "1:4"))
+            self.platform.toolchain.additional_sdc_commands += [
+                'set_false_path -from [get_clocks {sys_clk}] -to [get_clocks {*afi_clk*}]',
+                'set_false_path -from [get_clocks {*afi_clk*}] -to [get_clocks {sys_clk}]',
+            ]
+            # main_ram: Wishbone -> LiteDRAM native port of the UniPHY crossbar.
+            port     = self.ddr3.crossbar.get_port()
+            wb_sdram = wishbone.Interface(data_width=self.bus.data_width)
+            wb_port  = wishbone.Interface(data_width=port.data_width)
+            self.bus.add_slave("main_ram", wb_sdram, SoCRegion(origin=self.mem_map["main_ram"], size=self.ddr3.size))
+            self.submodules += wishbone.Converter(wb_sdram, wb_port)
+            self.submodules.wishbone_bridge = LiteDRAMWishbone2Native(wb_port, port,
+                base_address = self.bus.regions["main_ram"].origin)
+            # See pcie_mitm.host.dram.DRAMBenchmarkDriver.
+            self.submodules.dram_bench = DRAMBenchmark(self.ddr3.crossbar)
 
         # Ethernet ---------------------------------------------------------------------------------
         if with_etherbone:
@@ -97,33 +134,66 @@ class BaseSoC(SoCCore):
                 pads         = led_pads,
                 sys_clk_freq = sys_clk_freq)
         else:
-            self.submodules.led_gpio = AvalonMMGPIO(self.platform)
+            self.submodules.led_gpio = AvalonMMGPIO(width=8)
             for src, sink in zip(self.led_gpio.out_port, led_pads):
                 self.comb += sink.eq(src)
             # for i in range(8):
             #     self.comb += led_pads[i].eq(self.led_gpio.out_port[i])
-            self.led_gpio_wb = wishbone.Interface(adr_width=2)
-            self.add_memory_region("gpio", 0x9000_0000, length=4*4, type="io")
+            self.led_gpio_wb = wishbone.Interface(adr_width=4)
+            self.add_memory_region("gpio", 0x9000_0000, length=16*4, type="io")
             self.add_wb_slave(0x9000_0000, self.led_gpio_wb)
-            self.submodules.led_gpi_avmm2wb = avalon.AvalonMM2Wishbone(self.led_gpio.avmm, self.led_gpio_wb)
+            self.submodules.led_gpi_avmm2wb = Wishbone2AvalonMM(self.led_gpio_wb, self.led_gpio.avmm,
+                read_latency = 0)
 
         if True:
-            analyzer_signals = set([
-                *get_signals(led_pads),
-                *get_signals(self.led_gpio),
-                *get_signals(self.led_gpio_wb),
-                # *get_signals(self.led_gpi_avmm2wb),
-            ])
+            with phase("analyzer signals"):
+                analyzer_signals = set([
+                    *get_signals(led_pads),
+                    *get_signals(self.led_gpio),
+                    *get_signals(self.led_gpio_wb),
+                    # *get_signals(self.led_gpi_avmm2wb),
+                ])
             analyzer_signals_denylist = set([
             ])
             analyzer_signals -= analyzer_signals_denylist
             analyzer_signals = list(analyzer_signals)
-            self.submodules.analyzer = LiteScopeAnalyzer(analyzer_signals,
-                depth        = 64*1,
-                register     = True,
-                clock_domain = "sys",
-                samplerate   = sys_clk_freq,
-                csr_csv      = "analyzer.csv")
+            if trigger_stages:
+                # Multi-stage trigger, see pcie_mitm.host.trigger.TriggerSequencerDriver.
+                self.submodules.analyzer = SequencedAnalyzer(analyzer_signals,
+                    depth          = 64*1,
+                    register       = True,
+                    clock_domain   = "sys",
+                    trigger_stages = trigger_stages,
+                    samplerate     = sys_clk_freq,
+                    csr_csv        = "analyzer.csv")
+            else:
+                self.submodules.analyzer = LiteScopeAnalyzer(analyzer_signals,
+                    depth        = 64*1,
+                    register     = True,
+                    clock_domain = "sys",
+                    samplerate   = sys_clk_freq,
+                    csr_csv      = "analyzer.csv")
+
+            # UDP capture streaming ---------------------------------------------------------------
+            if with_udp_capture:
+                # Samples are Cat(analyzer_signals), in the order of analyzer.csv, see
+                # pcie_mitm.host.udp for the receiver. The GMII link cannot take a sample per sys
+                # cycle: the streamer decimates them to its sustainable rate.
+                sample       = Cat(*analyzer_signals)
+                sample_width = max(8, 1 << (len(sample) - 1).bit_length())
+                samples      = stream.Endpoint([("data", sample_width)])
+                self.comb += [
+                    samples.valid.eq(1),
+                    samples.data.eq(sample),
+                ]
+                udp_port = self.ethcore_etherbone.udp.crossbar.get_port(4321, dw=8)
+                self.submodules.udp_capture = UDPCaptureStreamer(udp_port,
+                    data_width    = len(samples.data),
+                    payload_bytes = 8192,
+                    cd            = "eth_rx",
+                    ip_address    = udp_capture_ip,
+                    decimation    = udp_capture_decimation(sys_clk_freq, len(samples.data)))
+                self.comb += samples.connect(self.udp_capture.sink)
 
 # Build --------------------------------------------------------------------------------------------
 
@@ -143,6 +213,17 @@ def main():
     parser.add_argument("--with-etherbone",     action="store_true", help="Enable Etherbone support.")
     parser.add_argument("--eth-ip",              default=DEFAULT_IP_PREFIX + "50", type=str, help="Ethernet/Etherbone IP address.")
     parser.add_argument("--with-jtagbone",       action="store_true", help="Enable JTAGbone support.")
+    parser.add_argument("--with-udp-capture",    action="store_true", help="Stream the analyzer signals over UDP (port 4321) on the Etherbone Ethernet core, decimated to the link rate.")
+    parser.add_argument("--udp-capture-ip",      default=DEFAULT_IP_PREFIX + "100", type=str, help="Destination IP address of the UDP capture stream.")
+    parser.add_argument("--trigger-stages",      default=4,           type=int, help="Stages of the analyzer trigger sequencer (0: LiteScope value/mask trigger).")
+    parser.add_argument("--with-ddr3",           action="store_true", help="Enable the DDR3 SODIMM (main_ram and DRAM benchmark).")
+    parser.add_argument("--no-gen-cache",        action="store_true", help="Always elaborate and regenerate the SoC.")
+    parser.add_argument("--profile-build",       action="store_true", help="Add a cProfile of each generation phase to the build report.")
+    parser.add_argument("--seeds",               default=None,        help="Fitter seed sweep with --build: number of seeds or comma-separated seeds.")
+    parser.add_argument("--dse",                 default="default",   help="Comma-separated exploration presets of the sweep ({}).".format(", ".join(exploration_presets)))
+    parser.add_argument("--jobs",                default=None,        type=int, help="Parallel Quartus compiles of the sweep (default: cores).")
+    parser.add_argument("--rapid-recompile",     action="store_true", help="Reuse the placement and routing of the previous compile of each trial.")
+    parser.add_argument("--quartus-bin",         default=None,        help="Directory of the Quartus tools of the sweep (e.g. a stub toolchain).")
     builder_args(parser)
     soc_core_args(parser)
 
@@ -157,20 +238,49 @@ def main():
 
 
     args = parser.parse_args()
+    if args.with_udp_capture and not args.with_etherbone:
+        parser.error("--with-udp-capture uses the Ethernet core of --with-etherbone")
+
+    def make_soc():
+        return BaseSoC(
+            sys_clk_freq             = int(float(args.sys_clk_freq)),
+            with_etherbone           = args.with_etherbone,
+            eth_ip                   = args.eth_ip,
+            with_jtagbone            = args.with_jtagbone,
+            trigger_stages           = args.trigger_stages,
+            with_ddr3                = args.with_ddr3,
+            with_udp_capture         = args.with_udp_capture,
+            udp_capture_ip           = args.udp_capture_ip,
+            **soc_core_argdict(args)
+        )
+    # Unchanged configurations skip the elaboration and go straight to Quartus.
+    run_args = ["build", "load", "no_gen_cache", "profile_build", "seeds", "dse", "jobs", "rapid_recompile", "quartus_bin"]
+    key = generation_key({k: v for k, v in vars(args).items() if k not in run_args}, sources=[__file__])
+    with BuildProfiler(detail=args.profile_build) as profiler:
+        gen = generate(make_soc, lambda soc: Builder(soc, **builder_argdict(args)), key,
+            outputs = ["analyzer.csv"],
+            cache   = not args.no_gen_cache)
+        sweep = args.seeds is not None or args.dse != "default"
+        if args.build and not sweep:
+            run_toolchain(gen.gateware_dir, gen.build_name)
+    print(profiler.report())
 
-    soc = BaseSoC(
-        sys_clk_freq             = int(float(args.sys_clk_freq)),
-        with_etherbone           = args.with_etherbone,
-        eth_ip                   = args.eth_ip,
-        with_jtagbone            = args.with_jtagbone,
-        **soc_core_argdict(args)
-    )
-    builder = Builder(soc, **builder_argdict(args))
-    builder.build(run=args.build)
+    # Parallel seeds/settings trials, the best Fmax result is copied to the gateware directory.
+    if args.build and sweep:
+        seeds = args.seeds or "1"
+        seeds = [int(s) for s in seeds.split(",")] if "," in seeds else list(range(1, int(seeds) + 1))
+        runner = QuartusRunner(gen.gateware_dir, gen.build_name,
+            jobs            = args.jobs,
+            rapid_recompile = args.rapid_recompile,
+            quartus_bin     = args.quartus_bin)
+        results, best = runner.sweep(trials(seeds, args.dse.split(",")))
+        print(format_results(results))
+        if best is None:
+            raise OSError("Every Quartus trial failed, see trials/*/build.log.")
 
     if args.load:
-        prog = soc.platform.create_programmer()
-        prog.load_bitstream(os.path.join(builder.gateware_dir, soc.build_name + ".sof"))
+        prog = arriav_board.Platform().create_programmer()
+        prog.load_bitstream(os.path.join(gen.gateware_dir, gen.build_name + ".sof"))
 
 if __name__ == "__main__":
     main()
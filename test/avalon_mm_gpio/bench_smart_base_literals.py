@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import argparse
+import time
+
+import numpy as np
+
+from pcie_mitm.host.literals import (_is_pretty_base_hex, is_pretty_base_hex, is_pretty_base_hex_array,
+    smart_literals)
+
+
+# Synthetic Values ---------------------------------------------------------------------------------
+
+def capture_values(n, seed=0):
+    """Address/length/data mix of a decoded capture: a few BARs, small lengths, random data."""
+    rng   = np.random.default_rng(seed)
+    bars  = np.array([0xf000_0000, 0xf100_0000, 0xfe00_0000, 0x1_0000_0000], np.uint64)
+    addrs = rng.choice(bars, n//3) + (rng.integers(0, 256, n//3, dtype=np.uint64) << np.uint64(4))
+    lens  = rng.integers(1, 129, n//3, dtype=np.uint64)
+    datas = rng.integers(0, 2**32, n - 2*(n//3), dtype=np.uint64)
+    values = np.concatenate([addrs, lens, datas])
+    rng.shuffle(values)
+    return values
+
+# Main ---------------------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Smart-base literal formatter benchmark")
+    parser.add_argument("--values",        default=1000000, help="Values formatted.")
+    parser.add_argument("--scalar-values", default=100000,  help="Values used for the (slow) uncached scalar version.")
+    args = parser.parse_args()
+
+    values = capture_values(int(args.values))
+    py     = values.tolist()
+    scalar = py[:int(args.scalar_values)]
+
+    def bench(name, fn, n):
+        start   = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        print(f"{name:<28} {n/elapsed/1e6:8.3f} Mvalues/s")
+
+    bench("scalar",            lambda: [_is_pretty_base_hex(v) for v in scalar], len(scalar))
+    is_pretty_base_hex.cache_clear()
+    bench("scalar + LRU cache", lambda: [is_pretty_base_hex(v) for v in py], len(py))
+    bench("numpy batch",        lambda: is_pretty_base_hex_array(values), len(py))
+    bench("numpy batch strings", lambda: smart_literals(values), len(py))
+
+if __name__ == "__main__":
+    main()
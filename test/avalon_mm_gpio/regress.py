@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+
+from litex.build.sim.config import SimConfig
+from litex.soc.integration.soc_core import *
+from litex.soc.integration.builder import *
+
+from pcie_mitm.sim.regression import print_report, run_regression
+from pcie_mitm.sim.verilator import build_sim
+
+from sim import SimSoC
+
+
+# Main ---------------------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel Verilator regression of the Avalon-MM GPIO SoC")
+    parser.add_argument("--sys-clk-freq", default=200e6,         help="System clock frequency.")
+    parser.add_argument("--stimulus",     default=os.path.join(os.path.dirname(__file__), "stimulus_fuzz.py"),
+                                                                 help="Stimulus file (async def main(bus, csrs, seed)).")
+    parser.add_argument("--seeds",        default=1000,          help="Number of seeds.")
+    parser.add_argument("--first-seed",   default=0,             help="First seed.")
+    parser.add_argument("--jobs",         default=os.cpu_count(), help="Parallel model instances.")
+    parser.add_argument("--timeout",      default=60,            help="Timeout per run (s).")
+    parser.add_argument("--coverage",     action="store_true",   help="Build with Verilator coverage and merge it.")
+    parser.add_argument("--no-cache",     action="store_true",   help="Always recompile the Verilator model.")
+    parser.add_argument("--output-dir",   default="regression",  help="Per-seed run directories and report.json.")
+    builder_args(parser)
+    soc_core_args(parser)
+    args = parser.parse_args()
+
+    # CPU-less SoC driven over UARTbone/TCP: one port per instance, no shared TAP interface.
+    sim_config = SimConfig()
+    sim_config.add_clocker("sys_clk", freq_hz=float(args.sys_clk_freq))
+    sim_config.add_module("serial2tcp", "serial", args={"port": 0})
+
+    soc_kwargs = soc_core_argdict(args)
+    soc_kwargs["cpu_type"]            = None
+    soc_kwargs["with_uart"]           = False
+    soc_kwargs["integrated_rom_size"] = 0
+    soc = SimSoC(sys_clk_freq=int(float(args.sys_clk_freq)), stimulus_bus="uartbone", **soc_kwargs)
+
+    builder_kwargs = builder_argdict(args)
+    builder_kwargs["csr_csv"] = "csr.csv"
+    builder = Builder(soc, **builder_kwargs)
+    gateware_dir, rebuilt = build_sim(builder, sim_config,
+        cache    = not args.no_cache,
+        coverage = args.coverage)
+    print("Verilator model " + ("rebuilt" if rebuilt else "reused"))
+
+    first  = int(args.first_seed)
+    report = run_regression(gateware_dir,
+        sim_config = json.loads(sim_config.get_json()),
+        stimulus   = args.stimulus,
+        seeds      = range(first, first + int(args.seeds)),
+        jobs       = int(args.jobs),
+        run_dir    = args.output_dir,
+        timeout    = float(args.timeout))
+    print_report(report)
+    sys.exit(1 if report["failed"] else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
 import argparse
+import asyncio
+import os
 
 from migen import *
 
@@ -11,16 +13,32 @@ from litex.build.sim import SimPlatform
 from litex.build.sim.config import SimConfig
 from litex.build.sim.verilator import verilator_build_args, verilator_build_argdict
 
+from litex.soc.cores.uart import RS232PHYModel, UARTBone
 from litex.soc.interconnect import avalon
+from litex.soc.interconnect import stream
 from litex.soc.interconnect import wishbone
 from litex.soc.integration.soc_core import *
 from litex.soc.integration.builder import *
 
 from liteeth.phy.model import LiteEthPHYModel
 
+from litedram import modules as litedram_modules
+from litedram.phy.model import sdram_module_nphases, get_sdram_phy_settings
+from litedram.phy.model import SDRAMPHYModel
+
 from litescope import LiteScopeAnalyzer
 
 from pcie_mitm.ip.gpio import AvalonMMGPIO
+from pcie_mitm.ip.bridge import Wishbone2AvalonMM
+from pcie_mitm.ip.capture import DRAMCapture
+from pcie_mitm.ip.dram import DRAMBenchmark
+from pcie_mitm.ip import dram as dram_modules
+from pcie_mitm.ip.udp import UDPCaptureStreamer, udp_capture_decimation
+from pcie_mitm.ip.trigger import SequencedAnalyzer
+from pcie_mitm.host.etherbone import UARTboneTransport, UDPTransport
+from pcie_mitm.sim.regression import load_stimulus, stimulus_session
+from pcie_mitm.build.generate import BuildProfiler, generate, generation_key, phase
+from pcie_mitm.sim.verilator import compile_sim, run_sim, start_sim
 
 
 # IOs ----------------------------------------------------------------------------------------------
@@ -72,7 +90,10 @@ class Platform(SimPlatform):
 # Bench SoC ----------------------------------------------------------------------------------------
 
 class SimSoC(SoCCore):
-    def __init__(self, sys_clk_freq = None, trace=False, **kwargs):
+    def __init__(self, sys_clk_freq = None, trace=False, with_dram_capture=False,
+                 sdram_module="MT48LC16M16", sdram_data_width=32, capture_depth=1*1024*1024,
+                 capture_compress=False, stimulus_bus="etherbone", with_udp_capture=False, trigger_stages=4, with_dram_bench=False,
+                 **kwargs):
         platform     = Platform()
         sys_clk_freq = int(sys_clk_freq)
 
@@ -90,9 +111,36 @@ class SimSoC(SoCCore):
         # Trace ------------------------------------------------------------------------------------
         self.platform.add_debug(self, reset=0)
 
-        # Etherbone --------------------------------------------------------------------------------
-        self.submodules.ethphy = LiteEthPHYModel(self.platform.request("eth"))
-        self.add_etherbone(phy=self.ethphy, ip_address = "192.168.42.50", buffer_depth=16*4096-1)
+        # SDRAM ------------------------------------------------------------------------------------
+        if with_dram_capture or with_dram_bench:
+            # Module timings are computed for the clock of the PHY model.
+            sdram_clk_freq   = int(100e6)
+            sdram_module_cls = getattr(dram_modules, sdram_module, None) or getattr(litedram_modules, sdram_module)
+            sdram_rate       = "1:{}".format(sdram_module_nphases[sdram_module_cls.memtype])
+            sdram_module     = sdram_module_cls(sdram_clk_freq, sdram_rate)
+            self.submodules.sdrphy = SDRAMPHYModel(
+                module     = sdram_module,
+                data_width = sdram_data_width,
+                clk_freq   = sdram_clk_freq)
+            self.add_sdram("sdram",
+                phy           = self.sdrphy,
+                module        = sdram_module,
+                l2_cache_size = 0)
+
+        # DRAM Benchmark ---------------------------------------------------------------------------
+        if with_dram_bench:
+            # See pcie_mitm.host.dram.DRAMBenchmarkDriver.
+            self.submodules.dram_bench = DRAMBenchmark(self.sdram.crossbar)
+
+        # Etherbone / UARTbone ---------------------------------------------------------------------
+        if stimulus_bus == "etherbone":
+            self.submodules.ethphy = LiteEthPHYModel(self.platform.request("eth"))
+            self.add_etherbone(phy=self.ethphy, ip_address = "192.168.42.50", buffer_depth=16*4096-1)
+        else:
+            # UARTbone on the sim serial pads (serial2tcp), no TAP interface/root needed.
+            self.submodules.uartbone_phy = RS232PHYModel(self.platform.request("serial"))
+            self.submodules.uartbone     = UARTBone(phy=self.uartbone_phy, clk_freq=sys_clk_freq)
+            self.bus.add_master(name="uartbone", master=self.uartbone.wishbone)
 
         # Leds -------------------------------------------------------------------------------------
         led_pads = platform.request_all("user_led")
@@ -101,33 +149,84 @@ class SimSoC(SoCCore):
                 pads         = led_pads,
                 sys_clk_freq = sys_clk_freq)
         else:
-            self.submodules.led_gpio = AvalonMMGPIO(self.platform)
+            self.submodules.led_gpio = AvalonMMGPIO(width=8)
             for src, sink in zip(self.led_gpio.out_port, led_pads):
                 self.comb += sink.eq(src)
-            self.led_gpio_wb = wishbone.Interface(adr_width=2)
-            self.add_memory_region("gpio", 0x9000_0000, length=4*4, type="io")
+            self.led_gpio_wb = wishbone.Interface(adr_width=4)
+            self.add_memory_region("gpio", 0x9000_0000, length=16*4, type="io")
             self.add_wb_slave(0x9000_0000, self.led_gpio_wb)
-            self.submodules.led_gpio_avmm2wb = avalon.AvalonMM2Wishbone(self.led_gpio.avmm, self.led_gpio_wb)
+            self.submodules.led_gpio_avmm2wb = Wishbone2AvalonMM(self.led_gpio_wb, self.led_gpio.avmm,
+                read_latency = 0)
 
 
         if True:
-            analyzer_signals = set([
-                *get_signals(led_pads),
-                *get_signals(self.led_gpio),
-                *get_signals(self.led_gpio_wb),
-                *get_signals(self.led_gpio_avmm2wb),
-            ])
+            with phase("analyzer signals"):
+                analyzer_signals = set([
+                    *get_signals(led_pads),
+                    *get_signals(self.led_gpio),
+                    *get_signals(self.led_gpio_wb),
+                    *get_signals(self.led_gpio_avmm2wb),
+                ])
             analyzer_signals_denylist = set([
             ])
             analyzer_signals -= analyzer_signals_denylist
             analyzer_signals = list(analyzer_signals)
-            self.submodules.analyzer = LiteScopeAnalyzer(analyzer_signals,
-                depth        = 64*1,
-                register     = True,
-                clock_domain = "sys",
-                samplerate   = sys_clk_freq,
-                csr_csv      = "analyzer.csv")
-
+            if with_dram_capture:
+                # Ring buffer in the upper half of main_ram, the lower half is left to software.
+                sdram_size = self.bus.regions["main_ram"].size
+                self.submodules.capture = DRAMCapture(analyzer_signals,
+                    port       = self.sdram.crossbar.get_port(mode="write"),
+                    base       = sdram_size//2,
+                    depth      = min(capture_depth, sdram_size//2),
+                    samplerate = sys_clk_freq,
+                    compress   = capture_compress,
+                    csr_csv    = "capture.csv")
+            elif trigger_stages:
+                # Multi-stage trigger, see pcie_mitm.host.trigger.TriggerSequencerDriver.
+                self.submodules.analyzer = SequencedAnalyzer(analyzer_signals,
+                    depth          = 64*1,
+                    register       = True,
+                    clock_domain   = "sys",
+                    trigger_stages = trigger_stages,
+                    samplerate     = sys_clk_freq,
+                    csr_csv        = "analyzer.csv")
+            else:
+                self.submodules.analyzer = LiteScopeAnalyzer(analyzer_signals,
+                    depth        = 64*1,
+                    register     = True,
+                    clock_domain = "sys",
+                    samplerate   = sys_clk_freq,
+                    csr_csv      = "analyzer.csv")
+
+            # UDP capture streaming ---------------------------------------------------------------
+            if with_udp_capture:
+                # Samples are Cat(analyzer_signals), in the order of analyzer.csv (capture.csv). One
+                # is offered every cycle and the streamer keeps what the 1 Gb/s link carries.
+                sample       = Cat(*analyzer_signals)
+                sample_width = max(8, 1 << (len(sample) - 1).bit_length())
+                samples      = stream.Endpoint([("data", sample_width)])
+                self.comb += [
+                    samples.valid.eq(1),
+                    samples.data.eq(sample),
+                ]
+                udp_port = self.ethcore_etherbone.udp.crossbar.get_port(4321, dw=8)
+                self.submodules.udp_capture = UDPCaptureStreamer(udp_port,
+                    data_width    = len(samples.data),
+                    payload_bytes = 8192,
+                    cd            = "eth_rx",
+                    ip_address    = "192.168.42.100",
+                    decimation    = udp_capture_decimation(sys_clk_freq, len(samples.data)))
+                self.comb += samples.connect(self.udp_capture.sink)
+
+# Stimulus -----------------------------------------------------------------------------------------
+
+def run_stimulus(filename, args):
+    """Run `async def main(bus, csrs, seed)` of `filename` against the running simulation."""
+    if args.stimulus_bus == "uartbone":
+        transport = UARTboneTransport("localhost", int(args.uartbone_port))
+    else:
+        transport = UDPTransport("192.168.42.50", 1234)
+    asyncio.run(stimulus_session(load_stimulus(filename), transport, "csr.csv", seed=int(args.seed)))
 
 # Main ---------------------------------------------------------------------------------------------
 
@@ -135,15 +234,40 @@ def main():
     parser = argparse.ArgumentParser(description="LiteEth Bench Simulation")
     parser.add_argument("--sys-clk-freq",         default=200e6,           help="System clock frequency (default: 200MHz)")
     parser.add_argument("--debug-soc-gen",        action="store_true",     help="Don't run simulation")
+    parser.add_argument("--with-dram-capture",    action="store_true",     help="Capture into a SDRAM ring buffer instead of the LiteScope BRAM.")
+    parser.add_argument("--sdram-module",         default="MT48LC16M16",   help="Select SDRAM chip (litedram or pcie_mitm.ip.dram module, e.g. MT8JSF12864HZ).")
+    parser.add_argument("--with-dram-bench",      action="store_true",     help="Add the DRAM bandwidth/latency benchmark on the SDRAM.")
+    parser.add_argument("--sdram-data-width",     default=32,              help="Set SDRAM chip data width.")
+    parser.add_argument("--capture-depth",        default=1*1024*1024,     help="DRAM capture ring size in bytes.")
+    parser.add_argument("--capture-compress",     action="store_true",     help="Only store the cycles where the captured signals change.")
+    parser.add_argument("--trigger-stages",       default=4,               type=int, help="Stages of the analyzer trigger sequencer (0: LiteScope value/mask trigger).")
+    parser.add_argument("--with-udp-capture",     action="store_true",     help="Stream the analyzer signals to 192.168.42.100:4321 over UDP (etherbone bus), decimated to the link rate.")
+    parser.add_argument("--no-cpu",               action="store_true",     help="CPU-less SoC, driven from the host only.")
+    parser.add_argument("--stimulus-bus",         default="etherbone",     help="Host bus: etherbone (tap0, needs root) or uartbone (TCP, requires --no-cpu).")
+    parser.add_argument("--uartbone-port",        default=2430,            help="TCP port of the UARTbone bus.")
+    parser.add_argument("--stimulus",             default=None,            help="Python file with an `async def main(bus, csrs, seed)` run against the simulation.")
+    parser.add_argument("--seed",                 default=0,               help="Seed passed to the stimulus.")
+    parser.add_argument("--no-cache",             action="store_true",     help="Always regenerate the SoC and recompile the Verilator model.")
+    parser.add_argument("--profile-build",        action="store_true",     help="Add a cProfile of each generation phase to the build report.")
     builder_args(parser)
     soc_core_args(parser)
     verilator_build_args(parser)
     args = parser.parse_args()
+    if args.stimulus_bus not in ["etherbone", "uartbone"]:
+        parser.error("--stimulus-bus must be etherbone or uartbone")
+    if args.with_udp_capture and args.stimulus_bus != "etherbone":
+        parser.error("--with-udp-capture uses the Ethernet core of the etherbone bus")
+    if args.stimulus_bus == "uartbone" and not args.no_cpu:
+        parser.error("--stimulus-bus uartbone uses the serial port of the CPU, use --no-cpu")
 
     sim_config = SimConfig()
     sim_config.add_clocker("sys_clk", freq_hz=args.sys_clk_freq)
-    sim_config.add_module("serial2console", "serial")
-    sim_config.add_module("ethernet", "eth", args={"interface": "tap0", "ip": "192.168.42.100"})
+    if args.stimulus_bus == "uartbone":
+        sim_config.add_module("serial2tcp", "serial", args={"port": int(args.uartbone_port)})
+    else:
+        if not args.no_cpu:
+            sim_config.add_module("serial2console", "serial")
+        sim_config.add_module("ethernet", "eth", args={"interface": "tap0", "ip": "192.168.42.100"})
 
 
     soc_kwargs     = soc_core_argdict(args)
@@ -151,27 +275,65 @@ def main():
     verilator_build_kwargs = verilator_build_argdict(args)
 
     soc_kwargs['sys_clk_freq'] = int(args.sys_clk_freq)
-    soc_kwargs['uart_name'] = 'sim'
-    # soc_kwargs['cpu_type'] = 'None'
-    soc_kwargs['cpu_type'] = 'femtorv' # slow
-    soc_kwargs['cpu_variant'] = 'quark'
+    if args.no_cpu:
+        soc_kwargs['cpu_type'] = None
+        soc_kwargs['with_uart'] = False
+        soc_kwargs['integrated_rom_size'] = 0
+    else:
+        soc_kwargs['uart_name'] = 'sim'
+        soc_kwargs['cpu_type'] = 'femtorv' # slow
+        soc_kwargs['cpu_variant'] = 'quark'
     builder_kwargs['csr_csv'] = 'csr.csv'
 
-    soc     = SimSoC(
-        trace=args.trace,
-        trace_reset_on=int(float(args.trace_start)) > 0 or int(float(args.trace_end)) > 0,
-        **soc_kwargs)
-    if not args.debug_soc_gen:
-        builder = Builder(soc, **builder_kwargs)
-        for i in range(2):
-            build = (i == 0)
-            run   = (i == 1)
-            builder.build(
-                build=build,
-                run=run,
-                sim_config=sim_config,
-                **verilator_build_kwargs,
-            )
+    def make_soc():
+        return SimSoC(
+            trace=args.trace,
+            with_dram_capture=args.with_dram_capture,
+            sdram_module=args.sdram_module,
+            sdram_data_width=int(args.sdram_data_width),
+            capture_depth=int(float(args.capture_depth)),
+            capture_compress=args.capture_compress,
+            stimulus_bus=args.stimulus_bus,
+            with_udp_capture=args.with_udp_capture,
+            trigger_stages=args.trigger_stages,
+            with_dram_bench=args.with_dram_bench,
+            trace_reset_on=int(float(args.trace_start)) > 0 or int(float(args.trace_end)) > 0,
+            **soc_kwargs)
+    if args.debug_soc_gen:
+        make_soc()
+    else:
+        # Arguments only used at run time don't change the generated SoC.
+        run_args = ["stimulus", "seed", "no_cache", "profile_build", "debug_soc_gen"]
+        key = generation_key({
+            "args":       {k: v for k, v in vars(args).items() if k not in run_args},
+            "sim_config": sim_config.modules,
+        }, sources=[__file__])
+        with BuildProfiler(detail=args.profile_build) as profiler:
+            gen = generate(make_soc, lambda soc: Builder(soc, **builder_kwargs), key,
+                outputs    = ["analyzer.csv", "capture.csv"],
+                cache      = not args.no_cache,
+                build      = True,
+                build_name = "sim",
+                sim_config = sim_config,
+                **verilator_build_kwargs)
+            with phase("verilator"):
+                rebuilt = compile_sim(gen.gateware_dir, gen.sources, gen.build_name,
+                    cache   = not args.no_cache,
+                    options = verilator_build_kwargs)
+        print(profiler.report())
+        print("SoC " + ("restored from the generation cache" if gen.cached else "generated"))
+        print("Verilator model " + ("rebuilt" if rebuilt else "reused (gateware and sim config unchanged)"))
+        gateware_dir = gen.gateware_dir
+        as_root = sim_config.has_module("ethernet")
+        if args.stimulus is None:
+            run_sim(gateware_dir, as_root=as_root)
+        else:
+            sim = start_sim(gateware_dir, as_root=as_root)
+            try:
+                run_stimulus(os.path.abspath(args.stimulus), args)
+            finally:
+                sim.terminate()
+                sim.wait()
 
 if __name__ == "__main__":
     main()
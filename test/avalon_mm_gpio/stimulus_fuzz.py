@@ -0,0 +1,31 @@
+# Randomized stimulus for sim.py/regress.py: interleaved write/read bursts on the LED GPIO
+# (through the Wishbone -> Avalon-MM bridge), checked against a reference model of the PIO.
+
+import random
+
+from pcie_mitm.ip.gpio import gpio_registers
+
+gpio_base = 0x9000_0000
+
+async def main(bus, csrs, seed=0):
+    rng  = random.Random(seed)
+    data = 0
+    for i in range(rng.randrange(16, 64)):
+        # 8 outputs updated through out/set/clear/toggle, no inputs: the others read zero.
+        if rng.random() < 0.5:
+            reg   = rng.choice(["out", "set", "clear", "toggle"])
+            datas = [rng.randrange(2**32) for _ in range(rng.randrange(1, 4))]
+            bus.write(gpio_base + 4*gpio_registers[reg], datas)
+            # Burst words go to consecutive registers, the ones past toggle are read-only here.
+            for adr, value in enumerate(datas, start=gpio_registers[reg]):
+                data = {
+                    gpio_registers["out"]:    value,
+                    gpio_registers["set"]:    data | value,
+                    gpio_registers["clear"]:  data & ~value,
+                    gpio_registers["toggle"]: data ^ value,
+                }.get(adr, data) & 0xff
+        else:
+            reg   = rng.randrange(16)
+            value, = await bus.read(gpio_base + 4*reg)
+            expected = data if reg <= gpio_registers["toggle"] else 0
+            assert value == expected, f"seed {seed}: reg {reg} read 0x{value:08x}, expected 0x{expected:08x}"
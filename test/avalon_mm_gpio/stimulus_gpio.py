@@ -0,0 +1,19 @@
+# Example stimulus for sim.py --stimulus: walk a bit across the LED GPIO (through the
+# Wishbone -> Avalon-MM bridge) and check the data register reads back.
+
+from pcie_mitm.ip.gpio import gpio_registers
+
+gpio_base = 0x9000_0000
+
+async def main(bus, csrs, seed=0):
+    for i in range(8):
+        bus.write(gpio_base, 1 << i)
+        value, = await bus.read(gpio_base)
+        assert value & 0xff == 1 << i, f"GPIO readback 0x{value:02x}, expected 0x{1 << i:02x}"
+    # Single-write updates of a subset of the LEDs.
+    bus.write(gpio_base + 4*gpio_registers["set"],    0x0f)
+    bus.write(gpio_base + 4*gpio_registers["clear"],  0x81)
+    bus.write(gpio_base + 4*gpio_registers["toggle"], 0x3c)
+    value, = await bus.read(gpio_base)
+    assert value == 0x32, f"GPIO set/clear/toggle readback 0x{value:02x}, expected 0x32"
+    print("GPIO stimulus passed")
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+from migen import *
+
+from litex.soc.interconnect import wishbone
+
+from pcie_mitm.ip.bridge import Wishbone2AvalonMM
+from pcie_mitm.ip.gpio import AvalonMMGPIO, gpio_registers
+from pcie_mitm.sim.bus import wishbone_burst_read, wishbone_burst_write
+
+
+# Helpers ------------------------------------------------------------------------------------------
+
+class _DUT(Module):
+    def __init__(self, **kwargs):
+        # Same hookup as led_gpio in arria_v_hpc.py/sim.py.
+        self.submodules.gpio = AvalonMMGPIO(**kwargs)
+        self.wb = wishbone.Interface(adr_width=4)
+        self.submodules.bridge = Wishbone2AvalonMM(self.wb, self.gpio.avmm, read_latency=0)
+
+def write(dut, reg, value, sel=None):
+    yield from wishbone_burst_write(dut.wb, gpio_registers[reg], [value], sel)
+
+def read(dut, reg):
+    value, = yield from wishbone_burst_read(dut.wb, gpio_registers[reg], 1)
+    return value
+
+# Tests --------------------------------------------------------------------------------------------
+
+def test_gpio_outputs():
+    dut = _DUT(width=12)
+
+    def generator():
+        yield from write(dut, "out", 0xffff_0a5a)
+        assert (yield from read(dut, "out")) == 0xa5a
+        yield from write(dut, "set", 0x101)
+        yield from write(dut, "clear", 0x00a)
+        yield from write(dut, "toggle", 0xf00)
+        for i in range(4):
+            yield
+        assert (yield dut.gpio.out_port) == 0x451
+        for reg in ["out", "set", "clear", "toggle"]:
+            assert (yield from read(dut, reg)) == 0x451
+        # Byte enables: only the low byte.
+        yield from write(dut, "out", 0xfff, sel=0b0001)
+        assert (yield from read(dut, "out")) == 0x4ff
+        assert (yield from read(dut, "in")) == 0
+
+    run_simulation(dut, generator())
+
+def test_gpio_edges():
+    dut = _DUT(width=4, in_width=4)
+
+    def generator():
+        yield from write(dut, "rising", 0b0011)
+        yield from write(dut, "falling", 0b0110)
+        yield from write(dut, "irq_mask", 0b0100)
+        for value in [0b1111, 0b0000, 0b0001]:
+            yield dut.gpio.in_port.eq(value)
+            for i in range(4):
+                yield
+        assert (yield from read(dut, "in")) == 0b0001
+        assert (yield from read(dut, "edges")) == 0b0111
+        assert (yield dut.gpio.irq)
+        yield from write(dut, "edges", 0b0101)
+        for i in range(4):
+            yield
+        assert (yield from read(dut, "edges")) == 0b0010
+        assert not (yield dut.gpio.irq)
+
+    run_simulation(dut, generator())
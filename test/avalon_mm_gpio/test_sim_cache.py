@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+
+from pcie_mitm.sim.verilator import sim_build_hash
+
+
+# Tests --------------------------------------------------------------------------------------------
+
+def test_sim_build_hash(tmp_path):
+    gateware = tmp_path / "gateware"
+    gateware.mkdir()
+    verilog  = gateware / "sim.v"
+    config   = gateware / "sim_config.js"
+    extra    = tmp_path / "gpio.v"
+    extra.write_text("module gpio(); endmodule\n")
+    sources  = [(str(verilog), "verilog", "work"), (str(extra), "verilog", "work")]
+
+    def digest(**options):
+        return sim_build_hash(str(gateware), sources, options)
+
+    verilog.write_text("// Auto-Generated by LiteX on 2022-06-01 10:00:00\nmodule sim(); endmodule\n")
+    config.write_text('[{"module": "clocker"}]')
+    (gateware / "mem.init").write_text("00\n")
+    reference = digest(threads=1)
+
+    # Regenerating the same gateware, or new memory contents (read at run time), reuse the model.
+    verilog.write_text("// Auto-Generated by LiteX on 2022-06-02 11:00:00\nmodule sim(); endmodule\n")
+    (gateware / "mem.init").write_text("01\n")
+    assert digest(threads=1) == reference
+
+    # Gateware, extra sources, sim config or build options changes rebuild it.
+    assert digest(threads=2) != reference
+    config.write_text('[{"module": "serial2tcp"}]')
+    assert digest(threads=1) != reference
+    config.write_text('[{"module": "clocker"}]')
+    extra.write_text("module gpio(input a); endmodule\n")
+    assert digest(threads=1) != reference
+    extra.write_text("module gpio(); endmodule\n")
+    verilog.write_text("module sim(input a); endmodule\n")
+    assert digest(threads=1) != reference
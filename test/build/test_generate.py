@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+from types import SimpleNamespace
+
+from migen import *
+
+from litex.build.generic_platform import Pins
+from litex.build.altera import AlteraPlatform
+from litex.build.io import CRG
+
+from litex.soc.integration.soc_core import SoCCore
+from litex.soc.integration.builder import Builder
+
+from pcie_mitm.build.generate import BuildProfiler, GenerationCache, generate, generated_files, generation_key, phase
+
+
+# SoC ----------------------------------------------------------------------------------------------
+
+class _SoC(SoCCore):
+    def __init__(self):
+        platform = AlteraPlatform("5AGTFD3H3F35I3", [("sys_clk", 0, Pins(1))], toolchain="quartus")
+        SoCCore.__init__(self, platform, clk_freq=int(50e6), cpu_type=None, with_uart=False,
+            integrated_rom_size=0, integrated_sram_size=0, with_timer=False)
+        self.submodules.crg = CRG(platform.request("sys_clk"))
+        with phase("leds"):
+            self.led = Signal()
+            self.sync += self.led.eq(~self.led)
+
+# Tests --------------------------------------------------------------------------------------------
+
+def test_generation_key(tmp_path):
+    script = tmp_path / "soc.py"
+    script.write_text("# v1\n")
+    reference = generation_key({"sys_clk_freq": 150e6}, sources=[str(script)], packages=["migen"])
+    assert generation_key({"sys_clk_freq": 150e6}, sources=[str(script)], packages=["migen"]) == reference
+    assert generation_key({"sys_clk_freq": 100e6}, sources=[str(script)], packages=["migen"]) != reference
+    assert generation_key({"sys_clk_freq": 150e6}, sources=[str(script)], packages=["litex"]) != reference
+    script.write_text("# v2\n")
+    assert generation_key({"sys_clk_freq": 150e6}, sources=[str(script)], packages=["migen"]) != reference
+
+def test_generation_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = GenerationCache(max_entries=2)
+    (tmp_path / "top.v").write_text("module top(); endmodule\n")
+    cache.store("a", ["top.v"], {"build_name": "top"})
+    (tmp_path / "top.v").write_text("module other(); endmodule\n")
+    assert cache.restore("a") == {"build_name": "top"}
+    assert (tmp_path / "top.v").read_text() == "module top(); endmodule\n"
+    assert cache.restore("b") is None
+
+    # Only the most recent entries are kept.
+    cache.store("b", ["top.v"], {})
+    cache.store("c", ["top.v"], {})
+    assert cache.restore("c") == {}
+    assert sorted(p.name for p in (tmp_path / "build" / "gen_cache").iterdir()) == ["b", "c"]
+
+def test_generation_cache_sim(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache    = GenerationCache()
+    gateware = tmp_path / "build" / "sim" / "gateware"
+    (gateware / "obj_dir").mkdir(parents=True)
+    builder  = SimpleNamespace(gateware_dir=str(gateware.relative_to(tmp_path)),
+        generated_dir="missing", csr_csv=None, csr_json=None, csr_svd=None)
+
+    # Files of the Verilator flow (build(run=False)), the pad bindings depend on the configuration.
+    def write(nleds):
+        files = {
+            "sim.v":         f"module sim(output [{nleds - 1}:0] user_led); endmodule\n",
+            "sim_header.h":  f"struct pad_s user_led[] = {{ {{ \"user_led\", {nleds} }} }};\n",
+            "sim_init.cpp":  f"void litex_sim_init(void **out) {{ /* {nleds} leds */ }}\n",
+            "variables.mak": "SRC_DIR = /litex/build/sim/core\n",
+            "sim_config.js": '[{"module": "clocker"}]',
+            "build_sim.sh":  "make -C . -f Makefile\n",
+        }
+        for name, contents in files.items():
+            (gateware / name).write_text(contents)
+        (gateware / "obj_dir" / "Vsim").write_text("model")
+        return files
+
+    one = write(1)
+    cache.store("one", generated_files(builder), {})
+    assert sorted(generated_files(builder)) == sorted(str(gateware.relative_to(tmp_path) / f) for f in one)
+    two = write(2)
+    cache.store("two", generated_files(builder), {})
+
+    # Switching configuration restores all of its model files, on a clean tree too.
+    for key, files in [("one", one), ("two", two), ("one", one)]:
+        assert cache.restore(key) == {}
+        assert {f: (gateware / f).read_text() for f in files} == files
+    for f in one:
+        (gateware / f).unlink()
+    assert cache.restore("two") == {}
+    assert {f: (gateware / f).read_text() for f in two} == two
+
+def test_generate(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    key = generation_key({"test": 1}, packages=[])
+    with BuildProfiler() as profiler:
+        gen = generate(_SoC, lambda soc: Builder(soc, csr_csv="csr.csv"), key)
+    assert not gen.cached and gen.builder is not None
+    phases = [(depth, name) for depth, name, _, _ in profiler.phases]
+    for expected in [(0, "elaborate"), (1, "leds"), (0, "generate"), (1, "finalize"), (1, "verilog")]:
+        assert expected in phases
+    assert "Total" in profiler.report()
+
+    # Deleted outputs are restored without elaborating the SoC again.
+    verilog = tmp_path / "build" / "platform" / "gateware" / "platform.v"
+    contents = verilog.read_text()
+    verilog.unlink()
+    (tmp_path / "csr.csv").unlink()
+    with BuildProfiler() as profiler:
+        gen = generate(_SoC, lambda soc: Builder(soc, csr_csv="csr.csv"), key)
+    assert gen.cached and gen.builder is None
+    assert gen.gateware_dir == str(verilog.parent) and gen.build_name == "platform"
+    assert verilog.read_text() == contents and (tmp_path / "csr.csv").exists()
+    assert [name for _, name, _, _ in profiler.phases] == ["restore cache"]
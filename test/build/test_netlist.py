@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import json
+import stat
+import sys
+
+from migen import *
+
+from litex.soc.interconnect import stream
+from litex.soc.interconnect.csr import AutoCSR, CSRStatus, CSRStorage
+
+from pcie_mitm.build.netlist import (NetlistReport, cell_resources, compare_baseline, convert_module,
+    format_reports, module_report, parse_ip, parse_ltp, parse_stat_json, save_baseline, load_baseline)
+
+
+# Design -------------------------------------------------------------------------------------------
+
+class _Counter(Module, AutoCSR):
+    def __init__(self):
+        self.sink    = sink = stream.Endpoint([("data", 8)])
+        self._offset = CSRStorage(8)
+        self._total  = CSRStatus(16)
+
+        # # #
+
+        scratch = Signal(8, name="scratch")
+        self.comb += [sink.ready.eq(1), scratch.eq(sink.data + self._offset.storage)]
+        self.sync += If(sink.valid, self._total.status.eq(self._total.status + scratch))
+
+# Stub yosys: writes the stat/ltp outputs the script tees, one $lut per byte of Verilog read.
+_stub_yosys = """#!{python}
+import json, re, sys
+script = open(sys.argv[-1]).read()
+size   = sum(len(open(f).read()) for f in re.findall(r"read_verilog -sv (\\S+)", script))
+top    = re.search(r"-top (\\S+)", script).group(1)
+stat   = re.search(r"tee -q -o (\\S+) stat -json", script).group(1)
+ltp    = re.search(r"tee -q -o (\\S+) ltp -noff", script).group(1)
+json.dump({{"modules": {{"\\\\" + top: {{"num_cells_by_type": {{"$lut": size, "$_DFF_P_": 16}}}}}}}}, open(stat, "w"))
+open(ltp, "w").write("Longest topological path in %s (length=7):\\n" % top)
+"""
+
+# Tests --------------------------------------------------------------------------------------------
+
+def test_convert_module():
+    v = convert_module(_Counter(), "counter")
+    header = v[v.index("module counter"):v.index(");")]
+    for port in ["input [7:0] sink_payload_data", "input [7:0] storage", "output reg [15:0] status",
+                 "output sink_ready"]:
+        assert port in " ".join(header.split())
+    assert "scratch" not in header and "scratch" in v
+
+def test_reports():
+    cells = parse_stat_json(json.dumps({"modules": {"\\top": {"num_cells_by_type": {
+        "MISTRAL_ALUT6": 10, "MISTRAL_ALUT_ARITH": 4, "MISTRAL_FF": 20, "MISTRAL_M10K": 2,
+        "MISTRAL_MLAB": 1, "MISTRAL_MUL27X27": 1, "$scopeinfo": 3}}}}), "top")
+    assert cell_resources(cells) == {"LUT": 14, "FF": 20, "BRAM": 2, "LUTRAM": 1, "DSP": 1, "other": 3}
+    assert parse_ltp("Longest topological path in top (length=12):\n") == 12
+    assert parse_ip("rewriter:nrules=16,key_dws=5") == ("rewriter_nrules16_key_dws5", "rewriter", {"nrules": 16, "key_dws": 5})
+    assert parse_ip("capture:compress=True") == ("capture_compressTrue", "capture", {"compress": True})
+
+def test_baseline(tmp_path):
+    def report(name, lut, depth):
+        return NetlistReport(name, {}, dict(cell_resources({}), LUT=lut), depth, 0.0)
+    filename = str(tmp_path / "baseline.json")
+    save_baseline([report("rewriter", 1000, 10), report("perf", 500, 8)], filename)
+    baseline = load_baseline(filename)
+    reports  = [report("rewriter", 1040, 10), report("perf", 500, 9), report("new", 10, 1)]
+    assert [(r.name, r.metric, r.baseline, r.value) for r in compare_baseline(reports, baseline)] == [
+        ("rewriter", "LUT", 1000, 1040), ("perf", "depth", 8, 9)]
+    assert [r.name for r in compare_baseline(reports, baseline, tolerance=0.05)] == ["perf"]
+    assert "1040 (+40)" in format_reports(reports, baseline)
+
+def test_module_report(tmp_path):
+    yosys = tmp_path / "yosys"
+    yosys.write_text(_stub_yosys.format(python=sys.executable))
+    yosys.chmod(yosys.stat().st_mode | stat.S_IXUSR)
+    r = module_report(_Counter(), "counter", yosys=str(yosys))
+    assert r.name == "counter" and r.depth == 7
+    assert r.resources["LUT"] == len(convert_module(_Counter(), "counter")) and r.resources["FF"] == 16
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+from pcie_mitm.build.quartus import (QuartusRunner, format_results, parse_fmax, parse_sta_summary,
+    stub_toolchain, trials)
+
+
+# Project ------------------------------------------------------------------------------------------
+
+def make_project(gateware):
+    gateware.mkdir(parents=True)
+    (gateware / "top.v").write_text("module top(); endmodule\n")
+    (gateware / "top.sdc").write_text("create_clock -name sys_clk -period 6.667 [get_ports {clk50}]\n")
+    (gateware / "top.qsf").write_text("set_global_assignment -name DEVICE 5AGTFD3H3F35I3\n")
+    (gateware / "build_top.sh").write_text(
+        "set -e\n"
+        "quartus_map --read_settings_files=on  --write_settings_files=off top -c top\n"
+        "quartus_fit --read_settings_files=off --write_settings_files=off top -c top\n"
+        "quartus_asm --read_settings_files=off --write_settings_files=off top -c top\n"
+        "quartus_sta top -c top\n")
+
+# Tests --------------------------------------------------------------------------------------------
+
+def test_parse_reports():
+    summary = (
+        "Type  : Slow 1100mV 85C Model Setup 'sys_clk'\nSlack : -0.125\nTNS   : -3.500\n\n"
+        "Type  : Slow 1100mV 85C Model Hold 'sys_clk'\nSlack : 0.201\nTNS   : 0.000\n")
+    assert [(s.slack, s.tns) for s in parse_sta_summary(summary)] == [(-0.125, -3.5), (0.201, 0.0)]
+    rpt = (
+        "; Slow 1100mV 85C Model Fmax Summary ;\n; 147.5 MHz ; 147.5 MHz ; sys_clk ;      ;\n"
+        "; Slow 1100mV 0C Model Fmax Summary ;\n; 152.1 MHz ; 152.1 MHz ; sys_clk ;      ;\n"
+        "; 480.3 MHz ; 250.0 MHz ; eth_rx_clk ; limit due to minimum period restriction ;\n")
+    assert parse_fmax(rpt) == {"sys_clk": 147.5, "eth_rx_clk": 250.0}
+
+def test_seed_sweep(tmp_path, monkeypatch):
+    gateware = tmp_path / "gateware"
+    make_project(gateware)
+    runner = QuartusRunner(str(gateware), "top", jobs=3, rapid_recompile=True,
+        quartus_bin=stub_toolchain(str(tmp_path / "bin")))
+    sweep  = trials(seeds=[1, 2, 3], presets=["default", "retiming"])
+    monkeypatch.setenv("QUARTUS_STUB_FAIL", "set_global_assignment -name SEED 2")
+    results, best = runner.sweep(sweep)
+    assert [r.trial.name for r in results] == [t.name for t in sweep]
+    assert [r.returncode != 0 for r in results] == [False, True, False]*2
+    assert best.fmax["sys_clk"] == max(r.fmax["sys_clk"] for r in results if r.returncode == 0)
+    assert (gateware / "top.sof").exists()
+    assert (gateware / "top.sta.rpt").read_text() == (tmp_path / best.directory / "top.sta.rpt").read_text()
+    assert "<- best" in format_results(results)
+
+    log = (gateware / "trials" / "retiming_seed3" / "quartus_stub.log").read_text().splitlines()
+    assert [l.split()[0] for l in log] == ["quartus_map", "quartus_fit", "quartus_asm", "quartus_sta"]
+    assert "--recompile=on" in log[0] and "--recompile=on" in log[1]
+    qsf = (gateware / "trials" / "retiming_seed3" / "top.qsf").read_text()
+    assert "SEED 3" in qsf and "PHYSICAL_SYNTHESIS_REGISTER_RETIMING ON" in qsf
+
+    # Unchanged trials are reused, the failed ones and the ones whose sources changed are run again.
+    monkeypatch.delenv("QUARTUS_STUB_FAIL")
+    results, _ = runner.sweep(sweep)
+    assert [r.reused for r in results] == [True, False, True]*2
+    (gateware / "top.v").write_text("module top(input a); endmodule\n")
+    results, _ = runner.sweep(sweep[:1])
+    assert not results[0].reused and results[0].returncode == 0
+    assert (gateware / "trials" / "default_seed1" / "top.v").read_text() == "module top(input a); endmodule\n"
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+from migen import *
+from migen.sim import passive
+
+from litedram.common import LiteDRAMNativePort
+
+from pcie_mitm.ip.capture import DRAMCapture
+
+
+# Helpers ------------------------------------------------------------------------------------------
+
+@passive
+def _dram_port_model(port, mem):
+    cmds = []
+    yield port.cmd.ready.eq(1)
+    yield port.wdata.ready.eq(1)
+    while True:
+        yield
+        if (yield port.cmd.valid):
+            cmds.append((yield port.cmd.addr))
+        if (yield port.wdata.valid):
+            mem[cmds.pop(0)] = (yield port.wdata.data)
+
+# Tests --------------------------------------------------------------------------------------------
+
+def test_dram_capture_window():
+    port    = LiteDRAMNativePort("write", 24, 32)
+    counter = Signal(8)
+    dut     = DRAMCapture([counter], port, base=0x100, depth=64)
+    dut.sync += counter.eq(counter + 1)
+    mem     = {}
+    result  = {}
+
+    def generator():
+        yield dut._pre_length.storage.eq(10)
+        yield dut._post_length.storage.eq(5)
+        yield dut._trigger_value.storage.eq(100)
+        yield dut._trigger_mask.storage.eq(0xff)
+        yield
+        yield dut._arm.re.eq(1)
+        yield
+        yield dut._arm.re.eq(0)
+        for i in range(400):
+            yield
+            if (yield dut._status.fields.done):
+                break
+        result["trigger_index"] = (yield dut._trigger_index.status)
+        result["count"]         = (yield dut._count.status)
+
+    run_simulation(dut, [generator(), _dram_port_model(port, mem)])
+
+    samples = []
+    for w in range(dut.words):
+        v = mem.get(0x100//4 + w, 0)
+        samples += [(v >> (8*j)) & 0xff for j in range(dut.ratio)]
+    start  = (result["trigger_index"] - 10) % dut.samples
+    window = [samples[(start + k) % dut.samples] for k in range(16)]
+    assert window == list(range(90, 106))
+    assert result["count"] % dut.ratio == 0
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+from migen import *
+
+from pcie_mitm.host.dram import bandwidth_patterns
+from pcie_mitm.ip.dram import MT8JSF12864HZ
+from pcie_mitm.sim.dram import DRAMBenchModel, bist, latency, run_benchmark
+
+
+# Helpers ------------------------------------------------------------------------------------------
+
+def _run(dut, generator):
+    run_simulation(dut, [generator, dut.model.generator()])
+
+# Tests --------------------------------------------------------------------------------------------
+
+def test_module():
+    module = MT8JSF12864HZ(int(100e6), "1:4")
+    assert module.geom_settings.bankbits == 3
+    assert module.geom_settings.rowbits  == 14
+    assert module.geom_settings.colbits  == 10
+    # 8 x8 chips: 1GB.
+    assert module.nbanks*module.nrows*module.ncols*64//8 == 1024**3
+
+def test_bist():
+    dut    = DRAMBenchModel(read_latency=3, waitrequest_rate=0.3)
+    length = 256
+    result = {}
+
+    def generator():
+        result["write"] = yield from bist(dut.bench, "write", length=length)
+        result["read"]  = yield from bist(dut.bench, "read",  length=length)
+        # Corrupt a word: the checker must see it.
+        dut.model.mem[5] ^= 1
+        result["corrupted"] = yield from bist(dut.bench, "read", length=length)
+
+    _run(dut, generator())
+    words = length//(dut.bench.data_width//8)
+    assert dut.model.writes == words
+    assert result["write"][0] >= words
+    assert result["read"][1] == 0
+    assert result["corrupted"][1] == 1
+
+def test_latency():
+    dut    = DRAMBenchModel(read_latency=5)
+    result = {}
+
+    def generator():
+        result["latency"] = yield from latency(dut.bench, stride=3, count=4)
+
+    _run(dut, generator())
+    lat_min, lat_max, lat_mean = result["latency"]
+    assert 5 <= lat_min <= lat_mean <= lat_max < 5 + 8
+
+def test_benchmark():
+    dut     = DRAMBenchModel(read_latency=2)
+    results = []
+    _run(dut, run_benchmark(dut, length=128, count=2, results=results))
+    assert [r.pattern for r in results[:len(bandwidth_patterns)]] == list(bandwidth_patterns)
+    assert all(r.errors == 0 for r in results[:len(bandwidth_patterns)])
+    assert all(r.min > 0 for r in results[len(bandwidth_patterns):])
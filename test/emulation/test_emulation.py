@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+from migen import *
+from migen.sim import passive
+
+from pcie_mitm.ip.emulation import DeviceEmulator
+from pcie_mitm.host.emulation import (decode_trap_record, make_completion, read_byte_count,
+    read_lower_address, type0_config_space)
+from pcie_mitm.host.fuzz import pack_corpus
+from pcie_mitm.sim.tlp import finalize_csrs, make_tlp, tlp_length, tlp_stream_write
+
+
+# Helpers ------------------------------------------------------------------------------------------
+
+class EmulatorModel:
+    """Expected completions of the emulator for served (non trapped) requests."""
+    def __init__(self, mem, config, mask, bars, mps):
+        self.mem          = dict(enumerate(mem))
+        self.config       = list(config)
+        self.mask         = list(mask)
+        self.bars         = bars # [(size mask, base)].
+        self.mps          = mps
+        self.completer_id = 0
+
+    def request(self, dws, bar):
+        fmt_type = dws[0] >> 24
+        length   = (dws[0] & 0x3ff) or 1024
+        rid, tag = dws[1] >> 16, (dws[1] >> 8) & 0xff
+        first_be, last_be = dws[1] & 0xf, (dws[1] >> 4) & 0xf
+        if fmt_type in [0x04, 0x44]:
+            target = dws[2] >> 16
+            reg    = (dws[2] >> 2) & 0x3ff
+            self.completer_id = target
+            if fmt_type == 0x04:
+                return [make_completion(rid, tag, target, [self.config[reg]])]
+            be   = sum(0xff << 8*i for i in range(4) if first_be & (1 << i))
+            mask = self.mask[reg] & be
+            self.config[reg] = (self.config[reg] & ~mask) | (dws[3] & mask)
+            return [make_completion(rid, tag, target)]
+        if fmt_type in [0x00, 0x20, 0x40, 0x60] and bar:
+            n        = (bar & -bar).bit_length() - 1
+            four_dw  = fmt_type & 0x20
+            address  = ((dws[2] << 32) | dws[3]) if four_dw else dws[2]
+            size, base = self.bars[n]
+            dw = (base + (address & size)) >> 2
+            if fmt_type & 0x40:
+                for i, data in enumerate(dws[4 if four_dw else 3:]):
+                    be    = first_be if i == 0 else last_be if i == length - 1 else 0xf
+                    wmask = sum(0xff << 8*j for j in range(4) if be & (1 << j))
+                    self.mem[dw + i] = (self.mem.get(dw + i, 0) & ~wmask) | (data & wmask)
+                return []
+            cpls, bc, first, addr_dw = [], read_byte_count(length, first_be, last_be), True, address >> 2
+            while length:
+                chunk = min(length, self.mps - addr_dw % self.mps)
+                lower = read_lower_address(address, first_be) if first else (addr_dw << 2) & 0x7f
+                cpls.append(make_completion(rid, tag, self.completer_id,
+                    [self.mem.get(dw + i, 0) for i in range(chunk)], byte_count=bc, lower_address=lower))
+                bc -= 4*chunk - (read_lower_address(0, first_be) if first else 0)
+                dw, addr_dw, length, first = dw + chunk, addr_dw + chunk, length - chunk, False
+            return cpls
+        if fmt_type & 0x40 or (fmt_type & 0x18) == 0x10:
+            return [] # Posted.
+        return [make_completion(rid, tag, self.completer_id, status="ur")]
+
+# Tests --------------------------------------------------------------------------------------------
+
+def test_device_emulator():
+    bar_depth = 256
+    mem       = [0xd000_0000 + i for i in range(2*bar_depth)]
+    config, mask = type0_config_space(0x1172, 0xe001, 0x058000, bars=[1024, 256], config_dws=64)
+    bars  = [(0x3ff, 0), (0xff, 0x400)]
+    model = EmulatorModel(mem, config, mask, bars, mps=4)
+
+    dut = finalize_csrs(DeviceEmulator(data_width=64, nbars=2, bar_depth=bar_depth, config_dws=64, ntraps=2,
+        trap_depth=4, payload_dws=4, response_depth=32))
+    dut.bar_mem.init    = [mem[2*i] | (mem[2*i + 1] << 32) for i in range(bar_depth)]
+    dut.config_mem.init = config + mask
+
+    def cfg(reg):
+        return (0x0300 << 16) | 4*reg
+
+    requests = [
+        (make_tlp("mrd32",  0x100, tag=1, address=0xf000_0010, length=1), 0b01),
+        (make_tlp("mwr32",  0x100, tag=2, address=0xf000_0024, datas=[0x11111111, 0x22222222, 0x33333333], last_be=0x3), 0b01),
+        (make_tlp("cfgrd0", 0x000, tag=3, address=cfg(0)), 0),
+        (make_tlp("mrd64",  0x100, tag=4, address=0x1_0000_001c, length=9), 0b01),
+        (make_tlp("mrd32",  0x100, tag=5, address=0xf100_0008, length=2, first_be=0xe, last_be=0x7), 0b10),
+        (make_tlp("cfgwr0", 0x000, tag=6, address=cfg(4), datas=[0xffffffff]), 0),
+        (make_tlp("cfgrd0", 0x000, tag=7, address=cfg(4)), 0),
+        (make_tlp("cfgwr0", 0x000, tag=8, address=cfg(0), datas=[0xffffffff]), 0),
+        (make_tlp("iord",   0x100, tag=9, address=0x100), 0),
+        (make_tlp("mrd32",  0x100, tag=10, address=0xe000_0000), 0),
+        (make_tlp("mwr64",  0x100, tag=11, address=0x1_0000_0104, datas=[0xa0 + i for i in range(5)], first_be=0xc), 0b01),
+        (make_tlp("mwr32",  0x100, tag=12, address=0xf100_0010, datas=[0xb0]), 0b10),
+        (make_tlp("mrd32",  0x100, tag=13, address=0xf000_00fc, length=8), 0b01),
+        (make_tlp("mrd32",  0x100, tag=14, address=0xf100_000c, length=3), 0b10),
+        (make_tlp("msg",    0x100, tag=15), 0),
+    ]
+    trapped = [
+        (make_tlp("mwr32",  0x100, tag=16, address=0xf000_0204, datas=[0xc0, 0xc1]), 0b01),
+        (make_tlp("mrd32",  0x100, tag=17, address=0xf000_0200, length=1), 0b01),
+        (make_tlp("cfgrd0", 0x000, tag=18, address=cfg(1)), 0),
+    ]
+    expected = [cpl for dws, bar in requests for cpl in model.request(dws, bar)]
+    response = make_completion(0x100, 17, 0x0300, [0xcafe])
+    dut.response.mem.init = pack_corpus([response], 64)
+    out = []
+
+    def generator():
+        yield dut._max_payload.storage.eq(4)
+        for i, (size, base) in enumerate(bars):
+            yield getattr(dut, f"_bar{i}_mask").storage.eq(size)
+            yield getattr(dut, f"_bar{i}_base").storage.eq(base)
+        yield
+        for dws, bar in requests:
+            yield from tlp_stream_write(dut.sink, dws, bar=bar)
+        for i in range(64):
+            yield
+        assert (yield dut._unsupported.status) == 2
+        assert (yield dut._completer_id.status) == 0x0300
+
+        # Trapped requests go to the host.
+        yield dut.trap0._bar_mask.storage.eq(0b01)
+        yield dut.trap0._low.storage.eq(0x200)
+        yield dut.trap0._high.storage.eq(0x2ff)
+        yield dut.trap0._ctrl.storage.eq(0b1101)
+        yield dut.trap1._low.storage.eq(0x04)
+        yield dut.trap1._high.storage.eq(0x07)
+        yield dut.trap1._ctrl.storage.eq(0b0111)
+        yield
+        for dws, bar in trapped:
+            yield from tlp_stream_write(dut.sink, dws, bar=bar)
+        for i in range(16):
+            yield
+        assert (yield dut._trap_level.status) == 3
+        records = []
+        for i in range(3):
+            records.append(decode_trap_record((yield dut._trap_record.status), 4, [m for m, b in bars]))
+            yield dut._trap_pop.re.eq(1)
+            yield
+            yield dut._trap_pop.re.eq(0)
+            yield
+        assert (yield dut._trap_level.status) == 0
+        assert [(r.kind, r.tag, r.offset, r.datas) for r in records] == [
+            ("mwr32", 16, 0x204, [0xc0, 0xc1]),
+            ("mrd32", 17, 0x200, []),
+            ("cfgrd0", 18, 0x4, []),
+        ]
+        assert records[0].bar == 0 and records[2].bar is None
+
+        # Host response.
+        yield dut.response._length.storage.eq(len(pack_corpus([response], 64)))
+        yield dut.response._repeat.storage.eq(1)
+        yield dut.response._start.re.eq(1)
+        yield
+        yield dut.response._start.re.eq(0)
+        for i in range(32):
+            yield
+
+    @passive
+    def collector():
+        packet = []
+        while True:
+            yield dut.source.ready.eq(1)
+            if (yield dut.source.valid):
+                beat = (yield dut.source.dat)
+                packet += [beat & 0xffffffff, beat >> 32]
+                if (yield dut.source.last):
+                    out.append(packet[:tlp_length(packet)])
+                    packet = []
+            yield
+
+    run_simulation(dut, [generator(), collector()])
+    assert out[:len(expected)] == expected
+    assert out[len(expected):] == [response]
+    assert model.config[4] == 0xffff_fc00 and model.config[0] == config[0]
+
+def test_read_byte_count():
+    assert read_byte_count(1, 0xf, 0) == 4
+    assert read_byte_count(1, 0x0, 0) == 1
+    assert read_byte_count(1, 0x6, 0) == 2
+    assert read_byte_count(2, 0xe, 0x7) == 6
+    assert read_byte_count(16, 0xf, 0xf) == 64
+    assert read_lower_address(0x1004, 0xc) == 0x06
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import time
+
+from litex import RemoteClient
+
+from pcie_mitm.host.etherbone import EtherboneQueue, CSRMap, ServerTransport, UDPTransport
+
+
+# Bench --------------------------------------------------------------------------------------------
+
+def bench_remote_client(args):
+    bus = RemoteClient(host=args.host, port=int(args.port), csr_csv=args.csr_csv)
+    bus.open()
+    start = time.perf_counter()
+    for name, reg in bus.regs.d.items():
+        reg.read()
+    scan = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in range(0, args.words, 255):
+        bus.read(args.mem_base + 4*i, length=min(255, args.words - i))
+    mem = time.perf_counter() - start
+    bus.close()
+    return scan, mem
+
+async def bench_queue(args):
+    if args.udp:
+        transport = UDPTransport(args.udp, int(args.port))
+    else:
+        transport = ServerTransport(args.host, int(args.port))
+    async with EtherboneQueue(transport) as bus:
+        csrs  = CSRMap(bus, args.csr_csv)
+        start = time.perf_counter()
+        await csrs.dump()
+        scan  = time.perf_counter() - start
+        start = time.perf_counter()
+        await bus.read_memory(args.mem_base, args.words)
+        mem   = time.perf_counter() - start
+    return scan, mem
+
+# Main ---------------------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched Etherbone vs RemoteClient register/memory access benchmark")
+    parser.add_argument("--csr-csv",  default="csr.csv",   help="SoC CSV file.")
+    parser.add_argument("--host",     default="localhost", help="litex_server host.")
+    parser.add_argument("--port",     default=1234,        help="litex_server (or Etherbone UDP) port.")
+    parser.add_argument("--udp",      default=None,        help="Talk Etherbone/UDP directly to this FPGA IP instead of litex_server.")
+    parser.add_argument("--mem-base", default="0x10000000", help="Memory read back for the bulk download test.")
+    parser.add_argument("--words",    default=4096,        help="Words read in the bulk download test.")
+    args = parser.parse_args()
+    args.mem_base = int(args.mem_base, 0)
+    args.words    = int(args.words)
+
+    for name, fn in [("RemoteClient", lambda: bench_remote_client(args)),
+                     ("EtherboneQueue", lambda: asyncio.run(bench_queue(args)))]:
+        scan, mem = fn()
+        print(f"{name:<16} register scan: {scan*1e3:8.1f} ms, {args.words} words: {mem*1e3:8.1f} ms "
+              f"({4*args.words/mem/1e6:.2f} MB/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+import asyncio
+import struct
+
+from litex.tools.remote.etherbone import EtherbonePacket, EtherboneRecord, EtherboneWrites
+
+from pcie_mitm.host.etherbone import EtherboneQueue, CSRMap, UARTboneTransport, UDPTransport, encode_packet
+
+
+# Helpers ------------------------------------------------------------------------------------------
+
+class _LoopbackTransport:
+    """In-process Etherbone slave decoding requests with the LiteX reference codec.
+
+    Like the LiteEth Etherbone core, only the first record of a packet is handled, the others are
+    dropped (and counted). The next `lose` replies are not sent back, as if lost on the network.
+    """
+    max_records = UDPTransport.max_records
+    max_bytes   = UDPTransport.max_bytes
+
+    def __init__(self):
+        self.mem     = {}
+        self.packets = 0
+        self.dropped = 0
+        self.lose    = 0
+
+    async def open(self, on_packet):
+        self.on_packet = on_packet
+
+    def close(self):
+        pass
+
+    def send(self, data):
+        self.packets += 1
+        packet = EtherbonePacket(32, data)
+        packet.decode()
+        self.dropped += len(packet.records) - 1
+        for record in packet.records[:1]:
+            if record.writes is not None:
+                for i, data in enumerate(record.writes.get_datas()):
+                    self.mem[record.writes.base_addr + 4*i] = data
+            if record.reads is not None:
+                if self.lose:
+                    self.lose -= 1
+                    continue
+                reply = EtherboneRecord(4)
+                # The LiteX decoder does not keep base_ret_addr, the LiteEth core echoes it.
+                base_ret_addr, = struct.unpack_from(">I", record.reads.bytes)
+                reply.writes = EtherboneWrites(addr_size=4, base_addr=base_ret_addr,
+                    datas=[self.mem.get(a, 0) for a in record.reads.get_addrs()])
+                reply.wcount = len(reply.writes)
+                response = EtherbonePacket(32)
+                response.records = [reply]
+                response.encode()
+                asyncio.get_running_loop().call_soon(self.on_packet, bytes(response.bytes))
+
+# Tests --------------------------------------------------------------------------------------------
+
+def test_encode_matches_litex():
+    packet = EtherbonePacket(32, encode_packet([(0x1000, [1, 2, 3], 0x42, [0x20, 0x24])]))
+    packet.decode()
+    record = packet.records[0]
+    assert record.writes.base_addr == 0x1000
+    assert record.writes.get_datas() == [1, 2, 3]
+    assert struct.unpack_from(">I", record.reads.bytes) == (0x42,)
+    assert record.reads.get_addrs() == [0x20, 0x24]
+
+def test_batched_accesses(tmp_path):
+    csr_csv = tmp_path / "csr.csv"
+    csr_csv.write_text("\n".join([
+        "csr_base,ctrl,0xf0000000,,",
+        "csr_register,ctrl_reset,0xf0000000,1,rw",
+        "csr_register,ctrl_scratch,0xf0000004,1,rw",
+        "csr_register,ctrl_bus_errors,0xf0000008,2,ro",
+        "constant,config_csr_data_width,32,,",
+        "memory_region,sram,0x10000000,0x1000,cached",
+    ]) + "\n")
+
+    async def main():
+        transport = _LoopbackTransport()
+        async with EtherboneQueue(transport) as bus:
+            csrs = CSRMap(bus, csr_csv)
+            csrs.ctrl_scratch.write(0x12345678)
+            transport.mem[0xf0000008] = 0x1
+            transport.mem[0xf000000c] = 0x2
+            regs = await csrs.dump("ctrl_")
+            assert regs["ctrl_scratch"] == 0x12345678
+            assert regs["ctrl_bus_errors"] == 0x1_0000_0002
+
+            base = csrs.mems["sram"][0]
+            for i in range(1000):
+                bus.write(base + 4*i, i)
+            packets = transport.packets
+            datas   = await bus.read_memory(base, 1000)
+            assert datas == list(range(1000))
+            # 1000 writes + 1000 reads, far fewer packets than accesses.
+            assert transport.packets - packets < 20
+
+            # Scattered writes, one record each.
+            for i in range(8):
+                bus.write(base + 0x100 + 8*i, i)
+            datas = await asyncio.gather(*[bus.read(base + 0x100 + 8*i) for i in range(8)])
+            assert datas == [[i] for i in range(8)]
+        assert transport.dropped == 0
+
+    asyncio.run(main())
+
+def test_lost_reply():
+    async def main():
+        transport = _LoopbackTransport()
+        async with EtherboneQueue(transport, timeout=0.2) as bus:
+            # Each write + read pair goes in its own record/packet; the first reply is lost.
+            transport.lose = 1
+            futures = []
+            for i in range(4):
+                bus.write(0x100 + 4*i, 0x10 + i)
+                futures.append(bus.read(0x100 + 4*i))
+            results = await asyncio.gather(*futures, return_exceptions=True)
+            assert isinstance(results[0], TimeoutError)
+            assert results[1:] == [[0x11], [0x12], [0x13]]
+            # The expired read does not linger, later reads still resolve.
+            assert await bus.read(0x100) == [0x10]
+            assert not bus.inflight
+
+    asyncio.run(main())
+
+def test_uartbone_transport():
+    mem = {}
+
+    async def slave(reader, writer):
+        # UARTbone (Stream2Wishbone) command decoder.
+        while True:
+            try:
+                cmd, length = await reader.readexactly(2)
+            except asyncio.IncompleteReadError:
+                return
+            addr, = struct.unpack(">I", await reader.readexactly(4))
+            if cmd == 0x01:
+                for i, data in enumerate(struct.unpack(f">{length}I", await reader.readexactly(4*length))):
+                    mem[addr + i] = data
+            else:
+                writer.write(struct.pack(f">{length}I", *[mem.get(addr + i, 0) for i in range(length)]))
+
+    async def main():
+        server = await asyncio.start_server(slave, "localhost", 0)
+        port   = server.sockets[0].getsockname()[1]
+        async with EtherboneQueue(UARTboneTransport("localhost", port)) as bus:
+            bus.write(0x100, list(range(20)))
+            assert await bus.read(0x100, 20) == list(range(20))
+            a, b = await asyncio.gather(bus.read(0x104, burst="fixed"), bus.read(0x120, 3))
+            assert a == [1] and b == [8, 9, 10]
+        server.close()
+
+    asyncio.run(main())
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+import asyncio
+import random
+
+import pytest
+
+from migen import *
+from migen.sim import passive
+
+from pcie_mitm.ip.fuzz import TLPFuzzer, TLPMutator, mutation_ops
+from pcie_mitm.host.fuzz import (FuzzScheduler, Mutation, mutate_tlp, overwrite, flip_bits,
+    corrupt_length, pack_corpus)
+from pcie_mitm.sim.tlp import finalize_csrs, make_tlp, tlp_length, tlp_stream_write
+
+
+# Tests --------------------------------------------------------------------------------------------
+
+def test_injector_mutator():
+    seeds = [
+        make_tlp("mrd32", requester_id=0x100, tag=1, address=0x1000, length=4),
+        make_tlp("mwr64", requester_id=0x100, tag=2, address=0x1_0000_2000, datas=[1, 2, 3]),
+        make_tlp("cfgrd0", requester_id=0x100, tag=3, address=0x10),
+    ]
+    link = [make_tlp("mwr32", requester_id=0x200, tag=i, address=0x3000, datas=[i]*5) for i in range(6)]
+    mutations = [overwrite(1, 0xff00, 0xab00), flip_bits(2, 0x4)]
+
+    dut = finalize_csrs(TLPFuzzer(data_width=64, corpus_depth=64, nslots=2, clk_freq=1e6, cpl_timeout=100e-6))
+    dut.injector.mem.init = pack_corpus(seeds, 64)
+    out = []
+
+    def generator():
+        for i, m in enumerate(mutations):
+            slot = getattr(dut.mutator, f"slot{i}")
+            yield slot._index.storage.eq(m.index)
+            yield slot._mask.storage.eq(m.mask)
+            yield slot._value.storage.eq(m.value)
+            yield slot._ctrl.storage.eq(1 | (mutation_ops[m.op] << 1))
+        yield dut.mutator._fmt_type_mask.storage.eq(0)
+        yield dut.mutator._ctrl.storage.eq(0b101) # Injected TLPs only.
+        yield dut.injector._length.storage.eq(len(pack_corpus(seeds, 64)))
+        yield dut.injector._repeat.storage.eq(2)
+        yield dut.injector._start.re.eq(1)
+        yield
+        yield dut.injector._start.re.eq(0)
+        for dws in link:
+            yield from tlp_stream_write(dut.sink, dws, gap=3)
+        for i in range(64):
+            yield
+        # One UR completion for the requests: the other MRd/CfgRd time out.
+        yield dut.cpl.valid.eq(1)
+        yield dut.cpl.first.eq(1)
+        yield dut.cpl.dat.eq(make_tlp("cpl", completer_id=0x100)[0] | (0b001 << (32 + 13)))
+        yield
+        yield dut.cpl.valid.eq(0)
+        for i in range(200):
+            yield
+        assert (yield dut._np_sent.status) == 4
+        assert (yield dut._cpl_ur.status) == 1
+        assert (yield dut._timeouts.status) >= 1
+        assert (yield dut.injector._injected.status) == 6
+
+    @passive
+    def collector():
+        yield dut.source.ready.eq(1)
+        packet = []
+        while True:
+            if (yield dut.source.valid):
+                beat = (yield dut.source.dat)
+                packet += [beat & 0xffffffff, beat >> 32]
+                if (yield dut.source.last):
+                    out.append(packet)
+                    packet = []
+            yield
+
+    run_simulation(dut, [generator(), collector()])
+    out = [dws[:tlp_length(dws)] for dws in out]
+    injected = [dws for dws in out if (dws[1] >> 16) == 0x100]
+    assert [dws for dws in out if (dws[1] >> 16) == 0x200] == link
+    assert injected == [mutate_tlp(s, mutations) for s in seeds]*2
+
+# Edge probabilities are checked against their worst-case LFSR draw.
+@pytest.mark.parametrize("probability, draw", [(0, 0x0000), (0x8000, None), (0xffff, 0xffff)])
+def test_mutator_probability(probability, draw):
+    dut  = finalize_csrs(TLPMutator(data_width=64, nslots=1))
+    tlps = [make_tlp("mwr32", requester_id=0x100, tag=i, address=0x1000, datas=[i]) for i in range(64)]
+    out  = []
+
+    def generator():
+        yield dut.slot0._index.storage.eq(1)
+        yield dut.slot0._mask.storage.eq(0xff00)
+        yield dut.slot0._value.storage.eq(0xab00)
+        yield dut.slot0._ctrl.storage.eq(1 | (mutation_ops["set"] << 1))
+        yield dut._probability.storage.eq(probability)
+        yield dut._ctrl.storage.eq(0b011) # Link TLPs.
+        yield
+        for dws in tlps:
+            yield from tlp_stream_write(dut.sink, dws)
+        for i in range(8):
+            yield
+        mutated = (yield dut._mutated.status)
+        assert mutated == sum(dws[1] != tlp[1] for dws, tlp in zip(out, tlps))
+        if probability == 0:
+            assert mutated == 0
+        elif probability == 0xffff:
+            assert mutated == len(tlps)
+        else:
+            assert 0 < mutated < len(tlps)
+
+    @passive
+    def pin():
+        while draw is not None:
+            yield dut.lfsr.o.eq(draw)
+            yield
+
+    @passive
+    def collector():
+        yield dut.source.ready.eq(1)
+        packet = []
+        while True:
+            if (yield dut.source.valid):
+                beat = (yield dut.source.dat)
+                packet += [beat & 0xffffffff, beat >> 32]
+                if (yield dut.source.last):
+                    out.append(packet)
+                    packet = []
+            yield
+
+    run_simulation(dut, [generator(), pin(), collector()])
+    assert len(out) == len(tlps)
+
+class FakeDriver:
+    """Endpoint model behind a fake injector: UR for unknown types, CA above 2GB, timeouts for
+    requests with tag 0xff."""
+    counters = ["np_sent", "cpl_sc", "cpl_ur", "cpl_crs", "cpl_ca", "timeouts"]
+
+    def __init__(self):
+        self.data_width   = 64
+        self.corpus_depth = 256
+        self.corpus       = {}
+        self.values       = dict.fromkeys(self.counters, 0)
+        self.rng          = random.Random(0)
+
+    def load(self, offset, beats):
+        for i, beat in enumerate(beats):
+            self.corpus[offset + i] = beat
+
+    def set_mutations(self, mutations, **kwargs):
+        self.mutations = mutations
+
+    def start(self, offset, length, repeat=1):
+        beats = [self.corpus[offset + i] for i in range(length)]
+        dws   = [(b >> 32*j) & 0xffffffff for b in beats for j in range(2)]
+        tlps, i = [], 0
+        while i < len(dws):
+            n = tlp_length(dws[i:])
+            tlps.append(dws[i:i + n])
+            i += n + (n % 2)
+        for r in range(repeat):
+            for tlp in tlps:
+                tlp = mutate_tlp(tlp, self.mutations, lambda: self.rng.getrandbits(32))
+                fmt_type = tlp[0] >> 24
+                if fmt_type in [0x40, 0x60]:
+                    continue
+                self.values["np_sent"] += 1
+                if (tlp[1] >> 8) & 0xff == 0xff:
+                    self.values["timeouts"] += 1
+                elif fmt_type not in [0x00, 0x20, 0x04, 0x44]:
+                    self.values["cpl_ur"] += 1
+                elif fmt_type == 0x20 and tlp[2] & 0x80000000:
+                    self.values["cpl_ca"] += 1
+                else:
+                    self.values["cpl_sc"] += 1
+
+    async def busy(self):
+        return 0
+
+    async def read_counters(self):
+        return dict(self.values)
+
+def test_scheduler_finds_signatures():
+    seeds = [
+        make_tlp("mrd32", tag=1, address=0x1000),
+        make_tlp("mrd64", tag=2, address=0x1_0000_2000),
+        make_tlp("mwr32", tag=3, address=0x3000, datas=[1, 2]),
+    ]
+    scheduler = FuzzScheduler(FakeDriver(), seeds, batch_size=3, repeat=2)
+    findings  = asyncio.run(scheduler.run(300))
+    assert len(scheduler.signatures) >= 3
+    assert len(scheduler.queue) == len(scheduler.signatures) + 1
+    assert findings
@@ -16,6 +16,8 @@ from litex.soc.cores.clock import Max10PLL
 from litex.soc.integration.soc_core import *
 from litex.soc.integration.builder import *
 
+from pcie_mitm.build.generate import BuildProfiler, generate, generation_key
+
 
 # CRG ----------------------------------------------------------------------------------------------
 
@@ -74,18 +76,25 @@ class BaseSoC(SoCCore):
 
 def main():
     parser = argparse.ArgumentParser(description="LiteX SoC on DECA")
+    parser.add_argument("--no-gen-cache",  action="store_true", help="Always elaborate and regenerate the SoC.")
+    parser.add_argument("--profile-build", action="store_true", help="Add a cProfile of each generation phase to the build report.")
     builder_args(parser)
     soc_core_args(parser)
     args = parser.parse_args()
 
     args.cpu_type = "None"
 
-    soc = BaseSoC(
-        sys_clk_freq = int(50e6),
-        **soc_core_argdict(args)
-    )
-    builder = Builder(soc, **builder_argdict(args))
-    builder.build(run=False)
+    def make_soc():
+        return BaseSoC(
+            sys_clk_freq = int(50e6),
+            **soc_core_argdict(args)
+        )
+    run_args = ["no_gen_cache", "profile_build"]
+    key = generation_key({k: v for k, v in vars(args).items() if k not in run_args}, sources=[__file__])
+    with BuildProfiler(detail=args.profile_build) as profiler:
+        generate(make_soc, lambda soc: Builder(soc, **builder_argdict(args)), key,
+            cache = not args.no_gen_cache)
+    print(profiler.report())
 
 if __name__ == "__main__":
     main()
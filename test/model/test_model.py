@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import time
+
+import pytest
+
+from migen import *
+
+from litex.soc.interconnect import wishbone
+
+from pcie_mitm.host.sniffer import TLPSnifferDriver
+from pcie_mitm.ip.bridge import Wishbone2AvalonMM
+from pcie_mitm.ip.gpio import AvalonMMGPIO, gpio_registers
+from pcie_mitm.ip.tlp import TLPSniffer, fmt_type_dict
+from pcie_mitm.sim.model import (GPIOModel, ModelBus, TLPSnifferModel, Wishbone2AvalonMMModel,
+    check_equivalence, random_gpio_vectors, run_migen, run_model)
+from pcie_mitm.sim.tlp import finalize_csrs, random_tlps, run_sniffer
+
+
+# Helpers ------------------------------------------------------------------------------------------
+
+class _GPIODUT(Module):
+    def __init__(self, **kwargs):
+        # Same hookup as led_gpio in arria_v_hpc.py/sim.py.
+        self.submodules.gpio = AvalonMMGPIO(**kwargs)
+        self.wb = wishbone.Interface(adr_width=4)
+        self.submodules.bridge = Wishbone2AvalonMM(self.wb, self.gpio.avmm, read_latency=0)
+
+def gpio_model(**kwargs):
+    return Wishbone2AvalonMMModel(GPIOModel(**kwargs))
+
+def gpio_migen(vectors, **kwargs):
+    dut   = _GPIODUT(**kwargs)
+    reads = []
+    run_simulation(dut, run_migen(dut.wb, vectors, dut.gpio.in_port, reads))
+    return reads
+
+def sniffer_setup(dut, csrs):
+    for name, value in csrs.items():
+        module = dut
+        if name.startswith("filter"):
+            rule, name = name.split("_", 1)
+            module = getattr(dut, rule)
+        yield getattr(module, "_" + name).storage.eq(value)
+
+def configure_sniffer(driver):
+    driver.clear_filters()
+    driver.set_filter(0, kind="mwr32", fmt_type_mask=0b1101_1111, requester_id=0x0100,
+        address=(0x1000_0000, 0x7fff_ffff))
+    driver.set_filter(1, kind="cpld", requester_id=0x0200, bars=[0, 2])
+    driver.start(max_payload=3)
+
+# GPIO ---------------------------------------------------------------------------------------------
+
+def test_gpio_model():
+    model = gpio_model(width=12, in_width=4)
+    gpio  = model.slave
+    model.write(gpio_registers["out"], [0xffff_0a5a])
+    model.write(gpio_registers["set"], [0x101])
+    model.write(gpio_registers["toggle"], [0xf00], sel=0b0010)
+    assert gpio.out_port == 0x45b
+    model.write(gpio_registers["rising"], [0b0011])
+    model.write(gpio_registers["irq_mask"], [0b0001])
+    gpio.in_port = 0b0001
+    model.step(3)
+    assert model.read(gpio_registers["in"]) == [0b0001] and gpio.irq
+
+@pytest.mark.parametrize("in_width", [0, 4])
+def test_gpio_equivalence(in_width):
+    vectors = random_gpio_vectors(300, seed=in_width, in_width=in_width)
+    kwargs  = dict(width=12, in_width=in_width)
+    check_equivalence(vectors, run_model(gpio_model(**kwargs), vectors), gpio_migen(vectors, **kwargs))
+
+def test_gpio_model_speed():
+    vectors = random_gpio_vectors(20000, seed=1, in_width=8)
+    start   = time.monotonic()
+    reads   = run_model(gpio_model(width=32, in_width=8), vectors)
+    assert len(reads) == len([v for v in vectors if v[0] == "read"])
+    assert time.monotonic() - start < 5.0
+
+# TLP Sniffer --------------------------------------------------------------------------------------
+
+@pytest.mark.parametrize("data_width", [64, 128])
+def test_sniffer_equivalence(data_width):
+    model = TLPSnifferModel(data_width=data_width, payload_dws=4)
+    configure_sniffer(TLPSnifferDriver(ModelBus({"sniffer": model})))
+    tlps = random_tlps(96, seed=data_width)
+    # Steer a few writes into the address window of rule 0.
+    for dws, bar in tlps[::3]:
+        if dws[0] >> 24 in [fmt_type_dict["mwr32"], fmt_type_dict["mwr64"]]:
+            dws[1] = (0x0100 << 16) | (dws[1] & 0xffff)
+            if dws[0] >> 24 == fmt_type_dict["mwr64"]:
+                dws[2], dws[3] = 0, 0x1234_5670
+            else:
+                dws[2] = 0x1234_5670
+    csrs     = {k: v for k, v in model.csrs.items() if k not in ["tlps", "matched", "dropped"]}
+    expected = [r for r in (model.push(dws, bar) for dws, bar in tlps) if r is not None]
+    assert 4 < len(expected) < len(tlps)
+    assert {r["hits"] for r in expected} == {1, 2}
+    assert model.csrs["tlps"] == len(tlps) and model.csrs["matched"] == len(expected)
+    dut = finalize_csrs(TLPSniffer(data_width=data_width, payload_dws=4))
+    assert run_sniffer(dut, tlps, lambda: sniffer_setup(dut, csrs)) == expected
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+import random
+
+from migen import *
+
+from pcie_mitm.host.emulation import make_completion
+from pcie_mitm.host.perf import decode_counters, decode_histograms, histogram_percentile
+from pcie_mitm.ip.perf import TLPPerfMonitor, latency_classes, perf_region_words, perf_regions
+from pcie_mitm.sim.bus import wishbone_burst_read
+from pcie_mitm.sim.tlp import finalize_csrs, make_tlp
+
+
+# Helpers ------------------------------------------------------------------------------------------
+
+def schedule_beats(traffic, lanes):
+    """{cycle: (first, last, dat)} of TLPs [(start cycle, dws)] sent back-to-back from their start.
+
+    Also returns the actual start cycle of each TLP (later when the tap is still busy).
+    """
+    beats, starts, cycle = {}, [None]*len(traffic), 0
+    for n in sorted(range(len(traffic)), key=lambda n: traffic[n][0]):
+        start, dws = traffic[n]
+        cycle  = max(cycle, start)
+        starts[n] = cycle
+        chunks = [dws[i:i + lanes] for i in range(0, len(dws), lanes)]
+        for i, chunk in enumerate(chunks):
+            beats[cycle] = (i == 0, i == len(chunks) - 1, sum(dw << 32*j for j, dw in enumerate(chunk)))
+            cycle += 1
+    return beats, starts
+
+def run_monitor(data_width, down, up, nbins=16, bin_shift=2, tag_bits=8, cycles=None):
+    """Drive the taps with scheduled TLPs and read back (counters, histograms, stats)."""
+    dut   = finalize_csrs(TLPPerfMonitor(data_width=data_width, nbins=nbins, tag_bits=tag_bits))
+    lanes = data_width//32
+    down_beats, _ = schedule_beats(down, lanes)
+    up_beats,   _ = schedule_beats(up, lanes)
+    if cycles is None:
+        cycles = max(list(down_beats) + list(up_beats)) + 1
+    result = {}
+
+    def generator():
+        yield dut._bin_shift.storage.eq(bin_shift)
+        yield
+        for cycle in range(cycles):
+            for ep, beats in [(dut.down, down_beats), (dut.up, up_beats)]:
+                first, last, dat = beats.get(cycle, (0, 0, 0))
+                yield ep.valid.eq(cycle in beats)
+                yield ep.first.eq(first)
+                yield ep.last.eq(last)
+                yield ep.dat.eq(dat)
+            yield
+        yield dut.down.valid.eq(0)
+        yield dut.up.valid.eq(0)
+        for i in range(8):
+            yield
+        region = perf_region_words(nbins)
+        words  = {}
+        for i, name in enumerate(perf_regions):
+            length = 32 if name.endswith("counters") else 2*nbins*len(latency_classes)
+            words[name] = yield from wishbone_burst_read(dut.bus, i*region, length)
+        result["counters"] = {d: decode_counters(words[f"{d}_counters"]) for d in ["down", "up"]}
+        result["histograms"] = {t: decode_histograms(words[f"{t}_latency"], nbins) for t in ["device", "host"]}
+        result["stats"] = {}
+        for t in ["device", "host"]:
+            tracker = getattr(dut, t)
+            result["stats"][t] = {}
+            for s in ["count", "sum", "min", "max", "unmatched", "lost"]:
+                result["stats"][t][s] = (yield getattr(tracker, f"_{s}").status)
+
+        # Clear.
+        yield dut._clear.re.eq(1)
+        yield
+        yield dut._clear.re.eq(0)
+        for i in range(2*nbins*len(latency_classes) + 4):
+            yield
+        result["cleared"] = [
+            (yield from wishbone_burst_read(dut.bus, 2*region, 2*nbins*len(latency_classes))),
+            (yield dut.device._count.status),
+        ]
+
+    run_simulation(dut, generator())
+    return result
+
+def histogram(latencies, nbins, bin_shift):
+    bins = {name: [0]*nbins for name in latency_classes}
+    for name, latency in latencies:
+        bins[name][min(latency >> bin_shift, nbins - 1)] += 1
+    return bins
+
+# Tests --------------------------------------------------------------------------------------------
+
+def test_perf_monitor():
+    cfg = (0x0300 << 16) | 0x10
+    down = [
+        (0,   make_tlp("mrd32",  0x100, tag=1, address=0x1000, length=8)),
+        (4,   make_tlp("mrd32",  0x100, tag=2, address=0x2000)),
+        (8,   make_tlp("cfgrd0", 0x000, tag=3, address=cfg)),
+        (12,  make_tlp("mwr32",  0x100, tag=0, address=0x3000, datas=[1, 2, 3, 4, 5])),
+        (20,  make_tlp("mrd64",  0x100, tag=4, address=0x1_0000_0000, length=1)),
+        (24,  make_tlp("mrd64",  0x100, tag=4, address=0x1_0000_0000, length=1)), # Reuses tag 4.
+        (100, make_completion(0x0300, 9, 0x0000, [0xaa]*2)),                     # Host completion.
+    ]
+    up = [
+        (30,  make_completion(0x100, 1, 0x0300, [0]*4, byte_count=32)),  # Split: first,
+        (45,  make_completion(0x100, 1, 0x0300, [0]*4, byte_count=16)),  # then last.
+        (50,  make_completion(0x101, 2, 0x0300, [0])),                   # Wrong requester.
+        (60,  make_tlp("mrd32", 0x0300, tag=9, address=0x8000, length=2)),
+        (70,  make_completion(0x100, 2, 0x0300, [0])),
+        (90,  make_completion(0x100, 4, 0x0300, [0])),
+        (150, make_completion(0x000, 3, 0x0300, [0x12345678])),
+        (160, make_completion(0x100, 1, 0x0300, [0])),                   # Tag 1 already completed.
+        (170, make_tlp("msg", 0x0300)),
+    ]
+    for data_width in [64, 256]:
+        r = run_monitor(data_width, down, up, nbins=4, bin_shift=5, tag_bits=4)
+        latencies = [("mrd", 30), ("mrd", 66), ("mrd", 66), ("cfg", 142)]
+        assert r["histograms"]["device"] == histogram(latencies, 4, 5)
+        assert r["histograms"]["host"] == histogram([("mrd", 40)], 4, 5)
+        assert r["stats"]["device"] == {"count": 4, "sum": 30 + 66 + 66 + 142, "min": 30, "max": 142,
+            "unmatched": 2, "lost": 1}
+        assert r["stats"]["host"]["count"] == 1 and r["stats"]["host"]["unmatched"] == 0
+        assert r["counters"]["down"]["mrd"] == (4, 0)
+        assert r["counters"]["down"]["mwr"] == (1, 5)
+        assert r["counters"]["down"]["cfg"] == (1, 0)
+        assert r["counters"]["down"]["cpld"] == (1, 2)
+        assert r["counters"]["up"]["cpld"] == (7, 13)
+        assert r["counters"]["up"]["mrd"] == (1, 0)
+        assert r["counters"]["up"]["msg"] == (1, 0)
+        assert r["cleared"] == [[0]*(2*4*len(latency_classes)), 0]
+
+def test_perf_monitor_random():
+    # Back-to-back single beat TLPs: every counter update hits the read-modify-write pipeline.
+    rng  = random.Random(0)
+    down, up, t = [], [], 0
+    for tag in range(64):
+        t      += rng.choice([1, 1, 2, 5])
+        latency = rng.choice([1, 2, 3, 4, 5, 8, 13, 40, 200])
+        down.append((t, make_tlp("mrd32", 0x100, tag=tag, address=0x1000)))
+        up.append((t + latency, make_completion(0x100, tag, 0x0300)))
+    r = run_monitor(128, down, up, nbins=8, bin_shift=1, tag_bits=6)
+    # Colliding start cycles shift the later TLPs: take the actual schedule.
+    _, down_starts = schedule_beats(down, 4)
+    _, up_starts   = schedule_beats(up, 4)
+    latencies = [("mrd", u - d) for d, u in zip(down_starts, up_starts)]
+    assert r["histograms"]["device"] == histogram(latencies, 8, 1)
+    assert r["counters"]["down"]["mrd"] == (64, 0) and r["counters"]["up"]["cpl"] == (64, 0)
+
+def test_histogram_percentile():
+    bins = [0, 5, 5, 0]
+    assert histogram_percentile(bins, 2, 0.5) == 8
+    assert histogram_percentile(bins, 2, 0.9) == 12
+    assert histogram_percentile([0, 0, 0, 1], 2, 0.5) == float("inf")
+    assert histogram_percentile([0]*4, 2, 0.5) is None
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from migen import *
+from migen.sim import passive
+
+from pcie_mitm.host.rewrite import Patch, compile_rules, entry_words, rule
+from pcie_mitm.ip.rewrite import TLPRewriter
+from pcie_mitm.sim.bus import wishbone_burst_write
+from pcie_mitm.sim.tlp import make_tlp
+
+
+# Bench --------------------------------------------------------------------------------------------
+
+def bench(data_width, key_dws, nrules, payload_dws, count, match):
+    """(added latency of the first beat, output beats/cycle) of back-to-back MWr TLPs."""
+    dut   = TLPRewriter(data_width=data_width, nrules=nrules, key_dws=key_dws)
+    lanes = data_width//32
+    rules = [rule("mwr32", tag=0xff if not match else None,
+        patches=[Patch("payload", 0, 0xff, 0x5a, "xor")])]
+    tlp   = make_tlp("mwr32", 0x100, address=0x1000, datas=list(range(payload_dws)))
+    beats = [tlp[i:i + lanes] for i in range(0, len(tlp), lanes)]
+    state = {"now": 0, "in": [], "out": []}
+
+    def generator():
+        words = []
+        for i, e in enumerate(compile_rules(rules, key_dws) + [None]*nrules):
+            if i < nrules:
+                words += entry_words(e, dut.npatches)
+        yield from wishbone_burst_write(dut.bus, 0, words)
+        yield dut._commit.re.eq(1)
+        yield
+        yield dut._commit.re.eq(0)
+        for n in range(count):
+            for i, beat in enumerate(beats):
+                yield dut.sink.valid.eq(1)
+                yield dut.sink.first.eq(i == 0)
+                yield dut.sink.last.eq(i == len(beats) - 1)
+                yield dut.sink.dat.eq(sum(dw << 32*j for j, dw in enumerate(beat)))
+                yield
+                while not (yield dut.sink.ready):
+                    yield
+        yield dut.sink.valid.eq(0)
+        for i in range(4*dut.latency):
+            yield
+
+    @passive
+    def monitor():
+        yield dut.source.ready.eq(1)
+        while True:
+            if (yield dut.sink.valid) and (yield dut.sink.ready) and (yield dut.sink.first):
+                state["in"].append(state["now"])
+            if (yield dut.source.valid) and (yield dut.source.first):
+                state["out"].append(state["now"])
+            yield
+            state["now"] += 1
+
+    run_simulation(dut, [generator(), monitor()])
+    latency = state["out"][0] - state["in"][0]
+    cycles  = state["out"][-1] - state["out"][0] + len(beats)
+    return latency, count*len(beats)/cycles
+
+# Main ---------------------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="TLPRewriter added latency benchmark (simulation cycles)")
+    parser.add_argument("--nrules",      default=8,  help="TCAM rules.")
+    parser.add_argument("--payload-dws", default=16, help="Payload DWs of the MWr TLPs.")
+    parser.add_argument("--tlps",        default=32, help="Back-to-back TLPs per run.")
+    args = parser.parse_args()
+
+    print(f"{'width':>5} {'key DWs':>7} {'match':>5} {'latency':>7} {'expected':>8} {'beats/cycle':>11}")
+    for data_width in [64, 128, 256]:
+        for key_dws in [4, 6, 8]:
+            for match in [False, True]:
+                latency, rate = bench(data_width, key_dws, int(args.nrules), int(args.payload_dws),
+                    int(args.tlps), match)
+                expected = TLPRewriter(data_width=data_width, key_dws=key_dws).latency
+                print(f"{data_width:>5} {key_dws:>7} {str(match):>5} {latency:>7} {expected:>8} {rate:>11.2f}")
+
+if __name__ == "__main__":
+    main()
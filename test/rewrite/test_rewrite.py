@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+from migen import *
+from migen.sim import passive
+
+from pcie_mitm.host.rewrite import (Patch, compile_rules, entry_words, patch_payload_bytes,
+    range_to_prefixes, remap_address, rewrite_tlp, rule)
+from pcie_mitm.ip.rewrite import TLPRewriter
+from pcie_mitm.sim.bus import wishbone_burst_write
+from pcie_mitm.sim.tlp import make_tlp, tlp_length, tlp_stream_write
+
+
+# Helpers ------------------------------------------------------------------------------------------
+
+def load_table(dut, entries):
+    words = []
+    for i in range(dut.nrules):
+        words += entry_words(entries[i] if i < len(entries) else None, dut.npatches)
+    yield from wishbone_burst_write(dut.bus, 0, words)
+    yield dut._commit.re.eq(1)
+    yield
+    yield dut._commit.re.eq(0)
+    yield
+
+def run_rewriter(data_width, batches, key_dws=6, nrules=8, ready=lambda cycle: True):
+    """Send batches of TLPs, each batch under its own rules: [(rules, tlps)]."""
+    dut = TLPRewriter(data_width=data_width, nrules=nrules, key_dws=key_dws)
+    lanes = data_width//32
+    out   = []
+
+    def generator():
+        for rules, tlps in batches:
+            yield from load_table(dut, compile_rules(rules, key_dws))
+            for dws in tlps:
+                yield from tlp_stream_write(dut.sink, dws)
+            for i in range(128):
+                yield
+
+    @passive
+    def collector():
+        packet, cycle = [], 0
+        while True:
+            yield dut.source.ready.eq(ready(cycle))
+            yield
+            cycle += 1
+            if (yield dut.source.valid) and (yield dut.source.ready):
+                beat = (yield dut.source.dat)
+                packet += [(beat >> 32*i) & 0xffffffff for i in range(lanes)]
+                if (yield dut.source.last):
+                    out.append(packet[:tlp_length(packet)])
+                    packet = []
+
+    run_simulation(dut, [generator(), collector()])
+    return dut, out
+
+def expected(batches, key_dws=6):
+    out = []
+    for rules, tlps in batches:
+        entries = compile_rules(rules, key_dws)
+        for dws in tlps:
+            action, delay, dws = rewrite_tlp(entries, dws, key_dws)
+            if action != "drop":
+                out.append(dws)
+    return out
+
+rules = [
+    rule("mwr32", tag=0x22, action="drop"),
+    remap_address(0xf000_1000, 0xf000_17ff, 0xf100_0000),
+    rule(requester_id=0x200, action="delay", delay=20, patches=[Patch("header", 1, 0xff00, 0x5500, "xor")]),
+    rule("mwr64", payload={1: (0xaa00, 0xff00)}, patches=patch_payload_bytes(5, b"\x12\x34\x56")),
+    rule("mwr32", payload={0: 0xdead_beef}, patches=patch_payload_bytes(0, b"\x00\x00")),
+]
+tlps = [
+    make_tlp("mrd32", 0x100, tag=1, address=0xf000_1010),
+    make_tlp("mwr32", 0x100, tag=0x22, address=0xf000_0000, datas=[1, 2, 3]),
+    make_tlp("mwr32", 0x100, tag=3, address=0xf000_17fc, datas=[4, 5]),
+    make_tlp("mrd32", 0x100, tag=4, address=0xf000_1800),
+    make_tlp("mrd64", 0x200, tag=5, address=0x1_0000_0000, length=4),
+    make_tlp("mwr64", 0x100, tag=6, address=0x1_0000_0040, datas=[0x11111111, 0x2222aa22, 0x33333333]),
+    make_tlp("mwr64", 0x100, tag=7, address=0x1_0000_0040, datas=[0x11111111, 0x2222bb22]),
+    make_tlp("mwr32", 0x100, tag=8, address=0xe000_0000, datas=[0xdead_beef, 0x10]),
+    make_tlp("cpld",  0x100, tag=9, datas=[0x44]),
+    make_tlp("mwr32", 0x100, tag=0x22, address=0xf000_1000, datas=[6]),
+]
+
+# Tests --------------------------------------------------------------------------------------------
+
+def test_range_to_prefixes():
+    assert range_to_prefixes(0, 15, 4) == [(0, 0b0000)]
+    assert range_to_prefixes(1, 6, 4) == [(1, 0b1111), (2, 0b1110), (4, 0b1110), (6, 0b1111)]
+    for low, high in [(3, 200), (0, 255), (17, 17), (128, 255)]:
+        covered = [v for v in range(256) if any((v ^ p) & m == 0 for p, m in range_to_prefixes(low, high, 8))]
+        assert covered == list(range(low, high + 1))
+
+def test_compile_rules():
+    entries = compile_rules([remap_address(0xf000_1000, 0xf000_17ff, 0xf100_0000)])
+    # 3DW and 4DW headers, one prefix each.
+    assert len(entries) == 2
+    assert entries[0].masks[2] == 0xffff_f800 and entries[1].masks[3] == 0xffff_f800
+    assert entries[0].patches[0].index == 2 and entries[1].patches[0].index == 3
+    action, delay, dws = rewrite_tlp(entries, make_tlp("mrd32", address=0xf000_1234))
+    assert dws[2] == 0xf100_0234
+
+def test_tlp_rewriter():
+    batches = [(rules, tlps), (rules[2:], tlps)]
+    for data_width in [64, 256]:
+        dut, out = run_rewriter(data_width, batches)
+        assert out == expected(batches)
+
+def test_tlp_rewriter_backpressure():
+    # 5 DWs keys: no payload match of 4DW headers.
+    batches = [(rules[:3] + rules[4:], tlps)]
+    dut, out = run_rewriter(64, batches, key_dws=5, ready=lambda cycle: cycle % 3 != 0)
+    assert out == expected(batches, key_dws=5)
+
+def test_tlp_rewriter_atomic_commit():
+    # The table is swapped while TLPs are in flight: each TLP sees the old or the new table.
+    dut    = TLPRewriter(data_width=64, nrules=4, key_dws=4)
+    old    = compile_rules([rule("mwr32", patches=[Patch("payload", 0, 0xffff_ffff, 1, "set"), Patch("payload", 1, 0xffff_ffff, 1, "set")])], 4)
+    new    = compile_rules([rule("mwr32", patches=[Patch("payload", 0, 0xffff_ffff, 2, "set"), Patch("payload", 1, 0xffff_ffff, 2, "set")])], 4)
+    sent   = [make_tlp("mwr32", tag=i, datas=[0, 0]) for i in range(32)]
+    out    = []
+
+    def generator():
+        yield from load_table(dut, old)
+        for i, dws in enumerate(sent):
+            yield from tlp_stream_write(dut.sink, dws)
+            if i == 8:
+                words = []
+                for j in range(dut.nrules):
+                    words += entry_words(new[j] if j < len(new) else None, dut.npatches)
+                yield from wishbone_burst_write(dut.bus, 0, words)
+            if i == 16:
+                yield dut._commit.re.eq(1)
+        for i in range(64):
+            yield
+
+    @passive
+    def collector():
+        packet = []
+        while True:
+            yield dut.source.ready.eq(1)
+            if (yield dut._commit.re):
+                yield dut._commit.re.eq(0)
+            if (yield dut.source.valid):
+                beat = (yield dut.source.dat)
+                packet += [beat & 0xffffffff, beat >> 32]
+                if (yield dut.source.last):
+                    out.append(packet[:tlp_length(packet)])
+                    packet = []
+            yield
+
+    run_simulation(dut, [generator(), collector()])
+    assert len(out) == len(sent)
+    payloads = [tuple(dws[3:]) for dws in out]
+    assert set(payloads) == {(1, 1), (2, 2)}
+    # Old table up to the commit, then the new one.
+    switch = payloads.index((2, 2))
+    assert payloads[:switch] == [(1, 1)]*switch and payloads[switch:] == [(2, 2)]*(len(out) - switch)
+    assert 12 <= switch <= 18
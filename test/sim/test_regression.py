@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+import json
+import sys
+
+from pcie_mitm.sim.regression import run_regression
+
+
+# Helpers ------------------------------------------------------------------------------------------
+
+# Stands in for obj_dir/Vsim: serves UARTbone on the serial2tcp port of its sim_config.js and, like
+# a model built with coverage, writes a coverage file on $finish (sim_finish CSR write) only.
+fake_model = r'''
+import asyncio, json, os, struct
+
+config = json.load(open("sim_config.js"))
+port   = [m for m in config if isinstance(m, dict) and m.get("module") == "serial2tcp"][0]["args"]["port"]
+mem, hits = {}, set()
+
+async def slave(reader, writer):
+    while True:
+        try:
+            cmd, length = await reader.readexactly(2)
+        except asyncio.IncompleteReadError:
+            return
+        addr, = struct.unpack(">I", await reader.readexactly(4))
+        hits.add(cmd)
+        if cmd == 0x01:
+            for i, data in enumerate(struct.unpack(f">{length}I", await reader.readexactly(4*length))):
+                mem[addr + i] = data & 0xff if addr + i == 0x9000_0000//4 else 0
+            if addr == 0xf000_0000//4:
+                finish()
+        else:
+            writer.write(struct.pack(f">{length}I", *[mem.get(addr + i, 0) for i in range(length)]))
+
+def finish():
+    with open("sim.cov", "w") as f:
+        for cmd in [0x01, 0x02]:
+            f.write(f"C 'cmd{cmd}' {int(cmd in hits)}\n")
+    os._exit(0)
+
+async def main():
+    server = await asyncio.start_server(slave, "localhost", port)
+    await server.serve_forever()
+
+asyncio.run(main())
+'''
+
+# Tests --------------------------------------------------------------------------------------------
+
+def test_regression_pool(tmp_path):
+    gateware = tmp_path / "gateware"
+    gateware.mkdir()
+    (gateware / "model.py").write_text(fake_model)
+    csr_csv = tmp_path / "csr.csv"
+    csr_csv.write_text("csr_register,sim_finish_finish,0xf0000000,1,rw\n"
+        "constant,config_csr_data_width,32,,\n")
+    stimulus = tmp_path / "stimulus.py"
+    stimulus.write_text(
+        "async def main(bus, csrs, seed):\n"
+        "    bus.write(0x9000_0000, seed)\n"
+        "    value, = await bus.read(0x9000_0000)\n"
+        "    assert seed != 3, 'seed 3 fails'\n"
+        "    assert value == seed & 0xff\n")
+    config = [{"module": "serial2tcp", "interface": [], "args": {"port": 0}}, {"timebase": 1}]
+
+    report = run_regression(str(gateware), config, str(stimulus), seeds=range(8), jobs=4,
+        run_dir = str(tmp_path / "regression"),
+        csr_csv = str(csr_csv),
+        command = [sys.executable, "model.py"],
+        timeout = 20)
+    assert report["passed"] == 7
+    assert [f["seed"] for f in report["failures"]] == [3]
+    assert report["coverage"] == {"points": 2, "hit": 2}
+    results = json.loads((tmp_path / "regression" / "report.json").read_text())
+    assert results["failed"] == 1
+    # Every run, the failing one included, ended with $finish and left its coverage.
+    assert all(r["coverage"] is not None for r in results["results"])
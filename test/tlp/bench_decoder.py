@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from pcie_mitm.host.tlp import TLPStreamDecoder, decode_headers, tlp_record_dtype
+from pcie_mitm.host.pcapng import PcapngWriter
+from pcie_mitm.ip.tlp import fmt_type_dict
+
+
+# Synthetic Capture --------------------------------------------------------------------------------
+
+def synthetic_capture(n, payload_dws, seed=0):
+    rng      = np.random.default_rng(seed)
+    records  = np.zeros(n, tlp_record_dtype(payload_dws))
+    kinds    = np.array([fmt_type_dict[k] for k in ["mrd32", "mrd64", "mwr32", "mwr64", "cpld"]], np.uint32)
+    fmt_type = rng.choice(kinds, n)
+    length   = rng.integers(1, 33, n, dtype=np.uint32)
+    with_data = (fmt_type >> 6) & 1
+    records["timestamp"] = np.cumsum(rng.integers(1, 16, n, dtype=np.uint64))
+    records["bar"]       = 1
+    records["captured"]  = np.where(with_data, np.minimum(length, payload_dws), 0)
+    records["flags"]     = with_data & (length > payload_dws)
+    records["header"][:, 0] = (fmt_type << 24) | length
+    records["header"][:, 1:] = rng.integers(0, 2**32, (n, 3), dtype=np.uint32)
+    records["payload"]   = rng.integers(0, 2**32, (n, payload_dws), dtype=np.uint32)
+    return records.tobytes()
+
+# Main ---------------------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Host TLP record decoder / pcap-ng writer benchmark")
+    parser.add_argument("--records",     default=1000000, help="Synthetic records.")
+    parser.add_argument("--payload-dws", default=8,       help="Payload DWs per record (sniffer payload_dws).")
+    parser.add_argument("--block-size",  default=1 << 20, help="Capture block size (bytes).")
+    parser.add_argument("--output",      default=os.devnull, help="pcap-ng output.")
+    args = parser.parse_args()
+
+    payload_dws = int(args.payload_dws)
+    block_size  = int(args.block_size)
+    data = synthetic_capture(int(args.records), payload_dws)
+    view = memoryview(data)
+
+    for name, pcapng in [("decode", False), ("decode+pcapng", True)]:
+        decoder = TLPStreamDecoder(payload_dws)
+        with open(args.output, "wb") as f:
+            writer = PcapngWriter(f, payload_dws=payload_dws) if pcapng else None
+            start  = time.perf_counter()
+            for records in decoder.decode(view[i:i + block_size] for i in range(0, len(data), block_size)):
+                if writer is None:
+                    decode_headers(records)
+                else:
+                    writer.write(records)
+            elapsed = time.perf_counter() - start
+        print(f"{name:<14} {decoder.records/elapsed/1e6:8.2f} Mrecords/s {decoder.bytes/elapsed/1e6:8.1f} MB/s")
+
+if __name__ == "__main__":
+    main()
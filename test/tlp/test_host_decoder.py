@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import io
+import random
+import struct
+
+import numpy as np
+
+from pcie_mitm.host.tlp import TLPStreamDecoder, decode_headers, tlp_record_dtype
+from pcie_mitm.host.pcapng import PcapngWriter
+from pcie_mitm.sim.tlp import make_tlp
+
+
+# Helpers ------------------------------------------------------------------------------------------
+
+def pack_record(timestamp, bar, dws, payload_dws):
+    four_dw   = (dws[0] >> 29) & 1
+    with_data = (dws[0] >> 30) & 1
+    hdr       = dws[:4 if four_dw else 3]
+    payload   = dws[len(hdr):] if with_data else []
+    captured  = payload[:payload_dws]
+    truncated = len(payload) > payload_dws
+    rec = struct.pack("<QBBBB4I4x", timestamp, bar, len(captured), truncated, 0, *(hdr + [0]*(4 - len(hdr))))
+    rec += struct.pack(f"<{payload_dws}I", *(captured + [0]*(payload_dws - len(captured))))
+    return rec + bytes(tlp_record_dtype(payload_dws).itemsize - len(rec))
+
+def random_capture(n, payload_dws):
+    rng  = random.Random(0)
+    tlps = []
+    for i in range(n):
+        kind   = rng.choice(["mrd32", "mrd64", "mwr32", "mwr64", "cpld", "cpl"])
+        length = rng.randrange(1, 12)
+        datas  = [rng.randrange(2**32) for _ in range(length)] if kind in ["mwr32", "mwr64", "cpld"] else None
+        tlps.append(make_tlp(kind,
+            requester_id = rng.randrange(2**16),
+            tag          = rng.randrange(256),
+            address      = rng.randrange(2**(64 if kind.endswith("64") else 32)) & ~3,
+            length       = length,
+            datas        = datas))
+    data = b"".join(pack_record(10*i, 1, dws, payload_dws) for i, dws in enumerate(tlps))
+    return tlps, data
+
+# Tests --------------------------------------------------------------------------------------------
+
+def test_stream_decoder_split_blocks():
+    tlps, data = random_capture(200, 8)
+    decoder = TLPStreamDecoder(8)
+    rng     = random.Random(1)
+    offset  = 0
+    batches = []
+    while offset < len(data):
+        n = rng.randrange(1, 300)
+        batches.append(decoder.feed(bytearray(data[offset:offset + n])).copy())
+        offset += n
+    records = np.concatenate(batches)
+    assert len(records) == len(tlps)
+    f = decode_headers(records)
+    for i, dws in enumerate(tlps):
+        fmt_type = dws[0] >> 24
+        assert f["fmt_type"][i] == fmt_type
+        assert f["timestamp"][i] == 10*i
+        if fmt_type & 0b11110 == 0b01010:
+            assert f["requester_id"][i] == dws[2] >> 16
+            assert f["tag"][i] == (dws[2] >> 8) & 0xff
+        else:
+            assert f["requester_id"][i] == dws[1] >> 16
+            address = (dws[2] << 32 | dws[3]) if fmt_type & 0x20 else dws[2]
+            assert f["address"][i] == address
+
+def test_pcapng_writer():
+    tlps, data = random_capture(50, 4)
+    records = TLPStreamDecoder(4).feed(data)
+    out     = io.BytesIO()
+    writer  = PcapngWriter(out, clk_freq=1e9, payload_dws=4)
+    writer.write(records[:20])
+    writer.write(records[20:])
+    buf = out.getvalue()
+
+    # Walk the blocks back.
+    offset, packets = 0, []
+    while offset < len(buf):
+        block_type, length = struct.unpack_from("<II", buf, offset)
+        assert struct.unpack_from("<I", buf, offset + length - 4)[0] == length
+        if block_type == 6:
+            _, tshi, tslo, caplen, origlen = struct.unpack_from("<IIIII", buf, offset + 8)
+            packets.append(((tshi << 32) | tslo, buf[offset + 28:offset + 28 + caplen], origlen))
+        offset += length
+    assert len(packets) == len(tlps)
+    for i, (dws, (ts, pkt, origlen)) in enumerate(zip(tlps, packets)):
+        hdr_dws = 4 if (dws[0] >> 29) & 1 else 3
+        with_data = (dws[0] >> 30) & 1
+        assert ts == 10*i
+        assert pkt[:4*hdr_dws] == struct.pack(f">{hdr_dws}I", *dws[:hdr_dws])
+        payload = dws[hdr_dws:] if with_data else []
+        assert pkt[4*hdr_dws:] == struct.pack(f"<{min(4, len(payload))}I", *payload[:4])
+        assert origlen == 4*(hdr_dws + len(payload))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import random
+
+import pytest
+
+from pcie_mitm.ip.tlp import TLPSniffer, fmt_type_dict
+from pcie_mitm.sim.tlp import finalize_csrs, make_tlp, random_tlps, run_sniffer
+
+
+# Tests --------------------------------------------------------------------------------------------
+
+@pytest.mark.parametrize("data_width", [64, 128])
+def test_sniffer_match_all(data_width):
+    dut  = finalize_csrs(TLPSniffer(data_width=data_width, payload_dws=4))
+    tlps = random_tlps(64)
+
+    def setup():
+        yield dut._ctrl.storage.eq(0b11)
+
+    records = run_sniffer(dut, tlps, setup)
+    assert len(records) == len(tlps)
+    for (dws, bar), r in zip(tlps, records):
+        four_dw = (dws[0] >> 29) & 1
+        hdr_dws = 4 if four_dw else 3
+        payload = dws[hdr_dws:] if (dws[0] >> 30) & 1 else []
+        # DWs past the end of a short TLP are 0, not left over from the previous one.
+        assert r["header"] == (dws + [0]*4)[:4]
+        assert r["bar"] == bar
+        assert r["payload"] == payload[:4]
+        assert r["truncated"] == (len(payload) > 4)
+
+@pytest.mark.parametrize("length", [256, 300, 1024])
+def test_sniffer_large_payload(length):
+    dut   = finalize_csrs(TLPSniffer(data_width=64, payload_dws=4))
+    rng   = random.Random(length)
+    datas = [rng.randrange(2**32) for _ in range(length)]
+    tlps  = [(make_tlp("mwr64", requester_id=0x0100, address=0x1_0000_0000, datas=datas), 1),
+             (make_tlp("mwr32", requester_id=0x0100, address=0x1000, datas=datas[:2]), 1)]
+
+    def setup():
+        yield dut._ctrl.storage.eq(0b11)
+
+    records = run_sniffer(dut, tlps, setup)
+    assert len(records) == 2
+    assert records[0]["captured"] == 4
+    assert records[0]["truncated"] == 1
+    assert records[0]["payload"] == datas[:4]
+    assert records[1]["captured"] == 2
+    assert records[1]["truncated"] == 0
+
+def test_sniffer_filters():
+    dut  = finalize_csrs(TLPSniffer(data_width=64, payload_dws=0))
+    tlps = random_tlps(128)
+
+    def setup():
+        f0, f1 = dut.filter0, dut.filter1
+        # Rule 0: memory writes (32/64-bit) from 0x0100 to [0x1000_0000, 0x1fff_ffff].
+        yield f0._ctrl.storage.eq(0b11)
+        yield f0._fmt_type_value.storage.eq(fmt_type_dict["mwr32"])
+        yield f0._fmt_type_mask.storage.eq(0b1101_1111)
+        yield f0._requester_value.storage.eq(0x0100)
+        yield f0._requester_mask.storage.eq(0xffff)
+        yield f0._address_low.storage.eq(0x1000_0000)
+        yield f0._address_high.storage.eq(0x1fff_ffff)
+        # Rule 1: completions with data to 0x0200 on BAR 0 or 2.
+        yield f1._ctrl.storage.eq(0b01)
+        yield f1._fmt_type_value.storage.eq(fmt_type_dict["cpld"])
+        yield f1._fmt_type_mask.storage.eq(0xff)
+        yield f1._requester_value.storage.eq(0x0200)
+        yield f1._requester_mask.storage.eq(0xffff)
+        yield f1._bar_mask.storage.eq(0b101)
+        yield dut._ctrl.storage.eq(0b01)
+
+    def expected(dws, bar):
+        fmt_type = dws[0] >> 24
+        hits = 0
+        if fmt_type in [fmt_type_dict["mwr32"], fmt_type_dict["mwr64"]]:
+            address = (dws[2] << 32 | dws[3]) if fmt_type & 0x20 else dws[2]
+            if (dws[1] >> 16) == 0x0100 and 0x1000_0000 <= address <= 0x1fff_ffff:
+                hits |= 1
+        if fmt_type == fmt_type_dict["cpld"] and (dws[2] >> 16) == 0x0200 and bar & 0b101:
+            hits |= 2
+        return hits
+
+    # Steer a few writes into the address window.
+    for dws, bar in tlps[::4]:
+        if dws[0] >> 24 == fmt_type_dict["mwr32"]:
+            dws[2] = 0x1234_5670
+    records = run_sniffer(dut, tlps, setup)
+    matching = [(dws, expected(dws, bar)) for dws, bar in tlps if expected(dws, bar)]
+    assert len(matching) > 4
+    assert [r["header"][:3] for r in records] == [dws[:3] for dws, hits in matching]
+    assert [r["hits"] for r in records] == [hits for dws, hits in matching]
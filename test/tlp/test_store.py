@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import sys
+
+import numpy as np
+
+from pcie_mitm.host.store import CaptureStore, CaptureStoreWriter, main
+from pcie_mitm.host.tlp import concatenate_records, decode_headers, tlp_record_dtype
+from pcie_mitm.ip.tlp import fmt_type_dict
+
+
+# Helpers ------------------------------------------------------------------------------------------
+
+def synthetic_records(n, payload_dws=4, seed=0):
+    rng     = np.random.default_rng(seed)
+    records = np.zeros(n, tlp_record_dtype(payload_dws))
+    kinds   = np.array([fmt_type_dict[k] for k in ["mrd32", "mwr32", "mwr64", "cpld"]], np.uint32)
+    # Traffic phases so that the index has something to prune.
+    phase   = np.arange(n)*4//n
+    records["timestamp"] = np.cumsum(rng.integers(1, 8, n, dtype=np.uint64))
+    records["bar"]       = np.where((phase == 1) | (phase == 2), 1, 4)
+    records["header"][:, 0] = (np.where(phase == 1, kinds[rng.integers(0, 4, n)], kinds[0]) << 24) | 1
+    records["header"][:, 1] = np.where(phase == 3, 0x0300, rng.integers(0, 4, n)*0x100) << 16
+    records["header"][:, 2] = rng.integers(0, 2**20, n, dtype=np.uint32) << 2
+    return records
+
+# Tests --------------------------------------------------------------------------------------------
+
+def test_store_query(tmp_path):
+    records = synthetic_records(10000)
+    with CaptureStoreWriter(str(tmp_path / "store"), payload_dws=4, chunk_records=256) as store:
+        for i in range(0, len(records), 1000):
+            store.write(records[i:i + 1000])
+    store = CaptureStore(str(tmp_path / "store"))
+    assert len(store) == len(records)
+
+    f  = decode_headers(records)
+    ts = records["timestamp"]
+    t1, t2 = int(ts[2000]), int(ts[6000])
+    queries = [
+        (dict(fmt_types=[fmt_type_dict["mwr32"]], bar=0, t_start=t1, t_end=t2),
+            (f["fmt_type"] == fmt_type_dict["mwr32"]) & (records["bar"] & 1 != 0) & (ts >= t1) & (ts <= t2)),
+        (dict(requester_id=0x0300),
+            f["requester_id"] == 0x0300),
+        (dict(address=(0x1000, 0x4_0fff), fmt_types=[fmt_type_dict["mwr32"], fmt_type_dict["mwr64"]]),
+            (f["address"] >= 0x1000) & (f["address"] <= 0x4_0fff) &
+            np.isin(f["fmt_type"], [fmt_type_dict["mwr32"], fmt_type_dict["mwr64"]])),
+    ]
+    for kwargs, expected in queries:
+        assert expected.sum() > 0
+        results = list(store.query(**kwargs))
+        found   = concatenate_records(results, store.dtype)
+        assert np.array_equal(found["timestamp"], ts[expected])
+    # "MWr to BAR0 between t1 and t2" only touches the chunks of phase 1 (records 2500-4999).
+    found = list(store.query(fmt_types=[fmt_type_dict["mwr32"]], bar=0, t_start=t1, t_end=t2))
+    assert len(concatenate_records(found, store.dtype)) > 0
+    assert store.scanned <= len(np.unique(np.arange(2500, 5000)//256))
+
+def test_store_cli(tmp_path, monkeypatch, capsys):
+    records = synthetic_records(2000)
+    # Config and message requests: their DW2/DW3 are not addresses, address queries skip them.
+    other = records[:2].copy()
+    other["timestamp"]     = records["timestamp"][-1] + np.arange(1, 3, dtype=np.uint64)
+    other["header"][:, 0]  = (np.array([fmt_type_dict["cfgrd0"], fmt_type_dict["msg"]], np.uint32) << 24) | 1
+    other["header"][:, 2:] = [[0x2000, 0], [0, 0x2000]]
+    capture = tmp_path / "capture.bin"
+    concatenate_records([records, other], records.dtype).tofile(capture)
+    store = str(tmp_path / "store")
+
+    def run(*args):
+        monkeypatch.setattr(sys, "argv", ["store.py", *args])
+        main()
+        return capsys.readouterr()
+
+    out = run("ingest", str(capture), store, "--payload-dws", "4", "--chunk-records", "256")
+    assert "2002 records ingested" in out.out
+
+    f        = decode_headers(records)
+    expected = ~f["is_cpl"] & (f["address"] >= 0x1000) & (f["address"] <= 0x4_0fff)
+    assert expected.sum() > 0
+    out = run("query", store, "--address", "0x1000:0x40fff", "--count")
+    assert out.err.startswith(f"{expected.sum()} TLPs")
+
+    out = run("query", store, "--type", "cfgrd0,msg")
+    assert out.err.startswith("2 TLPs")
+    assert [line.split()[2] for line in out.out.splitlines()] == ["cfgrd0", "msg"]
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+import random
+
+import pytest
+
+from migen import *
+
+from pcie_mitm.ip.trigger import SequencedAnalyzer, TriggerSequencer
+from pcie_mitm.host.trigger import TriggerSequencerDriver, sequence_trigger, stage, within
+
+
+# Helpers ------------------------------------------------------------------------------------------
+
+# Analyzer layout: a (4-bit), b (4-bit), c (8-bit), LSB first.
+layout = {"a": (0, 4), "b": (4, 4), "c": (8, 8)}
+
+class _Reg:
+    def __init__(self, writes, name):
+        self.writes, self.name = writes, name
+
+    def write(self, value):
+        self.writes.append((self.name, value))
+
+class _Regs:
+    def __init__(self):
+        self.writes = []
+        self.d      = _RegDict(self.writes)
+
+class _RegDict(dict):
+    def __init__(self, writes):
+        self.writes = writes
+
+    def __missing__(self, name):
+        return _Reg(self.writes, name)
+
+class _Bus:
+    def __init__(self):
+        self.regs = _Regs()
+
+def program(dut, stages):
+    """Replay the register writes of TriggerSequencerDriver.configure on `dut`."""
+    bus    = _Bus()
+    driver = TriggerSequencerDriver(bus, config_csv=None)
+    driver.layout = layout
+    driver.configure(stages)
+    for name, value in bus.regs.writes:
+        csr = getattr(dut, "_" + name[len("analyzer_trigger_"):])
+        if name.endswith("_write"):
+            yield csr.re.eq(1)
+            yield
+            yield csr.re.eq(0)
+        else:
+            yield csr.storage.eq(value)
+            yield
+
+def run_sequencer(stages, samples, nstages=4):
+    dut    = TriggerSequencer(16, nstages=nstages)
+    result = {"fired": None}
+
+    def generator():
+        yield from program(dut, stages)
+        yield dut.sink.valid.eq(1)
+        yield dut._enable.storage.eq(1)
+        for i, sample in enumerate(samples):
+            yield dut.sink.data.eq(sample)
+            yield
+            if (yield dut.source.hit) and result["fired"] is None:
+                result["fired"] = i
+        result["restarts"] = (yield dut._restarts.status)
+        result["done"]     = (yield dut._done.status)
+
+    run_simulation(dut, generator())
+    return result
+
+def random_samples(prng, n):
+    # Narrow fields so that every stage condition is seen regularly.
+    return [prng.randrange(4) | (prng.randrange(4) << 4) | (prng.randrange(2) << 8) for _ in range(n)]
+
+# Tests --------------------------------------------------------------------------------------------
+
+sequences = {
+    "single":   [stage({"a": 3, "b": 1})],
+    "counted":  [stage({"a": 2}, count=3), stage({"b": "0b1x"})],
+    "within":   within({"a": 1, "b": 2}, {"a": 3, "b": 3, "c": 1}, cycles=4),
+    "edge":     [stage({"c": "0x01"}, edge=True, count=2), stage({"a": 0}, invert=True, edge=True)],
+    "restarts": [stage({"a": 1}), stage({"b": 1}, timeout=2, fail=0), stage({"a": 2, "b": 2}, timeout=3, fail=1)],
+}
+
+@pytest.mark.parametrize("name", sequences)
+def test_sequencer_model(name):
+    prng    = random.Random(name)
+    samples = random_samples(prng, 300)
+    result  = run_sequencer(sequences[name], [0] + samples)
+    expected = sequence_trigger(sequences[name], [0] + samples, layout)
+    assert expected is not None
+    assert result["fired"] == expected and result["done"]
+
+def test_within_timeout():
+    a, b   = 0x1, 0x2
+    stages = within({"a": a}, {"a": b}, cycles=3)
+    # b 4 cycles after a is too late and restarts; 3 cycles after the second a fires.
+    samples = [0, a, 0, 0, 0, b, a, 0, 0, b, 0]
+    result  = run_sequencer(stages, samples)
+    assert sequence_trigger(stages, samples, layout) == 9
+    assert result["fired"] == 9 and result["restarts"] == 1
+
+def test_analyzer():
+    a, b     = Signal(4), Signal(4)
+    analyzer = SequencedAnalyzer([a, b], depth=16, trigger_stages=3, csr_csv=None)
+    assert analyzer.data_width == 8 and analyzer.trigger.nstages == 3
+    names = {csr.name for csr in analyzer.get_csrs()}
+    for name in ["trigger_enable", "trigger_done", "trigger_stage_value", "trigger_stage_write",
+                 "storage_enable", "storage_mem_data"]:
+        assert name in names
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+import io
+import random
+import socket
+import struct
+
+import pytest
+
+from migen import *
+from migen.sim import passive
+
+from litex.soc.interconnect import stream
+
+from liteeth.common import eth_udp_user_description
+from liteeth.core import LiteEthUDPIPCore
+from liteeth.phy.model import LiteEthPHYModel
+
+from pcie_mitm.ip.udp import (UDPCaptureStreamer, frame_header_bytes, frame_overhead_bytes,
+    udp_capture_decimation)
+from pcie_mitm.host.udp import UDPCaptureReceiver, frame_header, parse_frame
+
+
+# Helpers ------------------------------------------------------------------------------------------
+
+class _Port:
+    def __init__(self):
+        self.sink = stream.Endpoint(eth_udp_user_description(8))
+
+def feed(streamer, words, timeout=0):
+    yield streamer._timeout.storage.eq(timeout)
+    yield streamer._enable.storage.eq(1)
+    for w in words:
+        yield streamer.sink.valid.eq(1)
+        yield streamer.sink.data.eq(w)
+        yield
+    yield streamer.sink.valid.eq(0)
+
+def decode_words(payload, width=4):
+    return [int.from_bytes(payload[i:i + width], "little") for i in range(0, len(payload), width)]
+
+# Tests --------------------------------------------------------------------------------------------
+
+def test_framer():
+    port     = _Port()
+    streamer = UDPCaptureStreamer(port, data_width=32, payload_bytes=16, fifo_frames=2, dst_port=5000,
+        ip_address="192.168.42.100")
+    words    = list(range(100, 140))
+    frames   = []
+    status   = {}
+
+    def consumer():
+        prng, data, params = random.Random(3), [], None
+        for _ in range(1200):
+            yield port.sink.ready.eq(prng.randrange(4) != 0)
+            yield
+            if (yield port.sink.valid) and (yield port.sink.ready):
+                params = params or ((yield port.sink.ip_address), (yield port.sink.dst_port), (yield port.sink.length))
+                data.append((yield port.sink.data))
+                if (yield port.sink.last):
+                    frames.append((params, bytes(data)))
+                    data, params = [], None
+        status["frames"]   = (yield streamer._frames.status)
+        status["overflow"] = (yield streamer._overflow.status)
+
+    run_simulation(streamer, [feed(streamer, words, timeout=50), consumer()])
+
+    received = []
+    for i, ((ip, dst_port, length), data) in enumerate(frames):
+        seq, overflow, payload = parse_frame(data)
+        assert seq == i and (ip, dst_port) == (0xc0a82a64, 5000) and length == len(data)
+        # Beats dropped before the frame was started are all older than its first word.
+        assert overflow <= status["overflow"]
+        received += decode_words(payload)
+    # Full frames first, then the remainder flushed by the timeout.
+    assert [len(d) - frame_header_bytes for _, d in frames[:-1]] == [16]*(len(frames) - 1)
+    assert status["overflow"] > 0 and len(received) + status["overflow"] == len(words)
+    assert received == sorted(received) and set(received) <= set(words)
+    assert status["frames"] == len(frames)
+
+def test_phy_model():
+    class DUT(Module):
+        def __init__(self):
+            self.pads = pads = Record([("source_valid", 1), ("source_ready", 1), ("source_data", 8),
+                ("sink_valid", 1), ("sink_ready", 1), ("sink_data", 8)])
+            self.submodules.phy = LiteEthPHYModel(pads)
+            # PHY clock domain datapath, as with add_etherbone.
+            core = LiteEthUDPIPCore(self.phy, 0x10e2d5000000, "192.168.42.50", int(100e6), with_icmp=False)
+            self.submodules.core = ClockDomainsRenamer({"sys": "eth_rx"})(core)
+            port = self.core.udp.crossbar.get_port(4321, dw=8)
+            self.submodules.streamer = UDPCaptureStreamer(port, data_width=32, payload_bytes=32,
+                cd="eth_rx", ip_address="255.255.255.255", src_port=4321, dst_port=4322)
+
+    dut, frames = DUT(), []
+    def monitor():
+        data = []
+        for _ in range(400):
+            if (yield dut.pads.source_valid):
+                data.append((yield dut.pads.source_data))
+            elif data:
+                frames.append(bytes(data))
+                data = []
+            yield
+
+    run_simulation(dut, {"sys": [feed(dut.streamer, range(20), timeout=40)], "eth_rx": [monitor()]},
+        clocks={"sys": 10, "eth_rx": 8, "eth_tx": 8})
+
+    received = []
+    for i, frame in enumerate(frames):
+        assert frame[12:14] == b"\x08\x00" and frame[23] == 17 # IPv4/UDP.
+        src_port, dst_port, length = struct.unpack(">HHH", frame[34:40])
+        assert (src_port, dst_port) == (4321, 4322) and length == len(frame) - 34
+        seq, overflow, payload = parse_frame(frame[42:])
+        assert (seq, overflow) == (i, 0)
+        received += decode_words(payload)
+    assert received == list(range(20))
+    assert [len(f) - 42 - frame_header_bytes for f in frames] == [32, 32, 16]
+
+def test_sustained_rate():
+    # Default jumbo frames, a 512-bit sample offered every cycle of a 125MHz (GMII) link domain: one
+    # byte per cycle plus the Ethernet/IP/UDP overhead of each frame. With a single frame of
+    # buffering, the stream only keeps up across frames if it stays under the link rate.
+    decimation = udp_capture_decimation(125e6, 512)
+    port       = _Port()
+    streamer   = UDPCaptureStreamer(port, data_width=512, fifo_frames=1, decimation=decimation)
+    words      = range(5*128//2*decimation) # 2.5 frames, past the end of the first one on the wire.
+    frames     = []
+
+    def generator():
+        yield from feed(streamer, words)
+        assert (yield streamer._overflow.status) == 0
+
+    @passive
+    def link():
+        data = []
+        while True:
+            yield port.sink.ready.eq(1)
+            yield
+            if (yield port.sink.valid):
+                data.append((yield port.sink.data))
+                if (yield port.sink.last):
+                    frames.append(bytes(data))
+                    data = []
+                    yield port.sink.ready.eq(0)
+                    for _ in range(frame_overhead_bytes):
+                        yield
+
+    run_simulation(streamer, [generator(), link()])
+
+    assert decimation == 65
+    assert len(frames) == 1
+    seq, overflow, payload = parse_frame(frames[0])
+    assert (seq, overflow) == (0, 0) and len(payload) == 8192
+    assert decode_words(payload, 64) == list(words)[::decimation][:128]
+
+@pytest.mark.parametrize("use_recvmmsg", [True, False])
+def test_receiver(use_recvmmsg):
+    receiver = UDPCaptureReceiver(port=0, address="127.0.0.1", rcvbuf=1 << 20, batch=4, max_frame=256,
+        use_recvmmsg=use_recvmmsg)
+    sender   = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # Frames 3 and 4 are lost, 6 arrives late.
+        for seq in [0, 1, 2, 5, 7, 6, 8]:
+            sender.sendto(frame_header.pack(seq, 2*seq) + bytes([seq])*16, ("127.0.0.1", receiver.port))
+        frames = []
+        while len(frames) < 7:
+            batch = receiver.receive(timeout=1.0)
+            assert batch
+            assert len(batch) <= 4
+            frames += [(seq, overflow, bytes(payload)) for seq, overflow, payload in batch]
+        assert [f[0] for f in frames] == [0, 1, 2, 5, 7, 6, 8]
+        assert frames[3] == (5, 10, bytes([5])*16)
+        assert receiver.stats == (7, 7*16, 3, 1, 16)
+
+        # Saving the payloads.
+        sender.sendto(frame_header.pack(9, 0) + b"abcd", ("127.0.0.1", receiver.port))
+        f = io.BytesIO()
+        assert receiver.save(f, timeout=0.2) == 4 and f.getvalue() == b"abcd"
+    finally:
+        sender.close()
+        receiver.close()